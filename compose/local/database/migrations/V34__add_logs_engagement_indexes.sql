@@ -0,0 +1,20 @@
+-- Composite indexes for the engagement dedupe / history lookups on logs (db.py).
+-- Before this the only indexes were the FK ones on user_id and post_id, so every
+-- lookup scanned all of a user's rows — and logs grows without bound.
+--
+-- post_url is TEXT, so it is indexed on a 255-char prefix (LinkedIn post/profile URLs
+-- are shorter than that; longer ones are re-checked against the row).
+
+-- has_user_commented_on_post_url, has_engaged_url_with_x_days (created_at range),
+-- get_dm_history_for_profile (ORDER BY created_at on the action_type/post_url prefix)
+ALTER TABLE logs
+    ADD INDEX idx_logs_user_action_url (user_id, action_type, post_url(255), result, created_at);
+
+-- get_post_url_from_log_for_user / get_post_message_from_log_for_user
+-- (latest successful POST log for a post)
+ALTER TABLE logs
+    ADD INDEX idx_logs_user_post_action (user_id, post_id, action_type, result, created_at);
+
+-- get_recent_logs (newest-first activity feed per user)
+ALTER TABLE logs
+    ADD INDEX idx_logs_user_created (user_id, created_at);
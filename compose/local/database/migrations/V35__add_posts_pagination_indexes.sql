@@ -0,0 +1,13 @@
+-- Composite indexes for paging a user's posts in (scheduled_time, id) order (db.get_posts).
+-- Before this the only index was the FK one on user_id, so every /posts/ page sorted all
+-- of the user's rows and OFFSET pages re-read every skipped row. The keyset (cursor)
+-- mode seeks straight to the cursor position on these. InnoDB appends the primary key
+-- (id) to every secondary index, so it is the tie-breaker without being listed.
+
+-- Unfiltered pages
+ALTER TABLE posts
+    ADD INDEX idx_posts_user_scheduled (user_id, scheduled_time);
+
+-- status_filter pages, and the per-user status histogram (GROUP BY status)
+ALTER TABLE posts
+    ADD INDEX idx_posts_user_status_scheduled (user_id, status, scheduled_time);
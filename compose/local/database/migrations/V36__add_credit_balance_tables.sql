@@ -0,0 +1,29 @@
+-- Materialized credit balances. The ledgers stay the audit history, but every ledger insert
+-- now changes the user's balance row in the same transaction (db.py _apply_credit_delta), so
+-- balance reads are a primary-key lookup instead of SUM(delta) over the whole history, and
+-- spending is a single conditional decrement (UPDATE ... WHERE balance >= n) that cannot
+-- race a concurrent spend into a negative balance.
+--
+-- reconcile_credit_balances (the reconcile-credit-balances beat task) rebuilds these from
+-- the ledgers and reports any drift.
+
+CREATE TABLE IF NOT EXISTS avatar_credit_balances (
+    user_id    INT      NOT NULL PRIMARY KEY,
+    balance    INT      NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS video_credit_balances (
+    user_id    INT      NOT NULL PRIMARY KEY,
+    balance    INT      NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Seed from the existing ledger history
+INSERT INTO avatar_credit_balances (user_id, balance)
+SELECT user_id, SUM(delta) FROM avatar_credit_ledger GROUP BY user_id;
+
+INSERT INTO video_credit_balances (user_id, balance)
+SELECT user_id, SUM(delta) FROM video_credit_ledger GROUP BY user_id;
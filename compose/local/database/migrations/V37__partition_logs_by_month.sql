@@ -0,0 +1,36 @@
+-- Monthly range partitioning of logs, plus an index for purging expired sessions.
+--
+-- logs grows without bound and every engagement dedupe lookup reads the user's slice of
+-- it. With one partition per month, the db-maintenance beat task (db_maintenance.py)
+-- archives months older than LOGS_RETENTION_MONTHS to compressed JSONL and removes them
+-- with DROP PARTITION (a metadata change) instead of a DELETE scan, so the table — and
+-- each index probe — stays bounded by the retention window.
+--
+-- The rebuild below copies the table, and the first maintenance run moves it into
+-- p_history; run both in a quiet window on large installs.
+
+-- Partitioned InnoDB tables cannot have foreign keys. The ON DELETE CASCADE cleanup of
+-- a deleted user's or post's logs moves to the maintenance task (purge_orphaned_logs);
+-- the FK indexes on user_id / post_id stay.
+ALTER TABLE logs DROP FOREIGN KEY fk_logs_user_id;
+ALTER TABLE logs DROP FOREIGN KEY logs_ibfk_1;
+
+-- The partitioning column must be part of every unique key, the primary key included.
+UPDATE logs SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE logs
+    MODIFY created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (id, created_at);
+
+-- Every row starts in p_future. On its first run the maintenance task splits p_history
+-- (rows from before the month it runs in, bounded in epoch seconds so the session time
+-- zone cannot move it) and the month partitions ahead off p_future, and archives
+-- p_history as a whole once it leaves the window.
+ALTER TABLE logs
+    PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) (
+        PARTITION p_future VALUES LESS THAN MAXVALUE
+    );
+
+-- purge_expired_sessions: DELETE ... WHERE expires_at < %s LIMIT n
+ALTER TABLE sessions
+    ADD INDEX idx_sessions_expires_at (expires_at);
@@ -0,0 +1,8 @@
+-- Index for the scheduler's claim query (db.claim_ready_to_post_posts):
+--   WHERE status = 'approved' AND scheduled_time BETWEEN ? AND ? ORDER BY scheduled_time
+--   LIMIT ? FOR UPDATE SKIP LOCKED
+-- Without it InnoDB scans (and locks) every posts row to find the due ones, so two
+-- concurrent claimers would block on each other's scanned rows instead of skipping only
+-- the claimed ones. With it the range scan touches just the due, still-approved rows.
+ALTER TABLE posts
+    ADD INDEX idx_posts_status_scheduled (status, scheduled_time);
@@ -0,0 +1,7 @@
+-- Covering index for the batch content planner's grouped read
+-- (db.get_post_type_counts_for_users):
+--   SELECT user_id, post_type, COUNT(*) FROM posts WHERE user_id IN (...) GROUP BY user_id, post_type
+-- With it the counts for a batch of users come straight from the index instead of
+-- reading every post row of every user.
+ALTER TABLE posts
+    ADD INDEX idx_posts_user_type (user_id, post_type);
@@ -1,9 +1,11 @@
+import asyncio
 import json
 import os
 import time
-from datetime import datetime, timedelta, timezone
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from enum import IntEnum
-from typing import Dict, List, Union
+from typing import List, Union
 from typing import Optional, Any
 from urllib.parse import urlparse, urlunparse
 
@@ -17,39 +19,42 @@ from cqc_lem.app.run_automation import (
 from celery import chain as celery_chain
 from cqc_lem.app.run_content_plan import auto_create_weekly_content, plan_content_for_user
 from cqc_lem.utilities.db import (
-    insert_post, get_post_by_email, get_user_id, update_db_post, get_post_user_id,
-    add_user_with_access_token, update_user, PostType, PostStatus, get_posts,
+    insert_post, get_user_id, update_db_post, get_post_user_id,
+    add_user_with_access_token, update_user, PostType, PostStatus, encode_post_cursor,
     get_recent_logs, bulk_update_posts, soft_delete_posts,
     create_pin_for_email, verify_pin_for_email, delete_pin_for_email,
-    create_session, get_session_user_id, delete_session,
-    add_user_by_email, get_user_email, get_user_token_info, store_linkedin_li_at,
+    create_session, get_session_user_id,
+    add_user_by_email, get_user_token_info, store_linkedin_li_at,
     has_linkedin_session, get_user_password_pair_by_id,
-    get_company_linked_in_url_for_user, update_company_linked_in_url_for_user,
-    get_user_subscription_info, get_user_preferences, update_user_preferences,
+    update_company_linked_in_url_for_user,
+    get_user_subscription_info, update_user_preferences,
     update_subscription_from_stripe, update_user_linkedin_token,
     get_users_with_stripe_subscriptions,
     update_user_linkedin_password,
-    get_user_blog_url, get_user_sitemap_url,
     get_user_by_stripe_customer_id, get_avatar_credit_ledger_entry_by_session,
-    get_avatar_credit_balance, add_avatar_credits,
+    add_avatar_credits,
     get_video_credit_balance, add_video_credits,
     get_video_credit_ledger_entry_by_session, update_post_video_quality,
-    deduct_avatar_credit, insert_avatar_training,
+    deduct_avatar_credit, refund_avatar_credit, link_avatar_credit_to_training, insert_avatar_training,
     update_avatar_training_status, set_active_avatar,
-    get_avatar_trainings, get_active_avatar,
+    get_avatar_trainings,
     get_user_timezone, update_user_timezone,
     get_user_geo, update_user_location,
     replace_video_url_base, get_post_type, get_post_buyer_stage,
     update_db_post_carousel_slides,
     get_post_url_from_log_for_user,
+    get_db_pool_stats, get_replica_stats,
 )
+from cqc_lem.utilities import db_async, db_metrics, delayed_dispatch, engagement_session, once_locks, \
+    provider_slots, selenium_fair_share
 from cqc_lem.utilities.email import generate_pin, hash_pin, send_pin_email
+from cqc_lem.utilities.linkedin import pacing
 from cqc_lem.utilities.linkedin.verification_pin import (
     extract_pin_from_text, extract_token_from_address, submit_pin_by_token)
 from cqc_lem.utilities.linkedin.token_refresh import (
     get_token_expiry, is_token_expired, is_token_expiring_soon, attempt_token_refresh,
 )
-from cqc_lem.utilities.env_constants import LI_CLIENT_ID, LI_CLIENT_SECRET, LI_REDIRECT_URL, LI_STATE_SALT, ADMIN_SECRET, API_ACCESS_TOKENS, \
+from cqc_lem.utilities.env_constants import LI_CLIENT_ID, LI_CLIENT_SECRET, LI_REDIRECT_URL, LI_STATE_SALT, ADMIN_SECRET, API_ACCESS_TOKENS, METRICS_TOKEN, \
     DEFAULT_IMAGE_MODEL, DEFAULT_VIDEO_MODEL, DEFAULT_VIDEO_RATIO
 import requests
 from cqc_lem.utilities.logger import myprint, log_warning, log_info
@@ -62,6 +67,7 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, APIKeyHea
 from fastapi.responses import FileResponse
 from fastapi.responses import JSONResponse
 from fastapi.responses import HTMLResponse
+from fastapi.responses import PlainTextResponse
 from fastapi.responses import RedirectResponse
 from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
@@ -70,7 +76,13 @@ from linkedin_api.clients.restli.client import RestliClient
 from linkedin_api.common.errors import ResponseFormattingError
 from pydantic import BaseModel, computed_field, model_validator
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    yield
+    await db_async.close_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # All API routes live under /api so the React client's baseURL: '/api' works
 router = APIRouter(prefix="/api")
@@ -91,6 +103,7 @@ async def observability_middleware(request: Request, call_next):
             status_code=status_code,
             latency_ms=int((time.time() - start) * 1000),
         )
+        db_metrics.maybe_publish()
 
 
 # Bearer-token gate for /api routes. Active only when API_ACCESS_TOKENS is set,
@@ -349,39 +362,66 @@ def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics(authorization: Optional[str] = Header(default=None)) -> str:
+    """Per-function db latency, pool, delayed-dispatch, content-provider, per-user Selenium
+    admission, engagement-session and LinkedIn pacing gauges in Prometheus text format.
+
+    Served outside /api so scrapers need no API token; requires
+    ``Authorization: Bearer <METRICS_TOKEN>`` when METRICS_TOKEN is set.
+    """
+    if METRICS_TOKEN and _bearer_token(authorization) != METRICS_TOKEN:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    pool = get_db_pool_stats()
+    async_pool = db_async.get_async_pool_stats()
+    replica = get_replica_stats()
+    delayed = delayed_dispatch.get_delayed_dispatch_stats()
+    return db_metrics.render_prometheus({
+        **selenium_fair_share.prometheus_gauges(),
+        **engagement_session.prometheus_gauges(),
+        **pacing.prometheus_gauges(),
+        **once_locks.prometheus_gauges(),
+        **{f'cqc_lem_provider_slots_in_use{{provider="{name}"}}': slots["in_use"]
+           for name, slots in provider_slots.get_provider_slot_stats().items()},
+        "cqc_lem_db_pool_checked_out": pool["checked_out"],
+        "cqc_lem_db_pool_idle": pool["idle"],
+        "cqc_lem_db_pool_waits_total": pool["waits"],
+        "cqc_lem_db_pool_timeouts_total": pool["timeouts"],
+        "cqc_lem_db_async_pool_in_use": async_pool["size"] - async_pool["free"],
+        "cqc_lem_db_replica_reads_total": replica["replica_reads"],
+        "cqc_lem_db_replica_primary_reads_total": replica["primary_reads"],
+        "cqc_lem_delayed_tasks_pending": delayed["pending"],
+        "cqc_lem_delayed_tasks_leased": delayed["leased"],
+        "cqc_lem_delayed_tasks_overdue_seconds": delayed["overdue_seconds"],
+        "cqc_lem_delayed_tasks_dispatched_total": delayed["dispatched"],
+        "cqc_lem_delayed_tasks_lateness_seconds_total": delayed["lateness_seconds"],
+    })
+
+
 @router.get("/dashboard/stats/", responses={
     200: {"description": "Dashboard stats returned"},
     **{k: v for k, v in error_responses.items() if k in [400, 403]}
 })
-def get_dashboard_stats(email: str) -> ResponseModel:
+async def get_dashboard_stats(email: str) -> ResponseModel:
     if not email:
         raise HTTPException(status_code=400, detail="Email is required")
 
-    user_id = get_user_id(email)
+    user_id = await db_async.get_user_id(email)
     if not user_id:
         raise HTTPException(status_code=403, detail="User not found")
 
-    posts, _ = get_posts(user_id)
-    now = datetime.now(timezone.utc)
-    week_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    # Back up to Monday. Use timedelta, not replace(day=...): naive day subtraction
-    # goes out of range in the first days of a month (e.g. Wed the 1st → day=-1).
-    week_start = week_start - timedelta(days=week_start.weekday())
-
-    scheduled_this_week = sum(
-        1 for p in posts
-        if p.get("status") in (PostStatus.APPROVED, PostStatus.PENDING)
-        and p.get("scheduled_time") and p["scheduled_time"] >= week_start
-    )
-    pending_review = sum(1 for p in posts if p.get("status") == PostStatus.PENDING)
-    posted_total = sum(1 for p in posts if p.get("status") == PostStatus.POSTED)
+    stats = await db_async.get_post_dashboard_stats(user_id)
+    if stats is None:
+        raise HTTPException(status_code=500, detail="Could not load dashboard stats")
 
-    stats: Dict[str, int] = {
-        "scheduled_this_week": scheduled_this_week,
-        "pending_review": pending_review,
-        "posted_total": posted_total,
-    }
-    return ResponseModel(status_code=200, detail=stats)
+    return ResponseModel(status_code=200, detail={
+        "scheduled_this_week": stats["scheduled_this_week"],
+        "pending_review": stats["pending_review"],
+        "posted_total": stats["posted_total"],
+        "total": stats["total"],
+        "by_status": stats["by_status"],
+        "by_type": stats["by_type"],
+    })
 
 
 @router.get("/activity/", responses={
@@ -565,21 +605,28 @@ def get_user_id_from_email(email: str) -> ResponseModel:
     200: {"description": "Posts retrieved successfully"},
     **{k: v for k, v in error_responses.items() if k in [400, 404]}
 })
-def get_posts_for_email(
+async def get_posts_for_email(
     email: str,
     page: int = Query(default=1, ge=1),
     page_size: int = Query(default=10, ge=1, le=200),
     sort_order: str = Query(default='asc', pattern='^(asc|desc)$'),
     status_filter: Optional[str] = Query(default=None),
+    cursor: Optional[str] = Query(default=None, description="next_cursor from the previous page; "
+                                                            "takes precedence over page"),
+    include_total: bool = Query(default=True),
 ) -> ResponseModel:
     if not email:
         raise HTTPException(status_code=400, detail="Email is required")
 
     offset = (page - 1) * page_size
-    posts, total = get_post_by_email(
-        email, limit=page_size, offset=offset,
-        sort_order=sort_order, status_filter=status_filter
-    )
+    try:
+        posts, total = await db_async.get_post_by_email(
+            email, limit=page_size, offset=offset,
+            sort_order=sort_order, status_filter=status_filter,
+            cursor=cursor, include_total=include_total,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     posts_list = [
         {
@@ -598,9 +645,25 @@ def get_posts_for_email(
         "total": total,
         "page": page,
         "page_size": page_size,
+        "next_cursor": encode_post_cursor(posts[-1]) if len(posts) == page_size else None,
     })
 
 
+def _sync_delayed_post_tasks(post_ids: list[int], status: Optional[PostStatus] = None,
+                             scheduled_time: Optional[datetime] = None) -> None:
+    """Keep a claimed post's parked tasks (utilities.delayed_dispatch) in step with an edit.
+
+    Any status other than 'scheduled' cancels them (an approved post is claimed again when
+    due); a new scheduled_time moves them along with it. No-op for posts not yet claimed.
+    """
+    for post_id in post_ids:
+        key = delayed_dispatch.post_key(post_id)
+        if status is not None and status != PostStatus.SCHEDULED:
+            delayed_dispatch.cancel(key)
+        elif scheduled_time is not None:
+            delayed_dispatch.reschedule(key, scheduled_time)
+
+
 @router.post("/posts/bulk_update/", responses={
     200: {"description": "Posts updated successfully"},
     **{k: v for k, v in error_responses.items() if k in [400, 405]}
@@ -610,6 +673,7 @@ def bulk_update_posts_endpoint(request: BulkUpdateRequest) -> ResponseModel:
         raise HTTPException(status_code=400, detail="post_ids is required")
 
     if bulk_update_posts(request.post_ids, status=request.status, scheduled_time=request.scheduled_datetime):
+        _sync_delayed_post_tasks(request.post_ids, status=request.status, scheduled_time=request.scheduled_datetime)
         return ResponseModel(status_code=200, detail="Posts updated successfully")
     else:
         raise HTTPException(status_code=405, detail="Posts could not be updated")
@@ -624,6 +688,7 @@ def delete_posts_endpoint(request: BulkDeleteRequest) -> ResponseModel:
         raise HTTPException(status_code=400, detail="post_ids is required")
 
     if soft_delete_posts(request.post_ids):
+        _sync_delayed_post_tasks(request.post_ids, status=PostStatus.REJECTED)
         return ResponseModel(status_code=200, detail="Posts deleted successfully")
     else:
         raise HTTPException(status_code=405, detail="Posts could not be deleted")
@@ -651,6 +716,7 @@ def update_post(post_id: int, post: PostRequest) -> ResponseModel:
     myprint(f"Received Post Request: {post}")
 
     if update_db_post(post.content, post.video_url, post.scheduled_datetime, post.post_type, post_id, post.status):
+        _sync_delayed_post_tasks([post_id], status=post.status, scheduled_time=post.scheduled_datetime)
         return ResponseModel(status_code=200, detail="Post updated successful")
     else:
         raise HTTPException(status_code=405, detail="Post could not be updated")
@@ -789,17 +855,17 @@ def auth_email_verify(request: AuthVerifyRequest) -> ResponseModel:
 
 
 @router.post("/auth/logout")
-def auth_logout(request: LogoutRequest) -> ResponseModel:
-    delete_session(request.session_token)
+async def auth_logout(request: LogoutRequest) -> ResponseModel:
+    await db_async.delete_session(request.session_token)
     return ResponseModel(status_code=200, detail="Logged out")
 
 
 @router.get("/auth/session")
-def auth_check_session(session_token: str) -> ResponseModel:
-    user_id = get_session_user_id(session_token)
+async def auth_check_session(session_token: str) -> ResponseModel:
+    user_id = await db_async.get_session_user_id(session_token)
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid or expired session")
-    email = get_user_email(user_id)
+    email = await db_async.get_user_email(user_id)
     return ResponseModel(status_code=200, detail={"user_id": user_id, "email": email})
 
 
@@ -941,16 +1007,21 @@ def linkedin_callback(code: str, state: str = None) -> Union[ResponseModel, Redi
 
 
 @router.get("/user/settings")
-def get_user_settings(session_token: str) -> ResponseModel:
-    user_id = get_session_user_id(session_token)
+async def get_user_settings(session_token: str) -> ResponseModel:
+    user_id = await db_async.get_session_user_id(session_token)
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid or expired session")
 
-    subscription = get_user_subscription_info(user_id)
-    preferences = get_user_preferences(user_id)
-    blog_url = get_user_blog_url(user_id)
-    sitemap_url = get_user_sitemap_url(user_id)
-    company_linked_in_url = get_company_linked_in_url_for_user(user_id)
+    subscription = await db_async.get_user_subscription_info(user_id)
+    settings = await db_async.get_user_settings(user_id)
+    # Same defaults as db.get_user_preferences when the settings row can't be read
+    preferences = {
+        "last_login_inactivate_delay": settings.last_login_inactivate_delay if settings else None,
+        "auto_schedule_posts": settings.auto_schedule_posts if settings else True,
+    }
+    blog_url = settings.blog_url if settings else None
+    sitemap_url = settings.sitemap_url if settings else None
+    company_linked_in_url = settings.company_linked_in_url if settings else None
 
     def _iso(dt):
         return dt.isoformat() if dt else None
@@ -1482,12 +1553,12 @@ async def billing_webhook(request: Request) -> dict:
     200: {"description": "Credit balance and active avatar returned"},
     **{k: v for k, v in error_responses.items() if k in [401]}
 })
-def get_avatar_credits_endpoint(session_token: str) -> ResponseModel:
-    user_id = get_session_user_id(session_token)
+async def get_avatar_credits_endpoint(session_token: str) -> ResponseModel:
+    user_id = await db_async.get_session_user_id(session_token)
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid or expired session")
-    balance = get_avatar_credit_balance(user_id)
-    active = get_active_avatar(user_id)
+    balance, active = await asyncio.gather(db_async.get_avatar_credit_balance(user_id),
+                                           db_async.get_active_avatar(user_id))
     return ResponseModel(status_code=200, detail={"balance": balance, "active_avatar": active})
 
 
@@ -1521,11 +1592,11 @@ def avatar_credits_checkout(request: AvatarCreditCheckoutRequest) -> ResponseMod
     200: {"description": "Video credit balance returned"},
     **{k: v for k, v in error_responses.items() if k in [401]}
 })
-def get_video_credits_endpoint(session_token: str) -> ResponseModel:
-    user_id = get_session_user_id(session_token)
+async def get_video_credits_endpoint(session_token: str) -> ResponseModel:
+    user_id = await db_async.get_session_user_id(session_token)
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid or expired session")
-    return ResponseModel(status_code=200, detail={"balance": get_video_credit_balance(user_id)})
+    return ResponseModel(status_code=200, detail={"balance": await db_async.get_video_credit_balance(user_id)})
 
 
 @router.post("/video/credits/checkout", responses={
@@ -1594,11 +1665,11 @@ async def start_avatar_training_endpoint(
     trigger_word: str = Form(...),
     photos: UploadFile = File(...),
 ) -> ResponseModel:
-    user_id = get_session_user_id(session_token)
+    user_id = await db_async.get_session_user_id(session_token)
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid or expired session")
 
-    balance = get_avatar_credit_balance(user_id)
+    balance = await db_async.get_avatar_credit_balance(user_id)
     if balance < 1:
         raise HTTPException(status_code=402, detail="Insufficient avatar credits. Purchase credits to train a new avatar.")
 
@@ -1620,13 +1691,20 @@ async def start_avatar_training_endpoint(
     except _zipfile.BadZipFile:
         raise HTTPException(status_code=400, detail="Uploaded file is not a valid ZIP")
 
+    # Reserve the credit before training starts: the conditional decrement lets only one of
+    # two concurrent requests spend the last credit. It is refunded if the start fails.
+    if not deduct_avatar_credit(user_id):
+        raise HTTPException(status_code=402, detail="Insufficient avatar credits. Purchase credits to train a new avatar.")
+
     from cqc_lem.utilities.avatar.replicate_avatar import start_avatar_training
     try:
         training_id = start_avatar_training(user_id, zip_bytes, trigger_word)
     except Exception as exc:
+        if not refund_avatar_credit(user_id):
+            log_warning("Could not refund avatar credit after training failed to start", user_id=user_id)
         raise HTTPException(status_code=500, detail=f"Could not start training: {exc}")
 
-    deduct_avatar_credit(user_id, training_id)
+    link_avatar_credit_to_training(user_id, training_id)
     db_id = insert_avatar_training(user_id, training_id, trigger_word)
     return ResponseModel(status_code=200, detail={"training_id": training_id, "db_id": db_id})
 
@@ -1635,11 +1713,11 @@ async def start_avatar_training_endpoint(
     200: {"description": "Avatar trainings listed"},
     **{k: v for k, v in error_responses.items() if k in [401]}
 })
-def list_avatar_trainings(session_token: str) -> ResponseModel:
-    user_id = get_session_user_id(session_token)
+async def list_avatar_trainings(session_token: str) -> ResponseModel:
+    user_id = await db_async.get_session_user_id(session_token)
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid or expired session")
-    trainings = get_avatar_trainings(user_id)
+    trainings = await db_async.get_avatar_trainings(user_id)
     return ResponseModel(status_code=200, detail=trainings)
 
 
@@ -17,7 +17,7 @@ redis_socket_timeout = 30
 
 # AWS deployment decision: use SQS as the broker and ElastiCache Redis as the result backend.
 # Set CELERY_BROKER_URL=sqs:// and CELERY_RESULT_BACKEND=redis://<elasticache-host>:6379/1 in AWS secrets.
-# celery-once still requires CELERY_BROKER_URL to point at Redis for lock tracking (see my_celery.py).
+# celery-once locks are kept in that Redis too when the broker is SQS (see my_celery.py).
 result_backend = os.getenv('CELERY_RESULT_BACKEND', f'redis://redis:{REDIS_PORT}/1')
 
 # The Redis backend visibility timout
@@ -75,35 +75,104 @@ def get_aws_sqs(queue_name: str,
 task_create_missing_queues = True
 
 # ---------------------------------------------------------------------------
-# Queue definitions
+# Queue topology
 # ---------------------------------------------------------------------------
-# 'celery'   — default queue consumed by the main worker (scheduler tasks, API
-#               calls, content plan, Stripe sync, etc.).
-# 'selenium' — consumed exclusively by the selenium worker (concurrency=1).
-#               All tasks that open a Chrome session must route here so only
-#               one browser is used at a time.
-task_queues = (
-    Queue('celery'),
-    Queue('selenium'),
-)
+# One queue per resource class, listed from most to least time-critical. Each class gets
+# its own worker (compose/local/celery/worker/start-queue) running the pool that suits the
+# work: threads for I/O-bound queues whose tasks mostly wait on HTTP (LinkedIn REST, LLM
+# APIs), prefork for CPU/memory-heavy ones (video download + C2PA signing, Chrome).
+#
+# 'publish'     — due posts and the scheduler that dispatches them; never behind batch work.
+# 'selenium'    — every task that opens a Chrome session; one browser at a time.
+# 'celery'      — default queue for anything not listed below.
+# 'llm'         — content planning and text generation.
+# 'media'       — image/video generation, Runway polling, downloads, signing.
+# 'maintenance' — cleanup, Stripe/credit reconciliation, db maintenance.
+QUEUE_TOPOLOGY = {
+    'publish': {'pool': 'threads', 'concurrency': 4},
+    'selenium': {'pool': 'prefork', 'concurrency': 1},
+    'celery': {'pool': 'prefork', 'concurrency': 2},
+    'llm': {'pool': 'threads', 'concurrency': 8},
+    'media': {'pool': 'prefork', 'concurrency': 2},
+    'maintenance': {'pool': 'prefork', 'concurrency': 1},
+}
+
+# Routing table: queue -> the tasks it owns. Unlisted tasks go to task_default_queue.
+TASK_QUEUE_ROUTES = {
+    'publish': (
+        'cqc_lem.app.run_automation.post_to_linkedin',
+        'cqc_lem.app.run_scheduler.auto_check_scheduled_posts',
+        'cqc_lem.app.run_scheduler.dispatch_delayed_tasks',
+        'cqc_lem.app.run_scheduler.resume_engagement_sessions',
+    ),
+    'selenium': (
+        'cqc_lem.app.run_automation.comment_on_post',
+        'cqc_lem.app.run_automation.automate_commenting',
+        'cqc_lem.app.run_automation.automate_reply_commenting',
+        'cqc_lem.app.run_automation.automate_appreciation_dms_for_user',
+        'cqc_lem.app.run_automation.automate_profile_viewer_engagement',
+        'cqc_lem.app.run_automation.engage_with_profile_viewer',
+        'cqc_lem.app.run_automation.send_private_dm',
+        'cqc_lem.app.run_automation.invite_to_connect',
+        'cqc_lem.app.run_automation.update_stale_profile',
+        'cqc_lem.app.run_automation.automate_invites_to_company_page_for_user',
+    ),
+    'llm': (
+        'cqc_lem.app.run_content_plan.auto_generate_content',
+        'cqc_lem.app.run_content_plan.plan_content_for_user',
+        'cqc_lem.app.run_content_plan.auto_create_weekly_content',
+        'cqc_lem.app.run_content_plan.report_weekly_content',
+    ),
+    'media': (
+        'cqc_lem.app.run_content_plan.create_weekly_post',
+        'cqc_lem.app.run_content_plan.regenerate_post_video_task',
+        'cqc_lem.app.run_content_plan.regenerate_post_carousel_task',
+    ),
+    'maintenance': (
+        'cqc_lem.app.run_scheduler.auto_clean_stale_invites',
+        'cqc_lem.app.run_scheduler.auto_clean_stale_profiles',
+        'cqc_lem.app.run_scheduler.auto_clean_old_videos',
+        'cqc_lem.app.run_scheduler.sync_stripe_subscriptions',
+        'cqc_lem.app.run_scheduler.auto_reconcile_credit_balances',
+        'cqc_lem.app.run_scheduler.auto_db_maintenance',
+        'cqc_lem.app.run_scheduler.auto_backfill_missing_assets',
+        'cqc_lem.app.run_scheduler.reap_once_locks',
+        'cqc_lem.app.run_automation.clean_stale_invites',
+    ),
+}
+
+task_queues = tuple(Queue(name) for name in QUEUE_TOPOLOGY)
 task_default_queue = 'celery'
 
-# Explicit routing for every Selenium-backed task.  The queue='selenium'
-# parameter on each task decorator already handles routing at dispatch time;
-# this mapping is a belt-and-suspenders safety net for any send() call that
-# doesn't pass queue= explicitly.
+# Tasks that pass queue= explicitly (the Selenium ones) agree with this table; it also
+# covers send_task() and any call that does not.
 task_routes = {
-    'cqc_lem.app.run_automation.automate_commenting': {'queue': 'selenium'},
-    'cqc_lem.app.run_automation.automate_reply_commenting': {'queue': 'selenium'},
-    'cqc_lem.app.run_automation.automate_appreciation_dms_for_user': {'queue': 'selenium'},
-    'cqc_lem.app.run_automation.automate_profile_viewer_engagement': {'queue': 'selenium'},
-    'cqc_lem.app.run_automation.engage_with_profile_viewer': {'queue': 'selenium'},
-    'cqc_lem.app.run_automation.send_private_dm': {'queue': 'selenium'},
-    'cqc_lem.app.run_automation.invite_to_connect': {'queue': 'selenium'},
-    'cqc_lem.app.run_automation.update_stale_profile': {'queue': 'selenium'},
-    'cqc_lem.app.run_automation.automate_invites_to_company_page_for_user': {'queue': 'selenium'},
+    task_name: {'queue': queue}
+    for queue, task_names in TASK_QUEUE_ROUTES.items()
+    for task_name in task_names
 }
 
+# A worker consuming several queues (e.g. a single all-in-one worker) drains them in the
+# order given to --queues instead of round-robin, so publish work is always taken first.
+# Per-message priorities are not used: on Redis they split each queue into several lists.
+broker_transport_options['queue_order_strategy'] = 'priority'
+
+
+def worker_options(queues: str) -> list[str]:
+    """Worker CLI options for a comma-separated list of queues (most critical first).
+
+    Threads only when every queue is I/O-bound; concurrency is the largest configured for
+    a queue of the chosen pool, so a thread count (llm's 8) never becomes a process count.
+    ``CELERY_WORKER_POOL`` / ``CELERY_WORKER_CONCURRENCY`` override either.
+    """
+    names = [q.strip() for q in queues.split(',') if q.strip()] or [task_default_queue]
+    topology = [QUEUE_TOPOLOGY.get(q, QUEUE_TOPOLOGY[task_default_queue]) for q in names]
+    pool = 'threads' if all(t['pool'] == 'threads' for t in topology) else 'prefork'
+    concurrency = max(t['concurrency'] for t in topology if t['pool'] == pool)
+    pool = os.getenv('CELERY_WORKER_POOL') or pool
+    concurrency = os.getenv('CELERY_WORKER_CONCURRENCY') or concurrency
+    return [f'--pool={pool}', f'--concurrency={concurrency}', f'--queues={",".join(names)}']
+
 
 # Addition setting for AWS SQS Usage
 
@@ -154,3 +223,10 @@ def setup_aws_sqs_config():
         except Exception as e:
             print(f"Error getting AWS session: {e}")
             session = None
+
+
+if __name__ == '__main__':
+    # Used by the worker start scripts: python -m cqc_lem.app.celeryconfig publish,celery
+    import sys
+    options = worker_options(sys.argv[1] if len(sys.argv) > 1 else task_default_queue)
+    print(' '.join(options))  # noqa: T201 — stdout is read by the start script
@@ -1,10 +1,13 @@
+import socket
 import time as _time
 from datetime import datetime, timedelta
+from typing import Optional
 
 from celery import Celery
 from celery import current_app
 from celery.schedules import crontab
-from celery.signals import worker_process_init, task_received, task_success, task_sent, task_prerun, task_postrun
+from celery.signals import worker_process_init, task_prerun, task_postrun, worker_process_shutdown, \
+    before_task_publish, worker_ready, worker_shutdown, beat_init, worker_init
 from celery.app.control import Inspect
 
 from cqc_lem.app import celeryconfig
@@ -12,6 +15,10 @@ from cqc_lem.app.celeryconfig import broker_url
 from cqc_lem.utilities.env_constants import CODE_TRACING, AWS_REGION
 from cqc_lem.utilities.jaeger_tracer_helper import get_jaeger_tracer
 from cqc_lem.utilities.logger import myprint, logger
+from cqc_lem.utilities import db_metrics, queue_metrics
+from cqc_lem.utilities.delayed_dispatch import poll_seconds, get_delayed_dispatch_stats
+from cqc_lem.utilities.selenium_fair_share import note_queued
+from cqc_lem.utilities.db import flush_logs
 from cqc_lem.utilities.observability import track_task
 from cqc_lem.utilities.utils import get_cloudwatch_client
 
@@ -40,14 +47,14 @@ app.autodiscover_tasks(['cqc_lem'])
 # Setup Celery Once for task that should only be queued once per parameters sent
 
 app.conf.ONCE = {
-    # celery-once uses Redis for deduplication lock tracking even when the Celery broker is SQS.
-    # On AWS, point CELERY_BROKER_URL at the ElastiCache Redis instance (not SQS) so celery-once works.
-    'backend': 'celery_once.backends.Redis',
+    # Locks live in the shared Redis (utilities.redis_client: the broker when it is Redis, else
+    # the result backend), so deduplication works when the Celery broker is SQS. They never
+    # block: a duplicate apply_async returns the queued task's result at once instead of
+    # stalling the caller (utilities.once_locks).
+    'backend': 'cqc_lem.utilities.once_locks.RedisOnceBackend',
     'settings': {
-        'url': broker_url,
         'default_timeout': 60 * 60,
-        'blocking': True,
-        'blocking_timeout': 30,
+        'blocking': False,
     }
 }
 
@@ -68,6 +75,24 @@ app.conf.update(
             # min late, and any non-:00/:30 scheduled time could slip).
             'schedule': crontab(minute='*/10')
         },
+        'dispatch-delayed-tasks': {
+            'task': 'cqc_lem.app.run_scheduler.dispatch_delayed_tasks',
+            # Moves post/pre-post tasks parked in Redis to the queue once due, instead of
+            # holding them in worker memory as Celery ETA tasks (utilities.delayed_dispatch)
+            'schedule': timedelta(seconds=poll_seconds())
+        },
+        'resume-engagement-sessions': {
+            'task': 'cqc_lem.app.run_scheduler.resume_engagement_sessions',
+            # Picks up commenting / reply / viewer / DM loops from their Redis checkpoint
+            # when the worker running them died (utilities.engagement_session)
+            'schedule': timedelta(minutes=5)
+        },
+        'reap-once-locks': {
+            'task': 'cqc_lem.app.run_scheduler.reap_once_locks',
+            # Releases task locks whose run already finished (e.g. its worker process was
+            # killed) so duplicates stop coalescing into it (utilities.once_locks)
+            'schedule': timedelta(minutes=5)
+        },
         'generate-content-plan': {
             'task': 'cqc_lem.app.run_content_plan.auto_generate_content',
             'schedule': crontab(hour='1', minute='0')  # Run every day at 1:00 AM
@@ -108,6 +133,14 @@ app.conf.update(
             'task': 'cqc_lem.app.run_scheduler.sync_stripe_subscriptions',
             'schedule': crontab(hour='6', minute='0')  # Daily at 6:00 AM — safety-net for missed webhooks
         },
+        'reconcile-credit-balances': {
+            'task': 'cqc_lem.app.run_scheduler.auto_reconcile_credit_balances',
+            'schedule': crontab(hour='4', minute='30')  # Daily at 4:30 AM — rebuild balances from the ledgers
+        },
+        'db-maintenance': {
+            'task': 'cqc_lem.app.run_scheduler.auto_db_maintenance',
+            'schedule': crontab(hour='4', minute='45')  # Daily at 4:45 AM — logs partitions/archive, expired sessions
+        },
 
     }
 )
@@ -148,8 +181,9 @@ def init_celery_tracing(*args, **kwargs):
         myprint("Tracing is disabled")
 
 
-def get_queue_metric(name_space: str = 'cqc-lem/celery_queue/celery', metric_name: str = 'QueueLength',
-                     period: int = 60, time_delta_minutes: int = 1, statistics: str = "Maximum") -> int:
+def get_queue_metric(name_space: str = queue_metrics.NAMESPACE, metric_name: str = 'QueueLength',
+                     period: int = 60, time_delta_minutes: int = 1, statistics: str = "Maximum",
+                     queue_name: str = 'celery') -> int:
 
     if not AWS_REGION:
         return 0
@@ -160,6 +194,7 @@ def get_queue_metric(name_space: str = 'cqc-lem/celery_queue/celery', metric_nam
         response = cloudwatch.get_metric_statistics(
             Namespace=name_space,
             MetricName=metric_name,
+            Dimensions=[{'Name': 'QueueName', 'Value': queue_name}],
             StartTime=datetime.now() - timedelta(minutes=time_delta_minutes),
             EndTime=datetime.now(),
             Period=period,
@@ -189,8 +224,23 @@ def configure_posthog_for_worker(**kwargs) -> None:
 
 
 @task_prerun.connect(weak=False)
-def on_task_prerun(task_id: str = None, task=None, **kwargs) -> None:
+def on_task_prerun(task_id: str = None, task=None, kwargs: dict = None, **extra) -> None:
     _task_start_times[task_id] = _time.time()
+    if getattr(task, 'queue', None) == 'selenium' and (kwargs or {}).get('user_id') is not None:
+        note_queued(kwargs['user_id'], -1)
+
+
+@before_task_publish.connect(weak=False)
+def count_queued_selenium_task(body=None, routing_key: str = None, **kwargs) -> None:
+    """Per-user count of browser tasks waiting in the selenium queue (selenium_fair_share)."""
+    if routing_key != 'selenium':
+        return
+    try:
+        task_kwargs = body[1]  # message protocol 2: (args, kwargs, embed)
+    except (TypeError, IndexError, KeyError):
+        return
+    if isinstance(task_kwargs, dict) and task_kwargs.get('user_id') is not None:
+        note_queued(task_kwargs['user_id'])
 
 
 @task_postrun.connect(weak=False)
@@ -202,59 +252,96 @@ def on_task_postrun(task_id: str = None, task=None, state: str = None, **kwargs)
         success=(state == "SUCCESS"),
         state=state or "UNKNOWN",
     )
+    # Activity logs are buffered in-process; persist them before the worker picks up
+    # the next task (or gets recycled by worker_max_tasks_per_child).
+    flush_logs()
+    # Per-function db latency goes out in batches (DB_METRICS_PUBLISH_SECONDS), not per task
+    db_metrics.maybe_publish()
 
 
-@task_sent.connect
-@task_received.connect
-@task_success.connect
-def update_queue_length_metric(sender=None, headers=None, **kwargs) -> int:
-    """
-    Get the current queue length from Redis broker and push to CloudWatch
-    """
-    # Use the global app
-    global app
+@worker_process_shutdown.connect(weak=False)
+def flush_logs_on_shutdown(**kwargs) -> None:
+    flush_logs()
+    db_metrics.maybe_publish(force=True, background=False)
 
-    base_namespace = "cqc-lem/celery_queue/"
-    queue_name = getattr(sender, 'queue', 'celery')
-    name_space = base_namespace + queue_name
 
-    # For Redis broker, get the actual Redis connection
-    with app.pool.acquire(block=True) as conn:
-        redis = conn.default_channel.client
+_forking_pool = True
 
-        # Get length of the main celery queue
-        total_tasks = redis.llen(queue_name)
-        #print(f"List length for {queue_name}: {total_tasks}")
 
-    #print(f"Total tasks found: {total_tasks}")
+@worker_init.connect(weak=False)
+def init_non_forking_pool(sender=None, **kwargs) -> None:
+    """threads/solo workers (the I/O-bound queues in celeryconfig.QUEUE_TOPOLOGY) run tasks
+    in the main process, where worker_process_init/shutdown never fire; run those hooks here."""
+    global _forking_pool
+    pool = str(getattr(sender, 'pool_cls', None) or 'prefork').lower()
+    _forking_pool = 'prefork' in pool or 'processes' in pool
+    if not _forking_pool:
+        init_celery_tracing()
+        configure_posthog_for_worker()
 
 
-    if AWS_REGION:
-        try:
-            cloudwatch = get_cloudwatch_client(AWS_REGION)
-
-            # Push metric to CloudWatch
-            cloudwatch.put_metric_data(
-                Namespace=name_space,
-                MetricData=[
-                    {
-                        'MetricName': 'QueueLength',
-                        'Value': total_tasks,
-                        'Unit': 'Count',
-                        'Timestamp': datetime.utcnow(),
-                        'Dimensions': [
-                            {
-                                'Name': 'QueueName',
-                                'Value': 'celery'
-                            }
-                        ]
-                    }
-                ]
-            )
-            logger.info(
-                f"Successfully published metric to CloudWatch: Queue length [{queue_name}]: {total_tasks}")
-
-        except Exception as e:
-            logger.error(f"Failed to publish metric: {str(e)}")
-
-    return total_tasks
\ No newline at end of file
+_queue_sampler: Optional[queue_metrics.QueueSampler] = None
+
+
+def sample_queue_depths() -> dict:
+    """One reading of the shared backlog: broker lengths of every queue in a single pipeline,
+    and the delayed-dispatch backlog. Sampled by beat only, so each is reported once."""
+    queues = [q.name for q in celeryconfig.task_queues]
+    sample = {name: {} for name in queues}
+
+    if broker_url.startswith(('redis://', 'rediss://')):
+        with app.pool.acquire(block=True) as conn:
+            pipe = conn.default_channel.client.pipeline()
+            for name in queues:
+                pipe.llen(name)
+            for name, length in zip(queues, pipe.execute()):
+                sample[name]['QueueLength'] = length
+
+    sample['delayed'] = {'DelayedTasks': get_delayed_dispatch_stats()['pending']}
+    return sample
+
+
+def sample_worker_state() -> dict:
+    """The tasks this worker holds reserved / waiting on an ETA / executing, per queue."""
+    from celery.worker import state
+
+    def _queue_of(request) -> str:
+        return (request.delivery_info or {}).get('routing_key') or celeryconfig.task_default_queue
+
+    sample = {q.name: {'ReservedTasks': 0, 'EtaTasks': 0, 'ActiveTasks': 0} for q in celeryconfig.task_queues}
+    for request in list(state.reserved_requests):
+        counts = sample.setdefault(_queue_of(request), {'ReservedTasks': 0, 'EtaTasks': 0, 'ActiveTasks': 0})
+        counts['EtaTasks' if request.eta else 'ReservedTasks'] += 1
+    for request in list(state.active_requests):
+        counts = sample.setdefault(_queue_of(request), {'ReservedTasks': 0, 'EtaTasks': 0, 'ActiveTasks': 0})
+        counts['ActiveTasks'] += 1
+    return sample
+
+
+def _start_queue_sampler(sample, dimensions: Optional[dict] = None) -> None:
+    global _queue_sampler
+    if _queue_sampler is None:
+        _queue_sampler = queue_metrics.QueueSampler(sample, aws_region=AWS_REGION, dimensions=dimensions)
+        _queue_sampler.start()
+
+
+@worker_ready.connect(weak=False)
+def start_worker_queue_sampler(sender=None, **kwargs) -> None:
+    # Per-worker state, one series per worker; the broker lengths come from beat
+    hostname = getattr(sender, 'hostname', None) or socket.gethostname()
+    _start_queue_sampler(sample_worker_state, {'Worker': hostname})
+
+
+@beat_init.connect(weak=False)
+def start_beat_queue_sampler(**kwargs) -> None:
+    _start_queue_sampler(sample_queue_depths)
+
+
+@worker_shutdown.connect(weak=False)
+def stop_queue_sampler(**kwargs) -> None:
+    global _queue_sampler
+    if _queue_sampler is not None:
+        _queue_sampler.stop()
+        _queue_sampler = None
+    if not _forking_pool:
+        flush_logs_on_shutdown()
@@ -1,4 +1,3 @@
-import inspect
 import json
 import random
 import sys
@@ -8,7 +7,6 @@ from datetime import datetime
 from typing import List, Tuple
 from urllib.parse import urlparse
 
-from celery_once import QueueOnce
 from cqc_lem.app.my_celery import app as shared_task
 from cqc_lem.utilities.ai.ai_helper import generate_ai_response, get_ai_message_refinement, summarize_recent_activity, \
     ai_check_message_history
@@ -17,12 +15,16 @@ from cqc_lem.utilities.db import get_user_password_pair_by_id, get_user_id, inse
     LogResultType, has_user_commented_on_post_url, get_post_url_from_log_for_user, get_post_message_from_log_for_user, \
     has_engaged_url_with_x_days, get_post_content, get_post_video_url, update_db_post_status, PostStatus, PostType, \
     get_dm_history_for_profile, get_post_status, get_user_blog_url, get_post_type, get_carousel_slides
+from cqc_lem.utilities.engagement_session import EngagementSession
 from cqc_lem.utilities.linkedin.company_page_inviter import automate_invitations
 from cqc_lem.utilities.linkedin.helper import login_to_linkedin, get_my_profile, get_linkedin_profile_from_url, \
     load_profile_for_user
+from cqc_lem.utilities.linkedin.pacing import acquire_token, paced
 from cqc_lem.utilities.linkedin.poster import share_on_linkedin, share_carousel_on_linkedin
 from cqc_lem.utilities.linkedin.profile import LinkedInProfile
 from cqc_lem.utilities.logger import myprint, log_error, log_info, log_warning
+from cqc_lem.utilities.once_locks import QueueOnce
+from cqc_lem.utilities.selenium_fair_share import fair_share_slot
 from cqc_lem.utilities.selenium_util import click_element_wait_retry, \
     get_element_wait_retry, get_elements_as_list_wait_stale, getText, close_tab, get_driver_wait_pair, quit_gracefully, \
     wait_for_ajax
@@ -235,7 +237,9 @@ def simulate_typing(driver: WebDriver, editable_element: WebElement, text, allow
 
 
 @shared_task.task(bind=True, base=QueueOnce, once={'graceful': True, 'keys': ['user_id', 'post_link']},
-                  reject_on_worker_lost=True, rate_limit='4/m')
+                  reject_on_worker_lost=True, rate_limit='4/m', queue='selenium')
+@paced('comment')
+@fair_share_slot
 def comment_on_post(self, user_id: int, post_link: str, comment_text: str):
     """Post a comment to the given post link"""
 
@@ -244,7 +248,7 @@ def comment_on_post(self, user_id: int, post_link: str, comment_text: str):
         myprint("User has already commented on this post. Skipping...")
         return "User has already commented on this post. Skipping..."
 
-    driver, wait = get_driver_wait_pair(session_name='Post Comment')
+    driver, wait = get_driver_wait_pair(session_name='Post Comment', user_id=user_id)
 
     try:
 
@@ -398,311 +402,314 @@ def check_commented(driver, wait, user_id: int = None, post_url: str = None):
 
 @shared_task.task(bind=True, base=QueueOnce, once={'graceful': True, 'unlock_before_run': True, 'keys': ['user_id']},
                   queue='selenium')
-def automate_commenting(self, user_id: int, loop_for_duration: int = None, future_forward: int = 60):
+@paced('comment', spend=False)
+@fair_share_slot
+def automate_commenting(self, user_id: int, loop_for_duration: int = None, future_forward: int = 60,
+                        session: str = None):
     global stop_all_thread
 
     myprint("Starting Automate Commenting Thread...")
 
+    engagement = EngagementSession.open(self, "commenting", {
+        'user_id': user_id, 'loop_for_duration': loop_for_duration, 'future_forward': future_forward,
+        'session': session})
+    if engagement is None:
+        return "Automate Commenting session continues elsewhere"
+
     try:
         driver, wait, user_email, my_profile = get_current_profile(user_id=user_id, session_name="Auto Commenting")
     except Exception as e:
         log_error("Error while getting profile for auto commenting", exc=e, user_id=user_id, task_name="automate_commenting")
+        engagement.finish()
         return f"Failed to start auto commenting: {e}"
 
     result = "Automate Commenting Task Started"
 
     try:
+        result = engagement.run(lambda: _comment_on_feed(driver, wait, my_profile, user_id, engagement.deadline,
+                                                         reload=engagement.iteration > 0))
+    except Exception as e:
+        log_error("Error while automating commenting", exc=e, user_id=user_id, task_name="automate_commenting")
+        result = f"Error while automating commenting: {e}"
+    finally:
+        quit_gracefully(driver)  # Close the driver
 
-        navigate_to_feed(driver, wait)
-
-        start_time = datetime.now()
-
-        # Get 10 posts from the feed
-        posts = get_feed_posts(driver, wait, num_posts=10)
-
-        current_tab = driver.current_window_handle
-        handles = driver.window_handles
-
-        post_commented_count = 0
+    return result
 
-        for post in posts:
-            # break if it has been loop_for_duration seconds since the start time
-            if loop_for_duration:
-                elapsed_time = datetime.now() - start_time
-                if elapsed_time.total_seconds() >= loop_for_duration:
-                    myprint("Loop duration reached. Stopping Automate Commenting thread...")
-                    break
 
-            # Switch back to tab
-            driver.switch_to.window(current_tab)
+def _comment_on_feed(driver, wait, my_profile: LinkedInProfile, user_id: int, deadline: float = None,
+                     reload: bool = False) -> str:
+    """One commenting pass: comment on up to 10 feed posts, stopping early at ``deadline`` or
+    when the comment budget runs out."""
+    if reload:
+        # A later pass in the same browser session: reload the feed, paced like any feed load
+        delay = acquire_token("feed", user_id)
+        if delay:
+            return f"Feed reload paced; next token in {delay:.0f}s"
+        driver.refresh()
+    navigate_to_feed(driver, wait)
 
-            post_link = post['link']
-            myprint(f"Post Link: {post_link}")
+    # Get 10 posts from the feed
+    posts = get_feed_posts(driver, wait, num_posts=10)
 
-            # Wait for the new window or tab
-            driver.switch_to.new_window('tab')
-            wait.until(EC.new_window_is_opened(handles))
+    current_tab = driver.current_window_handle
+    handles = driver.window_handles
 
-            # Generate and post comment
-            successful = generate_and_post_comment(driver, wait, post_link, my_profile)
+    post_commented_count = 0
 
-            if successful:
-                post_commented_count += 1
+    for post in posts:
+        # break once the session's time budget is spent
+        if deadline and time.time() >= deadline:
+            myprint("Loop duration reached. Stopping Automate Commenting thread...")
+            break
 
-            # Close tab when done
-            close_tab(driver)
+        delay = acquire_token("comment", user_id)
+        if delay:
+            myprint(f"Comment budget spent; next token in {delay:.0f}s. Ending this pass...")
+            break
 
         # Switch back to tab
         driver.switch_to.window(current_tab)
 
-        result = f"Automate Commenting Task Completed. Commented on {post_commented_count} posts."
+        post_link = post['link']
+        myprint(f"Post Link: {post_link}")
 
-        # Re-schedule the task in the queue for the future
-        if loop_for_duration:
-            elapsed_time = datetime.now() - start_time
-            new_loop_for_duration = round(loop_for_duration - elapsed_time.total_seconds() - future_forward)
-            frame = inspect.currentframe()
-            current_function_name = frame.f_code.co_name
-            args, _, _, values = inspect.getargvalues(frame)
-            kwargs = {arg: values[arg] for arg in args}
-            # myprint(f"{current_function_name} parameters: {kwargs}")
+        # Wait for the new window or tab
+        driver.switch_to.new_window('tab')
+        wait.until(EC.new_window_is_opened(handles))
 
-            if new_loop_for_duration < 0:
-                myprint(f"Loop duration reached. Stopping {current_function_name} task...")
-            else:
-                # Change the value of the loop_for_duration parameter
-                kwargs['loop_for_duration'] = new_loop_for_duration
-                # Add our function call back to the task queue
-                myprint(f"Adding {current_function_name} back to queue for {future_forward} seconds in the future...")
-                # Remove 'self' from kwargs if it exists
-                if 'self' in kwargs:
-                    del kwargs['self']
-                # Call self again in the future
-                globals()[current_function_name].apply_async(kwargs=kwargs, countdown=future_forward)
+        # Generate and post comment
+        successful = generate_and_post_comment(driver, wait, post_link, my_profile)
 
-    except Exception as e:
-        log_error("Error while automating commenting", exc=e, user_id=user_id, task_name="automate_commenting")
-        result = f"Error while automating commenting: {e}"
-    finally:
-        quit_gracefully(driver)  # Close the driver
+        if successful:
+            post_commented_count += 1
 
-    return result
+        # Close tab when done
+        close_tab(driver)
+
+    # Switch back to tab
+    driver.switch_to.window(current_tab)
+
+    return f"Automate Commenting Task Completed. Commented on {post_commented_count} posts."
 
 
 @shared_task.task(bind=True, base=QueueOnce,
                   once={'graceful': True, 'unlock_before_run': True, 'keys': ['user_id', 'post_id']},
                   queue='selenium')
-def automate_reply_commenting(self, user_id: int, post_id: int, loop_for_duration: int = 60, future_forward=0):
+@paced('comment', spend=False)
+@fair_share_slot
+def automate_reply_commenting(self, user_id: int, post_id: int, loop_for_duration: int = 60, future_forward=0,
+                              session: str = None):
     """Reply to recent comments left on the post recently posted"""
 
+    engagement = EngagementSession.open(self, "reply_commenting", {
+        'user_id': user_id, 'post_id': post_id, 'loop_for_duration': loop_for_duration,
+        'future_forward': future_forward, 'session': session}, scope=post_id)
+    if engagement is None:
+        return "Reply Commenting session continues elsewhere"
+
     try:
         driver, wait, user_email, my_profile = get_current_profile(user_id=user_id, session_name="Reply to Comments")
     except Exception as e:
         log_error("Error while getting profile for reply commenting", exc=e, user_id=user_id, task_name="automate_reply_commenting")
+        engagement.finish()
         return f"Failed to start reply commenting: {e}"
 
     result = "Automate Reply Commenting Task Started"
 
     try:
+        result = engagement.run(lambda: _reply_to_post_comments(driver, wait, my_profile, user_id, post_id),
+                                next_wait=_reply_comment_backoff)
+    except Exception as e:
+        log_error("Error while replying to comments", exc=e, user_id=user_id, post_id=post_id, task_name="automate_reply_commenting")
+        result = f"Error while replying to comments: {e}"
+    finally:
+        quit_gracefully(driver)
 
-        start_time = datetime.now()
-
-        myprint(f"Replying to Comments of Post ID:{post_id} ...")
-
-        # Use the user id and the post id to get the post_url from the database
-        post_url = get_post_url_from_log_for_user(user_id, post_id)
-
-        # Get the message content of the post
-        post_message = get_post_message_from_log_for_user(user_id, post_id)
+    return result
 
-        if post_url:
-            # Navigate to the Post
-            if driver.current_url != post_url:
-                driver.get(post_url)
 
-            # If load more comments button exists click it until its gone
-            while True:
-                load_more_comments_button = click_element_wait_retry(driver, wait,
-                                                                     '//button[contains(@class,"load-more-comments")]',
-                                                                     "Finding Load More Comments Button",
-                                                                     use_action_chain=True,
-                                                                     max_retry=0,
-                                                                     element_always_expected=False)
-                if load_more_comments_button:
-                    myprint("Loading More Comments....")
-                    time.sleep(2)
-                else:
-                    break
+# Wait before each reply pass; ``future_forward`` is the index into this list
+_REPLY_BACKOFF_SECONDS = [0, 60 * 5, 60 * 10, 60 * 15, 60 * 30, 60 * 60]
 
-            try:
 
-                # Get all the comments
-                comments = get_elements_as_list_wait_stale(wait,
-                                                           "//div[contains(@class,'comments-comment-list__container')]/article[contains(@class,'comments-comment-entity')]",
-                                                           "Finding Comments",
-                                                           max_retry=0,
-                                                           )
-            except Exception as e:
-                log_warning("Error while finding comments", exc=e, user_id=user_id)
-                comments = []
-
-            # Print how many comments found
-            myprint(f"Comments Found: {len(comments)}")
-            result = f"Comments Found: {len(comments)}"
-
-            # Get the unique_url_name after "in/" and before / or end or profile url
-            path = urlparse(str(my_profile.profile_url)).path
-            unique_url_name = path.split("/")[2] if len(path.split("/")) > 2 else None
-            # myprint(f"Unique URL Name: {unique_url_name}")
-
-            comments_replied_count = 0
-
-            # For each comment element see if we have already replied; if so skip it
-            for comment in comments:
-                # Get the comment text
-                comment_text = getText(comment.find_element(By.XPATH,
-                                                            './/span[contains(@class,"comments-comment-item__main-content")][1]'))
-
-                # Search the comment element using xpath for a child span that contains the text "Author"
-                author_element = get_element_wait_retry(driver, wait,
-                                                        f'.//a[contains(@href,"{unique_url_name}") and contains(@aria-label,"View")]',
-                                                        "Finding Author Element", element_always_expected=False,
-                                                        max_try=0,
-                                                        parent_element=comment)
-
-                if len(comment_text) > 75:
-                    short_comment_text = comment_text[:75]
-                else:
-                    short_comment_text = comment_text
-                if author_element:
-                    myprint(f"We already replied to this comment: {short_comment_text}...")
-                    continue
-                else:
-                    myprint(f"Responding to this comment: {short_comment_text}...")
+def _reply_comment_backoff(engagement: EngagementSession) -> float:
+    """Step further back between passes while more than 30 minutes of budget is left."""
+    step = int(engagement.kwargs.get('future_forward') or 0)
+    if engagement.remaining() > 60 * 30:
+        step += 1
+    step = min(step, len(_REPLY_BACKOFF_SECONDS) - 1)
+    engagement.kwargs['future_forward'] = step
+    return _REPLY_BACKOFF_SECONDS[step]
 
-                    # Use the context of the post, and the comment to generate a response
-                    response = generate_ai_response(post_message, my_profile, post_comment=comment_text)
-                    myprint(f"AI Generated Response to Comment: {response}")
 
-                    try:
+def _reply_to_post_comments(driver, wait, my_profile: LinkedInProfile, user_id: int, post_id: int) -> str:
+    """One reply pass: answer the comments on the post that we have not replied to yet."""
+    myprint(f"Replying to Comments of Post ID:{post_id} ...")
 
-                        # Find and click the Reply Button
-                        reply_button = click_element_wait_retry(driver, wait,
-                                                                './/button[contains(@class,"reply")][1]',
-                                                                "Finding Reply Button",
-                                                                use_action_chain=True,
-                                                                parent_element=comment)
+    # Use the user id and the post id to get the post_url from the database
+    post_url = get_post_url_from_log_for_user(user_id, post_id)
 
-                        # Find the text box (should be the element that now has focus)
-                        text_box = driver.switch_to.active_element
+    # Get the message content of the post
+    post_message = get_post_message_from_log_for_user(user_id, post_id)
 
-                        # Simulate superfast typing the comment in the text box
-                        simulate_typing(driver, text_box, response, allow_pauses=False)
+    if post_url:
+        # Navigate to the Post
+        if driver.current_url != post_url:
+            driver.get(post_url)
+        elif acquire_token("feed", user_id):
+            return "Post reload paced; waiting for the next feed-load token"
+        else:
+            driver.refresh()  # A later pass in the same browser session
+
+        # If load more comments button exists click it until its gone
+        while True:
+            load_more_comments_button = click_element_wait_retry(driver, wait,
+                                                                 '//button[contains(@class,"load-more-comments")]',
+                                                                 "Finding Load More Comments Button",
+                                                                 use_action_chain=True,
+                                                                 max_retry=0,
+                                                                 element_always_expected=False)
+            if load_more_comments_button:
+                myprint("Loading More Comments....")
+                time.sleep(2)
+            else:
+                break
 
-                        # Sleep so post button shows up
-                        time.sleep(2)
+        try:
 
-                        # Click the send button
-                        # Find the parent element of the current text_box element where the parent element is a div with a class containing "comments-comment-texteditor"
-                        parent_element = text_box.find_element(By.XPATH,
-                                                               './ancestor::form')
+            # Get all the comments
+            comments = get_elements_as_list_wait_stale(wait,
+                                                       "//div[contains(@class,'comments-comment-list__container')]/article[contains(@class,'comments-comment-entity')]",
+                                                       "Finding Comments",
+                                                       max_retry=0,
+                                                       )
+        except Exception as e:
+            log_warning("Error while finding comments", exc=e, user_id=user_id)
+            comments = []
+
+        # Print how many comments found
+        myprint(f"Comments Found: {len(comments)}")
+        result = f"Comments Found: {len(comments)}"
+
+        # Get the unique_url_name after "in/" and before / or end or profile url
+        path = urlparse(str(my_profile.profile_url)).path
+        unique_url_name = path.split("/")[2] if len(path.split("/")) > 2 else None
+        # myprint(f"Unique URL Name: {unique_url_name}")
+
+        comments_replied_count = 0
+
+        # For each comment element see if we have already replied; if so skip it
+        for comment in comments:
+            # Get the comment text
+            comment_text = getText(comment.find_element(By.XPATH,
+                                                        './/span[contains(@class,"comments-comment-item__main-content")][1]'))
+
+            # Search the comment element using xpath for a child span that contains the text "Author"
+            author_element = get_element_wait_retry(driver, wait,
+                                                    f'.//a[contains(@href,"{unique_url_name}") and contains(@aria-label,"View")]',
+                                                    "Finding Author Element", element_always_expected=False,
+                                                    max_try=0,
+                                                    parent_element=comment)
+
+            if len(comment_text) > 75:
+                short_comment_text = comment_text[:75]
+            else:
+                short_comment_text = comment_text
+            if author_element:
+                myprint(f"We already replied to this comment: {short_comment_text}...")
+                continue
+            else:
+                delay = acquire_token("comment", user_id)
+                if delay:
+                    myprint(f"Comment budget spent; next token in {delay:.0f}s. Ending this pass...")
+                    break
+                myprint(f"Responding to this comment: {short_comment_text}...")
 
-                        # From this parent element, find the child button element with a span element containing the text "Reply"
-                        send_reply_button = click_element_wait_retry(driver, wait,
-                                                                     './/button[contains(@class, "submit")]',
-                                                                     "Finding Send Reply Button",
-                                                                     parent_element=parent_element,
-                                                                     max_retry=1, use_action_chain=True)
+                # Use the context of the post, and the comment to generate a response
+                response = generate_ai_response(post_message, my_profile, post_comment=comment_text)
+                myprint(f"AI Generated Response to Comment: {response}")
 
-                        # Sleep 5 seconds to let the click register
-                        time.sleep(5)
+                try:
 
-                        # Update DB with log entry
-                        insert_new_log(user_id=user_id, post_id=post_id, action_type=LogActionType.REPLY,
-                                       result=LogResultType.SUCCESS,
-                                       post_url=post_url, message=response)
+                    # Find and click the Reply Button
+                    reply_button = click_element_wait_retry(driver, wait,
+                                                            './/button[contains(@class,"reply")][1]',
+                                                            "Finding Reply Button",
+                                                            use_action_chain=True,
+                                                            parent_element=comment)
 
-                        # From the parent element, find the like button and click it
-                        like_button = click_element_wait_retry(driver, wait,
-                                                               './/button[contains(@aria-label,"Like") and contains(@class,"react-button__trigger")][1]',
-                                                               "Finding Like Comment Button",
-                                                               parent_element=comment,
-                                                               max_retry=1, use_action_chain=True)
+                    # Find the text box (should be the element that now has focus)
+                    text_box = driver.switch_to.active_element
 
-                        comments_replied_count += 1
+                    # Simulate superfast typing the comment in the text box
+                    simulate_typing(driver, text_box, response, allow_pauses=False)
 
-                        # Sleep so like click registers
-                        time.sleep(5)
+                    # Sleep so post button shows up
+                    time.sleep(2)
 
+                    # Click the send button
+                    # Find the parent element of the current text_box element where the parent element is a div with a class containing "comments-comment-texteditor"
+                    parent_element = text_box.find_element(By.XPATH,
+                                                           './ancestor::form')
 
-                    except Exception as e:
-                        log_error("Error while replying to comment", exc=e, user_id=user_id, post_id=post_id, action_type="reply_comment")
-                        # Update DB with log entry
-                        insert_new_log(user_id=user_id, post_id=post_id, action_type=LogActionType.REPLY,
-                                       result=LogResultType.FAILURE,
-                                       post_url=post_url, message=response)
-                result = f"Replied to {comments_replied_count} comments"
+                    # From this parent element, find the child button element with a span element containing the text "Reply"
+                    send_reply_button = click_element_wait_retry(driver, wait,
+                                                                 './/button[contains(@class, "submit")]',
+                                                                 "Finding Send Reply Button",
+                                                                 parent_element=parent_element,
+                                                                 max_retry=1, use_action_chain=True)
 
-        else:
-            myprint("Could not find successful post for this user and post_id. Sleeping...")
-            result = "Could not find successful post for this user and post_id. Sleeping..."
+                    # Sleep 5 seconds to let the click register
+                    time.sleep(5)
 
-        # Re-schedule the task in the queue for the future
-        if loop_for_duration:
-            elapsed_time = datetime.now() - start_time
+                    # Update DB with log entry
+                    insert_new_log(user_id=user_id, post_id=post_id, action_type=LogActionType.REPLY,
+                                   result=LogResultType.SUCCESS,
+                                   post_url=post_url, message=response)
 
-            # If the loop for duration is more than 30 minutes, increase future forward timeby 5 minutes
-            if loop_for_duration > (60 * 30):
-                future_forward += 1
+                    # From the parent element, find the like button and click it
+                    like_button = click_element_wait_retry(driver, wait,
+                                                           './/button[contains(@aria-label,"Like") and contains(@class,"react-button__trigger")][1]',
+                                                           "Finding Like Comment Button",
+                                                           parent_element=comment,
+                                                           max_retry=1, use_action_chain=True)
 
-            # Future forward is an index. Use it to get the number of seconds to go forward
-            future_forward_times = [0, 60 * 5, 60 * 10, 60 * 15, 60 * 30, 60 * 60]
+                    comments_replied_count += 1
 
-            # Cap the future_forward to the length of the future_forward_times list
-            if future_forward > len(future_forward_times) - 1:
-                future_forward = len(future_forward_times) - 1
+                    # Sleep so like click registers
+                    time.sleep(5)
 
-            future_forward_time = future_forward_times[future_forward]
 
-            new_loop_for_duration = round(loop_for_duration - elapsed_time.total_seconds() - future_forward_time)
-            frame = inspect.currentframe()
-            current_function_name = frame.f_code.co_name
-            args, _, _, values = inspect.getargvalues(frame)
-            kwargs = {arg: values[arg] for arg in args}
-            # myprint(f"{current_function_name} parameters: {kwargs}")
+                except Exception as e:
+                    log_error("Error while replying to comment", exc=e, user_id=user_id, post_id=post_id, action_type="reply_comment")
+                    # Update DB with log entry
+                    insert_new_log(user_id=user_id, post_id=post_id, action_type=LogActionType.REPLY,
+                                   result=LogResultType.FAILURE,
+                                   post_url=post_url, message=response)
+            result = f"Replied to {comments_replied_count} comments"
 
-            if new_loop_for_duration < 0:
-                myprint(f"Loop duration reached. Stopping {current_function_name} task...")
-            else:
-                # Change the value of the loop_for_duration and future_forward parameters
-                kwargs['loop_for_duration'] = new_loop_for_duration
-                kwargs['future_forward'] = future_forward
-                # Add our function call back to the task queue
-                myprint(
-                    f"Adding {current_function_name} back to queue for {future_forward_time} seconds in the future...")
-                # Remove 'self' from kwargs if it exists
-                if 'self' in kwargs:
-                    del kwargs['self']
-
-                # Call self again in the future
-                globals()[current_function_name].apply_async(kwargs=kwargs, countdown=future_forward_time)
-    except Exception as e:
-        log_error("Error while replying to comments", exc=e, user_id=user_id, post_id=post_id, task_name="automate_reply_commenting")
-        result = f"Error while replying to comments: {e}"
-    finally:
-        quit_gracefully(driver)
+    else:
+        myprint("Could not find successful post for this user and post_id. Sleeping...")
+        result = "Could not find successful post for this user and post_id. Sleeping..."
 
     return result
 
 
-def accept_connection_request(user_id: int):
-    """Accept connection requests for the given user."""
+def accept_connection_request(user_id: int, driver: WebDriver = None, wait: WebDriverWait = None):
+    """Accept connection requests for the given user.
 
-    user_email, user_password = get_user_password_pair_by_id(user_id)
+    Uses the given logged-in ``driver`` when there is one (and leaves it open), otherwise
+    opens and closes its own browser session.
+    """
 
-    driver, wait = get_driver_wait_pair(session_name='Accept Connection Requests')
+    own_driver = driver is None
+    if own_driver:
+        user_email, user_password = get_user_password_pair_by_id(user_id)
 
-    login_to_linkedin(driver, wait, user_email, user_password)
+        driver, wait = get_driver_wait_pair(session_name='Accept Connection Requests', user_id=user_id)
+
+        login_to_linkedin(driver, wait, user_email, user_password)
 
     # Navigate to the invitations manager page
     driver.get("https://www.linkedin.com/mynetwork/invitation-manager/")
@@ -729,7 +736,8 @@ def accept_connection_request(user_id: int):
         log_error("Error while accepting connection requests", exc=e, user_id=user_id, action_type="accept_connection")
         invitation_data = {}
     finally:
-        quit_gracefully(driver)
+        if own_driver:
+            quit_gracefully(driver)
 
     # Return the invitations list
     return invitation_data
@@ -755,74 +763,28 @@ def get_recent_collaborators(driver, wait) -> dict[str, str]:
 
 @shared_task.task(bind=True, base=QueueOnce, once={'graceful': True, 'unlock_before_run': True, 'keys': ['user_id']},
                   reject_on_worker_lost=True, rate_limit='2/m', queue='selenium')
-def automate_appreciation_dms_for_user(self, user_id: int, loop_for_duration: int = None, future_forward: int = 60):
+@paced('feed', spend=False)
+@fair_share_slot
+def automate_appreciation_dms_for_user(self, user_id: int, loop_for_duration: int = None, future_forward: int = 60,
+                                       session: str = None):
+    engagement = EngagementSession.open(self, "appreciation_dms", {
+        'user_id': user_id, 'loop_for_duration': loop_for_duration, 'future_forward': future_forward,
+        'session': session})
+    if engagement is None:
+        return "Appreciation DMs session continues elsewhere"
+
     user_email, user_password = get_user_password_pair_by_id(user_id)
 
-    driver, wait = get_driver_wait_pair(session_name='Appreciation DMs')
+    driver, wait = get_driver_wait_pair(session_name='Appreciation DMs', user_id=user_id)
 
     try:
         login_to_linkedin(driver, wait, user_email, user_password)
 
-        start_time = datetime.now()
-
-        myprint("Sending Appreciations here...")
-
-        result = "Appreciation DMs Sent"
-
-        # After Accepting a Connection Request:
-        invitations_accepted = accept_connection_request(user_id)
-        for profile_url, name in invitations_accepted.items():
-            first_name = name.split(" ")[0]
-            message = f"Hi {first_name}, I appreciate you connecting with me on LinkedIn. I look forward to learning more about you and your work."
-            send_private_dm.apply_async(kwargs={"user_id": user_id, "profile_url": profile_url, "message": message})
-
-        # After Receiving a Recommendation — thank the recommender
-        recommendations_received = get_recent_recommendations(driver, wait)
-        for profile_url, name in recommendations_received.items():
-            first_name = name.split(" ")[0]
-            message = (
-                f"Hi {first_name}, thank you so much for the kind recommendation on LinkedIn! "
-                "I really appreciate you taking the time to share your experience working with me. "
-                "I hope we have the opportunity to collaborate again in the future."
-            )
-            send_private_dm.apply_async(kwargs={"user_id": user_id, "profile_url": profile_url, "message": message})
-
-        # After a Successful Collaboration — express gratitude and offer to connect further
-        recent_collaborators = get_recent_collaborators(driver, wait)
-        for profile_url, name in recent_collaborators.items():
-            first_name = name.split(" ")[0]
-            message = (
-                f"Hi {first_name}, it was a pleasure collaborating with you! "
-                "Your contributions made a real difference and I'm grateful for the opportunity. "
-                "Let's stay in touch — I'd love to explore future opportunities to work together."
-            )
-            send_private_dm.apply_async(kwargs={"user_id": user_id, "profile_url": profile_url, "message": message})
-
-        # Re-schedule the task in the queue for the future
-        if loop_for_duration:
-            elapsed_time = datetime.now() - start_time
-            new_loop_for_duration = round(loop_for_duration - elapsed_time.total_seconds() - future_forward)
-            frame = inspect.currentframe()
-            current_function_name = frame.f_code.co_name
-            args, _, _, values = inspect.getargvalues(frame)
-            kwargs = {arg: values[arg] for arg in args}
-            # myprint(f"{current_function_name} parameters: {kwargs}")
-
-            if new_loop_for_duration < 0:
-                myprint(f"Loop duration reached. Stopping {current_function_name} task...")
-            else:
-                # Change the value of the loop_for_duration parameter
-                kwargs['loop_for_duration'] = new_loop_for_duration
-                # Add our function call back to the task queue
-                myprint(f"Adding {current_function_name} back to queue for {future_forward} seconds in the future...")
-                # Remove 'self' from kwargs if it exists
-                if 'self' in kwargs:
-                    del kwargs['self']
-                # Call self again in the future
-                globals()[current_function_name].apply_async(kwargs=kwargs, countdown=future_forward)
+        result = engagement.run(lambda: _send_appreciation_dms(driver, wait, user_id))
 
     except Exception as e:
         log_error("Error while sending appreciation DMs", exc=e, user_id=user_id, task_name="automate_appreciation_dms_for_user", action_type="dm")
+        engagement.finish()
         result = f"Error while sending appreciation DMs: {e}"
     finally:
         quit_gracefully(driver)
@@ -830,6 +792,46 @@ def automate_appreciation_dms_for_user(self, user_id: int, loop_for_duration: in
     return result
 
 
+def _send_appreciation_dms(driver, wait, user_id: int) -> str:
+    """One appreciation pass: queue thank-you DMs for new connections, recommenders and collaborators."""
+    myprint("Sending Appreciations here...")
+
+    # The invitation manager is a page load of its own (the login's feed token is spent)
+    delay = acquire_token("feed", user_id)
+    if delay:
+        return f"Appreciation pass paced; next feed-load token in {delay:.0f}s"
+
+    # After Accepting a Connection Request:
+    invitations_accepted = accept_connection_request(user_id, driver=driver, wait=wait)
+    for profile_url, name in invitations_accepted.items():
+        first_name = name.split(" ")[0]
+        message = f"Hi {first_name}, I appreciate you connecting with me on LinkedIn. I look forward to learning more about you and your work."
+        send_private_dm.apply_async(kwargs={"user_id": user_id, "profile_url": profile_url, "message": message})
+
+    # After Receiving a Recommendation — thank the recommender
+    recommendations_received = get_recent_recommendations(driver, wait)
+    for profile_url, name in recommendations_received.items():
+        first_name = name.split(" ")[0]
+        message = (
+            f"Hi {first_name}, thank you so much for the kind recommendation on LinkedIn! "
+            "I really appreciate you taking the time to share your experience working with me. "
+            "I hope we have the opportunity to collaborate again in the future."
+        )
+        send_private_dm.apply_async(kwargs={"user_id": user_id, "profile_url": profile_url, "message": message})
+
+    # After a Successful Collaboration — express gratitude and offer to connect further
+    recent_collaborators = get_recent_collaborators(driver, wait)
+    for profile_url, name in recent_collaborators.items():
+        first_name = name.split(" ")[0]
+        message = (
+            f"Hi {first_name}, it was a pleasure collaborating with you! "
+            "Your contributions made a real difference and I'm grateful for the opportunity. "
+            "Let's stay in touch — I'd love to explore future opportunities to work together."
+        )
+        send_private_dm.apply_async(kwargs={"user_id": user_id, "profile_url": profile_url, "message": message})
+
+    return "Appreciation DMs Sent"
+
 def generate_and_post_comment(driver, wait, post_link, my_profile: LinkedInProfile) -> bool:
     if post_link != driver.current_url:
         # Switch to post url
@@ -904,11 +906,20 @@ def generate_and_post_comment(driver, wait, post_link, my_profile: LinkedInProfi
 
 @shared_task.task(bind=True, base=QueueOnce, once={'graceful': True, 'unlock_before_run': True, 'keys': ['user_id']},
                   queue='selenium')
-def automate_profile_viewer_engagement(self, user_id: int, loop_for_duration: int = None, future_forward: int = 60):
+@paced('profile_view', spend=False)
+@fair_share_slot
+def automate_profile_viewer_engagement(self, user_id: int, loop_for_duration: int = None, future_forward: int = 60,
+                                       session: str = None):
     global stop_all_thread
 
     myprint(f"Starting Profile Viewer DMs")
 
+    engagement = EngagementSession.open(self, "profile_viewers", {
+        'user_id': user_id, 'loop_for_duration': loop_for_duration, 'future_forward': future_forward,
+        'session': session})
+    if engagement is None:
+        return "Profile Viewer DMs session continues elsewhere"
+
     try:
         driver, wait, user_email, my_profile = get_current_profile(user_id=user_id, session_name="Profile Viewer DMs")
     except Exception as e:
@@ -916,151 +927,143 @@ def automate_profile_viewer_engagement(self, user_id: int, loop_for_duration: in
             "Failed to get profile for profile viewer engagement",
             exc=e, user_id=user_id, task_name="automate_profile_viewer_engagement",
         )
+        engagement.finish()
         return f"Failed to start profile viewer engagement: {e}"
 
     result = "Profile Viewer DMs Started"
 
     try:
+        result = engagement.run(lambda: _engage_recent_profile_viewers(driver, wait, my_profile, user_id))
+    except Exception as e:
+        log_error("Error while engaging with profile viewers", exc=e, user_id=user_id, task_name="automate_profile_viewer_engagement")
+        result = f"Error while engaging with profile viewers: {e}"
+    finally:
+        quit_gracefully(driver)
 
-        # Navigate to profile view page
-        driver.get("https://www.linkedin.com/analytics/profile-views/")
-
-        start_time = datetime.now()
-
-        viewed_on_xpath = './/div[contains(@class,"artdeco-entity-lockup__caption ember-view")]'
-
-        while True:  # Keep looping until we find a viewed on date out of range
-            # Get Each Viewer within the last day (or time of dm run via database log)
-            viewer_elements = get_elements_as_list_wait_stale(wait,
-                                                              '//ul[@aria-label="List of Entities"]//a[contains(@href,"linkedin.com/in") and not(contains(@aria-label,"Update"))]',
-                                                              "Finding Profile Viewers")
-
-            # myprint(f"Viewers count: {len(viewer_elements)}")
-
-            if len(viewer_elements) > 0:
-                # myprint("Here 1")
-                # Get the last viewer
-                last_viewer = viewer_elements[-1]
-                # myprint("Here 2")
-                # Extract the viewer's name
-                name_element = last_viewer.find_element(By.XPATH,
-                                                        './/div[contains(@class,"artdeco-entity-lockup__title")]/span/span[1]')
-                # myprint("Here 3")
-                if name_element:
-                    last_viewer_name = getText(name_element)
-                    # myprint(f"Last Viewer Name: {last_viewer_name}")
-                else:
-                    last_viewer_name = random.choice(["John", "Jane"]) + " Doe"
-                    myprint("Could not find name of last viewer")
-
-                last_viewed_on_element = last_viewer.find_element(By.XPATH, viewed_on_xpath)
-                if last_viewed_on_element:
-                    last_viewed_on = getText(last_viewed_on_element).strip()
-                    # myprint(f"Last Viewed on: {last_viewed_on}")
-
-                    # Convert viewed on to date
-                    last_viewed_date = convert_viewed_on_to_date(last_viewed_on)
-                    # myprint(f"Last Viewed on Date: {last_viewed_date}")
-
-                    # if the last viewed on date is Greater than 24 hours break the while loop
-                    if (datetime.now() - last_viewed_date).days > 1:
-                        # myprint("Last viewed on date is more than 24 hours ago")
-                        break  # Break the while loop
-                else:
-                    myprint(f"Could not find viewed on element for {last_viewer_name}")
+    return result
 
-                # Scroll down to get more elements
-                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(2)
 
+def _engage_recent_profile_viewers(driver, wait, my_profile: LinkedInProfile, user_id: int) -> str:
+    """One viewer pass: queue engagement with everyone who viewed the profile in the last day."""
+    delay = acquire_token("feed", user_id)
+    if delay:
+        return f"Profile viewer pass paced; next feed-load token in {delay:.0f}s"
+
+    # Navigate to profile view page
+    driver.get("https://www.linkedin.com/analytics/profile-views/")
+
+    viewed_on_xpath = './/div[contains(@class,"artdeco-entity-lockup__caption ember-view")]'
+
+    while True:  # Keep looping until we find a viewed on date out of range
+        # Get Each Viewer within the last day (or time of dm run via database log)
+        viewer_elements = get_elements_as_list_wait_stale(wait,
+                                                          '//ul[@aria-label="List of Entities"]//a[contains(@href,"linkedin.com/in") and not(contains(@aria-label,"Update"))]',
+                                                          "Finding Profile Viewers")
+
+        # myprint(f"Viewers count: {len(viewer_elements)}")
+
+        if len(viewer_elements) > 0:
+            # myprint("Here 1")
+            # Get the last viewer
+            last_viewer = viewer_elements[-1]
+            # myprint("Here 2")
+            # Extract the viewer's name
+            name_element = last_viewer.find_element(By.XPATH,
+                                                    './/div[contains(@class,"artdeco-entity-lockup__title")]/span/span[1]')
+            # myprint("Here 3")
+            if name_element:
+                last_viewer_name = getText(name_element)
+                # myprint(f"Last Viewer Name: {last_viewer_name}")
+            else:
+                last_viewer_name = random.choice(["John", "Jane"]) + " Doe"
+                myprint("Could not find name of last viewer")
+
+            last_viewed_on_element = last_viewer.find_element(By.XPATH, viewed_on_xpath)
+            if last_viewed_on_element:
+                last_viewed_on = getText(last_viewed_on_element).strip()
+                # myprint(f"Last Viewed on: {last_viewed_on}")
+
+                # Convert viewed on to date
+                last_viewed_date = convert_viewed_on_to_date(last_viewed_on)
+                # myprint(f"Last Viewed on Date: {last_viewed_date}")
+
+                # if the last viewed on date is Greater than 24 hours break the while loop
+                if (datetime.now() - last_viewed_date).days > 1:
+                    # myprint("Last viewed on date is more than 24 hours ago")
+                    break  # Break the while loop
             else:
-                break  # Break the while loop
+                myprint(f"Could not find viewed on element for {last_viewer_name}")
 
-        # myprint(f"Viewers: {str(viewer_elements)}")
-        result = f"Profile Viewer DMs Started. Found {len(viewer_elements)} viewers"
-        myprint(f"Final Viewers count: {len(viewer_elements)}")
+            # Scroll down to get more elements
+            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+            time.sleep(2)
 
-        try:
-            # Filter the viewers by date within the last day
-            viewer_elements = [e for e in viewer_elements if (datetime.now() - convert_viewed_on_to_date(
-                getText(e.find_element(By.XPATH, viewed_on_xpath)))).days <= 1]
-        except Exception as e:
-            log_warning("Error filtering viewers by date", exc=e, user_id=user_id)
-
-        myprint(f"Filtered Viewers count: {len(viewer_elements)}")
-
-        current_tab = driver.current_window_handle
-        handles = driver.window_handles
-
-        # Get all the viewer names and urls into list so that elements don't go stale
-        viewer_names = [
-            getText(e.find_element(By.XPATH, './/div[contains(@class,"artdeco-entity-lockup__title")]/span/span[1]'))
-            for e
-            in viewer_elements]
-        viewer_urls = [e.get_attribute('href') for e in viewer_elements]
-        # Merge them into a dictionary to iterate over
-        viewer_data = dict(zip(viewer_names, viewer_urls))
-
-        # Get the viewed data from each element and filter by a day ago or specific date
-        for viewer_name, viewer_url in viewer_data.items():
-            # Switch back to tab
-            driver.switch_to.window(current_tab)
-
-            myprint(f"Viewer Name: {viewer_name}")
-            myprint(f"Viewer URL: {viewer_url}")
-
-            # Wait for the new window or tab
-            driver.switch_to.new_window('tab')
-            wait.until(EC.new_window_is_opened(handles))
-
-            # Switch to viewer_url
-            driver.get(viewer_url)
-
-            # Engage with the viewer
-            kwargs = {'user_id': get_user_id(my_profile.email),
-                      'viewer_url': viewer_url,
-                      'viewer_name': viewer_name}
-            engage_with_profile_viewer.apply_async(kwargs=kwargs)
-
-            # Close tab when done
-            close_tab(driver)
-
-        result = f"Profile Viewer DMs Completed. Engaged with {len(viewer_data)} viewers"
-
-        # Re-schedule the task in the queue for the future
-        if loop_for_duration:
-            elapsed_time = datetime.now() - start_time
-            new_loop_for_duration = round(loop_for_duration - elapsed_time.total_seconds() - future_forward)
-            frame = inspect.currentframe()
-            current_function_name = frame.f_code.co_name
-            args, _, _, values = inspect.getargvalues(frame)
-            kwargs = {arg: values[arg] for arg in args}
-            # myprint(f"{current_function_name} parameters: {kwargs}")
-
-            if new_loop_for_duration < 0:
-                myprint(f"Loop duration reached. Stopping {current_function_name} task...")
-            else:
-                # Change the value of the loop_for_duration parameter
-                kwargs['loop_for_duration'] = new_loop_for_duration
-                # Add our function call back to the task queue
-                myprint(f"Adding {current_function_name} back to queue for {future_forward} seconds in the future...")
-                # Remove 'self' from kwargs if it exists
-                if 'self' in kwargs:
-                    del kwargs['self']
-
-                # Call self again in the future
-                globals()[current_function_name].apply_async(kwargs=kwargs, countdown=future_forward)
+        else:
+            break  # Break the while loop
+
+    # myprint(f"Viewers: {str(viewer_elements)}")
+    result = f"Profile Viewer DMs Started. Found {len(viewer_elements)} viewers"
+    myprint(f"Final Viewers count: {len(viewer_elements)}")
+
+    try:
+        # Filter the viewers by date within the last day
+        viewer_elements = [e for e in viewer_elements if (datetime.now() - convert_viewed_on_to_date(
+            getText(e.find_element(By.XPATH, viewed_on_xpath)))).days <= 1]
     except Exception as e:
-        log_error("Error while engaging with profile viewers", exc=e, user_id=user_id, task_name="automate_profile_viewer_engagement")
-        result = f"Error while engaging with profile viewers: {e}"
-    finally:
-        quit_gracefully(driver)
+        log_warning("Error filtering viewers by date", exc=e, user_id=user_id)
+
+    myprint(f"Filtered Viewers count: {len(viewer_elements)}")
+
+    current_tab = driver.current_window_handle
+    handles = driver.window_handles
+
+    # Get all the viewer names and urls into list so that elements don't go stale
+    viewer_names = [
+        getText(e.find_element(By.XPATH, './/div[contains(@class,"artdeco-entity-lockup__title")]/span/span[1]'))
+        for e
+        in viewer_elements]
+    viewer_urls = [e.get_attribute('href') for e in viewer_elements]
+    # Merge them into a dictionary to iterate over
+    viewer_data = dict(zip(viewer_names, viewer_urls))
+
+    # Get the viewed data from each element and filter by a day ago or specific date
+    for viewer_name, viewer_url in viewer_data.items():
+        delay = acquire_token("profile_view", user_id)
+        if delay:
+            myprint(f"Profile view budget spent; next token in {delay:.0f}s. Ending this pass...")
+            break
+
+        # Switch back to tab
+        driver.switch_to.window(current_tab)
+
+        myprint(f"Viewer Name: {viewer_name}")
+        myprint(f"Viewer URL: {viewer_url}")
+
+        # Wait for the new window or tab
+        driver.switch_to.new_window('tab')
+        wait.until(EC.new_window_is_opened(handles))
+
+        # Switch to viewer_url
+        driver.get(viewer_url)
+
+        # Engage with the viewer
+        kwargs = {'user_id': get_user_id(my_profile.email),
+                  'viewer_url': viewer_url,
+                  'viewer_name': viewer_name}
+        engage_with_profile_viewer.apply_async(kwargs=kwargs)
+
+        # Close tab when done
+        close_tab(driver)
+
+    result = f"Profile Viewer DMs Completed. Engaged with {len(viewer_data)} viewers"
 
     return result
 
 
 @shared_task.task(bind=True, base=QueueOnce, once={'graceful': True, 'keys': ['user_id', 'viewer_url']},
                   reject_on_worker_lost=True, rate_limit='2/m', queue='selenium')
+@paced('profile_view')
+@fair_share_slot
 def engage_with_profile_viewer(self, user_id: int, viewer_url, viewer_name):
     myprint(f"Starting Profile Viewer Engagement")
 
@@ -1115,6 +1118,10 @@ def engage_with_profile_viewer(self, user_id: int, viewer_url, viewer_name):
                     for activity in recent_activities:
                         link = str(activity.link)
 
+                        if acquire_token("comment", user_id):
+                            myprint("Comment budget spent; skipping activity comments")
+                            break
+
                         # Leave comment on that activity
                         able_to_comment = generate_and_post_comment(driver, wait, link, my_profile)
                         if able_to_comment:
@@ -1215,12 +1222,14 @@ def clean_stale_invites(self, user_id: int):
 
 @shared_task.task(bind=True, base=QueueOnce, once={'graceful': True}, reject_on_worker_lost=True,
                   rate_limit='2/m', queue='selenium')
+@paced('dm')
+@fair_share_slot
 def send_private_dm(self, user_id: int, profile_url: str, message: str):
     """ Send dm message to a profile. Must be a 1st connection"""
 
     user_email, user_password = get_user_password_pair_by_id(user_id)
 
-    driver, wait = get_driver_wait_pair(session_name='Private DM')
+    driver, wait = get_driver_wait_pair(session_name='Private DM', user_id=user_id)
 
     login_to_linkedin(driver, wait, user_email, user_password)
 
@@ -1284,10 +1293,12 @@ def send_private_dm(self, user_id: int, profile_url: str, message: str):
 
 @shared_task.task(bind=True, base=QueueOnce, once={'graceful': True, 'keys': ['user_id', 'profile_url']},
                   reject_on_worker_lost=True, rate_limit='1/m', queue='selenium')
+@paced('invite')
+@fair_share_slot
 def invite_to_connect(self, user_id: int, profile_url: str, message: str = None):
     user_email, user_password = get_user_password_pair_by_id(user_id)
 
-    driver, wait = get_driver_wait_pair(session_name='Invite to Connect')
+    driver, wait = get_driver_wait_pair(session_name='Invite to Connect', user_id=user_id)
 
     result = "Invitation to Connect Started"
 
@@ -1415,6 +1426,8 @@ def final_method(drivers: List[WebDriver]):
 
 @shared_task.task(bind=True, base=QueueOnce, once={'graceful': True}, reject_on_worker_lost=True,
                   rate_limit='1/m', queue='selenium')
+@paced('profile_view')
+@fair_share_slot
 def update_stale_profile(self, user_id: int):
     myprint(f"Updating Stale Profile. User ID: {user_id}")
     try:
@@ -1576,10 +1589,12 @@ def post_to_linkedin(self, user_id: int, post_id: int):
 
 @shared_task.task(bind=True, base=QueueOnce, once={'graceful': False}, reject_on_worker_lost=True,
                   rate_limit='4/m', queue='selenium')
+@paced('invite')
+@fair_share_slot
 def automate_invites_to_company_page_for_user(self, user_id: int):
     """Send invites to the company page for the given user."""
 
-    driver, wait = get_driver_wait_pair(session_name='Company Page Invites')
+    driver, wait = get_driver_wait_pair(session_name='Company Page Invites', user_id=user_id)
 
     try:
 
@@ -2,6 +2,7 @@ import calendar
 import json
 import os
 import random
+import time
 from datetime import datetime, timedelta
 from typing import Optional, Tuple
 from urllib.parse import urlparse
@@ -10,6 +11,7 @@ from xml.etree import ElementTree
 import pytz
 import requests
 from bs4 import BeautifulSoup
+from celery import chord
 from cqc_lem import assets_dir
 from cqc_lem.app.my_celery import app as shared_task
 from cqc_lem.utilities.ai.ai_helper import get_blog_summary_post_from_ai, get_website_content_post_from_ai, \
@@ -17,186 +19,196 @@ from cqc_lem.utilities.ai.ai_helper import get_blog_summary_post_from_ai, get_we
     create_runway_video, get_ai_linked_post_refinement
 from cqc_lem.utilities.ai.ai_helper import get_thought_leadership_post_from_ai, \
     get_industry_news_post_from_ai, get_personal_story_post_from_ai, generate_engagement_prompt_post
-from cqc_lem.utilities.db import get_post_type_counts, insert_planned_post, update_db_post_content, \
-    get_planned_posts_for_current_week, get_last_planned_post_date_for_user, get_user_password_pair_by_id, \
-    get_user_blog_url, get_user_sitemap_url, get_active_user_ids, get_planned_posts_for_next_week, PostStatus, \
+from cqc_lem.utilities.db import get_post_type_counts, insert_planned_posts, insert_planned_posts_batch, \
+    update_db_post_content, iter_planned_posts, get_last_planned_post_date_for_user, \
+    get_post_type_counts_for_users, get_last_planned_post_dates, \
+    get_user_blog_url, get_user_sitemap_url, iter_active_users, PostStatus, \
     update_db_post_video_url, update_db_post_status, PostType, get_user_preferences, \
     update_db_post_carousel_slides, get_post_content, get_user_timezone
 from cqc_lem.utilities.env_constants import API_URL_FINAL, DEFAULT_VIDEO_RATIO, \
     DEFAULT_IMAGE_RATIO, AI_DISCLOSURE_ENABLED, AI_DISCLOSURE_TEXT, \
     STANDARD_VIDEO_MODEL, PREMIUM_VIDEO_MODEL, PREMIUM_TOP_VIDEO_MODEL, \
     PREMIUM_VIDEO_CREDITS, PREMIUM_TOP_VIDEO_CREDITS
-from cqc_lem.utilities.linkedin.helper import get_my_profile, load_profile_for_user
+from cqc_lem.utilities.linkedin.helper import load_profile_for_user
 from cqc_lem.utilities.linkedin_formatter import sanitize_for_linkedin
 from cqc_lem.utilities.linkedin.profile import LinkedInProfile
 from cqc_lem.utilities.logger import myprint
-from cqc_lem.utilities.selenium_util import get_driver_wait_pair, quit_gracefully
+from cqc_lem.utilities.observability import track_task
+from cqc_lem.utilities.provider_slots import providers_for_post_type, acquire as acquire_provider_slots, \
+    release as release_provider_slots, defer_seconds as provider_defer_seconds
 from cqc_lem.utilities.utils import get_best_posting_time, create_folder_if_not_exists, save_video_url_to_dir
 from requests.adapters import HTTPAdapter
 from urllib3 import Retry
 
 
-@shared_task.task
-def auto_generate_content():
-    # Get active users from DB
-    active_users = get_active_user_ids()
-    # For each user generate content for the next 30 days
-    for user_id in active_users:
-        plan_content_for_user.apply_async(kwargs={"user_id": user_id})
+# Number of users auto_generate_content loads, plans and writes per batch.
+# Bounds memory, query size and transaction size for large user bases.
+_PLAN_FLUSH_USERS = 200
 
 
-@shared_task.task(bind=True, reject_on_worker_lost=True, rate_limit='1/m')
+@shared_task.task
+def auto_generate_content():
+    # Plan the next 30 days for every active user, _PLAN_FLUSH_USERS at a time: each batch
+    # loads its users' post-type counts and last planned dates with two grouped queries
+    # (timezones come from the settings cache the user stream warms), plans in memory and
+    # persists with a few multi-row inserts.
+    started = time.time()
+    planned_users = planned_posts = 0
+    batch: list[int] = []
+    for user in iter_active_users():
+        batch.append(user['id'])
+        if len(batch) >= _PLAN_FLUSH_USERS:
+            users, posts = _plan_and_save(batch)
+            planned_users, planned_posts = planned_users + users, planned_posts + posts
+            batch = []
+    if batch:
+        users, posts = _plan_and_save(batch)
+        planned_users, planned_posts = planned_users + users, planned_posts + posts
+    myprint(f"Content Plan | {planned_posts} posts for {planned_users} users "
+            f"in {time.time() - started:.1f}s")
+
+
+def _plan_and_save(user_ids: list[int]) -> tuple[int, int]:
+    plans = build_content_plans(user_ids)
+    if plans is None:
+        myprint(f"Content Plan | Skipped a batch of {len(user_ids)} users: their posts could not be read")
+        return 0, 0
+    pending_plans = {user_id: _plan_rows(plan) for user_id, plan in plans.items() if plan}
+    if pending_plans:
+        insert_planned_posts_batch(pending_plans)
+    return len(pending_plans), sum(len(rows) for rows in pending_plans.values())
+
+
+@shared_task.task(bind=True, reject_on_worker_lost=True)
 def plan_content_for_user(self, user_id: int):
     """
     Generate and plan content for the next 30 days based on current content representation in the database.
     Ensures a balanced distribution of post types (carousel, text, video) and buyer journey stages.
     """
+    daily_plan = build_content_plan(user_id)
+    if not daily_plan:
+        return
 
-    # 1. Review existing content in the database
-    # Query the database to count the current representation of each post_type in the 'posts' table
-    # Example: SELECT COUNT(*) FROM posts WHERE post_type = 'carousel'
-    current_counts = get_post_type_counts(user_id)
+    # 4. Save the daily plan to the database for tracking and scheduling
+    save_content_plan(user_id, daily_plan)
 
-    # Calculate the total posts and percentages of each type
-    total_posts = sum(current_counts.values())
-    if total_posts == 0:
-        # New user with no posts — treat all types as equally unrepresented
-        percentages = {post_type: 0.0 for post_type in current_counts}
-    else:
-        percentages = {post_type: (count / total_posts) * 100 for post_type, count in current_counts.items()}
 
-    # Log the current representation for debugging
-    # myprint(f"Current Content Percentages: {percentages}")
+_POST_TYPES = ('carousel', 'text', 'video')
+_JOURNEY_STAGES = ('awareness', 'consideration', 'decision')
 
-    # 2. Determine the target distribution of post types for the next 30 days
-    # Based on the percentages, calculate how many posts of each type are needed to balance the content
 
-    # Determine how many days are in this month
-    now = datetime.now()
-    days_in_month = calendar.monthrange(now.year, now.month)[1]
-    myprint(f"Days in Month: {days_in_month}")
+def build_content_plan(user_id: int) -> list[dict]:
+    """Build (but do not save) the user's content plan through the end of the month.
 
-    # Determine the start date as the day after the last scheduled post in planning status
+    Returns a list of {"scheduled_datetime", "post_type", "stage"} dicts, or an empty list
+    when the user is already planned more than 30 days out.
+    """
+    # Current representation of each post_type in the 'posts' table, and the last planned post
+    current_counts = get_post_type_counts(user_id)
     last_planned_date = get_last_planned_post_date_for_user(user_id)
-
-    # myprint(f"Last Planned Date: {last_planned_date}")
-
-    # Use the last planned date if it exists and it is after today
-    if last_planned_date and last_planned_date.date() > datetime.now().date():
-        start_date = last_planned_date + timedelta(days=1)  # Start with the next day
-
-        # If the start date is greate than 30 days from today just skip the process
-        if start_date > datetime.now() + timedelta(days=30):
-            myprint(f"Content Plan | Start Date: {start_date} | >30 days out | Skipped")
-            return
-    else:
-        start_date = datetime.now() + timedelta(days=1)  # Start with the next day
-    myprint(f"Content Plan | Start Date: {start_date}")
-
+    daily_plan = plan_posts(current_counts, last_planned_date, _user_tz(user_id))
+    myprint(f"Content Plan | User {user_id} | {len(daily_plan)} posts planned")
+    return daily_plan
 
 
-    # Determine how many days are left in this month
-    days_left_in_month = days_in_month - start_date.day
+def build_content_plans(user_ids: list[int], now: datetime = None) -> Optional[dict[int, list[dict]]]:
+    """build_content_plan for many users: two grouped queries, then planning in memory.
 
-    myprint(f"Days Left in Month after Start Date: {days_left_in_month}")
-
-    # Need on more post than days left in month
-    target_posts = days_left_in_month + 1  # Total posts till the end of the month
-
-    # myprint(f"Target Posts: {target_posts}")
-
-    needed_posts = {post_type: target_posts // 3 for post_type in ['carousel', 'text', 'video']}
+    Users that need no plan (already planned more than 30 days out) map to an empty list.
+    Returns None when either query failed: planning from tomorrow without knowing what is
+    already planned would insert a second month of posts.
+    """
+    now = now or datetime.now()
+    counts = get_post_type_counts_for_users(user_ids)
+    last_dates = get_last_planned_post_dates(user_ids) if counts is not None else None
+    if last_dates is None:
+        return None
+    utc_cache: dict = {}
+    plans = {}
+    for user_id in user_ids:
+        try:
+            plans[user_id] = plan_posts(counts.get(user_id, {}), last_dates.get(user_id),
+                                        _user_tz(user_id), now=now, utc_cache=utc_cache)
+        except Exception as e:
+            myprint(f"Content Plan | User {user_id} | Skipped: {type(e).__name__}: {e}")
+    return plans
 
-    # myprint(f"Needed Posts: {needed_posts}")
 
-    # Ensure all post types are present in current_counts and percentages
-    for post_type in ['carousel', 'text', 'video']:
-        if post_type not in percentages:
-            percentages[post_type] = 0.0
+def _user_tz(user_id: int):
+    # get_best_posting_time returns the user's LOCAL audience time (e.g. 2pm). Plans convert
+    # it from the user's timezone to UTC for storage, because the scheduler treats stored
+    # scheduled_time as UTC.
+    try:
+        return pytz.timezone(get_user_timezone(user_id))
+    except Exception as e:
+        myprint(f"Timezone lookup failed for user {user_id} — storing as UTC: {e}")
+        return None
 
-    # myprint(f"Updated Content Percentages: {percentages}" )
 
-    # Loop until the total needed posts equals the target posts
-    while sum(needed_posts.values()) != target_posts:
-        max_key = get_max_key(percentages)
-        min_key = get_min_key(percentages)
+def apportion_post_types(current_counts: dict, target_posts: int) -> dict[str, int]:
+    """Split ``target_posts`` evenly across the post types; the remainder (at most two posts)
+    goes to the types least represented in ``current_counts``, ties in _POST_TYPES order."""
+    current_counts = current_counts or {}
+    base, remainder = divmod(target_posts, len(_POST_TYPES))
+    by_share = sorted(_POST_TYPES, key=lambda post_type: current_counts.get(post_type, 0))
+    return {post_type: base + (1 if post_type in by_share[:remainder] else 0) for post_type in _POST_TYPES}
 
-        # Adjust the counts
-        if sum(needed_posts.values()) < target_posts:
-            needed_posts[min_key] += 1
-        else:
-            needed_posts[max_key] -= 1
 
-        # Recalculate percentages
-        total_posts = sum(needed_posts.values())
-        for post_type in percentages:
-            percentages[post_type] = (needed_posts[post_type] / total_posts) * 100
+def plan_posts(current_counts: dict, last_planned_date: Optional[datetime], user_tz=None,
+               now: datetime = None, rng=random, utc_cache: dict = None) -> list[dict]:
+    """Plan one user's posts from the day after their last planned post to the end of the month.
 
-    # Output the final needed_posts and percentages
-    # myprint(f"Final Needed Posts: {needed_posts}")
-    # myprint(f"Final Percentages: {percentages}")
+    Pure arithmetic over already-loaded data, so the batch planner can run it for thousands
+    of users. ``utc_cache`` memoizes the local→UTC conversion per (timezone, time), which
+    users in the same timezone share.
+    """
+    now = now or datetime.now()
+    days_in_month = calendar.monthrange(now.year, now.month)[1]
 
-    # 3. Plan content across the buyer journey stages | logic: randomly select a post type and buyer journey stage for each post
-    # Define buyer journey stages: Awareness, Consideration, Decision
-    journey_stages = ["awareness", "consideration", "decision"]
+    # Start the day after the last planned post when that is in the future
+    if last_planned_date and last_planned_date.date() > now.date():
+        start_date = last_planned_date + timedelta(days=1)
+        # If the start date is more than 30 days from today just skip the process
+        if start_date > now + timedelta(days=30):
+            return []
+    else:
+        start_date = now + timedelta(days=1)
+
+    # One more post than days left in the month after the start date
+    target_posts = days_in_month - start_date.day + 1
+    if target_posts <= 0:
+        return []
+    needed_posts = apportion_post_types(current_counts, target_posts)
+
+    # Post types in a random order; buyer journey stages round-robin from a random start
+    post_types = [post_type for post_type, count in needed_posts.items() for _ in range(count)]
+    rng.shuffle(post_types)
+    journey_stages = list(_JOURNEY_STAGES)
+    rng.shuffle(journey_stages)
+
+    utc_cache = {} if utc_cache is None else utc_cache
+    tz_name = user_tz.zone if user_tz is not None else None
     daily_plan = []
-
-    # Shuffle the journey stages to ensure a random order
-    random.shuffle(journey_stages)
-
-    # Create a list of post types based on needed_posts
-    post_types = []
-    for post_type, count in needed_posts.items():
-        post_types.extend([post_type] * count)
-
-    # Shuffle the post types to ensure a random order
-    random.shuffle(post_types)
-
-    # Generate content plan evenly across buyer journey stages and post types
-    for day in range(target_posts):  # Plan for end of this month
-        # Choose a post type from the shuffled list
-        post_type = post_types.pop()
-
-        # Choose a buyer journey stage in a round-robin fashion
-        stage = journey_stages[day % len(journey_stages)]
-
-        # TODO: Delete below |  Call the helper function to create content for this post type and buyer journey stage
-        # create_content(user_id, post_type, stage)
-
-        # Add this post to the daily plan
+    for day, post_type in enumerate(post_types):
         post_date = start_date + timedelta(days=day)
-
-        # Get the best time for the selected date
-        post_time = get_best_posting_time(post_date.date())
-
-        # get_best_posting_time returns the user's LOCAL audience time (e.g. 2pm). Convert
-        # it from the user's timezone to UTC for storage, because the scheduler treats
-        # stored scheduled_time as UTC. Without this, a 14:00 local post was stored as
-        # 14:00 UTC and fired hours off the intended local time.
-        scheduled_datetime = datetime.combine(post_date, post_time)
-        try:
-            user_tz = pytz.timezone(get_user_timezone(user_id))
-            scheduled_datetime = (
-                user_tz.localize(scheduled_datetime).astimezone(pytz.utc).replace(tzinfo=None)
-            )
-        except Exception as e:
-            myprint(f"Timezone conversion failed for user {user_id} — storing as UTC: {e}")
+        scheduled_datetime = datetime.combine(post_date, get_best_posting_time(post_date.date()))
+        if user_tz is not None:
+            key = (tz_name, scheduled_datetime)
+            if key not in utc_cache:
+                try:
+                    utc_cache[key] = user_tz.localize(scheduled_datetime).astimezone(pytz.utc).replace(tzinfo=None)
+                except Exception as e:
+                    myprint(f"Timezone conversion failed ({tz_name}) — storing as UTC: {e}")
+                    utc_cache[key] = scheduled_datetime
+            scheduled_datetime = utc_cache[key]
 
         daily_plan.append({
             "scheduled_datetime": scheduled_datetime,
             "post_type": post_type,
-            "stage": stage
+            "stage": journey_stages[day % len(journey_stages)],
         })
 
-        # Update the needed_posts count for the selected post type
-        needed_posts[post_type] -= 1
-
-    # Log the final content plan for the next 30 days
-    # myprint(f"Generated content plan: {daily_plan}")
-    myprint(f"Generated content plan")
-
-    # 4. Save the daily plan to the database for tracking and scheduling
-    save_content_plan(user_id, daily_plan)
+    return daily_plan
 
 
 # Function to find the key with the highest value in a dictionary
@@ -349,8 +361,8 @@ def _generate_video_src(user_id: int, text_content: str, profile, post_id: int =
     Returns the remote Runway URL (http) or a local Pexels path, or None.
     """
     from cqc_lem.utilities.ai.video_models import is_premium
-    from cqc_lem.utilities.db import (get_post_video_quality, get_video_credit_balance,
-                                      deduct_video_credits, refund_video_credits, get_active_avatar)
+    from cqc_lem.utilities.db import (get_post_video_quality, deduct_video_credits, refund_video_credits,
+                                      get_active_avatar)
 
     quality = get_post_video_quality(post_id) if post_id else "standard"
     tier = _premium_tier_for_quality(quality)
@@ -358,8 +370,8 @@ def _generate_video_src(user_id: int, text_content: str, profile, post_id: int =
     model, audio, deducted = STANDARD_VIDEO_MODEL, False, 0
     if tier and user_id:
         pmodel, pcredits, paudio = tier
-        if get_video_credit_balance(user_id) >= pcredits and \
-                deduct_video_credits(user_id, pcredits, post_id, reason=f"premium_video_{pmodel}"):
+        # Conditional decrement: succeeds only if the balance covers it, so no separate check
+        if deduct_video_credits(user_id, pcredits, post_id, reason=f"premium_video_{pmodel}"):
             model, audio, deducted = pmodel, paudio, pcredits
         else:
             myprint(f"Premium video requested but no credits for user {user_id} — using standard")
@@ -456,7 +468,6 @@ def regenerate_post_video_task(post_id: int):
     return regenerate_video_for_post(post_id)
 
 
-@shared_task.task
 def _carousel_slides_are_real_images(slides) -> bool:
     """True if carousel slides reference real images (URLs/paths), not plain text titles."""
     if not slides:
@@ -465,6 +476,7 @@ def _carousel_slides_are_real_images(slides) -> bool:
     return any(marker in blob for marker in ("http", "/assets", ".png", ".jpg"))
 
 
+@shared_task.task
 def regenerate_post_carousel_task(post_id: int):
     """Regenerate a carousel post's slide images (used by the asset-backfill safety net).
 
@@ -493,6 +505,27 @@ def regenerate_post_carousel_task(post_id: int):
     return content
 
 
+def _profile_for_post(user_id: int) -> LinkedInProfile:
+    """The user's cached profile, else a placeholder one.
+
+    Content tasks run concurrently on the llm/media workers, outside the selenium queue's
+    fair share and pacing, so they never open a browser themselves: a missing profile is
+    refreshed by ``update_stale_profile`` on the selenium queue for the next post instead.
+    """
+    user_profile = load_profile_for_user(user_id)
+    if user_profile is not None:
+        return user_profile
+
+    myprint(f"No cached profile for user {user_id}; using a placeholder and queueing a profile refresh")
+    try:
+        from cqc_lem.app.run_automation import update_stale_profile
+        update_stale_profile.apply_async(kwargs={'user_id': user_id})
+    except Exception as e:
+        myprint(f"Could not queue profile refresh for user {user_id}: {e}")
+    # Create empty dummy user profile
+    return LinkedInProfile(full_name="John Doe", job_title="Software Developer", company_name="ABC Inc.", )
+
+
 def create_text_post(user_id: int, stage: str, post_type: str = None, user_profile: LinkedInProfile=None,
                      refine_final_post: bool = True):
     """
@@ -517,16 +550,7 @@ def create_text_post(user_id: int, stage: str, post_type: str = None, user_profi
         post_type = random.choice(post_types)
 
     if user_profile is None:
-        user_email, user_password = get_user_password_pair_by_id(user_id)
-        driver, wait = get_driver_wait_pair(session_name='Create Text Post')
-        try:
-            user_profile = get_my_profile(driver, wait, user_email, user_password, user_id=user_id)
-        except Exception as e:
-            myprint(f"Error getting user profile: {e}")
-            # Create empty dummy user profile
-            user_profile = LinkedInProfile(full_name="John Doe", job_title="Software Developer", company_name="ABC Inc.",)
-        finally:
-            quit_gracefully(driver)
+        user_profile = _profile_for_post(user_id)
 
     # Generate the post based on the selected type
     myprint(f"Creating text post of type: {post_type} for stage: {stage}")
@@ -921,103 +945,164 @@ def extract_page_content(page_url):
         return None, None
 
 
+def _plan_rows(daily_plan: list[dict]) -> list[tuple]:
+    """Convert daily plan dicts into (scheduled_time, PostType, buyer_stage) rows for the bulk insert."""
+    return [
+        (plan['scheduled_datetime'], PostType[plan['post_type'].upper()], plan['stage'])
+        for plan in daily_plan
+    ]
+
+
 def save_content_plan(user_id: int, daily_plan: list[dict]):
     """Save the planned content schedule to the database."""
-    # Insert the 'daily_plan' into a database table for future reference and scheduling
-    for plan in daily_plan:
-        # Convert plan['post_type'] to Post Type object
-        post_type = PostType[plan['post_type'].upper()]
-        insert_planned_post(user_id, plan['scheduled_datetime'], post_type, plan['stage'])
+    # Insert the whole 'daily_plan' in one transaction for future reference and scheduling
+    if not daily_plan:
+        return
+    insert_planned_posts(user_id, _plan_rows(daily_plan))
 
 
 @shared_task.task
 def auto_create_weekly_content(user_id: int = None):
-    """Creates content for the week from the planed content in the database"""
+    """Creates content for the week from the planed content in the database.
+
+    Fans out one ``create_weekly_post`` per planned post as a chord, so one slow video no
+    longer holds up every post behind it; ``report_weekly_content`` collects the outcomes.
+    """
+    started_at = time.time()
 
     if user_id is not None:
         myprint(f"Creating weekly content for user id: {user_id}")
 
-    # Get the planned content for the current week or next week if today is saturday
-    if datetime.now().weekday() >= 5:
-        planned_posts = get_planned_posts_for_next_week(user_id)
-    else:
-        planned_posts = get_planned_posts_for_current_week(user_id)
+    # Stream the planned content for the current week or next week if today is saturday
+    planned_posts = iter_planned_posts(next_week=datetime.now().weekday() >= 5, user_id=user_id)
 
-    if not planned_posts:
+    header = []
+    for post in planned_posts:
+        signature = create_weekly_post.si(post.id, post.user_id, post.post_type, post.buyer_stage)
+        # Text posts only call the LLM; keep them off the media workers (celeryconfig routes)
+        if providers_for_post_type(post.post_type) == ('llm',):
+            signature = signature.set(queue='llm')
+        header.append(signature)
+    if not header:
         myprint("No planned posts found for this period. Skipping content creation.")
         return
 
-    # Cache preferences per user so we don't hit the DB once per post
-    _prefs_cache: dict[int, dict] = {}
+    myprint(f"Creating content for {len(header)} planned post(s)")
+    chord(header)(report_weekly_content.s(started_at=started_at, user_id=user_id))
 
-    for post in planned_posts:
-        user_id = post['user_id']
-        post_id = post['id']
-        post_type = post['post_type']
-        stage = post['buyer_stage']
 
-        try:
-            content, video_url = create_content(user_id, post_type, stage, post_id=post_id)
-        except Exception as e:
-            myprint(f"Skipping post_id {post_id}: content generation raised {type(e).__name__}: {e}")
-            continue
-
-        if content is None:
-            myprint(f"Skipping post_id {post_id}: content generation returned None")
-            continue
-
-        # Copy the video from url to our assets/video folder and store it to the database for later retrieval via api call
-        ai_video = False
-        if video_url:
-            # AI (Runway) output is a remote http URL; Pexels fallback is a local path.
-            ai_video = str(video_url).startswith("http")
-            # Define and create assets_dir / videos
-            videos_dir = os.path.join(assets_dir, 'videos', 'runwayml')
-            create_folder_if_not_exists(videos_dir)
-            video_file_path = save_video_url_to_dir(video_url, videos_dir)
-            myprint(f"Video from url: {video_url} | Saved to: {video_file_path}")
-            # Attach AI Content Credentials to AI-generated video only (not stock).
-            if ai_video:
-                try:
-                    from cqc_lem.utilities.c2pa_helper import add_ai_content_credentials
-                    add_ai_content_credentials(video_file_path)
-                except Exception as e:
-                    myprint(f"C2PA signing skipped for post_id={post_id}: {e}")
-            # Get the file name from the video file path
-            video_file_name = os.path.basename(video_file_path)
+@shared_task.task(bind=True, reject_on_worker_lost=True)
+def create_weekly_post(self, post_id: int, user_id: int, post_type: str, stage: str) -> dict:
+    """Create the content for one planned post. Returns ``{post_id, user_id, status, seconds}``.
 
-            # The video url is our api prefix + 'assets?file=videos/runwayml' +  video_file_name
-            api_video_url = f"{API_URL_FINAL}/api/assets?file_name=videos/runwayml/{video_file_name}"
-            myprint(f"Video URL: {api_video_url}")
+    Waits (by retrying) while a provider the post needs is at its concurrency limit
+    (utilities.provider_slots). Never raises otherwise, so one failed post cannot fail the chord.
+    """
+    started = time.time()
+    providers = providers_for_post_type(post_type)
+    holder = self.request.id or f"post:{post_id}"
+    busy = acquire_provider_slots(providers, holder)
+    if busy:
+        myprint(f"post_id {post_id}: {busy} at its concurrency limit, retrying shortly")
+        raise self.retry(countdown=provider_defer_seconds(), max_retries=None)
 
-            # Update the database with the video url
-            update_db_post_video_url(post_id, api_video_url)
+    try:
+        status = _create_weekly_post(post_id, user_id, post_type, stage)
+    except Exception as e:
+        myprint(f"Skipping post_id {post_id}: content creation raised {type(e).__name__}: {e}")
+        status = "failed"
+    finally:
+        release_provider_slots(providers, holder)
+
+    return {"post_id": post_id, "user_id": user_id, "status": status,
+            "seconds": round(time.time() - started, 3)}
 
-        # Disclose AI-generated visuals in the caption (caption-line fallback for C2PA)
+
+def _create_weekly_post(post_id: int, user_id: int, post_type: str, stage: str) -> str:
+    try:
+        content, video_url = create_content(user_id, post_type, stage, post_id=post_id)
+    except Exception as e:
+        myprint(f"Skipping post_id {post_id}: content generation raised {type(e).__name__}: {e}")
+        return "failed"
+
+    if content is None:
+        myprint(f"Skipping post_id {post_id}: content generation returned None")
+        return "skipped"
+
+    # Copy the video from url to our assets/video folder and store it to the database for later retrieval via api call
+    ai_video = False
+    if video_url:
+        # AI (Runway) output is a remote http URL; Pexels fallback is a local path.
+        ai_video = str(video_url).startswith("http")
+        # Define and create assets_dir / videos
+        videos_dir = os.path.join(assets_dir, 'videos', 'runwayml')
+        create_folder_if_not_exists(videos_dir)
+        video_file_path = save_video_url_to_dir(video_url, videos_dir)
+        myprint(f"Video from url: {video_url} | Saved to: {video_file_path}")
+        # Attach AI Content Credentials to AI-generated video only (not stock).
         if ai_video:
-            content = _apply_ai_disclosure(content)
+            try:
+                from cqc_lem.utilities.c2pa_helper import add_ai_content_credentials
+                add_ai_content_credentials(video_file_path)
+            except Exception as e:
+                myprint(f"C2PA signing skipped for post_id={post_id}: {e}")
+        # Get the file name from the video file path
+        video_file_name = os.path.basename(video_file_path)
+
+        # The video url is our api prefix + 'assets?file=videos/runwayml' +  video_file_name
+        api_video_url = f"{API_URL_FINAL}/api/assets?file_name=videos/runwayml/{video_file_name}"
+        myprint(f"Video URL: {api_video_url}")
+
+        # Update the database with the video url
+        update_db_post_video_url(post_id, api_video_url)
+
+    # Disclose AI-generated visuals in the caption (caption-line fallback for C2PA)
+    if ai_video:
+        content = _apply_ai_disclosure(content)
+
+    # Update the database with the created content
+    myprint(f"Updating content for post_id: {post_id}")
+    update_db_post_content(post_id, content)
+
+    # Respect the user's auto_schedule_posts preference:
+    # True → APPROVED (Celery will pick it up); False → PENDING (manual review required)
+    prefs = get_user_preferences(user_id)
+    auto_schedule = bool(prefs.get("auto_schedule_posts", True))
+    new_status = PostStatus.APPROVED if auto_schedule else PostStatus.PENDING
+
+    # Never auto-approve a video/carousel post whose media failed to generate — hold it
+    # PENDING so the backfill task (or manual review) can complete the asset before it
+    # can be scheduled/posted. Prevents assetless posts going out.
+    if _post_missing_required_asset(post_id, post_type, video_url):
+        new_status = PostStatus.PENDING
+        myprint(f"post_id {post_id}: required media asset missing — holding PENDING")
+
+    myprint(f"Updating post_id: {post_id} Status={new_status}")
+    update_db_post_status(post_id, new_status)
+    return "approved" if new_status == PostStatus.APPROVED else "pending"
 
-        # Update the database with the created content
-        myprint(f"Updating content for post_id: {post_id}")
-        update_db_post_content(post_id, content)
 
-        # Respect the user's auto_schedule_posts preference (fetched once per user):
-        # True → APPROVED (Celery will pick it up); False → PENDING (manual review required)
-        if user_id not in _prefs_cache:
-            _prefs_cache[user_id] = get_user_preferences(user_id)
-        prefs = _prefs_cache[user_id]
-        auto_schedule = bool(prefs.get("auto_schedule_posts", True))
-        new_status = PostStatus.APPROVED if auto_schedule else PostStatus.PENDING
-
-        # Never auto-approve a video/carousel post whose media failed to generate — hold it
-        # PENDING so the backfill task (or manual review) can complete the asset before it
-        # can be scheduled/posted. Prevents assetless posts going out.
-        if _post_missing_required_asset(post_id, post_type, video_url):
-            new_status = PostStatus.PENDING
-            myprint(f"post_id {post_id}: required media asset missing — holding PENDING")
-
-        myprint(f"Updating post_id: {post_id} Status={new_status}")
-        update_db_post_status(post_id, new_status)
+@shared_task.task
+def report_weekly_content(results: list, started_at: float, user_id: int = None) -> dict:
+    """Chord callback: summarise per-post outcomes and record the run's wall-clock time."""
+    results = [r for r in (results or []) if isinstance(r, dict)]
+    summary = {"posts": len(results), "approved": 0, "pending": 0, "skipped": 0, "failed": 0}
+    for result in results:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+        if result["status"] in ("skipped", "failed"):
+            myprint(f"Weekly content | post_id {result['post_id']} (user {result['user_id']}): {result['status']}")
+    summary["wall_seconds"] = round(time.time() - started_at, 3)
+    summary["slowest_post_seconds"] = max((r.get("seconds", 0) for r in results), default=0)
+
+    myprint(f"Weekly content finished in {summary['wall_seconds']}s: {summary}")
+    track_task(
+        task_name="cqc_lem.app.run_content_plan.auto_create_weekly_content",
+        duration_ms=int(summary["wall_seconds"] * 1000),
+        success=summary["failed"] == 0,
+        user_id=user_id,
+        **{k: v for k, v in summary.items() if k != "wall_seconds"},
+    )
+    return summary
 
 
 def is_blog_post(url):
@@ -2,31 +2,48 @@ import os
 import shutil
 from datetime import timedelta, datetime, timezone
 
-from celery_once import QueueOnce
-
 from cqc_lem import assets_dir
 from cqc_lem.app.my_celery import app as shared_task
 from cqc_lem.app.run_automation import automate_commenting, automate_profile_viewer_engagement, \
     automate_appreciation_dms_for_user, clean_stale_invites, update_stale_profile, post_to_linkedin, \
     automate_invites_to_company_page_for_user
 from cqc_lem.utilities.db import (
-    get_ready_to_post_posts, get_orphaned_scheduled_posts, update_db_post_status,
-    get_active_user_ids, PostStatus, has_linkedin_session,
-    get_company_linked_in_url_for_user,
-    get_users_with_stripe_subscriptions, update_subscription_from_stripe,
+    claim_ready_to_post_posts, get_orphaned_scheduled_posts,
+    get_active_user_ids, iter_active_user_ids, iter_active_users, has_linkedin_session,
+    iter_users_with_stripe_subscriptions, update_subscription_from_stripe, reconcile_credit_balances,
 )
-from cqc_lem.utilities.env_constants import SELENIUM_KEEP_VIDEOS_X_DAYS, CQC_LEM_POST_TIME_DELTA_MINUTES
+from cqc_lem.utilities import delayed_dispatch, engagement_session, once_locks
+from cqc_lem.utilities.db_maintenance import run_maintenance
+from cqc_lem.utilities.env_constants import SELENIUM_KEEP_VIDEOS_X_DAYS, CQC_LEM_POST_TIME_DELTA_MINUTES, \
+    CQC_LEM_POST_CLAIM_BATCH
 from cqc_lem.utilities.logger import myprint, log_info, log_debug, log_warning
 from cqc_lem.utilities.notifications import notify_linkedin_session
+from cqc_lem.utilities.once_locks import QueueOnce
+
 
 
+def _dispatch_at(task, kwargs: dict, eta: datetime, post_id: int, scheduled_time: datetime) -> None:
+    """Park ``task`` in the Redis delayed-dispatch set until ``eta``, filed under the post so
+    it can be cancelled or retimed with it. Falls back to a Celery ETA without Redis."""
+    if not delayed_dispatch.schedule(task.name, kwargs, eta, key=delayed_dispatch.post_key(post_id),
+                                     anchor=scheduled_time):
+        task.apply_async(kwargs=kwargs, eta=eta)
+
 
 @shared_task.task(bind=True, base=QueueOnce, once={'graceful': True, }, reject_on_worker_lost=True)
 def auto_check_scheduled_posts(self):
     """Checks if there are any posts to publish."""
 
-    # Get post that should have run between yesterday and in the next 20 minutes
-    posts = get_ready_to_post_posts(post_time_delta_minutes=CQC_LEM_POST_TIME_DELTA_MINUTES)
+    # Claim posts that should have run between yesterday and in the next 20 minutes. The
+    # claim flips them to 'scheduled' in the same transaction that reads them, so another
+    # dispatcher sweeping at the same time never sees them; a full batch means more may be due.
+    posts = []
+    while True:
+        batch = claim_ready_to_post_posts(post_time_delta_minutes=CQC_LEM_POST_TIME_DELTA_MINUTES,
+                                          limit=CQC_LEM_POST_CLAIM_BATCH)
+        posts.extend(batch)
+        if len(batch) < CQC_LEM_POST_CLAIM_BATCH:
+            break
     # Fetch active users only when there are posts (avoids a DB round-trip when idle).
     active_user_ids = set(get_active_user_ids()) if posts else set()
 
@@ -36,15 +53,11 @@ def auto_check_scheduled_posts(self):
         if scheduled_time.tzinfo is None:
             scheduled_time = scheduled_time.replace(tzinfo=timezone.utc)
 
-        log_info(f"Post ready to schedule", post_id=post_id, user_id=user_id, task_name="auto_check_scheduled_posts")
-
-        # Update the DB with post status = scheduled so it won't get processed again
-        update_db_post_status(post_id, PostStatus.SCHEDULED)
         log_info(f"Post {post_id} queued for {scheduled_time}", post_id=post_id, user_id=user_id)
 
         # Schedule the post to be posted (REST API — no Selenium required)
         post_kwargs = {'user_id': user_id, 'post_id': post_id}
-        post_to_linkedin.apply_async(kwargs=post_kwargs, eta=scheduled_time)
+        _dispatch_at(post_to_linkedin, post_kwargs, scheduled_time, post_id, scheduled_time)
 
         # Only dispatch Selenium pre-post tasks for users with an active LinkedIn
         # connection and subscription. Inactive/disconnected users' sessions fail
@@ -53,11 +66,13 @@ def auto_check_scheduled_posts(self):
             base_kwargs = {'user_id': user_id, 'loop_for_duration': 60 * 15}
 
             # Start the pre-post commenting task 15 minutes before scheduled post (loop for 15 minutes)
-            automate_commenting.apply_async(kwargs=base_kwargs, eta=scheduled_time - timedelta(minutes=15))
+            _dispatch_at(automate_commenting, base_kwargs, scheduled_time - timedelta(minutes=15), post_id,
+                         scheduled_time)
 
             # Schedule the pre-post profile viewer dm task 10 minutes before scheduled post (loop for 10 minutes)
-            base_kwargs['loop_for_duration'] = 60 * 10
-            automate_profile_viewer_engagement.apply_async(kwargs=base_kwargs, eta=scheduled_time - timedelta(minutes=10))
+            base_kwargs = {**base_kwargs, 'loop_for_duration': 60 * 10}
+            _dispatch_at(automate_profile_viewer_engagement, base_kwargs, scheduled_time - timedelta(minutes=10),
+                         post_id, scheduled_time)
         else:
             log_warning(
                 "Skipping pre-post Selenium tasks — user not active/connected",
@@ -66,8 +81,10 @@ def auto_check_scheduled_posts(self):
 
     # Re-queue any posts that got stuck in 'scheduled' (task was lost, e.g. on container restart)
     # but never transitioned to 'posted'. The 2-hour gap ensures we don't race with a task
-    # that is still in-flight.
-    orphaned = get_orphaned_scheduled_posts(lookback_hours=2)
+    # that is still in-flight. Posts whose jobs are still parked in Redis are not lost, just
+    # waiting on the dispatcher — re-queueing those would publish them twice.
+    orphaned = [post for post in get_orphaned_scheduled_posts(lookback_hours=2)
+                if not delayed_dispatch.pending(delayed_dispatch.post_key(post[0]))]
     for post_id, scheduled_time, user_id in orphaned:
         if scheduled_time.tzinfo is None:
             scheduled_time = scheduled_time.replace(tzinfo=timezone.utc)
@@ -83,12 +100,59 @@ def auto_check_scheduled_posts(self):
         return f"Started Process for {len(posts)} post(s); re-queued {len(orphaned)} orphaned post(s)"
 
 
+@shared_task.task(bind=True, base=QueueOnce, once={'graceful': True, 'timeout': 60})
+def dispatch_delayed_tasks(self):
+    """Send the delayed tasks that have come due (see utilities.delayed_dispatch)."""
+    result = delayed_dispatch.dispatch_due(_send_delayed_task)
+    if result["dispatched"] or result["failed"]:
+        log_debug(f"Delayed dispatch: {result}", task_name="dispatch_delayed_tasks")
+    return result
+
+
+def _send_delayed_task(task_name: str, kwargs: dict) -> None:
+    # Through the registered task when this process has it, so its own apply_async
+    # behaviour (queue, QueueOnce locking) applies exactly as for a direct dispatch.
+    task = shared_task.tasks.get(task_name)
+    if task is not None:
+        task.apply_async(kwargs=kwargs)
+    else:
+        shared_task.send_task(task_name, kwargs=kwargs)
+
+
+@shared_task.task(bind=True, base=QueueOnce, once={'graceful': True, 'timeout': 60})
+def resume_engagement_sessions(self):
+    """Re-send engagement loops whose worker died mid-session (see utilities.engagement_session)."""
+    result = engagement_session.resume_lost(_send_engagement_task)
+    if result["resumed"] or result["expired"]:
+        log_info(f"Engagement sessions: {result}", task_name="resume_engagement_sessions")
+    return result
+
+
+def _send_engagement_task(task_name: str, kwargs: dict, task_id: str) -> None:
+    # The resumed message must carry the id written to the checkpoint, so it owns the session
+    task = shared_task.tasks.get(task_name)
+    if task is not None:
+        task.apply_async(kwargs=kwargs, task_id=task_id)
+    else:
+        shared_task.send_task(task_name, kwargs=kwargs, task_id=task_id)
+
+
+@shared_task.task(bind=True, base=QueueOnce, once={'graceful': True, 'timeout': 60})
+def reap_once_locks(self):
+    """Release task locks left behind by runs that finished without releasing them (see
+    utilities.once_locks)."""
+    result = once_locks.reap_stale(lambda task_id: shared_task.AsyncResult(task_id).state)
+    if result["reaped"]:
+        log_warning(f"Reaped stale task locks: {result}", task_name="reap_once_locks")
+    return result
+
+
 @shared_task.task
 def auto_appreciate_dms():
-    # For each user schedule appreciate DMS
-    users = get_active_user_ids()
-
-    for user_id in users:
+    # For each user schedule appreciate DMS, dispatching while the user scan is still reading
+    users = 0
+    for user_id in iter_active_user_ids():
+        users += 1
         # Send appreciation DM for 5 minutes
         kwargs = {
             'user_id': user_id,
@@ -102,10 +166,10 @@ def auto_appreciate_dms():
                                                            'interval_start': 60,
                                                            'interval_step': 30
                                                        })
-    if len(users) == 0:
+    if users == 0:
         return f"No Active Users"
     else:
-        return f"Started Appreciate DM Process for {len(users)} user(s)"
+        return f"Started Appreciate DM Process for {users} user(s)"
 
 
 @shared_task.task
@@ -113,16 +177,16 @@ def auto_notify_missing_linkedin_session():
     """Email active users who have no validated LinkedIn session cookie, prompting them
     to connect — automation can't run without one. Throttled per-user inside
     notify_linkedin_session, so this can run daily without spamming."""
-    users = get_active_user_ids()
-    notified = 0
-    for user_id in users:
+    users = notified = 0
+    for user_id in iter_active_user_ids():
+        users += 1
         try:
             if not has_linkedin_session(user_id):
                 if notify_linkedin_session(user_id, revalidation=False):
                     notified += 1
         except Exception as e:
             log_warning("Failed to notify missing LinkedIn session", exc=e, user_id=user_id)
-    return f"Notified {notified} of {len(users)} active user(s) missing a LinkedIn session"
+    return f"Notified {notified} of {users} active user(s) missing a LinkedIn session"
 
 
 @shared_task.task
@@ -130,12 +194,13 @@ def auto_backfill_missing_assets():
     """Safety net: regenerate missing media for unposted video/carousel posts before they
     publish, so a post never reaches its scheduled time without its asset (e.g. when the
     original generation failed)."""
-    from cqc_lem.utilities.db import get_unposted_posts_missing_assets
+    from cqc_lem.utilities.db import iter_unposted_posts_missing_assets
     from cqc_lem.app.run_content_plan import regenerate_post_video_task, regenerate_post_carousel_task
 
-    posts = get_unposted_posts_missing_assets()
-    queued = 0
-    for post_id, user_id, post_type, buyer_stage, scheduled_time in posts:
+    # Streamed: regenerations are dispatched while the scan is still reading
+    scanned = queued = 0
+    for post_id, user_id, post_type, buyer_stage, scheduled_time in iter_unposted_posts_missing_assets():
+        scanned += 1
         pt = str(post_type).lower()
         if pt == 'video':
             regenerate_post_video_task.apply_async(kwargs={'post_id': post_id})
@@ -145,7 +210,7 @@ def auto_backfill_missing_assets():
             queued += 1
         log_warning("Backfilling missing media asset for unposted post",
                     post_id=post_id, user_id=user_id, task_name="auto_backfill_missing_assets")
-    log_info(f"Asset backfill: queued {queued} regeneration(s) across {len(posts)} post(s)",
+    log_info(f"Asset backfill: queued {queued} regeneration(s) across {scanned} post(s)",
              task_name="auto_backfill_missing_assets")
     return f"Queued {queued} asset regeneration(s)"
 
@@ -154,10 +219,10 @@ def auto_backfill_missing_assets():
 def auto_clean_stale_invites():
     """Cleans up stale invites for each active user"""
 
-    # Get all active users and loop through them
-    users = get_active_user_ids()
-
-    for user_id in users:
+    # Stream the active users and loop through them
+    users = 0
+    for user_id in iter_active_user_ids():
+        users += 1
         # Clean up stale invites for this user
         kwargs = {'user_id': user_id}
         clean_stale_invites.apply_async(kwargs=kwargs, retry=True,
@@ -166,20 +231,20 @@ def auto_clean_stale_invites():
                                             'interval_start': 60,
                                             'interval_step': 30
                                         })
-    if len(users) == 0:
+    if users == 0:
         return f"No Active Users"
     else:
-        return f"Started Process for {len(users)} user(s)"
+        return f"Started Process for {users} user(s)"
 
 
 @shared_task.task
 def auto_clean_stale_profiles():
     """Cleans up stale profiles for each active user"""
 
-    # Get all active users and loop through them
-    users = get_active_user_ids()
-
-    for user_id in users:
+    # Stream the active users and loop through them
+    users = 0
+    for user_id in iter_active_user_ids():
+        users += 1
         log_info(f"Cleaning stale profiles", user_id=user_id, task_name="auto_clean_stale_profiles")
 
         # Clean up stale profiles for this user
@@ -192,25 +257,24 @@ def auto_clean_stale_profiles():
                                              'interval_step': 30
                                          })
 
-    if len(users) == 0:
+    if users == 0:
         return f"No Active Users"
     else:
-        return f"Started Process for {len(users)} user(s)"
+        return f"Started Process for {users} user(s)"
 
 
 @shared_task.task
 def auto_invite_to_company_pages():
     """Start invite process for each active user who has a linked in company page"""
 
-    # Get all active users and loop through them
-    users = get_active_user_ids()
-
+    # Stream active users with their company page in one pass instead of a lookup per user
     started = 0
-    for user_id in users:
+    for user in iter_active_users(columns=('company_linked_in_url',)):
+        user_id = user['id']
         # Only invite for users who have actually set a company page — otherwise the
         # inviter would build "<None>?invite=true" and fail. Invite credits are limited
         # and reset monthly, which is why this runs on the 1st.
-        if not get_company_linked_in_url_for_user(user_id):
+        if not user['company_linked_in_url']:
             log_debug("Skipping company page invites — no company page set",
                       user_id=user_id, task_name="auto_invite_to_company_pages")
             continue
@@ -315,12 +379,11 @@ def sync_stripe_subscriptions(self):
         fetch_subscription, get_subscription_tier_from_price, stripe_status_to_db,
     )
 
-    rows = get_users_with_stripe_subscriptions()
-    log_info(f"Stripe subscription sync: checking {len(rows)} subscriber(s)", task_name="sync_stripe_subscriptions")
-
-    for row in rows:
-        sub_id = row.get("stripe_subscription_id")
-        customer_id = row.get("stripe_customer_id")
+    checked = 0
+    for row in iter_users_with_stripe_subscriptions():
+        checked += 1
+        sub_id = row.stripe_subscription_id
+        customer_id = row.stripe_customer_id
         if not sub_id:
             continue
 
@@ -341,15 +404,42 @@ def sync_stripe_subscriptions(self):
         period_end_ts = sub.get("current_period_end")
         period_end = datetime.fromtimestamp(period_end_ts, tz=timezone.utc) if period_end_ts else None
 
-        current_db_status = row.get("subscription_status")
-        if current_db_status != db_status or (tier and tier != row.get("subscription_tier")):
+        current_db_status = row.subscription_status
+        if current_db_status != db_status or (tier and tier != row.subscription_tier):
             log_info(
-                f"Syncing subscription: DB={current_db_status}/{row.get('subscription_tier')} → Stripe={db_status}/{tier}",
-                user_id=row["id"], api_provider="stripe",
+                f"Syncing subscription: DB={current_db_status}/{row.subscription_tier} → Stripe={db_status}/{tier}",
+                user_id=row.id, api_provider="stripe",
             )
             update_subscription_from_stripe(customer_id, db_status, tier, sub_id, period_end)
         else:
-            log_debug(f"Subscription up-to-date ({db_status}/{tier})", user_id=row["id"])
+            log_debug(f"Subscription up-to-date ({db_status}/{tier})", user_id=row.id)
+
+    log_info(f"Stripe subscription sync: checked {checked} subscriber(s)", task_name="sync_stripe_subscriptions")
+
+
+@shared_task.task
+def auto_reconcile_credit_balances():
+    """Safety net: rebuild the materialized avatar/video credit balances from their ledgers
+    and report any drift (every ledger write updates its balance in the same transaction,
+    so drift means a manual ledger edit or a bug)."""
+    fixed = 0
+    for kind in ('avatar', 'video'):
+        drift = reconcile_credit_balances(kind)
+        for user_id, (was, now) in drift.items():
+            log_warning(f"Reconciled {kind} credit balance {was} -> {now}",
+                        user_id=user_id, task_name="auto_reconcile_credit_balances")
+        fixed += len(drift)
+    return f"Reconciled {fixed} credit balance(s)"
+
+
+@shared_task.task(bind=True, base=QueueOnce, once={'graceful': True})
+def auto_db_maintenance(self, dry_run: bool = False):
+    """Retention: add upcoming logs month partitions, archive and drop the ones past
+    LOGS_RETENTION_MONTHS, purge logs of deleted users and expired sessions (see
+    utilities.db_maintenance). ``dry_run`` only reports what would be done."""
+    summary = run_maintenance(dry_run=dry_run)
+    log_info(f"DB maintenance{' (dry run)' if dry_run else ''}: {summary}", task_name="auto_db_maintenance")
+    return summary
 
 
 if __name__ == "__main__":
@@ -79,13 +79,28 @@ selenium_stack.add_dependency(main_stack)
 
 celery_worker_stack = CeleryWorkerStack(app, "CeleryWorkerStack",
                                         env=env,
-                                        props=main_stack.outputs
+                                        props=main_stack.outputs,
+                                        queues=("celery", "llm", "media", "maintenance"),
                                         # props=device_farm_stack.outputs
                                         # props=selenium_stack.outputs
                                         )
 
 # Add dependencies to ensure correct order
 celery_worker_stack.add_dependency(main_stack)
+
+# Scheduled posts get their own small service so a media/LLM backlog never delays them
+celery_publish_worker_stack = CeleryWorkerStack(app, "CeleryPublishWorkerStack",
+                                                env=env,
+                                                props=main_stack.outputs,
+                                                cpu=256,
+                                                memory_limit_mib=512,
+                                                queues=("publish",),
+                                                worker_name="celery_worker_publish",
+                                                max_capacity=5,
+                                                )
+
+# Add dependencies to ensure correct order
+celery_publish_worker_stack.add_dependency(main_stack)
 # celery_worker_stack.add_dependency(selenium_stack)
 # celery_worker_stack.add_dependency(device_farm_stack)
 
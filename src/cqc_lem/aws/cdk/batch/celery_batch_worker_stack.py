@@ -143,10 +143,13 @@ class CeleryBatchWorkerStack(Stack):
             alarm = cloudwatch.Alarm(
                 self, f"RedisQueueAlarmThreshold{config['threshold']}",
                 metric=cloudwatch.Metric(
-                    namespace="cqc-lem/celery_queue/celery",  # TODO: Need this somewhere central
+                    namespace="cqc-lem/celery_queue",  # TODO: Need this somewhere central
                     metric_name="QueueLength",
                     period=Duration.minutes(1),
-                    statistic="Maximum"
+                    statistic="Maximum",
+                    dimensions_map={
+                        "QueueName": "celery"
+                    }
                 ),
                 threshold=config['threshold'],
                 evaluation_periods=config['periods'],
@@ -11,18 +11,30 @@ from cqc_lem.aws.cdk.shared_stack_props import SharedStackProps
 
 
 class CeleryWorkerStack(Stack):
+    """One Fargate worker service draining ``queues`` (most time-critical first).
+
+    Pool and concurrency come from QUEUE_TOPOLOGY in cqc_lem/app/celeryconfig.py through
+    /start-celeryworker-queue, and the service scales on the summed length of the queues it
+    consumes, so each worker service scales on its own backlog.
+    """
 
     def __init__(self, scope: Construct, id: str,
                  props: SharedStackProps,
                  cpu: int = 512,
                  memory_limit_mib: int = 1024,
+                 queues: tuple[str, ...] = ("celery", "llm", "media", "maintenance"),
+                 worker_name: str = "celery_worker",
+                 max_capacity: int = 50,
                  **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
 
+        # e.g. celery_worker_publish -> celery-worker-publish for service and policy names
+        resource_name = worker_name.replace('_', '-')
+
         # Create a new Fargate Task Definition
         task_definition = ecs.FargateTaskDefinition(
             self, 'CeleryWorkerFargateTaskDef',
-            family='celery_worker',
+            family=worker_name,
             cpu=cpu,
             memory_limit_mib=memory_limit_mib,
             task_role=props.task_execution_role
@@ -37,10 +49,10 @@ class CeleryWorkerStack(Stack):
 
         # Add a new container to the Fargate Task Definition
         celery_worker_container = task_definition.add_container("CeleryWorkerContainer",
-                                                                container_name="celery_worker",
+                                                                container_name=worker_name,
                                                                 image=ecs.ContainerImage.from_docker_image_asset(
                                                                     props.ecr_docker_asset),
-                                                                command=["/start-celeryworker-solo"],
+                                                                command=["/start-celeryworker-queue"],
                                                                 environment={
                                                                     # Env passed through props back to service ENV
                                                                     "OPENAI_API_KEY": props.open_api_key,
@@ -61,8 +73,8 @@ class CeleryWorkerStack(Stack):
                                                                     "AWS_REGION": props.env.region,
                                                                     "CELERY_BROKER_URL": f"redis://{props.redis_url}:{props.redis_port}/0",
                                                                     "CELERY_RESULT_BACKEND": f"redis://{props.redis_url}:{props.redis_port}/1",
-                                                                    "CELERY_QUEUE": "celery",
-                                                                    # ^^^ Use this to define different priority of queues with more or less processing power
+                                                                    "CELERY_WORKER_QUEUES": ",".join(queues),
+                                                                    # ^^^ Drained most time-critical first (queue_order_strategy=priority)
                                                                     # Use the AWS Device Farm by setting below env variables
                                                                     "DEVICE_FARM_PROJECT_ARN": props.device_farm_project_arn,
                                                                     "TEST_GRID_PROJECT_ARN": props.test_grid_project_arn,
@@ -80,10 +92,10 @@ class CeleryWorkerStack(Stack):
 
                                                                 },
                                                                 logging=ecs.LogDriver.aws_logs(
-                                                                    stream_prefix="celery_worker_logs",
+                                                                    stream_prefix=f"{worker_name}_logs",
                                                                     log_group=logs.LogGroup(
                                                                         self, "CeleryWorkerLogGroup",
-                                                                        log_group_name="/cqc-lem/celery_worker",
+                                                                        log_group_name=f"/cqc-lem/{worker_name}",
                                                                         retention=logs.RetentionDays.ONE_WEEK,
                                                                         removal_policy=RemovalPolicy.DESTROY
                                                                     )
@@ -119,7 +131,7 @@ class CeleryWorkerStack(Stack):
             min_healthy_percent=100,
             vpc_subnets=ec2.SubnetSelection(one_per_az=True, subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS),
             security_groups=security_groups,
-            service_name="celery-worker-service",
+            service_name=f"{resource_name}-service",
             capacity_provider_strategies=[
                 ecs.CapacityProviderStrategy(
                     capacity_provider='FARGATE',
@@ -143,10 +155,10 @@ class CeleryWorkerStack(Stack):
 
         # Create the scalable target
         target = applicationautoscaling.ScalableTarget(
-            self, f'celery-worker-scalable-target',
+            self, f'{resource_name}-scalable-target',
             service_namespace=applicationautoscaling.ServiceNamespace.ECS,
             min_capacity=1,
-            max_capacity=50,  # TODO: Find a good number for max celery workers capacity
+            max_capacity=max_capacity,  # TODO: Find a good number for max celery workers capacity
             resource_id=f'service/{props.ecs_cluster.cluster_name}/{celery_worker_service.service_name}',
             scalable_dimension='ecs:service:DesiredCount'
         )
@@ -184,8 +196,8 @@ class CeleryWorkerStack(Stack):
         '''
 
         scaling_policy = applicationautoscaling.TargetTrackingScalingPolicy(
-            self, f"celery_worker-target-cpu-scaling-policy",
-            policy_name=f"celery-worker-scalable-target-cpu-scaling",
+            self, f"{worker_name}-target-cpu-scaling-policy",
+            policy_name=f"{resource_name}-scalable-target-cpu-scaling",
             scaling_target=target,
             target_value=40.0,  # 40% CPU utilization target
             scale_in_cooldown=Duration.seconds(300),  # 5 minutes
@@ -193,19 +205,29 @@ class CeleryWorkerStack(Stack):
             predefined_metric=applicationautoscaling.PredefinedMetric.ECS_SERVICE_AVERAGE_CPU_UTILIZATION
         )
 
-        queue_length_metric = cloudwatch.Metric(
-            namespace="cqc-lem/celery_queue/celery",
-            metric_name="QueueLength",
+        # Backlog across every queue this service consumes; a queue with no datapoint counts as empty
+        queue_metrics = {
+            f"q{i}": cloudwatch.Metric(
+                namespace="cqc-lem/celery_queue",
+                metric_name="QueueLength",
+                period=Duration.minutes(1),
+                statistic="Maximum",
+                dimensions_map={
+                    "QueueName": queue
+                }
+            )
+            for i, queue in enumerate(queues)
+        }
+        queue_length_metric = cloudwatch.MathExpression(
+            expression=" + ".join(f"FILL({name}, 0)" for name in queue_metrics),
+            using_metrics=queue_metrics,
+            label=f"{worker_name} queue length",
             period=Duration.minutes(1),
-            statistic="Maximum",
-            dimensions_map={
-                "QueueName": "celery"
-            }
         )
 
         # Create the scaling policy with steps based on queue length thresholds
         target.scale_on_metric(
-            'celery-worker-queue-length-scaling',
+            f'{resource_name}-queue-length-scaling',
             metric=queue_length_metric,  # Use queue_length_metric instead of worker_utilization_metric
             adjustment_type=applicationautoscaling.AdjustmentType.EXACT_CAPACITY,
             evaluation_periods=2,  # Add this
@@ -1,13 +1,24 @@
+import atexit
+import base64
 import json
 import os
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from enum import StrEnum
-from typing import Optional
+from typing import Iterator, NamedTuple, Optional
 
 import mysql.connector
+from cqc_lem.utilities import db_metrics
+from cqc_lem.utilities.db_log_buffer import LogBuffer, log_buffer_max_rows, log_buffer_flush_seconds
+from cqc_lem.utilities.db_pool import ConnectionPool, SecretCache, pool_size, pool_timeout, pool_ping_after, \
+    secret_ttl
+from cqc_lem.utilities.db_replica import ReplicaRouter, replica_max_lag, replica_lag_check_interval
 from cqc_lem.utilities.env_constants import AWS_MYSQL_SECRET_NAME, AWS_REGION
 from cqc_lem.utilities.linkedin.profile import LinkedInProfile
 from cqc_lem.utilities.logger import myprint
+from cqc_lem.utilities.session_cache import SessionCache, session_cache_ttl, session_cache_uses_redis
+from cqc_lem.utilities.ttl_cache import TTLCache
 from cqc_lem.utilities.utils import get_top_level_domain, get_aws_ssm_secret
 from dotenv import load_dotenv
 from mysql.connector import errorcode
@@ -24,14 +35,13 @@ MYSQL_USER = os.getenv('MYSQL_USER')
 MYSQL_PASSWORD = os.getenv('MYSQL_PASSWORD')
 MYSQL_DATABASE = os.getenv('MYSQL_DATABASE')
 MYSQL_PORT = os.getenv('MYSQL_PORT')
+# Optional read replica; same credentials and schema as the primary
+MYSQL_REPLICA_HOST = os.getenv('MYSQL_REPLICA_HOST')
+MYSQL_REPLICA_PORT = os.getenv('MYSQL_REPLICA_PORT')
 
 
-def get_db_connection():
-    """Establishes a connection to the MySQL database and returns the connection object.
-
-    Raises:
-        mysql.connector.Error: If there is an error connecting to the database.
-    """
+def _load_mysql_settings() -> dict:
+    """Resolve connection settings, preferring the AWS secret when one is configured."""
 
     global MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE, MYSQL_PORT
 
@@ -44,7 +54,7 @@ def get_db_connection():
         MYSQL_DATABASE = secret_dict['dbname']
         MYSQL_PORT = secret_dict['port']
 
-    return mysql.connector.connect(
+    return dict(
         host=MYSQL_HOST,
         user=MYSQL_USER,
         password=MYSQL_PASSWORD,
@@ -54,6 +64,85 @@ def get_db_connection():
     )
 
 
+# The AWS secret is cached for MYSQL_SECRET_TTL_SECONDS and re-read on an auth failure
+# (rotation), instead of one Secrets Manager call per connection.
+_mysql_settings = SecretCache(_load_mysql_settings, secret_ttl())
+_pool = ConnectionPool(_mysql_settings.get, size=pool_size(), timeout=pool_timeout(),
+                       ping_after=pool_ping_after(), on_auth_failure=_mysql_settings.invalidate)
+os.register_at_fork(after_in_child=_pool.discard_after_fork)
+
+
+def _load_replica_settings() -> dict:
+    settings = dict(_mysql_settings.get())
+    settings['host'] = MYSQL_REPLICA_HOST
+    settings['port'] = MYSQL_REPLICA_PORT or settings['port']
+    return settings
+
+
+# Read-only helpers that tolerate a few seconds of staleness read through this router
+# (see db_replica); without MYSQL_REPLICA_HOST it always answers "primary".
+_replica_router = ReplicaRouter(
+    ConnectionPool(_load_replica_settings, size=pool_size(), timeout=pool_timeout(),
+                   ping_after=pool_ping_after(), on_auth_failure=_mysql_settings.invalidate)
+    if MYSQL_REPLICA_HOST else None,
+    max_lag=replica_max_lag(), check_interval=replica_lag_check_interval(),
+)
+os.register_at_fork(after_in_child=_replica_router.discard_after_fork)
+
+
+def get_db_connection():
+    """Check a connection out of the process-wide pool.
+
+    The returned connection's close() gives it back to the pool, so callers keep the
+    usual ``finally: connection.close()`` pattern (or use ``db_connection()``).
+
+    Raises:
+        mysql.connector.Error: If there is an error connecting to the database, or
+            PoolExhausted if no connection frees up within MYSQL_POOL_TIMEOUT_SECONDS.
+    """
+    return _pool.acquire()
+
+
+@contextmanager
+def db_connection():
+    """Context manager yielding a pooled connection that is returned on exit."""
+    connection = get_db_connection()
+    try:
+        yield connection
+    finally:
+        connection.close()
+
+
+def get_read_connection(user_id: Optional[int] = None):
+    """Connection for a read-only query that can tolerate replica lag.
+
+    Returns a read-replica connection when one is configured, within
+    MYSQL_REPLICA_MAX_LAG_SECONDS and not behind a recent write for ``user_id`` (or by the
+    current request/task); otherwise a primary connection. Never use it for a read
+    that feeds a write decision.
+    """
+    connection = _replica_router.acquire(user_id)
+    return connection if connection is not None else get_db_connection()
+
+
+def get_db_pool_stats() -> dict:
+    """Pool metrics for this process: checked_out, idle, waits, wait_time_ms, ..."""
+    return _pool.stats()
+
+
+def get_replica_stats() -> dict:
+    """Replica routing for this process: enabled, lag_seconds, replica_reads, primary_reads, ..."""
+    return _replica_router.stats()
+
+
+def reset_db_pool() -> None:
+    """Close idle pooled connections and start from an empty pool (tests, shutdown)."""
+    _pool.close_all()
+    _pool.discard_after_fork()
+    _replica_router.reset()
+    _mysql_settings.invalidate()
+
+
 class PostType(StrEnum):
     TEXT = 'text'
     CAROUSEL = 'carousel'
@@ -391,6 +480,7 @@ def insert_post(email: str, content: str, scheduled_time: datetime, post_type: P
     finally:
         cursor.close()
         connection.close()
+        invalidate_post_stats(user_id)
 
     return success
 
@@ -421,9 +511,69 @@ def insert_planned_post(user_id: int, scheduled_time: datetime, post_type: PostT
     finally:
         cursor.close()
         connection.close()
+        invalidate_post_stats(user_id)
     return success
 
 
+# Rows per multi-row INSERT statement. Keeps each statement well under max_allowed_packet
+# while still collapsing a month of plans for hundreds of users into a handful of statements.
+_PLANNED_POST_INSERT_CHUNK = 500
+
+
+def insert_planned_posts(user_id: int, rows: list[tuple[datetime, PostType, str]]) -> int:
+    """Insert a user's planned posts (scheduled_time, post_type, buyer_stage) in one transaction.
+
+    Returns the number of rows inserted (0 on error — nothing is committed).
+    """
+    return insert_planned_posts_batch({user_id: rows})
+
+
+def insert_planned_posts_batch(plans: dict[int, list[tuple[datetime, PostType, str]]]) -> int:
+    """Insert planned posts for many users using multi-row INSERTs in a single transaction.
+
+    ``plans`` maps user_id -> [(scheduled_time, post_type, buyer_stage), ...].
+    Returns the number of rows inserted (0 on error — the whole batch is rolled back).
+    """
+    values = []
+    for user_id, rows in plans.items():
+        for scheduled_time, post_type, buyer_stage in rows:
+            # Convert scheduled_time to UTC
+            if scheduled_time.tzinfo is None:
+                scheduled_time = scheduled_time.replace(tzinfo=timezone.utc)
+            else:
+                scheduled_time = scheduled_time.astimezone(timezone.utc)
+            values.append((scheduled_time, post_type.value, user_id, buyer_stage, PostStatus.PLANNING.value, 'TBD'))
+
+    if not values:
+        return 0
+
+    connection = get_db_connection()
+    cursor = connection.cursor()
+
+    inserted = 0
+    try:
+        for start in range(0, len(values), _PLANNED_POST_INSERT_CHUNK):
+            chunk = values[start:start + _PLANNED_POST_INSERT_CHUNK]
+            placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(chunk))
+            cursor.execute(
+                f"INSERT INTO posts (scheduled_time, post_type, user_id, buyer_stage, status, content) "
+                f"VALUES {placeholders}",
+                [param for row in chunk for param in row]
+            )
+            inserted += cursor.rowcount
+        connection.commit()
+    except mysql.connector.Error as e:
+        connection.rollback()
+        inserted = 0
+        myprint(f"Could not insert planned posts. An error occurred: {e}")
+    finally:
+        cursor.close()
+        connection.close()
+        for user_id in plans:
+            invalidate_post_stats(user_id)
+    return inserted
+
+
 def update_db_post(content: str, video_url: str, scheduled_time: datetime, post_type: PostType, post_id: int,
                    post_status: PostStatus) -> bool:
     connection = get_db_connection()
@@ -452,6 +602,7 @@ def update_db_post(content: str, video_url: str, scheduled_time: datetime, post_
     finally:
         cursor.close()
         connection.close()
+        invalidate_post_stats()
 
     return success
 
@@ -525,49 +676,191 @@ def update_db_post_status(post_id: int, post_status: PostStatus) -> bool:
     finally:
         cursor.close()
         connection.close()
+        invalidate_post_stats()
 
     return success
 
 
-def get_posts(user_id: int, limit: int = 10, offset: int = 0,
-              sort_order: str = 'asc', status_filter: Optional[str] = None) -> tuple[list, int]:
-    connection = get_db_connection()
+def _post_stats_ttl() -> float:
+    try:
+        return float(os.getenv("POST_STATS_CACHE_TTL_SECONDS", "30"))
+    except ValueError:
+        return 30.0
+
+
+# Per-user post aggregates backing the dashboard and the /posts/ total. Writes that know
+# the user evict just that user; writes keyed by post id clear the (small, per-process) cache.
+_post_stats_cache = TTLCache(maxsize=2048, ttl=_post_stats_ttl())
+
+
+def _current_week_start() -> datetime:
+    """Monday 00:00 UTC of the current week, naive like the posts DATETIME columns."""
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    # Use timedelta, not replace(day=...): naive day subtraction goes out of range in the
+    # first days of a month (e.g. Wed the 1st → day=-1).
+    return today - timedelta(days=today.weekday())
+
+
+def get_post_dashboard_stats(user_id: int) -> dict:
+    """Aggregate a user's posts in one grouped query, cached for POST_STATS_CACHE_TTL_SECONDS.
+
+    Returns scheduled_this_week (approved/pending posts scheduled Monday-Sunday of the
+    current UTC week), pending_review, posted_total, total, and by_status / by_type
+    histograms. Returns None on a database error.
+    """
+    week_start = _current_week_start()
+    stats = _post_stats_cache.get(user_id)
+    if stats is not None and stats['week_start'] == week_start:
+        return stats
+
+    connection = get_read_connection(user_id)
     cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute(*_post_stats_query(user_id, week_start))
+        rows = cursor.fetchall()
+    except mysql.connector.Error as err:
+        myprint(f"Could not get post stats for user id: {user_id} | Error: {err}")
+        return None
+    finally:
+        cursor.close()
+        connection.close()
 
-    order = 'ASC' if sort_order.lower() != 'desc' else 'DESC'
+    stats = _post_stats_from_rows(week_start, rows)
+    _post_stats_cache.set(user_id, stats)
+    return stats
+
+
+def _post_stats_query(user_id: int, week_start: datetime) -> tuple[str, tuple]:
+    return (
+        "SELECT post_type, status, COUNT(*) AS total, "
+        "SUM(status IN (%s, %s) AND scheduled_time >= %s AND scheduled_time < %s) AS this_week "
+        "FROM posts WHERE user_id = %s GROUP BY post_type, status",
+        (PostStatus.APPROVED.value, PostStatus.PENDING.value,
+         week_start, week_start + timedelta(days=7), user_id)
+    )
+
+
+def _post_stats_from_rows(week_start: datetime, rows: list[dict]) -> dict:
+    by_status: dict[str, int] = {}
+    by_type: dict[str, int] = {}
+    scheduled_this_week = 0
+    for row in rows:
+        total = int(row['total'])
+        by_status[row['status']] = by_status.get(row['status'], 0) + total
+        by_type[row['post_type']] = by_type.get(row['post_type'], 0) + total
+        scheduled_this_week += int(row['this_week'] or 0)
+
+    return {
+        'week_start': week_start,
+        'scheduled_this_week': scheduled_this_week,
+        'pending_review': by_status.get(PostStatus.PENDING.value, 0),
+        'posted_total': by_status.get(PostStatus.POSTED.value, 0),
+        'total': sum(by_status.values()),
+        'by_status': by_status,
+        'by_type': by_type,
+    }
+
+
+def get_post_status_counts(user_id: int) -> dict[str, int]:
+    """Number of the user's posts in each status (from the cached dashboard aggregate)."""
+    stats = get_post_dashboard_stats(user_id)
+    return stats['by_status'] if stats else {}
+
+
+def invalidate_post_stats(user_id: Optional[int] = None) -> None:
+    """Drop the cached aggregates for one user, or for everyone when the user is unknown.
+
+    Every post writer calls this, so it also keeps the user's (and this context's) routed
+    reads on the primary until the replica has caught up.
+    """
+    _replica_router.mark_write(user_id)
+    if user_id is None:
+        _post_stats_cache.clear()
+    else:
+        _post_stats_cache.pop(user_id)
 
+
+def encode_post_cursor(post: dict) -> Optional[str]:
+    """Opaque /posts/ cursor pointing just after ``post`` in (scheduled_time, id) order."""
+    scheduled_time = post.get('scheduled_time')
+    if scheduled_time is None:
+        return None
+    if isinstance(scheduled_time, datetime):
+        scheduled_time = scheduled_time.isoformat()
+    raw = f"{scheduled_time}|{post['id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_post_cursor(cursor: str) -> tuple[datetime, int]:
+    """Inverse of encode_post_cursor. Raises ValueError on a malformed cursor."""
     try:
-        where = "WHERE user_id = %s"
-        params: list = [user_id]
-        if status_filter:
-            where += " AND status = %s"
-            params.append(status_filter.lower())
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        scheduled_time, post_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(scheduled_time), int(post_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid posts cursor: {cursor!r}") from e
 
-        cursor.execute(
-            f"SELECT COUNT(*) AS total FROM posts {where}",
-            params
-        )
-        total = cursor.fetchone()['total']
 
-        cursor.execute(
-            f"SELECT id, content, video_url, scheduled_time, post_type, status, carousel_slides "
-            f"FROM posts {where} ORDER BY scheduled_time {order} LIMIT %s OFFSET %s",
-            params + [limit, offset]
-        )
-        posts = cursor.fetchall()
+def get_posts(user_id: int, limit: int = 10, offset: int = 0,
+              sort_order: str = 'asc', status_filter: Optional[str] = None,
+              cursor: Optional[str] = None, include_total: bool = True) -> tuple[list, Optional[int]]:
+    """Page through a user's posts ordered by (scheduled_time, id).
+
+    With ``cursor`` (from encode_post_cursor on the last row of the previous page) the page
+    is fetched by keyset — it costs the same at any depth — and ``offset`` is ignored.
+    The total comes from the cached status histogram, or is None when ``include_total`` is
+    False. Raises ValueError for a malformed cursor.
+    """
+    sql, params = _posts_page_query(user_id, limit, offset, sort_order, status_filter, cursor)
+
+    connection = get_read_connection(user_id)
+    db_cursor = connection.cursor(dictionary=True)
+    try:
+        db_cursor.execute(sql, params)
+        posts = db_cursor.fetchall()
     except mysql.connector.Error as err:
         myprint(f"Could not get posts for user id: {user_id} | Error: {err}")
-        posts = []
-        total = 0
+        return [], 0 if include_total else None
     finally:
-        cursor.close()
+        db_cursor.close()
         connection.close()
 
-    return posts, total
+    if not include_total:
+        return posts, None
+    return posts, _posts_total(get_post_status_counts(user_id), status_filter)
+
+
+def _posts_page_query(user_id: int, limit: int, offset: int, sort_order: str,
+                      status_filter: Optional[str], cursor: Optional[str]) -> tuple[str, list]:
+    """SELECT and params for one get_posts page. Raises ValueError for a malformed cursor."""
+    after = decode_post_cursor(cursor) if cursor else None
+
+    order = 'ASC' if sort_order.lower() != 'desc' else 'DESC'
+    where = "WHERE user_id = %s"
+    params: list = [user_id]
+    if status_filter:
+        where += " AND status = %s"
+        params.append(status_filter.lower())
+    if after:
+        op = '>' if order == 'ASC' else '<'
+        where += f" AND (scheduled_time {op} %s OR (scheduled_time = %s AND id {op} %s))"
+        params.extend([after[0], after[0], after[1]])
+        page = "LIMIT %s"
+        params.append(limit)
+    else:
+        page = "LIMIT %s OFFSET %s"
+        params.extend([limit, offset])
+
+    return (f"SELECT id, content, video_url, scheduled_time, post_type, status, carousel_slides "
+            f"FROM posts {where} ORDER BY scheduled_time {order}, id {order} {page}", params)
+
+
+def _posts_total(counts: dict[str, int], status_filter: Optional[str]) -> int:
+    return counts.get(status_filter.lower(), 0) if status_filter else sum(counts.values())
 
 
 def get_posted_posts(user_id: int):
-    connection = get_db_connection()
+    connection = get_read_connection(user_id)
     cursor = connection.cursor(dictionary=True)
 
     try:
@@ -587,14 +880,16 @@ def get_posted_posts(user_id: int):
 
 
 def get_post_by_email(email: str, limit: int = 10, offset: int = 0,
-                      sort_order: str = 'asc', status_filter: Optional[str] = None) -> tuple[list, int]:
+                      sort_order: str = 'asc', status_filter: Optional[str] = None,
+                      cursor: Optional[str] = None, include_total: bool = True) -> tuple[list, Optional[int]]:
     user_id = get_user_id(email)
 
     if not user_id:
         myprint(f"User with email {email} not found.")
         return [], 0
 
-    return get_posts(user_id, limit=limit, offset=offset, sort_order=sort_order, status_filter=status_filter)
+    return get_posts(user_id, limit=limit, offset=offset, sort_order=sort_order, status_filter=status_filter,
+                     cursor=cursor, include_total=include_total)
 
 
 def get_post_content(post_id: int):
@@ -762,6 +1057,8 @@ def bulk_update_posts(post_ids: list[int], status: Optional[PostStatus] = None,
     finally:
         cursor.close()
         connection.close()
+        if status is not None:
+            invalidate_post_stats()
 
     return success
 
@@ -856,6 +1153,55 @@ def get_ready_to_post_posts(pre_post_time: datetime = None, post_time_delta_minu
     return posts
 
 
+def claim_ready_to_post_posts(post_time_delta_minutes=20, limit: int = 200) -> list:
+    """Atomically claim up to ``limit`` due approved posts by flipping them to 'scheduled'.
+
+    Same window and row shape as get_ready_to_post_posts, but the read and the status
+    change happen in one transaction: the SELECT locks the due rows with
+    ``FOR UPDATE SKIP LOCKED`` so a concurrent claimer skips them instead of waiting,
+    and the UPDATE only touches rows still 'approved'. Any number of dispatchers can
+    sweep at once without publishing a post twice, and a batch costs three statements
+    however many posts it holds. Returns the claimed (id, scheduled_time, user_id) rows.
+    """
+    now = datetime.now(timezone.utc)
+    pre_post_time = now + timedelta(minutes=post_time_delta_minutes)
+    yesterday = now - timedelta(days=1)
+
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    claimed = []
+    try:
+        # Served by idx_posts_status_scheduled, so only the claimed rows are locked
+        cursor.execute(
+            """SELECT id, scheduled_time, user_id
+                FROM posts
+                WHERE status = 'approved' AND scheduled_time BETWEEN %s AND %s
+                ORDER BY scheduled_time ASC
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED""",
+            (yesterday, pre_post_time, limit))
+        claimed = cursor.fetchall()
+        if claimed:
+            ids = [post[0] for post in claimed]
+            placeholders = ", ".join(["%s"] * len(ids))
+            cursor.execute(
+                f"UPDATE posts SET status = %s WHERE status = 'approved' AND id IN ({placeholders})",
+                (PostStatus.SCHEDULED.value, *ids))
+        connection.commit()
+        myprint(f"Claimed posts to schedule: {[post[0] for post in claimed]}")
+    except mysql.connector.Error as err:
+        connection.rollback()
+        myprint(f"Could not claim ready to post posts | Error: {err}")
+        claimed = []
+    finally:
+        cursor.close()
+        connection.close()
+        if claimed:
+            invalidate_post_stats()
+
+    return claimed
+
+
 def get_orphaned_scheduled_posts(lookback_hours: int = 2) -> list:
     """Return posts stuck in 'scheduled' status that never reached 'posted'.
 
@@ -911,19 +1257,9 @@ def get_user_password_pair_by_id(user_id: int):
 
 
 def get_active_user_password_pairs():
-    connection = get_db_connection()
-    cursor = connection.cursor()
-
-    user_password_pairs = []
-
-    active_users = get_active_user_ids()
-
-    for user_id in active_users:
-        email, password = get_user_password_pair_by_id(user_id)
-        if email and password:
-            user_password_pairs.append([email, password])
-
-    return user_password_pairs
+    return [[user['email'], user['password']]
+            for user in iter_active_users(columns=('email', 'password'))
+            if user['email'] and user['password']]
 
 
 def add_linkedin_profile(profile: LinkedInProfile, user_id: Optional[int] = None):
@@ -1063,7 +1399,7 @@ def remove_linked_in_profile_by_email(profile_email: str):
 
 def get_post_type_counts(user_id: int):
     """Query the database to get the count of each post_type in the 'posts' table for the given user id."""
-    connection = get_db_connection()
+    connection = get_read_connection(user_id)
     cursor = connection.cursor(dictionary=True)
 
     try:
@@ -1080,23 +1416,29 @@ def get_post_type_counts(user_id: int):
     return post_counts
 
 
+# Rows per fetchmany() / keyset query of the streaming scans (_stream_rows, _stream_by_id)
+_STREAM_CHUNK = 500
+
+_CURRENT_WEEK_SQL = "YEARWEEK(scheduled_time, 1) = YEARWEEK(NOW(), 1)"
+# NOW() + (7 - WEEKDAY) days is always the coming Monday, whatever today is
+_NEXT_WEEK_SQL = "YEARWEEK(scheduled_time, 1) = YEARWEEK(NOW() + INTERVAL (7 - WEEKDAY(NOW())) DAY, 1)"
+
+
 def get_planned_posts_for_current_week(user_id: int = None) -> list[dict]:
     """Return status=planning posts scheduled in the current ISO week."""
-    connection = get_db_connection()
+    connection = get_read_connection(user_id)
     cursor = connection.cursor(dictionary=True)
     try:
         if user_id:
             cursor.execute(
                 "SELECT user_id, id, post_type, buyer_stage FROM posts"
-                " WHERE status = 'planning' AND user_id = %s"
-                " AND YEARWEEK(scheduled_time, 1) = YEARWEEK(NOW(), 1)",
+                f" WHERE status = 'planning' AND user_id = %s AND {_CURRENT_WEEK_SQL}",
                 (user_id,),
             )
         else:
             cursor.execute(
                 "SELECT user_id, id, post_type, buyer_stage FROM posts"
-                " WHERE status = 'planning'"
-                " AND YEARWEEK(scheduled_time, 1) = YEARWEEK(NOW(), 1)"
+                f" WHERE status = 'planning' AND {_CURRENT_WEEK_SQL}"
             )
         planned_content = cursor.fetchall()
     except mysql.connector.Error as err:
@@ -1116,23 +1458,19 @@ def get_planned_posts_for_next_week(user_id: int = None) -> list[dict]:
     coming Monday regardless of what day today is, avoiding the +7-day
     same-weekday pitfall.
     """
-    connection = get_db_connection()
+    connection = get_read_connection(user_id)
     cursor = connection.cursor(dictionary=True)
     try:
         if user_id:
             cursor.execute(
                 "SELECT user_id, id, post_type, buyer_stage FROM posts"
-                " WHERE status = 'planning' AND user_id = %s"
-                " AND YEARWEEK(scheduled_time, 1)"
-                "   = YEARWEEK(NOW() + INTERVAL (7 - WEEKDAY(NOW())) DAY, 1)",
+                f" WHERE status = 'planning' AND user_id = %s AND {_NEXT_WEEK_SQL}",
                 (user_id,),
             )
         else:
             cursor.execute(
                 "SELECT user_id, id, post_type, buyer_stage FROM posts"
-                " WHERE status = 'planning'"
-                " AND YEARWEEK(scheduled_time, 1)"
-                "   = YEARWEEK(NOW() + INTERVAL (7 - WEEKDAY(NOW())) DAY, 1)"
+                f" WHERE status = 'planning' AND {_NEXT_WEEK_SQL}"
             )
         planned_content = cursor.fetchall()
     except mysql.connector.Error as err:
@@ -1145,6 +1483,29 @@ def get_planned_posts_for_next_week(user_id: int = None) -> list[dict]:
     return planned_content
 
 
+class PlannedPost(NamedTuple):
+    user_id: int
+    id: int
+    post_type: str
+    buyer_stage: str
+
+
+def iter_planned_posts(next_week: bool = False, user_id: int = None,
+                       chunk_size: int = _STREAM_CHUNK) -> Iterator[PlannedPost]:
+    """Stream the status=planning posts of the current (or next) ISO week in id order.
+
+    Keyset chunks rather than one open cursor: the weekly content run spends minutes of
+    LLM/video generation per post, far too long to pin a connection and a server-side result.
+    """
+    sql = ("SELECT user_id, id, post_type, buyer_stage FROM posts"
+           f" WHERE status = 'planning' AND {_NEXT_WEEK_SQL if next_week else _CURRENT_WEEK_SQL}")
+    params: tuple = ()
+    if user_id:
+        sql += " AND user_id = %s"
+        params = (user_id,)
+    yield from _stream_by_id(sql, params, PlannedPost, chunk_size, "planned posts", user_id)
+
+
 def get_last_planned_post_date_for_user(user_id: int):
     """Query the database to get the last planned post date for the given user."""
     connection = get_db_connection()
@@ -1165,40 +1526,184 @@ def get_last_planned_post_date_for_user(user_id: int):
     return last_planned_date[0] if last_planned_date else None
 
 
-def get_user_blog_url(user_id: int):
-    """Query the database to get the blog URL for the given user."""
-    connection = get_db_connection()
-    cursor = connection.cursor()
+def get_post_type_counts_for_users(user_ids: list[int]) -> Optional[dict[int, dict[str, int]]]:
+    """get_post_type_counts for many users at once: {user_id: {post_type: count}}.
+
+    One grouped query per _USER_BULK_BATCH ids. Users without posts are absent; None when
+    the counts could not be read (not the same as "no posts").
+    """
+    ids = list(dict.fromkeys(user_ids))
+    counts: dict[int, dict[str, int]] = {}
+    if not ids:
+        return counts
 
+    connection = get_read_connection()
+    cursor = connection.cursor(dictionary=True)
     try:
-        cursor.execute("SELECT blog_url FROM users WHERE id = %s", (user_id,))
-        blog_url = cursor.fetchone()
+        for start in range(0, len(ids), _USER_BULK_BATCH):
+            chunk = ids[start:start + _USER_BULK_BATCH]
+            cursor.execute(
+                "SELECT user_id, post_type, COUNT(*) AS count FROM posts"
+                f" WHERE user_id IN ({', '.join(['%s'] * len(chunk))}) GROUP BY user_id, post_type",
+                chunk
+            )
+            for row in cursor.fetchall():
+                counts.setdefault(row['user_id'], {})[row['post_type']] = row['count']
     except mysql.connector.Error as err:
-        myprint(f"Could not get user blog url | Error: {err}")
-        blog_url = None
+        myprint(f"Could not get post type counts for users | Error: {err}")
+        return None
     finally:
         cursor.close()
         connection.close()
 
-    return blog_url[0] if blog_url else None
+    return counts
 
 
-def get_user_sitemap_url(user_id: int):
-    """Query the database to get the sitemap URL for the given user."""
+def get_last_planned_post_dates(user_ids: list[int]) -> Optional[dict[int, datetime]]:
+    """get_last_planned_post_date_for_user for many users at once: {user_id: last date}.
+
+    Reads the primary, like the single-user version, since the result decides what gets
+    inserted next. Users without (non-rejected) posts are absent; None when the dates could
+    not be read, so a failed read is never mistaken for users with nothing planned.
+    """
+    ids = list(dict.fromkeys(user_ids))
+    dates: dict[int, datetime] = {}
+    if not ids:
+        return dates
+
     connection = get_db_connection()
     cursor = connection.cursor()
+    try:
+        for start in range(0, len(ids), _USER_BULK_BATCH):
+            chunk = ids[start:start + _USER_BULK_BATCH]
+            cursor.execute(
+                "SELECT user_id, MAX(scheduled_time) AS last_planned_date FROM posts"
+                f" WHERE user_id IN ({', '.join(['%s'] * len(chunk))}) AND status != 'rejected'"
+                " GROUP BY user_id",
+                chunk
+            )
+            for user_id, last_planned_date in cursor.fetchall():
+                if last_planned_date is not None:
+                    dates[user_id] = last_planned_date
+    except mysql.connector.Error as err:
+        myprint(f"Could not get last planned post dates for users | Error: {err}")
+        return None
+    finally:
+        cursor.close()
+        connection.close()
+
+    return dates
+
+
+@dataclass(frozen=True)
+class UserSettings:
+    """The per-user settings read on hot paths (driver factory, planner, scheduler), loaded
+    with a single query and cached by get_user_settings()."""
+    user_id: int
+    timezone: Optional[str]
+    blog_url: Optional[str]
+    sitemap_url: Optional[str]
+    company_linked_in_url: Optional[str]
+    proxy_url: Optional[str]
+    latitude: Optional[float]
+    longitude: Optional[float]
+    locale: Optional[str]
+    city: Optional[str]
+    country: Optional[str]
+    last_login_inactivate_delay: Optional[int]
+    auto_schedule_posts: Optional[int]
+
+
+def _user_settings_ttl() -> float:
+    try:
+        return float(os.getenv("USER_SETTINGS_CACHE_TTL_SECONDS", "60"))
+    except ValueError:
+        return 60.0
+
+
+# In-process only: every update_* below invalidates the entry in the process that made the
+# change; other processes (API vs. workers) see it within USER_SETTINGS_CACHE_TTL_SECONDS.
+_user_settings_cache = TTLCache(maxsize=2048, ttl=_user_settings_ttl())
+
+
+_USER_SETTINGS_COLUMNS = ('timezone', 'blog_url', 'sitemap_url', 'company_linked_in_url', 'proxy_url',
+                          'latitude', 'longitude', 'locale', 'city', 'country',
+                          'last_login_inactivate_delay', 'auto_schedule_posts')
+
+
+def _user_settings_from_row(user_id: int, row: dict) -> UserSettings:
+    return UserSettings(
+        user_id=user_id,
+        timezone=row["timezone"],
+        blog_url=row["blog_url"],
+        sitemap_url=row["sitemap_url"],
+        company_linked_in_url=row["company_linked_in_url"],
+        proxy_url=row["proxy_url"],
+        latitude=float(row["latitude"]) if row["latitude"] is not None else None,
+        longitude=float(row["longitude"]) if row["longitude"] is not None else None,
+        locale=row["locale"],
+        city=row["city"],
+        country=row["country"],
+        last_login_inactivate_delay=row["last_login_inactivate_delay"],
+        auto_schedule_posts=row["auto_schedule_posts"],
+    )
 
+
+def get_user_settings(user_id: int) -> Optional[UserSettings]:
+    """Return the user's cached UserSettings, loading them in one query on a miss.
+
+    Returns None if the user row is missing or the query fails (neither is cached).
+    """
+    settings = _user_settings_cache.get(user_id)
+    if settings is not None:
+        return settings
+
+    connection = get_db_connection()
+    cursor = connection.cursor(dictionary=True)
     try:
-        cursor.execute("SELECT sitemap_url FROM users WHERE id = %s", (user_id,))
-        sitemap_url = cursor.fetchone()
+        cursor.execute(
+            f"SELECT {', '.join(_USER_SETTINGS_COLUMNS)} FROM users WHERE id = %s",
+            (user_id,),
+        )
+        row = cursor.fetchone()
     except mysql.connector.Error as err:
-        myprint(f"Could not get user sitemap url | Error: {err}")
-        sitemap_url = None
+        myprint(f"Could not get settings for user_id {user_id} | Error: {err}")
+        row = None
     finally:
         cursor.close()
         connection.close()
 
-    return sitemap_url[0] if sitemap_url else None
+    if not row:
+        return None
+    settings = _user_settings_from_row(user_id, row)
+    _user_settings_cache.set(user_id, settings)
+    return settings
+
+
+def invalidate_user_settings(user_id: int) -> None:
+    """Drop the cached UserSettings for user_id (called by every update_* that touches them)."""
+    _replica_router.mark_write(user_id)
+    _user_settings_cache.pop(user_id)
+
+
+def get_user_settings_cache_stats() -> dict:
+    return _user_settings_cache.stats()
+
+
+def reset_user_settings_cache() -> None:
+    _user_settings_cache.clear()
+
+
+def get_user_blog_url(user_id: int):
+    """Return the blog URL for the given user."""
+    settings = get_user_settings(user_id)
+    return settings.blog_url if settings else None
+
+
+def get_user_sitemap_url(user_id: int):
+    """Return the sitemap URL for the given user."""
+    settings = get_user_settings(user_id)
+    return settings.sitemap_url if settings else None
 
 
 _ALLOWED_USER_CLAUSES = frozenset({"email = %s", "blog_url = %s", "sitemap_url = %s"})
@@ -1233,24 +1738,16 @@ def update_user(user_id: int, email: str = None, blog_url: str = None, sitemap_u
     finally:
         cursor.close()
         connection.close()
+        invalidate_user_settings(user_id)
 
 
-def get_active_user_ids():
-    """Return user IDs eligible for automated posting/engagement.
-
-    A user is active when ALL of:
-      1. Has a valid LinkedIn connection (linkedin_connection_status = 'connected'
-         AND access_token not expired)
-      2. Has an active subscription OR an unexpired trial
-      3. Has logged in within their configured inactivate delay
-         (NULL delay = never auto-inactivate)
-    """
-    connection = get_db_connection()
-    cursor = connection.cursor()
-    try:
-        cursor.execute("""
-            SELECT id FROM users
-            WHERE
+# A user is active when ALL of:
+#   1. Has a valid LinkedIn connection (linkedin_connection_status = 'connected'
+#      AND access_token not expired)
+#   2. Has an active subscription OR an unexpired trial
+#   3. Has logged in within their configured inactivate delay
+#      (NULL delay = never auto-inactivate)
+_ACTIVE_USER_WHERE = """
                 -- Must have a live LinkedIn token
                 linkedin_connection_status = 'connected'
                 AND access_token IS NOT NULL
@@ -1274,7 +1771,15 @@ def get_active_user_ids():
                     OR last_login IS NULL
                     OR last_login >= NOW() - INTERVAL last_login_inactivate_delay DAY
                 )
-        """)
+"""
+
+
+def get_active_user_ids():
+    """Return user IDs eligible for automated posting/engagement (see _ACTIVE_USER_WHERE)."""
+    connection = get_read_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT id FROM users WHERE {_ACTIVE_USER_WHERE}")
         active_user_ids = [row[0] for row in cursor.fetchall()]
     except mysql.connector.Error as err:
         myprint(f"Could not get active user ids | Error: {err}")
@@ -1286,45 +1791,274 @@ def get_active_user_ids():
     return active_user_ids
 
 
-def get_user_location(user_id: int) -> tuple[float, float] | None:
-    connection = get_db_connection()
-    cursor = connection.cursor()
-    try:
-        cursor.execute("SELECT latitude, longitude FROM users WHERE id = %s", (user_id,))
-        row = cursor.fetchone()
-    except mysql.connector.Error as err:
-        myprint(f"Could not get user location | Error: {err}")
-        row = None
-    finally:
-        cursor.close()
-        connection.close()
-    return (float(row[0]), float(row[1])) if row and row[0] and row[1] else None
+class _UserId(NamedTuple):
+    id: int
 
 
-def insert_new_log(user_id: int, action_type: LogActionType, result: LogResultType, post_id: int = None,
-                   post_url: str = None, message: str = None):
-    connection = get_db_connection()
-    cursor = connection.cursor()
+def iter_active_user_ids(chunk_size: int = _STREAM_CHUNK) -> Iterator[int]:
+    """Stream the ids get_active_user_ids() returns in id order, without building the list.
 
-    try:
-        cursor.execute("""
-            INSERT INTO logs (user_id, action_type, post_id, post_url, message, result)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (user_id, action_type.value, post_id, post_url, message, result.value))
+    Keyset chunks: the per-user beat tasks check sessions and send email per user, too slow
+    to hold a server-side result open for the whole sweep.
+    """
+    for row in _stream_by_id(f"SELECT id FROM users WHERE {_ACTIVE_USER_WHERE}", (), _UserId,
+                             chunk_size, "active user ids"):
+        yield row.id
 
-        connection.commit()
-        success = cursor.rowcount == 1
-    except mysql.connector.Error as err:
-        myprint(f"Could not insert new log | Error: {err}")
-        success = False
-    finally:
-        cursor.close()
-        connection.close()
 
-    return success
+# Columns the bulk user readers may select. Names are interpolated into SQL, so anything
+# outside this set is rejected.
+_USER_BULK_COLUMNS = frozenset(_USER_SETTINGS_COLUMNS + (
+    'email', 'password', 'linkedin_connection_status', 'subscription_status', 'subscription_tier',
+    'last_login',
+))
+
+# Credentials plus everything UserSettings needs, so iterating users also warms that cache.
+_ACTIVE_USER_DEFAULT_COLUMNS = ('email', 'password') + _USER_SETTINGS_COLUMNS
+
+# Ids per IN (...) list / rows per keyset batch
+_USER_BULK_BATCH = 500
+
+
+def _user_columns_sql(columns: tuple[str, ...]) -> str:
+    for column in columns:
+        if column not in _USER_BULK_COLUMNS:
+            raise ValueError(f"Disallowed users column: {column!r}")
+    return ', '.join(('id',) + tuple(c for c in columns if c != 'id'))
+
+
+def _prime_user_settings(row: dict) -> None:
+    if all(column in row for column in _USER_SETTINGS_COLUMNS):
+        _user_settings_cache.set(row['id'], _user_settings_from_row(row['id'], row))
+
+
+def get_users_by_ids(user_ids: list[int],
+                     columns: tuple[str, ...] = _ACTIVE_USER_DEFAULT_COLUMNS) -> dict[int, dict]:
+    """Fetch ``columns`` for many users at once: {user_id: row}. Missing ids are absent.
+
+    One query per _USER_BULK_BATCH ids instead of one connection per user. Raises
+    ValueError for a column outside _USER_BULK_COLUMNS; returns {} on a database error.
+    """
+    select = _user_columns_sql(columns)
+    ids = list(dict.fromkeys(user_ids))
+    if not ids:
+        return {}
+
+    connection = get_read_connection()
+    cursor = connection.cursor(dictionary=True)
+    users: dict[int, dict] = {}
+    try:
+        for start in range(0, len(ids), _USER_BULK_BATCH):
+            chunk = ids[start:start + _USER_BULK_BATCH]
+            cursor.execute(
+                f"SELECT {select} FROM users WHERE id IN ({', '.join(['%s'] * len(chunk))})",
+                chunk
+            )
+            for row in cursor.fetchall():
+                _prime_user_settings(row)
+                users[row['id']] = row
+    except mysql.connector.Error as err:
+        myprint(f"Could not get users by ids | Error: {err}")
+        return {}
+    finally:
+        cursor.close()
+        connection.close()
+
+    return users
+
+
+def iter_active_users(columns: tuple[str, ...] = _ACTIVE_USER_DEFAULT_COLUMNS,
+                      batch_size: int = _USER_BULK_BATCH) -> Iterator[dict]:
+    """Yield active users (id plus ``columns``) in id order, one keyset batch at a time.
+
+    Each batch is its own short query, so no connection is held while the caller works on
+    the rows. With the default columns every row also primes the UserSettings cache, so
+    per-user settings getters inside the loop do not go back to the database.
+    """
+    select = _user_columns_sql(columns)
+    last_id = 0
+    while True:
+        connection = get_read_connection()
+        cursor = connection.cursor(dictionary=True)
+        try:
+            cursor.execute(
+                f"SELECT {select} FROM users WHERE id > %s AND {_ACTIVE_USER_WHERE} ORDER BY id LIMIT %s",
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+        except mysql.connector.Error as err:
+            myprint(f"Could not get active users after id {last_id} | Error: {err}")
+            return
+        finally:
+            cursor.close()
+            connection.close()
+
+        for row in rows:
+            _prime_user_settings(row)
+            yield row
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1]['id']
+
+
+# ---------------------------------------------------------------------------
+# Streaming scans for the batch schedulers
+# ---------------------------------------------------------------------------
+
+def _stream_rows(sql: str, params: tuple = (), row_type=None, chunk_size: int = _STREAM_CHUNK,
+                 what: str = "rows", primary: bool = False) -> Iterator:
+    """Yield the rows of a read-only query from an unbuffered (server-side) cursor.
+
+    Rows come off the socket ``chunk_size`` at a time, so memory stays flat however large
+    the scan and the caller can act on the first row before the last one is read. The
+    connection is held until the generator is exhausted or closed: use it for consumers
+    that only dispatch per row, and _stream_by_id for slow ones. ``primary`` skips the
+    read replica (reads that feed a write or delete). A database error is logged and
+    re-raised, so a truncated scan is never taken for a complete one.
+    """
+    connection = get_db_connection() if primary else get_read_connection()
+    cursor = connection.cursor(buffered=False)
+    exhausted = False
+    try:
+        cursor.execute(sql, params)
+        while rows := cursor.fetchmany(chunk_size):
+            for row in rows:
+                yield row_type._make(row) if row_type else row
+        exhausted = True
+    except mysql.connector.Error as err:
+        myprint(f"Could not stream {what} | Error: {err}")
+        raise
+    finally:
+        if not exhausted:
+            try:
+                connection.consume_results()  # caller stopped early: drain before reuse
+            except Exception:
+                pass
+        cursor.close()
+        connection.close()
+
+
+def _stream_by_id(sql: str, params: tuple, row_type, chunk_size: int = _STREAM_CHUNK,
+                  what: str = "rows", user_id: int = None) -> Iterator:
+    """Yield ``row_type`` rows of ``sql`` (a SELECT ending in its WHERE clause, with an
+    ``id`` column) in id order, one short keyset query per chunk.
+
+    Nothing is held between chunks, so the caller may spend as long as it likes per row,
+    and rows it updates meanwhile cannot shift the chunks (unlike OFFSET paging). A
+    database error is logged and re-raised, as in _stream_rows.
+    """
+    last_id = 0
+    while True:
+        connection = get_read_connection(user_id)
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f"{sql} AND id > %s ORDER BY id LIMIT %s", (*params, last_id, chunk_size))
+            rows = [row_type._make(row) for row in cursor.fetchall()]
+        except mysql.connector.Error as err:
+            myprint(f"Could not stream {what} after id {last_id} | Error: {err}")
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1].id
+
+
+def get_user_location(user_id: int) -> tuple[float, float] | None:
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT latitude, longitude FROM users WHERE id = %s", (user_id,))
+        row = cursor.fetchone()
+    except mysql.connector.Error as err:
+        myprint(f"Could not get user location | Error: {err}")
+        row = None
+    finally:
+        cursor.close()
+        connection.close()
+    return (float(row[0]), float(row[1])) if row and row[0] and row[1] else None
+
+
+def _write_log_rows(rows: list[tuple]) -> bool:
+    """LogBuffer writer: persist buffered logs rows with one multi-row INSERT.
+
+    Returns False (rows are retried on the next flush) only when the database is
+    unreachable. When the server rejects the batch (a row naming a deleted post or user,
+    a value too long, ...) the rows are inserted one at a time and only the rejected ones
+    are logged and dropped, so one bad row neither wedges the buffer nor takes the rest
+    of the batch — which the dedupe readers depend on — with it.
+    """
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    sql = "INSERT INTO logs (user_id, action_type, post_id, post_url, message, result) VALUES "
+
+    try:
+        try:
+            placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(rows))
+            cursor.execute(sql + placeholders, [param for row in rows for param in row])
+        except (mysql.connector.OperationalError, mysql.connector.InterfaceError):
+            raise
+        except mysql.connector.Error as err:
+            if len(rows) > 1:
+                myprint(f"Could not insert {len(rows)} logs at once, inserting them one by one | Error: {err}")
+            for row in rows:
+                try:
+                    cursor.execute(sql + "(%s, %s, %s, %s, %s, %s)", list(row))
+                except (mysql.connector.OperationalError, mysql.connector.InterfaceError):
+                    raise
+                except mysql.connector.Error as row_err:
+                    myprint(f"Could not insert log row, dropping it | Row: {row} | Error: {row_err}")
+        connection.commit()
+        success = True
+    except (mysql.connector.OperationalError, mysql.connector.InterfaceError) as err:
+        # Nothing was committed, so the whole batch is retried
+        myprint(f"Could not flush {len(rows)} logs, will retry | Error: {err}")
+        success = False
+    except mysql.connector.Error as err:
+        myprint(f"Could not commit {len(rows)} logs, dropping them | Error: {err}")
+        success = True
+    finally:
+        cursor.close()
+        connection.close()
+
+    return success
+
+
+# Activity logs are buffered per process and written in batches (LOG_BUFFER_MAX_ROWS rows
+# or every LOG_BUFFER_FLUSH_SECONDS). Celery flushes at task end and worker shutdown.
+_log_buffer = LogBuffer(_write_log_rows, max_rows=log_buffer_max_rows(), flush_interval=log_buffer_flush_seconds())
+os.register_at_fork(after_in_child=_log_buffer.discard_after_fork)
+atexit.register(_log_buffer.close)
+
+
+def flush_logs() -> bool:
+    """Synchronously write every buffered log row. Returns False if the database write failed."""
+    return _log_buffer.flush()
+
+
+def reset_log_buffer() -> None:
+    """Drop buffered log rows without writing them and stop the flusher (tests)."""
+    _log_buffer.reset()
+
+
+def insert_new_log(user_id: int, action_type: LogActionType, result: LogResultType, post_id: int = None,
+                   post_url: str = None, message: str = None, flush: bool = False) -> bool:
+    """Queue an activity log row for the next batched write.
+
+    Pass flush=True to write it (and anything already buffered) before returning.
+    """
+    _log_buffer.add((user_id, action_type.value, post_id, post_url, message, result.value))
+    if flush:
+        return flush_logs()
+    return True
 
 
 def has_user_commented_on_post_url(user_id: int, post_url: str):
+    # Read-after-write: a comment logged moments ago may still be buffered
+    flush_logs()
     connection = get_db_connection()
     cursor = connection.cursor()
 
@@ -1344,6 +2078,7 @@ def has_user_commented_on_post_url(user_id: int, post_url: str):
 
 
 def get_post_url_from_log_for_user(user_id: int, post_id: int):
+    flush_logs()
     connection = get_db_connection()
     cursor = connection.cursor()
 
@@ -1365,6 +2100,7 @@ def get_post_url_from_log_for_user(user_id: int, post_id: int):
 
 
 def get_post_message_from_log_for_user(user_id: int, post_id: int):
+    flush_logs()
     connection = get_db_connection()
     cursor = connection.cursor()
 
@@ -1386,6 +2122,7 @@ def get_post_message_from_log_for_user(user_id: int, post_id: int):
 
 
 def has_engaged_url_with_x_days(user_id: int, post_url: str, days: int):
+    flush_logs()
     connection = get_db_connection()
     cursor = connection.cursor()
 
@@ -1406,6 +2143,7 @@ def has_engaged_url_with_x_days(user_id: int, post_url: str, days: int):
 
 def get_dm_history_for_profile(user_id: int, profile_url: str) -> list[str]:
     """Return all DM messages previously sent by user_id to profile_url, oldest first."""
+    flush_logs()
     connection = get_db_connection()
     cursor = connection.cursor()
     try:
@@ -1440,20 +2178,8 @@ def get_post_status(post_id: int) -> str | None:
 
 
 def get_company_linked_in_url_for_user(user_id: int):
-    connection = get_db_connection()
-    cursor = connection.cursor()
-
-    try:
-        cursor.execute("SELECT company_linked_in_url FROM users WHERE id = %s", (user_id,))
-        company_linked_in_url = cursor.fetchone()
-    except mysql.connector.Error as err:
-        myprint(f"Could not get user company linked in url | Error: {err}")
-        company_linked_in_url = None
-    finally:
-        cursor.close()
-        connection.close()
-
-    return company_linked_in_url[0] if company_linked_in_url else None
+    settings = get_user_settings(user_id)
+    return settings.company_linked_in_url if settings else None
 
 
 def update_company_linked_in_url_for_user(user_id: int, company_linked_in_url: Optional[str]) -> bool:
@@ -1474,10 +2200,11 @@ def update_company_linked_in_url_for_user(user_id: int, company_linked_in_url: O
     finally:
         cursor.close()
         connection.close()
+        invalidate_user_settings(user_id)
 
 
 def get_recent_logs(user_id: int, limit: int = 20) -> list:
-    connection = get_db_connection()
+    connection = get_read_connection(user_id)
     cursor = connection.cursor(dictionary=True)
 
     try:
@@ -1538,6 +2265,7 @@ def update_user_settings(user_id: int, blog_url: str = None, sitemap_url: str =
     finally:
         cursor.close()
         connection.close()
+        invalidate_user_settings(user_id)
 
     return success
 
@@ -1608,6 +2336,19 @@ def verify_pin_for_email(email: str, pin_hash: str) -> bool:
 # Session management
 # ---------------------------------------------------------------------------
 
+# Validated tokens, so authenticated API requests usually skip the sessions query.
+# delete_session evicts; with SESSION_CACHE_REDIS the eviction reaches every replica.
+_session_cache = SessionCache(ttl=session_cache_ttl(), use_redis=session_cache_uses_redis())
+
+
+def get_session_cache_stats() -> dict:
+    return _session_cache.stats()
+
+
+def reset_session_cache() -> None:
+    _session_cache.clear()
+
+
 def create_session(user_id: int) -> Optional[str]:
     import secrets
     token = secrets.token_hex(32)
@@ -1635,15 +2376,21 @@ def create_session(user_id: int) -> Optional[str]:
 
 
 def get_session_user_id(token: str) -> Optional[int]:
+    user_id = _session_cache.get(token)
+    if user_id is not None:
+        return user_id
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
     try:
         cursor.execute(
-            "SELECT user_id FROM sessions WHERE session_token = %s AND expires_at > %s",
+            "SELECT user_id, expires_at FROM sessions WHERE session_token = %s AND expires_at > %s",
             (token, datetime.now(timezone.utc)),
         )
         row = cursor.fetchone()
-        return row['user_id'] if row else None
+        if not row:
+            return None
+        _session_cache.set(token, row['user_id'], row.get('expires_at'))
+        return row['user_id']
     except mysql.connector.Error as err:
         myprint(f"Could not validate session token | Error: {err}")
         return None
@@ -1653,6 +2400,8 @@ def get_session_user_id(token: str) -> Optional[int]:
 
 
 def delete_session(token: str) -> bool:
+    # Evict first so no replica keeps honouring the token even if the DELETE fails
+    _session_cache.evict(token)
     connection = get_db_connection()
     cursor = connection.cursor()
     try:
@@ -1667,6 +2416,47 @@ def delete_session(token: str) -> bool:
         connection.close()
 
 
+def delete_user(user_id: int) -> bool:
+    """Delete a user; their sessions and other owned rows go with it (ON DELETE CASCADE)."""
+    # Evict first so no replica keeps honouring the user's tokens even if the DELETE fails
+    _session_cache.evict_user(user_id)
+    invalidate_user_settings(user_id)
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+        connection.commit()
+        return cursor.rowcount > 0
+    except mysql.connector.Error as err:
+        myprint(f"Could not delete user {user_id} | Error: {err}")
+        return False
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def purge_expired_sessions(batch_size: int = 1000) -> int:
+    """Delete expired sessions ``batch_size`` rows per statement (each its own short
+    transaction, so the purge never holds many row locks). Returns the number deleted."""
+    deleted = 0
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    try:
+        while True:
+            cursor.execute("DELETE FROM sessions WHERE expires_at < %s LIMIT %s",
+                           (datetime.now(timezone.utc), batch_size))
+            connection.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                break
+    except mysql.connector.Error as err:
+        myprint(f"Could not purge expired sessions | Error: {err}")
+    finally:
+        cursor.close()
+        connection.close()
+    return deleted
+
+
 # ---------------------------------------------------------------------------
 # User helpers
 # ---------------------------------------------------------------------------
@@ -1927,18 +2717,27 @@ def update_subscription_from_stripe(
         connection.close()
 
 
+_STRIPE_SUBSCRIBERS_SQL = """SELECT id, stripe_customer_id, stripe_subscription_id,
+                                   subscription_status, subscription_tier
+                            FROM users
+                            WHERE stripe_subscription_id IS NOT NULL
+                              AND subscription_status IN ('active', 'past_due')"""
+
+
+class StripeSubscriber(NamedTuple):
+    id: int
+    stripe_customer_id: Optional[str]
+    stripe_subscription_id: Optional[str]
+    subscription_status: Optional[str]
+    subscription_tier: Optional[str]
+
+
 def get_users_with_stripe_subscriptions() -> list[dict]:
     """Return all users that have a Stripe subscription ID (for periodic sync)."""
-    connection = get_db_connection()
+    connection = get_read_connection()
     cursor = connection.cursor(dictionary=True)
     try:
-        cursor.execute(
-            """SELECT id, stripe_customer_id, stripe_subscription_id,
-                      subscription_status, subscription_tier
-               FROM users
-               WHERE stripe_subscription_id IS NOT NULL
-                 AND subscription_status IN ('active', 'past_due')"""
-        )
+        cursor.execute(_STRIPE_SUBSCRIBERS_SQL)
         return cursor.fetchall() or []
     except mysql.connector.Error as err:
         myprint(f"Could not fetch Stripe subscribers | Error: {err}")
@@ -1948,28 +2747,25 @@ def get_users_with_stripe_subscriptions() -> list[dict]:
         connection.close()
 
 
+def iter_users_with_stripe_subscriptions(chunk_size: int = _STREAM_CHUNK) -> Iterator[StripeSubscriber]:
+    """Stream get_users_with_stripe_subscriptions() rows in id order, in keyset chunks (the
+    daily sync makes a Stripe API call per row, so no cursor stays open across them)."""
+    yield from _stream_by_id(_STRIPE_SUBSCRIBERS_SQL, (), StripeSubscriber, chunk_size, "Stripe subscribers")
+
+
 def get_user_preferences(user_id: int) -> dict:
     """Return user preference fields with safe defaults.
 
     Defaults auto_schedule_posts=True so new users' content is automatically
     queued without requiring manual opt-in.
     """
-    _defaults: dict = {"last_login_inactivate_delay": None, "auto_schedule_posts": True}
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-    try:
-        cursor.execute(
-            "SELECT last_login_inactivate_delay, auto_schedule_posts FROM users WHERE id = %s",
-            (user_id,),
-        )
-        row = cursor.fetchone()
-        return row if row is not None else _defaults
-    except mysql.connector.Error as err:
-        myprint(f"Could not get preferences for user_id {user_id} | Error: {err}")
-        return _defaults
-    finally:
-        cursor.close()
-        connection.close()
+    settings = get_user_settings(user_id)
+    if settings is None:
+        return {"last_login_inactivate_delay": None, "auto_schedule_posts": True}
+    return {
+        "last_login_inactivate_delay": settings.last_login_inactivate_delay,
+        "auto_schedule_posts": settings.auto_schedule_posts,
+    }
 
 
 def update_user_preferences(
@@ -1997,6 +2793,7 @@ def update_user_preferences(
     finally:
         cursor.close()
         connection.close()
+        invalidate_user_settings(user_id)
 
 
 def get_user_geo(user_id: int) -> Optional[dict]:
@@ -2005,29 +2802,16 @@ def get_user_geo(user_id: int) -> Optional[dict]:
     Keys: latitude, longitude (floats or None), timezone, locale, city, country.
     Returns None only if the user row is missing.
     """
-    connection = get_db_connection()
-    cursor = connection.cursor()
-    try:
-        cursor.execute(
-            "SELECT latitude, longitude, timezone, locale, city, country FROM users WHERE id = %s",
-            (user_id,),
-        )
-        row = cursor.fetchone()
-    except mysql.connector.Error as err:
-        myprint(f"Could not get user geo for user_id {user_id} | Error: {err}")
-        row = None
-    finally:
-        cursor.close()
-        connection.close()
-    if not row:
+    settings = get_user_settings(user_id)
+    if settings is None:
         return None
     return {
-        "latitude": float(row[0]) if row[0] is not None else None,
-        "longitude": float(row[1]) if row[1] is not None else None,
-        "timezone": row[2],
-        "locale": row[3],
-        "city": row[4],
-        "country": row[5],
+        "latitude": settings.latitude,
+        "longitude": settings.longitude,
+        "timezone": settings.timezone,
+        "locale": settings.locale,
+        "city": settings.city,
+        "country": settings.country,
     }
 
 
@@ -2060,6 +2844,7 @@ def update_user_location(user_id: int, latitude: float, longitude: float,
     finally:
         cursor.close()
         connection.close()
+        invalidate_user_settings(user_id)
 
 
 def get_user_proxy(user_id: int) -> Optional[str]:
@@ -2069,20 +2854,10 @@ def get_user_proxy(user_id: int) -> Optional[str]:
     normally log in, reducing LinkedIn "new location" challenges. None = egress from
     the host directly.
     """
-    connection = get_db_connection()
-    cursor = connection.cursor()
-    try:
-        cursor.execute("SELECT proxy_url FROM users WHERE id = %s", (user_id,))
-        row = cursor.fetchone()
-    except mysql.connector.Error as err:
-        myprint(f"Could not get proxy for user_id {user_id} | Error: {err}")
-        row = None
-    finally:
-        cursor.close()
-        connection.close()
-    if not row or not row[0]:
+    settings = get_user_settings(user_id)
+    if settings is None or not settings.proxy_url:
         return None
-    return row[0]
+    return settings.proxy_url
 
 
 def update_user_proxy(user_id: int, proxy_url: Optional[str]) -> bool:
@@ -2102,22 +2877,13 @@ def update_user_proxy(user_id: int, proxy_url: Optional[str]) -> bool:
     finally:
         cursor.close()
         connection.close()
+        invalidate_user_settings(user_id)
 
 
 def get_user_timezone(user_id: int) -> str:
     """Return the IANA timezone string for the user, defaulting to UTC."""
-    connection = get_db_connection()
-    cursor = connection.cursor()
-    try:
-        cursor.execute("SELECT timezone FROM users WHERE id = %s", (user_id,))
-        row = cursor.fetchone()
-        return row[0] if row and row[0] else 'UTC'
-    except mysql.connector.Error as err:
-        myprint(f"Could not get timezone for user_id {user_id} | Error: {err}")
-        return 'UTC'
-    finally:
-        cursor.close()
-        connection.close()
+    settings = get_user_settings(user_id)
+    return settings.timezone if settings and settings.timezone else 'UTC'
 
 
 def update_user_timezone(user_id: int, tz: str) -> bool:
@@ -2134,6 +2900,7 @@ def update_user_timezone(user_id: int, tz: str) -> bool:
     finally:
         cursor.close()
         connection.close()
+        invalidate_user_settings(user_id)
 
 
 # ---------------------------------------------------------------------------
@@ -2158,126 +2925,197 @@ def get_user_by_stripe_customer_id(stripe_customer_id: str) -> Optional[dict]:
         connection.close()
 
 
-def get_avatar_credit_ledger_entry_by_session(stripe_session_id: str) -> Optional[dict]:
-    """Return an existing credit ledger entry for a Stripe session (idempotency check)."""
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-    try:
-        cursor.execute(
-            "SELECT id, user_id, delta FROM avatar_credit_ledger WHERE stripe_session_id = %s AND delta > 0 LIMIT 1",
-            (stripe_session_id,),
-        )
-        return cursor.fetchone()
-    except mysql.connector.Error as err:
-        myprint(f"Could not look up ledger entry for session={stripe_session_id} | Error: {err}")
-        return None
-    finally:
-        cursor.close()
-        connection.close()
+# ---------------------------------------------------------------------------
+# Credit balances: each ledger keeps the full history, and a materialized per-user balance
+# row changes in the same transaction as every ledger insert (V36).
+# ---------------------------------------------------------------------------
 
+# kind -> (ledger table, balance table)
+_CREDIT_TABLES = {
+    'avatar': ('avatar_credit_ledger', 'avatar_credit_balances'),
+    'video': ('video_credit_ledger', 'video_credit_balances'),
+}
 
-def get_avatar_credit_balance(user_id: int) -> int:
+
+def _get_credit_balance(kind: str, user_id: int) -> int:
+    _, balances = _CREDIT_TABLES[kind]
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
     try:
-        cursor.execute(
-            "SELECT COALESCE(SUM(delta), 0) AS balance FROM avatar_credit_ledger WHERE user_id = %s",
-            (user_id,),
-        )
+        cursor.execute(f"SELECT balance FROM {balances} WHERE user_id = %s", (user_id,))
         row = cursor.fetchone()
         return int(row["balance"]) if row else 0
     except mysql.connector.Error as err:
-        myprint(f"Could not fetch avatar credit balance for user_id {user_id} | Error: {err}")
+        myprint(f"Could not get {kind} credit balance for user_id {user_id} | Error: {err}")
         return 0
     finally:
         cursor.close()
         connection.close()
 
 
-def add_avatar_credits(
-    user_id: int,
-    amount: int,
-    reason: str,
-    stripe_session_id: Optional[str] = None,
-) -> bool:
+def _apply_credit_delta(kind: str, user_id: int, delta: int, reason: str, **ledger_columns) -> bool:
+    """Write a ledger row and move the balance by ``delta`` in one transaction.
+
+    A debit is a conditional decrement (``WHERE balance >= n``), so two concurrent spends
+    can never both succeed on the last credit; it returns False and writes nothing when
+    the balance is too low. ``ledger_columns`` are the ledger's optional link columns
+    (stripe_session_id, training_id, post_id).
+    """
+    ledger, balances = _CREDIT_TABLES[kind]
+    columns = ['user_id', 'delta', 'reason'] + list(ledger_columns)
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
     try:
+        if delta < 0:
+            cursor.execute(
+                f"UPDATE {balances} SET balance = balance - %s WHERE user_id = %s AND balance >= %s",
+                (-delta, user_id, -delta),
+            )
+            if cursor.rowcount != 1:
+                connection.rollback()
+                myprint(f"Insufficient {kind} credits for user_id {user_id} (needed {-delta})")
+                return False
+        else:
+            cursor.execute(
+                f"INSERT INTO {balances} (user_id, balance) VALUES (%s, %s) "
+                f"ON DUPLICATE KEY UPDATE balance = balance + VALUES(balance)",
+                (user_id, delta),
+            )
         cursor.execute(
-            """INSERT INTO avatar_credit_ledger (user_id, delta, reason, stripe_session_id)
-               VALUES (%s, %s, %s, %s)""",
-            (user_id, amount, reason, stripe_session_id),
+            f"INSERT INTO {ledger} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+            (user_id, delta, reason, *ledger_columns.values()),
         )
         connection.commit()
         return True
     except mysql.connector.Error as err:
-        myprint(f"Could not add avatar credits for user_id {user_id} | Error: {err}")
+        connection.rollback()
+        myprint(f"Could not apply {kind} credit delta {delta} for user_id {user_id} | Error: {err}")
         return False
     finally:
         cursor.close()
         connection.close()
 
 
-def deduct_avatar_credit(user_id: int, training_id: str) -> bool:
+def reconcile_credit_balances(kind: str) -> dict[int, tuple[int, int]]:
+    """Rebuild ``kind``'s balance rows from its ledger; returns {user_id: (was, now)} for drift.
+
+    Each drifted user is fixed under a lock on their balance row, which every ledger
+    write also takes, so a spend landing mid-reconcile is never lost.
+    """
+    ledger, balances = _CREDIT_TABLES[kind]
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
+    drift: dict[int, tuple[int, int]] = {}
     try:
         cursor.execute(
-            """INSERT INTO avatar_credit_ledger (user_id, delta, reason, training_id)
-               VALUES (%s, -1, 'training_start', %s)""",
-            (user_id, training_id),
+            f"""SELECT t.user_id, COALESCE(b.balance, 0) AS balance, COALESCE(l.total, 0) AS total
+                FROM (SELECT user_id FROM {ledger} UNION SELECT user_id FROM {balances}) t
+                LEFT JOIN {balances} b ON b.user_id = t.user_id
+                LEFT JOIN (SELECT user_id, SUM(delta) AS total FROM {ledger} GROUP BY user_id) l
+                       ON l.user_id = t.user_id
+                WHERE COALESCE(b.balance, 0) <> COALESCE(l.total, 0)"""
         )
+        candidates = [row['user_id'] for row in cursor.fetchall()]
         connection.commit()
-        return True
+
+        for user_id in candidates:
+            cursor.execute(
+                f"INSERT INTO {balances} (user_id, balance) VALUES (%s, 0) "
+                f"ON DUPLICATE KEY UPDATE balance = balance",
+                (user_id,),
+            )
+            cursor.execute(f"SELECT balance FROM {balances} WHERE user_id = %s FOR UPDATE", (user_id,))
+            was = int(cursor.fetchone()['balance'])
+            cursor.execute(f"SELECT COALESCE(SUM(delta), 0) AS total FROM {ledger} WHERE user_id = %s", (user_id,))
+            now = int(cursor.fetchone()['total'])
+            if was != now:
+                cursor.execute(f"UPDATE {balances} SET balance = %s WHERE user_id = %s", (now, user_id))
+                drift[user_id] = (was, now)
+            connection.commit()
     except mysql.connector.Error as err:
-        myprint(f"Could not deduct avatar credit for user_id {user_id} | Error: {err}")
-        return False
+        connection.rollback()
+        myprint(f"Could not reconcile {kind} credit balances | Error: {err}")
     finally:
         cursor.close()
         connection.close()
 
+    return drift
+
 
-def refund_avatar_credit(user_id: int, training_id: str) -> bool:
+def get_avatar_credit_ledger_entry_by_session(stripe_session_id: str) -> Optional[dict]:
+    """Return an existing credit ledger entry for a Stripe session (idempotency check)."""
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
     try:
         cursor.execute(
-            """INSERT INTO avatar_credit_ledger (user_id, delta, reason, training_id)
-               VALUES (%s, 1, 'training_refund', %s)""",
-            (user_id, training_id),
+            "SELECT id, user_id, delta FROM avatar_credit_ledger WHERE stripe_session_id = %s AND delta > 0 LIMIT 1",
+            (stripe_session_id,),
         )
-        connection.commit()
-        return True
+        return cursor.fetchone()
     except mysql.connector.Error as err:
-        myprint(f"Could not refund avatar credit for user_id {user_id} | Error: {err}")
-        return False
+        myprint(f"Could not look up ledger entry for session={stripe_session_id} | Error: {err}")
+        return None
     finally:
         cursor.close()
         connection.close()
 
 
-# ---------------------------------------------------------------------------
-# Premium video credits (mirrors avatar_credit_ledger; balance = SUM(delta))
-# ---------------------------------------------------------------------------
+def get_avatar_credit_balance(user_id: int) -> int:
+    return _get_credit_balance('avatar', user_id)
 
-def get_video_credit_balance(user_id: int) -> int:
+
+def add_avatar_credits(
+    user_id: int,
+    amount: int,
+    reason: str,
+    stripe_session_id: Optional[str] = None,
+) -> bool:
+    return _apply_credit_delta('avatar', user_id, amount, reason, stripe_session_id=stripe_session_id)
+
+
+def deduct_avatar_credit(user_id: int, training_id: Optional[str] = None) -> bool:
+    """Spend one avatar credit. False (nothing written) if the user has none left.
+
+    Called without ``training_id`` to reserve the credit before training starts; the
+    spend is tied to the training afterwards with ``link_avatar_credit_to_training``.
+    """
+    return _apply_credit_delta('avatar', user_id, -1, 'training_start', training_id=training_id)
+
+
+def refund_avatar_credit(user_id: int, training_id: Optional[str] = None) -> bool:
+    return _apply_credit_delta('avatar', user_id, 1, 'training_refund', training_id=training_id)
+
+
+def link_avatar_credit_to_training(user_id: int, training_id: str) -> bool:
+    """Record ``training_id`` on the user's latest credit reserved without one."""
     connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
+    cursor = connection.cursor()
     try:
         cursor.execute(
-            "SELECT COALESCE(SUM(delta), 0) AS balance FROM video_credit_ledger WHERE user_id = %s",
-            (user_id,),
+            """UPDATE avatar_credit_ledger SET training_id = %s
+               WHERE user_id = %s AND reason = 'training_start' AND training_id IS NULL
+               ORDER BY id DESC LIMIT 1""",
+            (training_id, user_id),
         )
-        row = cursor.fetchone()
-        return int(row["balance"]) if row else 0
+        connection.commit()
+        return cursor.rowcount > 0
     except mysql.connector.Error as err:
-        myprint(f"Could not get video credit balance for user_id {user_id} | Error: {err}")
-        return 0
+        myprint(f"Could not link avatar credit to training {training_id} for user_id {user_id} | Error: {err}")
+        return False
     finally:
         cursor.close()
         connection.close()
 
 
+# ---------------------------------------------------------------------------
+# Premium video credits (mirrors avatar_credit_ledger; balance materialized in
+# video_credit_balances)
+# ---------------------------------------------------------------------------
+
+def get_video_credit_balance(user_id: int) -> int:
+    return _get_credit_balance('video', user_id)
+
+
 def get_video_credit_ledger_entry_by_session(stripe_session_id: str) -> Optional[dict]:
     """Return an existing purchase ledger entry for a Stripe session (idempotency check)."""
     connection = get_db_connection()
@@ -2298,62 +3136,19 @@ def get_video_credit_ledger_entry_by_session(stripe_session_id: str) -> Optional
 
 def add_video_credits(user_id: int, amount: int, reason: str,
                       stripe_session_id: Optional[str] = None) -> bool:
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-    try:
-        cursor.execute(
-            """INSERT INTO video_credit_ledger (user_id, delta, reason, stripe_session_id)
-               VALUES (%s, %s, %s, %s)""",
-            (user_id, amount, reason, stripe_session_id),
-        )
-        connection.commit()
-        return True
-    except mysql.connector.Error as err:
-        myprint(f"Could not add video credits for user_id {user_id} | Error: {err}")
-        return False
-    finally:
-        cursor.close()
-        connection.close()
+    return _apply_credit_delta('video', user_id, amount, reason, stripe_session_id=stripe_session_id)
 
 
 def deduct_video_credits(user_id: int, amount: int, post_id: Optional[int] = None,
                          reason: str = "premium_video") -> bool:
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-    try:
-        cursor.execute(
-            """INSERT INTO video_credit_ledger (user_id, delta, reason, post_id)
-               VALUES (%s, %s, %s, %s)""",
-            (user_id, -abs(amount), reason, post_id),
-        )
-        connection.commit()
-        return True
-    except mysql.connector.Error as err:
-        myprint(f"Could not deduct video credits for user_id {user_id} | Error: {err}")
-        return False
-    finally:
-        cursor.close()
-        connection.close()
+    """Reserve-and-deduct in one conditional decrement. False (nothing written) if the
+    balance is below ``amount``, so callers need no separate balance check."""
+    return _apply_credit_delta('video', user_id, -abs(amount), reason, post_id=post_id)
 
 
 def refund_video_credits(user_id: int, amount: int, post_id: Optional[int] = None,
                          reason: str = "premium_video_refund") -> bool:
-    connection = get_db_connection()
-    cursor = connection.cursor(dictionary=True)
-    try:
-        cursor.execute(
-            """INSERT INTO video_credit_ledger (user_id, delta, reason, post_id)
-               VALUES (%s, %s, %s, %s)""",
-            (user_id, abs(amount), reason, post_id),
-        )
-        connection.commit()
-        return True
-    except mysql.connector.Error as err:
-        myprint(f"Could not refund video credits for user_id {user_id} | Error: {err}")
-        return False
-    finally:
-        cursor.close()
-        connection.close()
+    return _apply_credit_delta('video', user_id, abs(amount), reason, post_id=post_id)
 
 
 def get_post_video_quality(post_id: int) -> str:
@@ -2401,35 +3196,46 @@ def get_post_carousel_slides(post_id: int):
         connection.close()
 
 
+# Include 'error' so failed posts get a regeneration attempt. A carousel needs
+# regeneration when its slides are empty OR are plain text titles with no real image
+# reference — real slides are stored as URLs (https .../api/assets/...png), so the
+# absence of any image marker means generation never produced images.
+_MISSING_ASSETS_SQL = """
+    SELECT id, user_id, post_type, buyer_stage, scheduled_time
+    FROM posts
+    WHERE status IN ('approved', 'pending', 'scheduled', 'error')
+      AND scheduled_time > NOW()
+      AND scheduled_time <= NOW() + INTERVAL %s DAY
+      AND (
+            (post_type = 'video'    AND (video_url IS NULL OR video_url = ''))
+         OR (post_type = 'carousel' AND (
+                carousel_slides IS NULL OR carousel_slides = '' OR carousel_slides = '[]'
+                OR (carousel_slides NOT LIKE '%%http%%'
+                    AND carousel_slides NOT LIKE '%%/assets%%'
+                    AND carousel_slides NOT LIKE '%%.png%%'
+                    AND carousel_slides NOT LIKE '%%.jpg%%')
+            ))
+      )
+    ORDER BY scheduled_time
+"""
+
+
+class MissingAssetPost(NamedTuple):
+    id: int
+    user_id: int
+    post_type: str
+    buyer_stage: str
+    scheduled_time: datetime
+
+
 def get_unposted_posts_missing_assets(within_days: int = 14) -> list:
     """Posts not yet posted, due within `within_days`, whose required media asset is
     missing: video posts with no video_url, or carousel posts with no slides. Used by the
     backfill safety net. Returns (id, user_id, post_type, buyer_stage, scheduled_time)."""
-    connection = get_db_connection()
+    connection = get_read_connection()
     cursor = connection.cursor()
     try:
-        # Include 'error' so failed posts get a regeneration attempt. A carousel needs
-        # regeneration when its slides are empty OR are plain text titles with no real image
-        # reference — real slides are stored as URLs (https .../api/assets/...png), so the
-        # absence of any image marker means generation never produced images.
-        cursor.execute("""
-            SELECT id, user_id, post_type, buyer_stage, scheduled_time
-            FROM posts
-            WHERE status IN ('approved', 'pending', 'scheduled', 'error')
-              AND scheduled_time > NOW()
-              AND scheduled_time <= NOW() + INTERVAL %s DAY
-              AND (
-                    (post_type = 'video'    AND (video_url IS NULL OR video_url = ''))
-                 OR (post_type = 'carousel' AND (
-                        carousel_slides IS NULL OR carousel_slides = '' OR carousel_slides = '[]'
-                        OR (carousel_slides NOT LIKE '%%http%%'
-                            AND carousel_slides NOT LIKE '%%/assets%%'
-                            AND carousel_slides NOT LIKE '%%.png%%'
-                            AND carousel_slides NOT LIKE '%%.jpg%%')
-                    ))
-              )
-            ORDER BY scheduled_time
-        """, (within_days,))
+        cursor.execute(_MISSING_ASSETS_SQL, (within_days,))
         return cursor.fetchall()
     except mysql.connector.Error as err:
         myprint(f"Could not get unposted posts missing assets | Error: {err}")
@@ -2439,6 +3245,13 @@ def get_unposted_posts_missing_assets(within_days: int = 14) -> list:
         connection.close()
 
 
+def iter_unposted_posts_missing_assets(within_days: int = 14,
+                                       chunk_size: int = _STREAM_CHUNK) -> Iterator[MissingAssetPost]:
+    """Stream get_unposted_posts_missing_assets() rows, soonest first, off a server-side cursor."""
+    yield from _stream_rows(_MISSING_ASSETS_SQL, (within_days,), MissingAssetPost, chunk_size,
+                            "unposted posts missing assets")
+
+
 # ---------------------------------------------------------------------------
 # Avatar training records
 # ---------------------------------------------------------------------------
@@ -2525,32 +3338,47 @@ def set_active_avatar(user_id: int, avatar_id: int) -> bool:
         connection.close()
 
 
+_AVATAR_TRAININGS_SQL = """SELECT id, training_id, model_ref, trigger_word, status, is_active,
+                                  created_at, updated_at
+                           FROM avatar_trainings
+                           WHERE user_id = %s
+                           ORDER BY created_at DESC"""
+
+_ACTIVE_AVATAR_SQL = """SELECT id, training_id, model_ref, trigger_word, status
+                        FROM avatar_trainings
+                        WHERE user_id = %s AND is_active = 1
+                        LIMIT 1"""
+
+
+def _avatar_training_from_row(r: dict) -> dict:
+    return {
+        "id": r["id"],
+        "training_id": r["training_id"],
+        "model_ref": r["model_ref"],
+        "trigger_word": r["trigger_word"],
+        "status": r["status"],
+        "is_active": bool(r["is_active"]),
+        "created_at": r["created_at"].isoformat() if r.get("created_at") else None,
+        "updated_at": r["updated_at"].isoformat() if r.get("updated_at") else None,
+    }
+
+
+def _active_avatar_from_row(row: dict) -> dict:
+    return {
+        "id": row["id"],
+        "training_id": row["training_id"],
+        "model_ref": row["model_ref"],
+        "trigger_word": row["trigger_word"],
+        "status": row["status"],
+    }
+
+
 def get_avatar_trainings(user_id: int) -> list[dict]:
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
     try:
-        cursor.execute(
-            """SELECT id, training_id, model_ref, trigger_word, status, is_active,
-                      created_at, updated_at
-               FROM avatar_trainings
-               WHERE user_id = %s
-               ORDER BY created_at DESC""",
-            (user_id,),
-        )
-        rows = cursor.fetchall()
-        return [
-            {
-                "id": r["id"],
-                "training_id": r["training_id"],
-                "model_ref": r["model_ref"],
-                "trigger_word": r["trigger_word"],
-                "status": r["status"],
-                "is_active": bool(r["is_active"]),
-                "created_at": r["created_at"].isoformat() if r.get("created_at") else None,
-                "updated_at": r["updated_at"].isoformat() if r.get("updated_at") else None,
-            }
-            for r in rows
-        ]
+        cursor.execute(_AVATAR_TRAININGS_SQL, (user_id,))
+        return [_avatar_training_from_row(r) for r in cursor.fetchall()]
     except mysql.connector.Error as err:
         myprint(f"Could not fetch avatar trainings for user_id {user_id} | Error: {err}")
         return []
@@ -2563,26 +3391,46 @@ def get_active_avatar(user_id: int) -> Optional[dict]:
     connection = get_db_connection()
     cursor = connection.cursor(dictionary=True)
     try:
-        cursor.execute(
-            """SELECT id, training_id, model_ref, trigger_word, status
-               FROM avatar_trainings
-               WHERE user_id = %s AND is_active = 1
-               LIMIT 1""",
-            (user_id,),
-        )
+        cursor.execute(_ACTIVE_AVATAR_SQL, (user_id,))
         row = cursor.fetchone()
-        if not row:
-            return None
-        return {
-            "id": row["id"],
-            "training_id": row["training_id"],
-            "model_ref": row["model_ref"],
-            "trigger_word": row["trigger_word"],
-            "status": row["status"],
-        }
+        return _active_avatar_from_row(row) if row else None
     except mysql.connector.Error as err:
         myprint(f"Could not fetch active avatar for user_id {user_id} | Error: {err}")
         return None
     finally:
         cursor.close()
         connection.close()
+
+
+# Per-function call/latency metrics (utilities.db_metrics). Plumbing that runs no query
+# of its own, or only hands out connections, stays unwrapped.
+db_metrics.instrument_module(globals(), skip=frozenset({
+    "get_db_connection", "db_connection", "get_read_connection",
+    "get_db_pool_stats", "get_replica_stats", "reset_db_pool",
+    "encode_post_cursor", "decode_post_cursor",
+    "invalidate_post_stats", "invalidate_user_settings",
+    "get_user_settings_cache_stats", "reset_user_settings_cache",
+    "get_session_cache_stats", "reset_session_cache", "reset_log_buffer",
+}))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m cqc_lem.utilities.db")
+    parser.add_argument("--stats", action="store_true",
+                        help="print per-function db latency published by running API/worker processes")
+    parser.add_argument("--json", action="store_true", help="with --stats: print the raw merged snapshot")
+    args = parser.parse_args()
+    if not args.stats:
+        parser.print_help()
+    else:
+        totals, slow = db_metrics.load_published_snapshots()
+        if args.json:
+            output = json.dumps({"totals": totals, "slow": slow}, indent=2)
+        elif not totals:
+            output = ("No db metrics published yet — API and worker processes push them to Redis "
+                      "every DB_METRICS_PUBLISH_SECONDS.")
+        else:
+            output = db_metrics.report(totals, slow)
+        print(output)  # noqa: T201 — CLI output
@@ -0,0 +1,385 @@
+"""asyncio-native reads for the FastAPI hot paths, on an aiomysql pool.
+
+The sync helpers in ``cqc_lem.utilities.db`` block, so FastAPI runs every ``def`` endpoint
+in its worker threadpool (40 threads by default); under load requests queue for a thread
+rather than for the database. The endpoints that dominate API traffic (session checks,
+post listing, dashboard stats, settings, credit balances, avatars) are ``async def`` and
+await these coroutines instead, so one event loop can keep many queries in flight.
+
+Each function mirrors the ``db`` helper of the same name: same SQL (shared builders), same
+return shapes and the same error handling (logged, then the "empty" value). They read and
+fill the very same in-process caches as ``db`` — the session, user-settings and post-stats
+caches — so a sync write's invalidation is seen by the async readers too. Writes stay in
+``db``; ``delete_session`` is the one exception because logout is on the hot path.
+
+The pool is created lazily on the running event loop and sized by MYSQL_ASYNC_POOL_SIZE.
+Post pages and dashboard stats follow ``db``'s replica routing (see db_replica) through a
+second pool on MYSQL_REPLICA_HOST.
+
+When ``aiomysql`` is not installed every function falls back to running its ``db``
+counterpart in a worker thread, i.e. the old behaviour.
+"""
+
+import asyncio
+import functools
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from cqc_lem.utilities import db, db_metrics
+from cqc_lem.utilities.db_pool import pool_size, pool_timeout
+from cqc_lem.utilities.logger import myprint
+
+try:
+    import aiomysql
+except ImportError:  # optional: endpoints fall back to the sync helpers in a thread
+    aiomysql = None
+
+_ER_ACCESS_DENIED = 1045
+_DEFAULT_POOL_RECYCLE_SECONDS = 3600
+
+_DB_ERRORS = (OSError, asyncio.TimeoutError) + ((aiomysql.Error,) if aiomysql is not None else ())
+
+_pools: dict = {}  # replica? -> aiomysql pool, all bound to _pool_loop
+_pool_loop = None
+_pool_lock: Optional[asyncio.Lock] = None
+
+
+def async_pool_size() -> int:
+    try:
+        return int(os.getenv("MYSQL_ASYNC_POOL_SIZE", str(pool_size() * 2)))
+    except ValueError:
+        return pool_size() * 2
+
+
+def _pool_recycle() -> int:
+    try:
+        return int(os.getenv("MYSQL_ASYNC_POOL_RECYCLE_SECONDS", str(_DEFAULT_POOL_RECYCLE_SECONDS)))
+    except ValueError:
+        return _DEFAULT_POOL_RECYCLE_SECONDS
+
+
+async def _get_pool(replica: bool = False):
+    """The primary (or replica) pool for the running event loop, created on first use.
+
+    A pool is bound to the loop it was created on; a new loop (test clients, a restarted
+    worker) gets fresh pools and the old ones are left to be garbage collected.
+    """
+    global _pools, _pool_loop, _pool_lock
+
+    loop = asyncio.get_running_loop()
+    if _pool_loop is loop and replica in _pools:
+        return _pools[replica]
+    if _pool_loop is not loop:
+        _pools, _pool_loop, _pool_lock = {}, loop, asyncio.Lock()
+
+    async with _pool_lock:
+        if replica not in _pools:
+            # May call Secrets Manager: keep it off the event loop
+            load = db._load_replica_settings if replica else db._mysql_settings.get
+            settings = await asyncio.to_thread(load)
+            try:
+                _pools[replica] = await aiomysql.create_pool(
+                    host=settings['host'],
+                    port=int(settings['port'] or 3306),
+                    user=settings['user'],
+                    password=settings['password'],
+                    db=settings['database'],
+                    minsize=1,
+                    maxsize=async_pool_size(),
+                    pool_recycle=_pool_recycle(),
+                    autocommit=True,
+                    init_command="SET time_zone = '+00:00'",
+                )
+            except aiomysql.OperationalError as err:
+                if err.args and err.args[0] == _ER_ACCESS_DENIED:  # rotated secret
+                    db._mysql_settings.invalidate()
+                raise
+    return _pools[replica]
+
+
+async def _use_replica(user_id: Optional[int]) -> bool:
+    router = db._replica_router
+    if not router.enabled:
+        return False
+    if router.lag_check_due():
+        await asyncio.to_thread(router.refresh_lag_if_due)
+    if router.use_replica(user_id):
+        return True
+    router.record_read(replica=False)
+    return False
+
+
+async def _acquire(replica: bool):
+    started = time.perf_counter()
+    try:
+        pool = await _get_pool(replica)
+        return pool, await asyncio.wait_for(pool.acquire(), timeout=pool_timeout())
+    finally:
+        db_metrics.record_acquire(time.perf_counter() - started)
+
+
+@asynccontextmanager
+async def _cursor(routed: bool = False, user_id: Optional[int] = None):
+    """Dict cursor on a pooled connection; waits at most MYSQL_POOL_TIMEOUT_SECONDS for one.
+
+    ``routed`` reads go to the replica when db's router allows it for ``user_id``.
+    """
+    pool = None
+    if routed and await _use_replica(user_id):
+        try:
+            pool, connection = await _acquire(replica=True)
+            db._replica_router.record_read(replica=True)
+        except _DB_ERRORS as err:
+            db._replica_router.replica_failed(err)
+    if pool is None:
+        pool, connection = await _acquire(replica=False)
+    try:
+        async with connection.cursor(aiomysql.DictCursor) as cursor:
+            yield cursor
+    finally:
+        await pool.release(connection)
+
+
+async def _execute(cursor, sql: str, params, fetch=None):
+    """Run one statement (and its fetch), reporting time and row count to db_metrics."""
+    started = time.perf_counter()
+    try:
+        await cursor.execute(sql, params)
+        result = await fetch() if fetch is not None else None
+    except _DB_ERRORS:
+        db_metrics.record_statement(sql, params, time.perf_counter() - started, failed=True)
+        raise
+    rows = len(result) if isinstance(result, (list, tuple)) else int(result is not None)
+    db_metrics.record_statement(sql, params, time.perf_counter() - started, rows=rows)
+    return result
+
+
+async def _fetchone(sql: str, params) -> Optional[dict]:
+    async with _cursor() as cursor:
+        return await _execute(cursor, sql, params, cursor.fetchone)
+
+
+async def _fetchall(sql: str, params, routed: bool = False, user_id: Optional[int] = None) -> list[dict]:
+    async with _cursor(routed, user_id) as cursor:
+        return list(await _execute(cursor, sql, params, cursor.fetchall))
+
+
+def _sync_fallback(func):
+    """Without aiomysql, run the same-named ``db`` helper in a worker thread instead."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if aiomysql is None:
+            return await asyncio.to_thread(getattr(db, func.__name__), *args, **kwargs)
+        return await func(*args, **kwargs)
+
+    return wrapper
+
+
+def get_async_pool_stats() -> dict:
+    """size / free / maxsize of this process's async primary pool (zeros before first use)."""
+    pool = _pools.get(False)
+    if pool is None:
+        return {"size": 0, "free": 0, "maxsize": async_pool_size()}
+    return {"size": pool.size, "free": pool.freesize, "maxsize": pool.maxsize}
+
+
+async def close_pool() -> None:
+    """Close the pools' connections (app shutdown, tests)."""
+    global _pools, _pool_loop, _pool_lock
+    pools, _pools, _pool_loop, _pool_lock = _pools, {}, None, None
+    for pool in pools.values():
+        pool.close()
+        await pool.wait_closed()
+
+
+# ---------------------------------------------------------------------------
+# Sessions and users
+# ---------------------------------------------------------------------------
+
+@_sync_fallback
+async def get_session_user_id(token: str) -> Optional[int]:
+    user_id = await db._session_cache.aget(token)
+    if user_id is not None:
+        return user_id
+    try:
+        row = await _fetchone(
+            "SELECT user_id, expires_at FROM sessions WHERE session_token = %s AND expires_at > %s",
+            (token, datetime.now(timezone.utc)),
+        )
+    except _DB_ERRORS as err:
+        myprint(f"Could not validate session token | Error: {err}")
+        return None
+    if not row:
+        return None
+    await db._session_cache.aset(token, row['user_id'], row.get('expires_at'))
+    return row['user_id']
+
+
+@_sync_fallback
+async def delete_session(token: str) -> bool:
+    # Evict first so no replica keeps honouring the token even if the DELETE fails
+    await db._session_cache.aevict(token)
+    try:
+        async with _cursor() as cursor:
+            await _execute(cursor, "DELETE FROM sessions WHERE session_token = %s", (token,))
+        return True
+    except _DB_ERRORS as err:
+        myprint(f"Could not delete session | Error: {err}")
+        return False
+
+
+@_sync_fallback
+async def get_user_id(email: str):
+    try:
+        row = await _fetchone("SELECT id FROM users WHERE email = %s", (email,))
+    except _DB_ERRORS as err:
+        myprint(f"Could not get user id | Error: {err}")
+        row = None
+    return row['id'] if row else None
+
+
+@_sync_fallback
+async def get_user_email(user_id: int) -> Optional[str]:
+    try:
+        row = await _fetchone("SELECT email FROM users WHERE id = %s", (user_id,))
+    except _DB_ERRORS as err:
+        myprint(f"Could not get email for user_id {user_id} | Error: {err}")
+        return None
+    return row['email'] if row else None
+
+
+@_sync_fallback
+async def get_user_settings(user_id: int) -> Optional[db.UserSettings]:
+    settings = db._user_settings_cache.get(user_id)
+    if settings is not None:
+        return settings
+    try:
+        row = await _fetchone(
+            f"SELECT {', '.join(db._USER_SETTINGS_COLUMNS)} FROM users WHERE id = %s",
+            (user_id,),
+        )
+    except _DB_ERRORS as err:
+        myprint(f"Could not get settings for user_id {user_id} | Error: {err}")
+        return None
+    if not row:
+        return None
+    settings = db._user_settings_from_row(user_id, row)
+    db._user_settings_cache.set(user_id, settings)
+    return settings
+
+
+@_sync_fallback
+async def get_user_subscription_info(user_id: int) -> Optional[dict]:
+    try:
+        return await _fetchone(
+            """SELECT subscription_status, subscription_tier,
+                      trial_started_at, trial_ends_at,
+                      stripe_customer_id, stripe_subscription_id
+               FROM users WHERE id = %s""",
+            (user_id,),
+        )
+    except _DB_ERRORS as err:
+        myprint(f"Could not get subscription info for user_id {user_id} | Error: {err}")
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Posts
+# ---------------------------------------------------------------------------
+
+@_sync_fallback
+async def get_post_dashboard_stats(user_id: int) -> Optional[dict]:
+    week_start = db._current_week_start()
+    stats = db._post_stats_cache.get(user_id)
+    if stats is not None and stats['week_start'] == week_start:
+        return stats
+    try:
+        rows = await _fetchall(*db._post_stats_query(user_id, week_start), routed=True, user_id=user_id)
+    except _DB_ERRORS as err:
+        myprint(f"Could not get post stats for user id: {user_id} | Error: {err}")
+        return None
+    stats = db._post_stats_from_rows(week_start, rows)
+    db._post_stats_cache.set(user_id, stats)
+    return stats
+
+
+@_sync_fallback
+async def get_posts(user_id: int, limit: int = 10, offset: int = 0,
+                    sort_order: str = 'asc', status_filter: Optional[str] = None,
+                    cursor: Optional[str] = None, include_total: bool = True) -> tuple[list, Optional[int]]:
+    sql, params = db._posts_page_query(user_id, limit, offset, sort_order, status_filter, cursor)
+    try:
+        posts = await _fetchall(sql, params, routed=True, user_id=user_id)
+    except _DB_ERRORS as err:
+        myprint(f"Could not get posts for user id: {user_id} | Error: {err}")
+        return [], 0 if include_total else None
+
+    if not include_total:
+        return posts, None
+    stats = await get_post_dashboard_stats(user_id)
+    return posts, db._posts_total(stats['by_status'] if stats else {}, status_filter)
+
+
+@_sync_fallback
+async def get_post_by_email(email: str, limit: int = 10, offset: int = 0,
+                            sort_order: str = 'asc', status_filter: Optional[str] = None,
+                            cursor: Optional[str] = None, include_total: bool = True) -> tuple[list, Optional[int]]:
+    user_id = await get_user_id(email)
+
+    if not user_id:
+        myprint(f"User with email {email} not found.")
+        return [], 0
+
+    return await get_posts(user_id, limit=limit, offset=offset, sort_order=sort_order,
+                           status_filter=status_filter, cursor=cursor, include_total=include_total)
+
+
+# ---------------------------------------------------------------------------
+# Credits and avatars
+# ---------------------------------------------------------------------------
+
+async def _get_credit_balance(kind: str, user_id: int) -> int:
+    _, balances = db._CREDIT_TABLES[kind]
+    try:
+        row = await _fetchone(f"SELECT balance FROM {balances} WHERE user_id = %s", (user_id,))
+    except _DB_ERRORS as err:
+        myprint(f"Could not get {kind} credit balance for user_id {user_id} | Error: {err}")
+        return 0
+    return int(row["balance"]) if row else 0
+
+
+@_sync_fallback
+async def get_avatar_credit_balance(user_id: int) -> int:
+    return await _get_credit_balance('avatar', user_id)
+
+
+@_sync_fallback
+async def get_video_credit_balance(user_id: int) -> int:
+    return await _get_credit_balance('video', user_id)
+
+
+@_sync_fallback
+async def get_avatar_trainings(user_id: int) -> list[dict]:
+    try:
+        rows = await _fetchall(db._AVATAR_TRAININGS_SQL, (user_id,))
+    except _DB_ERRORS as err:
+        myprint(f"Could not fetch avatar trainings for user_id {user_id} | Error: {err}")
+        return []
+    return [db._avatar_training_from_row(r) for r in rows]
+
+
+@_sync_fallback
+async def get_active_avatar(user_id: int) -> Optional[dict]:
+    try:
+        row = await _fetchone(db._ACTIVE_AVATAR_SQL, (user_id,))
+    except _DB_ERRORS as err:
+        myprint(f"Could not fetch active avatar for user_id {user_id} | Error: {err}")
+        return None
+    return db._active_avatar_from_row(row) if row else None
+
+
+db_metrics.instrument_module(globals(), skip=frozenset({"get_async_pool_stats", "close_pool"}))
@@ -0,0 +1,127 @@
+"""In-process write buffer for activity ``logs`` rows.
+
+insert_new_log() is called from inside the Selenium engagement loops (one call per
+comment, reply, like, DM and post). Writing each row as its own INSERT + commit costs a
+round trip per browser action, so rows are buffered here and written with multi-row
+INSERTs when either ``max_rows`` are pending or ``flush_interval`` seconds have passed
+(background flusher thread). Celery flushes at the end of every task and on worker
+process shutdown; readers that need read-after-write consistency call ``flush()``.
+
+Rows are only ever held by the process that buffered them: after a fork the child drops
+the parent's pending rows (the parent still owns and flushes them) and restarts its own
+flusher thread on first use.
+"""
+
+import os
+import threading
+from typing import Callable, Optional
+
+from cqc_lem.utilities.logger import log_warning
+
+_DEFAULT_MAX_ROWS = 50
+_DEFAULT_FLUSH_SECONDS = 2.0
+# Rows kept across failed flushes (database down) before the oldest are dropped.
+_MAX_RETAINED_ROWS = 5000
+
+
+def log_buffer_max_rows() -> int:
+    try:
+        return int(os.getenv("LOG_BUFFER_MAX_ROWS", str(_DEFAULT_MAX_ROWS)))
+    except ValueError:
+        return _DEFAULT_MAX_ROWS
+
+
+def log_buffer_flush_seconds() -> float:
+    try:
+        return float(os.getenv("LOG_BUFFER_FLUSH_SECONDS", str(_DEFAULT_FLUSH_SECONDS)))
+    except ValueError:
+        return _DEFAULT_FLUSH_SECONDS
+
+
+class LogBuffer:
+    """Thread-safe row buffer flushed by size, by time, or on demand.
+
+    ``writer(rows)`` persists a list of row tuples and returns True on success. A failed
+    write puts the rows back at the front of the buffer so the next flush retries them.
+    ``max_rows <= 1`` makes the buffer write-through (every add flushes immediately).
+    """
+
+    def __init__(self, writer: Callable[[list], bool], max_rows: int = _DEFAULT_MAX_ROWS,
+                 flush_interval: float = _DEFAULT_FLUSH_SECONDS):
+        self._writer = writer
+        self._max_rows = max(1, max_rows)
+        self._flush_interval = flush_interval
+        self._reset_state()
+
+    def _reset_state(self) -> None:
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        # Serializes writers so rows reach the database in the order they were added.
+        self._flush_lock = threading.Lock()
+        self._rows: list = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def discard_after_fork(self) -> None:
+        """Drop rows and locks inherited from the parent process (its thread did not survive)."""
+        self._reset_state()
+
+    def reset(self) -> None:
+        """Stop the flusher thread and drop pending rows without writing them (tests)."""
+        self._stop.set()
+        self._reset_state()
+
+    def _ensure_flusher(self) -> None:
+        if self._flush_interval <= 0 or self._max_rows <= 1:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, args=(self._stop,), name="db-log-buffer",
+                                            daemon=True)
+            self._thread.start()
+
+    def _run(self, stop: threading.Event) -> None:
+        while not stop.wait(self._flush_interval):
+            self.flush()
+
+    def add(self, row: tuple) -> None:
+        if self._pid != os.getpid():
+            self.discard_after_fork()
+        with self._lock:
+            self._rows.append(row)
+            full = len(self._rows) >= self._max_rows
+            self._ensure_flusher()
+        if full:
+            self.flush()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+    def flush(self) -> bool:
+        """Write every pending row now. Returns False if the write failed (rows are kept)."""
+        if self._pid != os.getpid():
+            self.discard_after_fork()
+            return True
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return True
+            try:
+                written = self._writer(rows)
+            except Exception as e:
+                log_warning(f"Activity log flush raised | Error: {e}", rows=len(rows))
+                written = False
+            if not written:
+                with self._lock:
+                    self._rows[:0] = rows
+                    overflow = len(self._rows) - _MAX_RETAINED_ROWS
+                    if overflow > 0:
+                        del self._rows[:overflow]
+                        log_warning("Activity log buffer full — dropped oldest rows", dropped=overflow)
+            return written
+
+    def close(self) -> bool:
+        """Stop the flusher thread and write whatever is left."""
+        self._stop.set()
+        return self.flush()
@@ -0,0 +1,391 @@
+"""Retention for the tables that grow forever: monthly ``logs`` partitions and sessions.
+
+V37 range-partitions ``logs`` on UNIX_TIMESTAMP(created_at) into ``p_future`` alone; the
+first maintenance run splits ``p_history`` (every row from before the month it runs in) off
+it, then there is one ``pYYYYMM`` partition per month and ``p_future`` as the catch-all.
+The daily db-maintenance beat task (run_scheduler.auto_db_maintenance) runs
+``run_maintenance()``, which:
+
+1. keeps LOGS_PARTITIONS_AHEAD months of partitions split off ``p_future``, so every new
+   row lands in its month's partition (past the first run, splitting the empty ``p_future``
+   copies nothing);
+2. archives each partition that ended more than LOGS_RETENTION_MONTHS months ago to
+   ``LOGS_ARCHIVE_DIR/logs_YYYY_MM.jsonl.gz`` — streamed off a server-side cursor, row
+   count verified — then drops it, a metadata change instead of a DELETE scan;
+3. deletes the logs of users and posts that no longer exist (partitioned tables cannot
+   keep the ON DELETE CASCADE foreign keys logs used to have);
+4. deletes expired ``sessions`` rows SESSIONS_PURGE_BATCH at a time.
+
+``maintenance_report()`` — also ``python -m cqc_lem.utilities.db_maintenance --dry-run``
+— lists what a run would do and estimates the space it would reclaim from
+information_schema statistics.
+
+Engagement dedupe lookups only see the retention window: an interaction archived more
+than LOGS_RETENTION_MONTHS ago no longer blocks a repeat.
+"""
+
+import calendar
+import gzip
+import json
+import os
+from datetime import date, datetime, timezone
+from typing import NamedTuple, Optional
+
+import mysql.connector
+
+from cqc_lem import assets_dir
+from cqc_lem.utilities import db
+from cqc_lem.utilities.logger import log_warning, myprint
+
+_DEFAULT_RETENTION_MONTHS = 12
+_DEFAULT_PARTITIONS_AHEAD = 2
+_DEFAULT_SESSIONS_PURGE_BATCH = 1000
+_ORPHAN_PURGE_BATCH = 5000
+_HISTORY_PARTITION = "p_history"
+_FUTURE_PARTITION = "p_future"
+_LOG_COLUMNS = ("id", "user_id", "action_type", "post_id", "post_url", "message", "result", "created_at")
+
+
+def logs_retention_months() -> int:
+    try:
+        return max(1, int(os.getenv("LOGS_RETENTION_MONTHS", str(_DEFAULT_RETENTION_MONTHS))))
+    except ValueError:
+        return _DEFAULT_RETENTION_MONTHS
+
+
+def logs_partitions_ahead() -> int:
+    try:
+        return max(1, int(os.getenv("LOGS_PARTITIONS_AHEAD", str(_DEFAULT_PARTITIONS_AHEAD))))
+    except ValueError:
+        return _DEFAULT_PARTITIONS_AHEAD
+
+
+def sessions_purge_batch() -> int:
+    try:
+        return max(1, int(os.getenv("SESSIONS_PURGE_BATCH", str(_DEFAULT_SESSIONS_PURGE_BATCH))))
+    except ValueError:
+        return _DEFAULT_SESSIONS_PURGE_BATCH
+
+
+def logs_archive_dir() -> str:
+    return os.getenv("LOGS_ARCHIVE_DIR") or os.path.join(assets_dir, "archive", "logs")
+
+
+class LogPartition(NamedTuple):
+    name: str
+    bound: Optional[int]  # exclusive upper bound, epoch seconds; None for MAXVALUE
+    rows: int  # information_schema estimate
+    bytes: int  # data + index, information_schema estimate
+
+
+class _LogRow(NamedTuple):
+    id: int
+    user_id: Optional[int]
+    action_type: str
+    post_id: Optional[int]
+    post_url: Optional[str]
+    message: Optional[str]
+    result: str
+    created_at: datetime
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _epoch(month: date) -> int:
+    return calendar.timegm(month.timetuple())
+
+
+def _month_of(epoch: int) -> date:
+    moment = datetime.fromtimestamp(epoch, tz=timezone.utc)
+    return date(moment.year, moment.month, 1)
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+# ---------------------------------------------------------------------------
+# Planning (pure: no database access)
+# ---------------------------------------------------------------------------
+
+def partitions_to_add(partitions: list[LogPartition], today: date,
+                      ahead: int) -> list[tuple[str, int]]:
+    """(name, bound) of the month partitions to split off p_future so that months up to
+    ``ahead`` months after ``today``'s have their own partition. While p_future is the only
+    partition (V37 just applied), p_history comes first, bounded at ``today``'s month."""
+    if not partitions:
+        return []
+    this_month = date(today.year, today.month, 1)
+    bounds = [p.bound for p in partitions if p.bound is not None]
+    if bounds:
+        new = []
+        month = _month_of(max(bounds))  # first month still in p_future
+    else:
+        new = [(_HISTORY_PARTITION, _epoch(this_month))]
+        month = this_month
+    last = _add_months(this_month, ahead)
+    while month <= last:
+        new.append((f"p{month:%Y%m}", _epoch(_add_months(month, 1))))
+        month = _add_months(month, 1)
+    return new
+
+
+def partitions_to_archive(partitions: list[LogPartition], today: date,
+                          retention_months: int) -> list[LogPartition]:
+    """Partitions whose every row is older than the first day of the month
+    ``retention_months`` before ``today``'s."""
+    cutoff = _epoch(_add_months(date(today.year, today.month, 1), -retention_months))
+    return [p for p in partitions if p.bound is not None and p.bound <= cutoff]
+
+
+def archive_file_name(partition: LogPartition) -> str:
+    if partition.name == _HISTORY_PARTITION:
+        return f"logs_before_{_month_of(partition.bound):%Y_%m}.jsonl.gz"
+    return f"logs_{_add_months(_month_of(partition.bound), -1):%Y_%m}.jsonl.gz"
+
+
+# ---------------------------------------------------------------------------
+# Database operations
+# ---------------------------------------------------------------------------
+
+def get_log_partitions() -> list[LogPartition]:
+    """logs partitions in bound order; [] while logs is not partitioned (V37 not applied)."""
+    connection = db.get_db_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS, DATA_LENGTH + INDEX_LENGTH
+               FROM information_schema.PARTITIONS
+               WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'logs' AND PARTITION_NAME IS NOT NULL
+               ORDER BY PARTITION_ORDINAL_POSITION"""
+        )
+        return [
+            LogPartition(name, None if bound == "MAXVALUE" else int(bound), int(rows or 0), int(size or 0))
+            for name, bound, rows, size in cursor.fetchall()
+        ]
+    except mysql.connector.Error as err:
+        myprint(f"Could not read logs partitions | Error: {err}")
+        return []
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def add_log_partitions(partitions: list[LogPartition], today: Optional[date] = None) -> list[str]:
+    """Split the month partitions planned by partitions_to_add() off p_future."""
+    new = partitions_to_add(partitions, today or _today(), logs_partitions_ahead())
+    if not new:
+        return []
+    definitions = ", ".join(f"PARTITION {name} VALUES LESS THAN ({bound})" for name, bound in new)
+    connection = db.get_db_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            f"ALTER TABLE logs REORGANIZE PARTITION {_FUTURE_PARTITION} INTO "
+            f"({definitions}, PARTITION {_FUTURE_PARTITION} VALUES LESS THAN MAXVALUE)"
+        )
+    except mysql.connector.Error as err:
+        myprint(f"Could not add logs partitions | Error: {err}")
+        return []
+    finally:
+        cursor.close()
+        connection.close()
+    return [name for name, _ in new]
+
+
+def _partition_row_count(name: str) -> Optional[int]:
+    connection = db.get_db_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT COUNT(*) FROM logs PARTITION ({name})")
+        return cursor.fetchone()[0]
+    except mysql.connector.Error as err:
+        myprint(f"Could not count logs partition {name} | Error: {err}")
+        return None
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def archive_log_partition(partition: LogPartition, archive_dir: Optional[str] = None) -> Optional[dict]:
+    """Write ``partition`` to a gzipped JSONL file, then drop it if the file holds every row.
+
+    The file is written under a ``.partial`` name and renamed once complete, so a crash
+    never leaves a truncated archive that looks finished. Returns None (partition kept)
+    when anything fails.
+    """
+    archive_dir = archive_dir or logs_archive_dir()
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, archive_file_name(partition))
+    partial = f"{path}.partial"
+
+    archived = 0
+    try:
+        with gzip.open(partial, "wt", encoding="utf-8") as archive:
+            for row in db._stream_rows(f"SELECT {', '.join(_LOG_COLUMNS)} FROM logs PARTITION ({partition.name})",
+                                       row_type=_LogRow, what=f"logs partition {partition.name}", primary=True):
+                archive.write(json.dumps(row._asdict(), default=str) + "\n")
+                archived += 1
+    except mysql.connector.Error:
+        os.remove(partial)
+        return None
+
+    expected = _partition_row_count(partition.name)
+    if expected != archived:
+        log_warning(f"Keeping logs partition {partition.name}: archived {archived} of {expected} rows",
+                    task_name="auto_db_maintenance")
+        os.remove(partial)
+        return None
+    os.replace(partial, path)
+
+    connection = db.get_db_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"ALTER TABLE logs DROP PARTITION {partition.name}")
+    except mysql.connector.Error as err:
+        myprint(f"Could not drop logs partition {partition.name} | Error: {err}")
+        return None
+    finally:
+        cursor.close()
+        connection.close()
+    return {"partition": partition.name, "rows": archived, "file": path}
+
+
+def _orphaned_log_user_ids() -> set[int]:
+    connection = db.get_db_connection()
+    cursor = connection.cursor()
+    try:
+        # Loose index scan on idx_logs_user_created: one probe per distinct user, not per row
+        cursor.execute("SELECT DISTINCT user_id FROM logs WHERE user_id IS NOT NULL")
+        log_users = {row[0] for row in cursor.fetchall()}
+        cursor.execute("SELECT id FROM users")
+        return log_users - {row[0] for row in cursor.fetchall()}
+    except mysql.connector.Error as err:
+        myprint(f"Could not find orphaned logs | Error: {err}")
+        return set()
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def _orphaned_log_post_ids() -> set[int]:
+    connection = db.get_db_connection()
+    cursor = connection.cursor()
+    try:
+        # Anti-join rather than reading every post id: posts outgrows users by far
+        cursor.execute(
+            "SELECT DISTINCT l.post_id FROM logs l LEFT JOIN posts p ON p.id = l.post_id"
+            " WHERE l.post_id IS NOT NULL AND p.id IS NULL"
+        )
+        return {row[0] for row in cursor.fetchall()}
+    except mysql.connector.Error as err:
+        myprint(f"Could not find logs of deleted posts | Error: {err}")
+        return set()
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def purge_orphaned_logs(batch_size: int = _ORPHAN_PURGE_BATCH) -> int:
+    """Delete the logs of deleted users and deleted posts in ``batch_size`` row statements.
+    Returns rows deleted."""
+    orphans = [("user_id", user_id) for user_id in sorted(_orphaned_log_user_ids())] + \
+        [("post_id", post_id) for post_id in sorted(_orphaned_log_post_ids())]
+    if not orphans:
+        return 0
+    deleted = 0
+    connection = db.get_db_connection()
+    cursor = connection.cursor()
+    try:
+        for column, value in orphans:
+            while True:
+                cursor.execute(f"DELETE FROM logs WHERE {column} = %s LIMIT %s", (value, batch_size))
+                connection.commit()
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    break
+    except mysql.connector.Error as err:
+        myprint(f"Could not purge orphaned logs | Error: {err}")
+    finally:
+        cursor.close()
+        connection.close()
+    return deleted
+
+
+def _expired_sessions_estimate() -> tuple[int, int]:
+    """(expired session rows, estimated bytes) for the dry-run report."""
+    connection = db.get_db_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM sessions WHERE expires_at < %s", (datetime.now(timezone.utc),))
+        expired = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT AVG_ROW_LENGTH FROM information_schema.TABLES"
+            " WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'sessions'"
+        )
+        row = cursor.fetchone()
+        return expired, expired * int((row[0] if row else 0) or 0)
+    except mysql.connector.Error as err:
+        myprint(f"Could not estimate expired sessions | Error: {err}")
+        return 0, 0
+    finally:
+        cursor.close()
+        connection.close()
+
+
+# ---------------------------------------------------------------------------
+# Entry points
+# ---------------------------------------------------------------------------
+
+def maintenance_report(today: Optional[date] = None) -> dict:
+    """What run_maintenance() would do now, without changing anything."""
+    today = today or _today()
+    partitions = get_log_partitions()
+    archive = partitions_to_archive(partitions, today, logs_retention_months())
+    expired_sessions, session_bytes = _expired_sessions_estimate()
+    return {
+        "logs_partitioned": bool(partitions),
+        "retention_months": logs_retention_months(),
+        "partitions_to_add": [name for name, _ in partitions_to_add(partitions, today, logs_partitions_ahead())],
+        "partitions_to_archive": [
+            {"partition": p.name, "rows": p.rows, "bytes": p.bytes,
+             "file": os.path.join(logs_archive_dir(), archive_file_name(p))}
+            for p in archive
+        ],
+        "orphaned_log_users": len(_orphaned_log_user_ids()),
+        "orphaned_log_posts": len(_orphaned_log_post_ids()),
+        "expired_sessions": expired_sessions,
+        "reclaimable_bytes": sum(p.bytes for p in archive) + session_bytes,
+    }
+
+
+def run_maintenance(dry_run: bool = False, today: Optional[date] = None) -> dict:
+    if dry_run:
+        return maintenance_report(today)
+    today = today or _today()
+    partitions = get_log_partitions()
+    if not partitions:
+        log_warning("logs is not partitioned (migration V37 not applied); skipping partition maintenance",
+                    task_name="auto_db_maintenance")
+    added = add_log_partitions(partitions, today)
+    archived = [result for partition in partitions_to_archive(partitions, today, logs_retention_months())
+                if (result := archive_log_partition(partition)) is not None]
+    return {
+        "partitions_added": added,
+        "partitions_archived": archived,
+        "orphaned_logs_deleted": purge_orphaned_logs(),
+        "expired_sessions_deleted": db.purge_expired_sessions(sessions_purge_batch()),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m cqc_lem.utilities.db_maintenance")
+    parser.add_argument("--dry-run", action="store_true", help="report what a run would do and reclaim")
+    args = parser.parse_args()
+    result = run_maintenance(dry_run=args.dry_run)
+    print(json.dumps(result, indent=2, default=str))  # noqa: T201 — CLI output
@@ -0,0 +1,570 @@
+"""Per-function latency metrics for the database helpers.
+
+Every public function in ``db`` and ``db_async`` is wrapped by ``instrument`` at import
+time. A call records, under its function name:
+
+- calls, errors (raised, or a statement that failed inside the helper),
+- rows fetched,
+- connection-acquire time (pool wait + connect) and statement execution time,
+- wall time, as a histogram (cumulative buckets in seconds, Prometheus style).
+
+Acquire and execution time are attributed to the innermost instrumented call, so a
+helper that calls another (``get_post_by_email`` -> ``get_posts``) only shows its own
+queries; wall time includes nested calls.
+
+Statements slower than DB_SLOW_QUERY_MS are sampled with their SQL text (whitespace
+collapsed, long ``%s`` lists folded) and the *shape* of their parameters (types and
+counts) — never the values.
+
+Exports: ``render_prometheus()`` (the API's ``/metrics``), ``maybe_publish()`` (batched
+CloudWatch / PostHog pushes plus a Redis snapshot, at most every
+DB_METRICS_PUBLISH_SECONDS) and ``report()`` (``python -m cqc_lem.utilities.db --stats``).
+Set DB_METRICS_ENABLED=false to skip instrumentation entirely.
+"""
+
+import functools
+import inspect
+import json
+import os
+import re
+import socket
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_SLOW_SAMPLES = 100
+_SQL_MAX_CHARS = 2000
+_REDIS_PREFIX = "db_metrics:"
+_CLOUDWATCH_NAMESPACE = "cqc-lem/db"
+_CLOUDWATCH_BATCH = 20
+
+
+def metrics_enabled() -> bool:
+    return os.getenv("DB_METRICS_ENABLED", "true").strip().lower() not in ("0", "false", "no")
+
+
+def slow_query_ms() -> float:
+    try:
+        return float(os.getenv("DB_SLOW_QUERY_MS", "250"))
+    except ValueError:
+        return 250.0
+
+
+def publish_interval() -> float:
+    try:
+        return float(os.getenv("DB_METRICS_PUBLISH_SECONDS", "60"))
+    except ValueError:
+        return 60.0
+
+
+def normalize_sql(sql: str) -> str:
+    """One-line SQL with long placeholder lists folded, for sampling and reports."""
+    sql = " ".join(str(sql).split())
+    sql = re.sub(r"%s(?:, %s){3,}", "%s, ...", sql)
+    sql = re.sub(r"\(%s, ...\)(?:, \(%s, ...\))+", "(%s, ...), ...", sql)
+    return sql[:_SQL_MAX_CHARS]
+
+
+def params_shape(params, many: bool = False) -> Optional[str]:
+    """Types of the bound parameters, e.g. ``(int, str, datetime)`` — never the values."""
+    if params is None:
+        return None
+    if many:
+        params = list(params)
+        return f"{len(params)} x {params_shape(params[0]) if params else '()'}"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+    if not isinstance(params, (list, tuple)):
+        return type(params).__name__
+    runs: list[list] = []  # [type name, count], consecutive repeats folded
+    for value in params:
+        name = type(value).__name__
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    return "(" + ", ".join(name if n < 4 else f"{name} x {n}" for name, n in runs) + ")"
+
+
+class _CallFrame:
+    __slots__ = ("acquire", "execute", "rows", "failed")
+
+    def __init__(self):
+        self.acquire = 0.0
+        self.execute = 0.0
+        self.rows = 0
+        self.failed = False
+
+
+_current: ContextVar[Optional[tuple[str, _CallFrame]]] = ContextVar("db_metrics_call", default=None)
+
+
+class _FunctionStats:
+    __slots__ = ("calls", "errors", "rows", "acquire", "execute", "wall", "wall_max", "buckets")
+
+    def __init__(self):
+        self.calls = self.errors = self.rows = 0
+        self.acquire = self.execute = self.wall = self.wall_max = 0.0
+        self.buckets = [0] * len(_BUCKETS)
+
+    def add(self, frame: _CallFrame, wall: float) -> None:
+        self.calls += 1
+        self.errors += int(frame.failed)
+        self.rows += frame.rows
+        self.acquire += frame.acquire
+        self.execute += frame.execute
+        self.wall += wall
+        self.wall_max = max(self.wall_max, wall)
+        for i, bound in enumerate(_BUCKETS):
+            if wall <= bound:
+                self.buckets[i] += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "acquire_ms": round(self.acquire * 1000, 3),
+            "execute_ms": round(self.execute * 1000, 3),
+            "wall_ms": round(self.wall * 1000, 3),
+            "max_ms": round(self.wall_max * 1000, 3),
+            "buckets": list(self.buckets),
+        }
+
+
+class QueryRegistry:
+    """Thread-safe per-function totals (cumulative, plus a pending delta for publishing)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self._lock = threading.Lock()  # fresh after fork: the parent may have held it
+        self._totals: dict[str, _FunctionStats] = {}
+        self._pending: dict[str, _FunctionStats] = {}
+        self._slow: deque = deque(maxlen=_SLOW_SAMPLES)
+        self._last_publish = time.monotonic()
+        self._publishing = False
+
+    def record(self, name: str, frame: _CallFrame, wall: float) -> None:
+        with self._lock:
+            for table in (self._totals, self._pending):
+                stats = table.get(name)
+                if stats is None:
+                    stats = table[name] = _FunctionStats()
+                stats.add(frame, wall)
+
+    def record_slow(self, name: str, sql: str, shape: Optional[str], seconds: float) -> None:
+        with self._lock:
+            self._slow.append({
+                "function": name,
+                "sql": normalize_sql(sql),
+                "params": shape,
+                "ms": round(seconds * 1000, 3),
+                "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            })
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in self._totals.items()}
+
+    def slow_queries(self) -> list[dict]:
+        with self._lock:
+            return list(self._slow)
+
+    def take_pending(self) -> dict:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return {name: stats.as_dict() for name, stats in pending.items()}
+
+    def publish_due(self, force: bool = False) -> bool:
+        """True (once) when DB_METRICS_PUBLISH_SECONDS have passed since the last publish."""
+        with self._lock:
+            if self._publishing:
+                return False
+            if not force and time.monotonic() - self._last_publish < publish_interval():
+                return False
+            self._publishing = True
+            return True
+
+    def published(self) -> None:
+        with self._lock:
+            self._publishing = False
+            self._last_publish = time.monotonic()
+
+
+registry = QueryRegistry()
+os.register_at_fork(after_in_child=registry.reset)
+
+
+# ---------------------------------------------------------------------------
+# Recording
+# ---------------------------------------------------------------------------
+
+def record_acquire(seconds: float) -> None:
+    """Pool checkout time, charged to the instrumented call in progress (if any)."""
+    current = _current.get()
+    if current is not None:
+        current[1].acquire += seconds
+
+
+def record_statement(sql: str, params, seconds: float, rows: int = 0, failed: bool = False,
+                     many: bool = False) -> None:
+    current = _current.get()
+    if current is None:
+        return
+    name, frame = current
+    frame.execute += seconds
+    frame.rows += rows
+    frame.failed = frame.failed or failed
+    if seconds * 1000 >= slow_query_ms():
+        registry.record_slow(name, sql, params_shape(params, many), seconds)
+
+
+def record_rows(rows: int, seconds: float) -> None:
+    current = _current.get()
+    if current is not None:
+        current[1].rows += rows
+        current[1].execute += seconds
+
+
+class InstrumentedCursor:
+    """Cursor proxy timing execute/fetch calls into the current instrumented call."""
+
+    __slots__ = ("_cursor", "_last")
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._last = None  # (sql, params, many, seconds so far) of the last statement
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _run(self, method, sql, params, many):
+        started = time.perf_counter()
+        try:
+            result = method(sql, params) if params is not None else method(sql)
+        except Exception:
+            record_statement(sql, params, time.perf_counter() - started, failed=True, many=many)
+            raise
+        elapsed = time.perf_counter() - started
+        self._last = (sql, params, many, elapsed)
+        record_statement(sql, params, elapsed, many=many)
+        return result
+
+    def execute(self, sql, params=None, *args, **kwargs):
+        if args or kwargs:
+            return self._cursor.execute(sql, params, *args, **kwargs)
+        return self._run(self._cursor.execute, sql, params, False)
+
+    def executemany(self, sql, seq_params):
+        return self._run(self._cursor.executemany, sql, seq_params, True)
+
+    def _fetched(self, rows: int, seconds: float) -> None:
+        record_rows(rows, seconds)
+        if self._last is None:
+            return
+        # Unbuffered cursors do their work while fetching: sample a statement whose
+        # execute + fetch time crosses the threshold even if execute alone did not.
+        sql, params, many, so_far = self._last
+        self._last = (sql, params, many, so_far + seconds)
+        threshold = slow_query_ms() / 1000
+        current = _current.get()
+        if current is not None and so_far < threshold <= so_far + seconds:
+            registry.record_slow(current[0], sql, params_shape(params, many), so_far + seconds)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(int(row is not None), time.perf_counter() - started)
+        return row
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(len(rows or ()), time.perf_counter() - started)
+        return rows
+
+    def fetchmany(self, *args, **kwargs):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._fetched(len(rows or ()), time.perf_counter() - started)
+        return rows
+
+
+def instrument(func, name: Optional[str] = None):
+    """Wrap a db helper (plain, generator or coroutine function) to record its metrics."""
+    if not metrics_enabled():
+        return func
+    name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            frame = _CallFrame()
+            token = _current.set((name, frame))
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                frame.failed = True
+                raise
+            finally:
+                _current.reset(token)
+                registry.record(name, frame, time.perf_counter() - started)
+        return async_wrapper
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            frame = _CallFrame()
+            wall = 0.0
+            generator = func(*args, **kwargs)
+            try:
+                while True:
+                    # Only time spent inside the generator counts, not the consumer's work
+                    token = _current.set((name, frame))
+                    started = time.perf_counter()
+                    try:
+                        item = next(generator)
+                    except StopIteration:
+                        return
+                    except Exception:
+                        frame.failed = True
+                        raise
+                    finally:
+                        wall += time.perf_counter() - started
+                        _current.reset(token)
+                    yield item
+            finally:
+                generator.close()
+                registry.record(name, frame, wall)
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        frame = _CallFrame()
+        token = _current.set((name, frame))
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            frame.failed = True
+            raise
+        finally:
+            _current.reset(token)
+            registry.record(name, frame, time.perf_counter() - started)
+    return wrapper
+
+
+def instrument_module(namespace: dict, skip: frozenset = frozenset()) -> None:
+    """Wrap every public function defined in the module whose globals() is ``namespace``.
+
+    Rebinding the module globals means calls between helpers in the same module and
+    ``from module import name`` done afterwards both get the wrapped function.
+    """
+    module = namespace["__name__"]
+    for attr, value in list(namespace.items()):
+        if attr.startswith("_") or attr in skip or not inspect.isfunction(value):
+            continue
+        if value.__module__ != module:
+            continue  # imported from elsewhere
+        namespace[attr] = instrument(value)
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+def _percentile_ms(stats: dict, q: float) -> Optional[float]:
+    target = stats["calls"] * q
+    for bound, count in zip(_BUCKETS, stats["buckets"]):
+        if count >= target:
+            return bound * 1000
+    return None  # beyond the largest bucket
+
+
+def render_prometheus(extra_gauges: Optional[dict[str, float]] = None) -> str:
+    """Prometheus text exposition of the per-function totals (plus optional gauges)."""
+    lines = [
+        "# HELP cqc_lem_db_call_seconds Wall time of db helper calls.",
+        "# TYPE cqc_lem_db_call_seconds histogram",
+    ]
+    snapshot = registry.snapshot()
+    for name in sorted(snapshot):
+        stats = snapshot[name]
+        label = f'function="{name}"'
+        for bound, count in zip(_BUCKETS, stats["buckets"]):
+            lines.append(f'cqc_lem_db_call_seconds_bucket{{{label},le="{bound}"}} {count}')
+        lines.append(f'cqc_lem_db_call_seconds_bucket{{{label},le="+Inf"}} {stats["calls"]}')
+        lines.append(f"cqc_lem_db_call_seconds_sum{{{label}}} {stats['wall_ms'] / 1000}")
+        lines.append(f"cqc_lem_db_call_seconds_count{{{label}}} {stats['calls']}")
+    for metric, key, scale, help_text in (
+            ("cqc_lem_db_call_errors_total", "errors", 1, "Calls that raised or had a failing statement."),
+            ("cqc_lem_db_rows_total", "rows", 1, "Rows fetched."),
+            ("cqc_lem_db_acquire_seconds_total", "acquire_ms", 1000, "Time waiting for pooled connections."),
+            ("cqc_lem_db_execute_seconds_total", "execute_ms", 1000, "Time executing statements and fetching."),
+    ):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for name in sorted(snapshot):
+            lines.append(f'{metric}{{function="{name}"}} {snapshot[name][key] / scale}')
+    typed = set()
+    for gauge, value in sorted((extra_gauges or {}).items()):
+        # Labelled gauges (name{label="x"}) share one TYPE line per metric name
+        name = gauge.split("{", 1)[0]
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{gauge} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def report(snapshot: Optional[dict] = None, slow: Optional[list] = None, top: int = 40) -> str:
+    """Plain-text table of the heaviest functions by total wall time, then slow samples."""
+    snapshot = registry.snapshot() if snapshot is None else snapshot
+    slow = registry.slow_queries() if slow is None else slow
+    if not snapshot:
+        return "No db calls recorded."
+    header = f"{'function':<48} {'calls':>8} {'err':>5} {'rows':>9} {'total ms':>11} " \
+             f"{'acquire':>9} {'execute':>9} {'p50':>7} {'p95':>7} {'max ms':>9}"
+    lines = [header, "-" * len(header)]
+    ranked = sorted(snapshot.items(), key=lambda item: item[1]["wall_ms"], reverse=True)
+    for name, s in ranked[:top]:
+        p50, p95 = _percentile_ms(s, 0.5), _percentile_ms(s, 0.95)
+        lines.append(
+            f"{name:<48} {s['calls']:>8} {s['errors']:>5} {s['rows']:>9} {s['wall_ms']:>11.1f} "
+            f"{s['acquire_ms']:>9.1f} {s['execute_ms']:>9.1f} "
+            f"{'>10s' if p50 is None else f'{p50:g}':>7} {'>10s' if p95 is None else f'{p95:g}':>7} "
+            f"{s['max_ms']:>9.1f}"
+        )
+    if slow:
+        lines += ["", f"Slow statements (>= {slow_query_ms():g} ms, most recent last):"]
+        for sample in slow[-20:]:
+            lines.append(f"  {sample['ms']:>9.1f} ms  {sample['function']}  params={sample['params']}")
+            lines.append(f"             {sample['sql']}")
+    return "\n".join(lines)
+
+
+def merge_snapshots(snapshots: list[dict]) -> dict:
+    merged: dict[str, dict] = {}
+    for snapshot in snapshots:
+        for name, s in snapshot.items():
+            m = merged.setdefault(name, {"calls": 0, "errors": 0, "rows": 0, "acquire_ms": 0.0,
+                                         "execute_ms": 0.0, "wall_ms": 0.0, "max_ms": 0.0,
+                                         "buckets": [0] * len(_BUCKETS)})
+            for key in ("calls", "errors", "rows", "acquire_ms", "execute_ms", "wall_ms"):
+                m[key] += s[key]
+            m["max_ms"] = max(m["max_ms"], s["max_ms"])
+            m["buckets"] = [a + b for a, b in zip(m["buckets"], s["buckets"])]
+    return merged
+
+
+def maybe_publish(force: bool = False, background: bool = True) -> bool:
+    """Push the metrics gathered since the last push, if DB_METRICS_PUBLISH_SECONDS elapsed.
+
+    Cheap when not due. The push itself (CloudWatch, PostHog, Redis snapshot for
+    ``--stats``) runs in a daemon thread so callers on a request or task path never wait;
+    pass ``force=True, background=False`` for a final push at process shutdown.
+    """
+    if not metrics_enabled() or not registry.publish_due(force):
+        return False
+    if background:
+        threading.Thread(target=_publish, name="db-metrics-publish", daemon=True).start()
+    else:
+        _publish()
+    return True
+
+
+def _publish() -> None:
+    from cqc_lem.utilities.logger import log_warning
+
+    try:
+        pending = registry.take_pending()
+        if pending:
+            _publish_posthog(pending)
+            _publish_cloudwatch(pending)
+        _publish_redis_snapshot()
+    except Exception as err:
+        log_warning(f"Could not publish db metrics | Error: {err}")
+    finally:
+        registry.published()
+
+
+def _publish_posthog(pending: dict) -> None:
+    from cqc_lem.utilities.observability import track_db_calls
+    for name, stats in pending.items():
+        track_db_calls(name, calls=stats["calls"], errors=stats["errors"], rows=stats["rows"],
+                       wall_ms=stats["wall_ms"], acquire_ms=stats["acquire_ms"],
+                       execute_ms=stats["execute_ms"], max_ms=stats["max_ms"])
+
+
+def _publish_cloudwatch(pending: dict) -> None:
+    from cqc_lem.utilities.env_constants import AWS_REGION
+    if not AWS_REGION:
+        return
+    from cqc_lem.utilities.utils import get_cloudwatch_client
+
+    now = datetime.now(timezone.utc)
+    data = []
+    for name, stats in pending.items():
+        dimensions = [{"Name": "Function", "Value": name}]
+        data.append({
+            "MetricName": "CallLatency", "Dimensions": dimensions, "Timestamp": now, "Unit": "Milliseconds",
+            "StatisticValues": {"SampleCount": stats["calls"], "Sum": stats["wall_ms"],
+                                "Minimum": 0.0, "Maximum": stats["max_ms"]},
+        })
+        data.append({"MetricName": "Rows", "Dimensions": dimensions, "Timestamp": now,
+                     "Unit": "Count", "Value": stats["rows"]})
+        data.append({"MetricName": "AcquireTime", "Dimensions": dimensions, "Timestamp": now,
+                     "Unit": "Milliseconds", "Value": stats["acquire_ms"]})
+        if stats["errors"]:
+            data.append({"MetricName": "Errors", "Dimensions": dimensions, "Timestamp": now,
+                         "Unit": "Count", "Value": stats["errors"]})
+    cloudwatch = get_cloudwatch_client(AWS_REGION)
+    for i in range(0, len(data), _CLOUDWATCH_BATCH):
+        cloudwatch.put_metric_data(Namespace=_CLOUDWATCH_NAMESPACE, MetricData=data[i:i + _CLOUDWATCH_BATCH])
+
+
+def _publish_redis_snapshot() -> None:
+    from cqc_lem.utilities.redis_client import redis_client
+    client = redis_client()
+    if client is None:
+        return
+    key = f"{_REDIS_PREFIX}{socket.gethostname()}:{os.getpid()}"
+    payload = json.dumps({"totals": registry.snapshot(), "slow": registry.slow_queries()})
+    try:
+        client.set(key, payload, ex=max(60, int(publish_interval() * 5)))
+    except Exception:
+        pass  # fail open: --stats just won't see this process
+
+
+def load_published_snapshots() -> tuple[dict, list]:
+    """Merge the snapshots every live process published to Redis (for ``--stats``)."""
+    from cqc_lem.utilities.redis_client import redis_client
+    client = redis_client()
+    if client is None:
+        return {}, []
+    snapshots, slow = [], []
+    try:
+        for key in client.scan_iter(match=f"{_REDIS_PREFIX}*"):
+            raw = client.get(key)
+            if not raw:
+                continue
+            data = json.loads(raw)
+            snapshots.append(data.get("totals", {}))
+            slow.extend(data.get("slow", []))
+    except Exception as err:
+        from cqc_lem.utilities.logger import log_warning
+        log_warning(f"Could not read published db metrics from Redis | Error: {err}")
+        return {}, []
+    slow.sort(key=lambda sample: sample["at"])
+    return merge_snapshots(snapshots), slow
@@ -0,0 +1,296 @@
+"""Process-wide MySQL connection pool for cqc_lem.utilities.db.
+
+Every db.py helper used to open a fresh ``mysql.connector.connect`` (TCP + TLS + auth,
+plus an AWS Secrets Manager call when the secret is configured) and close it on return.
+A single weekly-content run made hundreds of those handshakes and the API made one per
+request. This pool keeps a small set of authenticated connections per process and hands
+them out behind a proxy whose ``close()`` returns the connection instead of closing it,
+so the existing ``connection.close()`` calls in db.py keep working unchanged.
+
+Checkout time and every cursor's statements are reported to ``db_metrics``, which
+attributes them to the db helper being called.
+
+Fork safety: Celery prefork children inherit the parent's sockets. Sharing a MySQL
+socket across processes corrupts the protocol stream, so the pool is discarded (never
+closed — closing would send COM_QUIT on the parent's socket) in the child after fork.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+import mysql.connector
+from mysql.connector import errorcode
+from mysql.connector.errors import PoolError
+
+from cqc_lem.utilities import db_metrics
+from cqc_lem.utilities.logger import log_warning
+
+_DEFAULT_POOL_SIZE = 5
+_DEFAULT_ACQUIRE_TIMEOUT_SECONDS = 10.0
+_DEFAULT_PING_AFTER_SECONDS = 30.0
+_DEFAULT_SECRET_TTL_SECONDS = 300.0
+
+_metrics_enabled = db_metrics.metrics_enabled()
+
+
+def _env_number(name: str, default, cast=float):
+    try:
+        return cast(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+class PoolExhausted(PoolError):
+    """No connection became available within the acquire timeout.
+
+    Subclasses mysql.connector's PoolError (itself an ``mysql.connector.Error``) so
+    callers that already handle database errors treat it the same way.
+    """
+
+
+class SecretCache:
+    """Caches connection settings resolved from AWS Secrets Manager for a TTL.
+
+    ``invalidate()`` forces the next ``get()`` to re-read the secret — used after an
+    authentication failure, which is what a rotated password looks like.
+    """
+
+    def __init__(self, loader: Callable[[], dict], ttl_seconds: float):
+        self._loader = loader
+        self._ttl = ttl_seconds
+        self._value: Optional[dict] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> dict:
+        with self._lock:
+            if self._value is None or time.monotonic() - self._loaded_at >= self._ttl:
+                self._value = self._loader()
+                self._loaded_at = time.monotonic()
+            return self._value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._value = None
+
+
+class PooledConnection:
+    """Proxy around a raw MySQL connection checked out of a ConnectionPool.
+
+    Attribute access is forwarded to the real connection. ``close()`` hands the
+    connection back to the pool; it is idempotent so the ``finally: close()`` pattern
+    in db.py can never return the same connection twice.
+    """
+
+    __slots__ = ("_pool", "_conn", "_released")
+
+    def __init__(self, pool: "ConnectionPool", conn):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._conn.cursor(*args, **kwargs)
+        return db_metrics.InstrumentedCursor(cursor) if _metrics_enabled else cursor
+
+    def close(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._pool._release(self._conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """Bounded, thread-safe, fork-aware pool of MySQL connections.
+
+    - At most ``size`` connections exist per process; ``acquire()`` blocks up to
+      ``timeout`` seconds for one to be returned, then raises PoolExhausted.
+    - Connections idle longer than ``ping_after`` seconds are pinged before reuse and
+      replaced if the server dropped them (wait_timeout, failover, restart).
+    - Returned connections are rolled back if a transaction is still open so the next
+      borrower never inherits a stale REPEATABLE READ snapshot or uncommitted writes.
+    """
+
+    def __init__(self, settings: Callable[[], dict], size: int = _DEFAULT_POOL_SIZE,
+                 timeout: float = _DEFAULT_ACQUIRE_TIMEOUT_SECONDS,
+                 ping_after: float = _DEFAULT_PING_AFTER_SECONDS,
+                 on_auth_failure: Optional[Callable[[], None]] = None):
+        self._settings = settings
+        self._size = max(1, size)
+        self._timeout = timeout
+        self._ping_after = ping_after
+        self._on_auth_failure = on_auth_failure
+        self._cond = threading.Condition()
+        self._reset_state()
+
+    def _reset_state(self) -> None:
+        self._pid = os.getpid()
+        self._idle: deque = deque()  # (conn, returned_at) — LIFO keeps hot connections warm
+        self._checked_out = 0
+        self._created = 0
+        self._discarded = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._timeouts = 0
+
+    # -- lifecycle ---------------------------------------------------------
+
+    def _check_pid(self) -> None:
+        # Belt-and-braces for platforms/processes where the at-fork hook did not run.
+        if self._pid != os.getpid():
+            self.discard_after_fork()
+
+    def discard_after_fork(self) -> None:
+        """Forget every inherited connection without touching its socket."""
+        self._cond = threading.Condition()
+        self._reset_state()
+
+    def _connect(self):
+        params = dict(self._settings())
+        try:
+            return mysql.connector.connect(**params)
+        except mysql.connector.Error as err:
+            if err.errno != errorcode.ER_ACCESS_DENIED_ERROR or self._on_auth_failure is None:
+                raise
+            # Most likely a rotated secret — refresh it and retry once.
+            log_warning(f"MySQL auth failed — refreshing cached credentials and retrying | Error: {err}")
+            self._on_auth_failure()
+            return mysql.connector.connect(**dict(self._settings()))
+
+    def _discard(self, conn) -> None:
+        self._discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, conn, idle_for: float) -> bool:
+        if idle_for < self._ping_after:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    # -- checkout / checkin -----------------------------------------------
+
+    def acquire(self) -> PooledConnection:
+        started = time.perf_counter()
+        try:
+            return self._acquire()
+        finally:
+            db_metrics.record_acquire(time.perf_counter() - started)
+
+    def _acquire(self) -> PooledConnection:
+        self._check_pid()
+        waited_since = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    idle_for = time.monotonic() - returned_at
+                    break
+                if self._checked_out < self._size:
+                    conn, idle_for = None, 0.0
+                    break
+                if waited_since is None:
+                    waited_since = time.monotonic()
+                    self._waits += 1
+                remaining = waited_since + self._timeout - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    self._record_wait(waited_since)
+                    raise PoolExhausted(
+                        f"No MySQL connection available within {self._timeout}s "
+                        f"({self._checked_out}/{self._size} checked out)"
+                    )
+                self._cond.wait(remaining)
+            # Reserve the slot before releasing the lock to ping or connect.
+            self._checked_out += 1
+            self._record_wait(waited_since)
+
+        if conn is not None and not self._healthy(conn, idle_for):
+            self._discard(conn)
+            conn = None
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._checked_out -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._created += 1
+        return PooledConnection(self, conn)
+
+    def _record_wait(self, waited_since: Optional[float]) -> None:
+        if waited_since is not None:
+            self._wait_time_total += time.monotonic() - waited_since
+
+    def _release(self, conn) -> None:
+        if self._pid != os.getpid():
+            return  # connection belongs to the parent process; drop the reference
+        reusable = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            reusable = False
+        with self._cond:
+            self._checked_out = max(0, self._checked_out - 1)
+            if reusable and len(self._idle) + self._checked_out < self._size:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._discard(conn)
+            self._cond.notify()
+
+    def close_all(self) -> None:
+        """Close every idle connection (checked-out ones are closed on return)."""
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "checked_out": self._checked_out,
+                "created": self._created,
+                "discarded": self._discarded,
+                "waits": self._waits,
+                "wait_time_ms": int(self._wait_time_total * 1000),
+                "timeouts": self._timeouts,
+            }
+
+
+def pool_size() -> int:
+    return _env_number("MYSQL_POOL_SIZE", _DEFAULT_POOL_SIZE, int)
+
+
+def pool_timeout() -> float:
+    return _env_number("MYSQL_POOL_TIMEOUT_SECONDS", _DEFAULT_ACQUIRE_TIMEOUT_SECONDS)
+
+
+def pool_ping_after() -> float:
+    return _env_number("MYSQL_POOL_PING_AFTER_SECONDS", _DEFAULT_PING_AFTER_SECONDS)
+
+
+def secret_ttl() -> float:
+    return _env_number("MYSQL_SECRET_TTL_SECONDS", _DEFAULT_SECRET_TTL_SECONDS)
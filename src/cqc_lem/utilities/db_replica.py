@@ -0,0 +1,206 @@
+"""Routing of read-only db.py queries to an optional MySQL read replica.
+
+With ``MYSQL_REPLICA_HOST`` set, the heavy read-only helpers (post pages, dashboard
+stats, activity logs, planner and nightly batch reads) check a connection out of a
+second pool pointed at the replica, so dashboard traffic and batch scans stop competing
+with scheduler writes on the primary. Writes always go to the primary.
+
+A read falls back to the primary when:
+
+- the replica's lag (``SHOW REPLICA STATUS``, re-measured every
+  MYSQL_REPLICA_LAG_CHECK_SECONDS) is unknown or above MYSQL_REPLICA_MAX_LAG_SECONDS —
+  a stopped replication thread or a failed probe counts as unknown;
+- the same user was written by this process within the last MYSQL_REPLICA_MAX_LAG_SECONDS,
+  or the current context (request / task) wrote anything in that window, so a caller
+  always reads its own writes;
+- the caller is inside ``force_primary()``;
+- the replica cannot be reached (then it is skipped until the next lag check).
+
+A replica that reports no replication status at all (e.g. an Aurora reader, whose
+replication is storage-level) is treated as current.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+import mysql.connector
+from mysql.connector import errorcode
+
+from cqc_lem.utilities.db_pool import ConnectionPool
+from cqc_lem.utilities.logger import log_warning
+from cqc_lem.utilities.ttl_cache import TTLCache
+
+_DEFAULT_MAX_LAG_SECONDS = 5.0
+_DEFAULT_LAG_CHECK_SECONDS = 10.0
+
+# monotonic deadline before which reads in this context stay on the primary
+_primary_until: ContextVar[float] = ContextVar("primary_until", default=0.0)
+_force_primary: ContextVar[bool] = ContextVar("force_primary", default=False)
+
+
+def replica_max_lag() -> float:
+    try:
+        return float(os.getenv("MYSQL_REPLICA_MAX_LAG_SECONDS", str(_DEFAULT_MAX_LAG_SECONDS)))
+    except ValueError:
+        return _DEFAULT_MAX_LAG_SECONDS
+
+
+def replica_lag_check_interval() -> float:
+    try:
+        return float(os.getenv("MYSQL_REPLICA_LAG_CHECK_SECONDS", str(_DEFAULT_LAG_CHECK_SECONDS)))
+    except ValueError:
+        return _DEFAULT_LAG_CHECK_SECONDS
+
+
+@contextmanager
+def force_primary():
+    """Send every routed read inside the block to the primary."""
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+class ReplicaRouter:
+    """Chooses primary or replica for each routed read; a no-op without a replica pool."""
+
+    def __init__(self, pool: Optional[ConnectionPool], max_lag: float = _DEFAULT_MAX_LAG_SECONDS,
+                 check_interval: float = _DEFAULT_LAG_CHECK_SECONDS):
+        self._pool = pool
+        self._max_lag = max_lag
+        self._check_interval = check_interval
+        self._recent_writes = TTLCache(maxsize=8192, ttl=max_lag)
+        self._lock = threading.Lock()
+        self._lag: Optional[float] = None
+        self._next_check = 0.0
+        self._replica_reads = 0
+        self._primary_reads = 0
+        self._failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._pool is not None
+
+    def mark_write(self, user_id: Optional[int] = None) -> None:
+        """Keep reads of this user, and of the current context, on the primary for a while."""
+        if not self.enabled:
+            return
+        _primary_until.set(time.monotonic() + self._max_lag)
+        if user_id is not None:
+            self._recent_writes.set(user_id, True)
+
+    def lag_check_due(self) -> bool:
+        return self.enabled and time.monotonic() >= self._next_check
+
+    def refresh_lag_if_due(self) -> None:
+        """Re-measure replica lag if MYSQL_REPLICA_LAG_CHECK_SECONDS have passed.
+
+        Only one thread probes; the others keep using the previous measurement.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not self.enabled or now < self._next_check:
+                return
+            self._next_check = now + self._check_interval
+        try:
+            lag = self._measure_lag()
+        except Exception as err:
+            log_warning(f"Replica lag check failed — reading from the primary | Error: {err}")
+            lag = None
+        with self._lock:
+            self._lag = lag
+
+    def use_replica(self, user_id: Optional[int] = None) -> bool:
+        """Whether a read for ``user_id`` (None: not user-scoped) may go to the replica.
+
+        Uses the last lag measurement only; call refresh_lag_if_due() first (db_async
+        does so in a worker thread so the probe never blocks the event loop).
+        """
+        if not self.enabled or _force_primary.get():
+            return False
+        if time.monotonic() < _primary_until.get():
+            return False
+        if user_id is not None and self._recent_writes.get(user_id) is not None:
+            return False
+        with self._lock:
+            return self._lag is not None and self._lag <= self._max_lag
+
+    def acquire(self, user_id: Optional[int] = None):
+        """A replica connection for this read, or None when it must go to the primary."""
+        self.refresh_lag_if_due()
+        if not self.use_replica(user_id):
+            self.record_read(replica=False)
+            return None
+        try:
+            connection = self._pool.acquire()
+        except mysql.connector.Error as err:
+            self.replica_failed(err)
+            return None
+        self.record_read(replica=True)
+        return connection
+
+    def record_read(self, replica: bool) -> None:
+        with self._lock:
+            if replica:
+                self._replica_reads += 1
+            else:
+                self._primary_reads += 1
+
+    def replica_failed(self, err: Exception) -> None:
+        """Route to the primary until the next lag check proves the replica healthy again."""
+        log_warning(f"Read replica unavailable — reading from the primary | Error: {err}")
+        with self._lock:
+            self._lag = None
+            self._failures += 1
+            self._primary_reads += 1
+            self._next_check = max(self._next_check, time.monotonic() + self._check_interval)
+
+    def discard_after_fork(self) -> None:
+        if self._pool is not None:
+            self._pool.discard_after_fork()
+
+    def reset(self) -> None:
+        """Forget lag, recent writes and counters (tests, shutdown)."""
+        self._recent_writes.clear()
+        with self._lock:
+            self._lag = None
+            self._next_check = 0.0
+            self._replica_reads = self._primary_reads = self._failures = 0
+        if self._pool is not None:
+            self._pool.close_all()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "lag_seconds": self._lag,
+                "max_lag_seconds": self._max_lag,
+                "replica_reads": self._replica_reads,
+                "primary_reads": self._primary_reads,
+                "failures": self._failures,
+                "pool": self._pool.stats() if self._pool is not None else None,
+            }
+
+    def _measure_lag(self) -> Optional[float]:
+        connection = self._pool.acquire()
+        cursor = connection.cursor(dictionary=True)
+        try:
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except mysql.connector.Error as err:
+                if err.errno != errorcode.ER_PARSE_ERROR:
+                    raise
+                cursor.execute("SHOW SLAVE STATUS")  # MySQL < 8.0.22
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+            connection.close()
+        if not row:
+            return 0.0
+        lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+        return None if lag is None else float(lag)
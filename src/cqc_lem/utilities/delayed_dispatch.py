@@ -0,0 +1,392 @@
+"""Durable delayed dispatch: Celery tasks parked in a Redis sorted set until they are due.
+
+``apply_async(eta=...)`` hands the message to a worker that holds it in memory until
+the ETA. With ``worker_prefetch_multiplier=1``, the 3-hour visibility timeout and
+frequent worker restarts, those in-memory tasks get lost or redelivered, which is what
+``get_orphaned_scheduled_posts`` has been patching over. Here a task that is due later
+is instead stored in Redis:
+
+- ``delayed:due`` — sorted set of job ids, scored by due time (epoch seconds)
+- ``delayed:jobs`` — hash of job id -> JSON payload (task name, kwargs, key, offset)
+- ``delayed:key:<key>`` — set of the job ids filed under one key (e.g. ``post:42``)
+- ``delayed:processing`` — sorted set of the job ids being sent, scored by lease deadline
+- ``delayed:lease_due`` — hash of leased job id -> its due time, to put it back with
+
+``dispatch_due`` (run by the ``dispatch-delayed-tasks`` beat entry) moves due jobs to
+the broker as plain, immediate messages. A pop (atomic, in Lua, so several pollers can
+run at once without sending a job twice) only leases a job: it moves to
+``delayed:processing`` and is deleted once the broker has accepted it. A poller that dies
+between pop and send leaves the lease to expire, and the next poll puts the job back, so
+a job is sent at least once rather than lost. Jobs filed under a key can be cancelled or
+moved to a new anchor time together, e.g. when a scheduled post is deleted or retimed.
+
+Fails open: ``schedule`` returns False when Redis is unavailable and the caller falls
+back to a Celery ETA.
+"""
+
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+from cqc_lem.utilities.logger import log_warning
+from cqc_lem.utilities.redis_client import redis_client
+
+_DUE_KEY = "delayed:due"
+_JOBS_KEY = "delayed:jobs"
+_KEY_PREFIX = "delayed:key:"
+_PROCESSING_KEY = "delayed:processing"
+_LEASE_DUE_KEY = "delayed:lease_due"
+_STATS_KEY = "delayed:stats"
+
+# KEYS: due, jobs, processing, lease_due. ARGV: now, limit, lease deadline.
+# First puts back jobs whose lease expired unsent, then leases up to ARGV[2] jobs due at or
+# before ARGV[1], in one step so two pollers never both get the same job.
+_POP_DUE_LUA = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[1])
+for _, id in ipairs(expired) do
+    local due = redis.call('HGET', KEYS[4], id) or ARGV[1]
+    redis.call('ZREM', KEYS[3], id)
+    redis.call('HDEL', KEYS[4], id)
+    if redis.call('HEXISTS', KEYS[2], id) == 1 then
+        redis.call('ZADD', KEYS[1], 'NX', due, id)
+    end
+end
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'WITHSCORES', 'LIMIT', 0, tonumber(ARGV[2]))
+local out = {}
+for i = 1, #ids, 2 do
+    local id = ids[i]
+    local payload = redis.call('HGET', KEYS[2], id)
+    redis.call('ZREM', KEYS[1], id)
+    if payload then
+        redis.call('ZADD', KEYS[3], ARGV[3], id)
+        redis.call('HSET', KEYS[4], id, ids[i + 1])
+        table.insert(out, id)
+        table.insert(out, ids[i + 1])
+        table.insert(out, payload)
+    end
+end
+return out
+"""
+
+# KEYS: processing, lease_due, due, jobs. ARGV: job id, key set prefix. Deletes a sent job,
+# unless it was scheduled again (same key and task) while leased. Returns 1 when deleted.
+_ACK_LUA = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('HDEL', KEYS[2], ARGV[1])
+if redis.call('ZSCORE', KEYS[3], ARGV[1]) then
+    return 0
+end
+local payload = redis.call('HGET', KEYS[4], ARGV[1])
+redis.call('HDEL', KEYS[4], ARGV[1])
+if payload then
+    local key = cjson.decode(payload)['key']
+    if key and key ~= cjson.null then
+        redis.call('SREM', ARGV[2] .. key, ARGV[1])
+    end
+end
+return 1
+"""
+
+# KEYS: processing, lease_due, due. ARGV: job id, due time. Ends a lease without sending, so
+# the next poll retries the job. Returns 1 when the job was leased.
+_RELEASE_LUA = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('ZADD', KEYS[3], 'NX', ARGV[2], ARGV[1])
+return 1
+"""
+
+
+class DelayedJob(NamedTuple):
+    id: str
+    task: str
+    kwargs: dict
+    due: float
+    key: Optional[str]
+    offset: float
+
+
+def delayed_dispatch_enabled() -> bool:
+    return os.getenv("DELAYED_DISPATCH_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+
+
+def poll_seconds() -> float:
+    """How often beat runs the dispatcher; bounds how late a job can start."""
+    try:
+        return float(os.getenv("DELAYED_DISPATCH_POLL_SECONDS", "15"))
+    except ValueError:
+        return 15.0
+
+
+def lease_seconds() -> float:
+    """How long a popped job may stay unsent before the next poll puts it back."""
+    try:
+        return float(os.getenv("DELAYED_DISPATCH_LEASE_SECONDS", "120"))
+    except ValueError:
+        return 120.0
+
+
+def late_warning_seconds() -> float:
+    try:
+        return float(os.getenv("DELAYED_DISPATCH_LATE_WARN_SECONDS", "120"))
+    except ValueError:
+        return 120.0
+
+
+def post_key(post_id: int) -> str:
+    return f"post:{post_id}"
+
+
+def _epoch(when: datetime) -> float:
+    if when.tzinfo is None:  # DATETIME columns come back naive, stored as UTC
+        when = when.replace(tzinfo=timezone.utc)
+    return when.timestamp()
+
+
+def _client():
+    return redis_client() if delayed_dispatch_enabled() else None
+
+
+def schedule(task_name: str, kwargs: dict, due_at: datetime, key: Optional[str] = None,
+             anchor: Optional[datetime] = None) -> bool:
+    """Park ``task_name(**kwargs)`` until ``due_at``. Returns False if Redis is unavailable.
+
+    Jobs with a ``key`` get a stable id (``<key>:<task_name>``), so scheduling the same
+    task for the same key again replaces the earlier job instead of adding a second one.
+    ``anchor`` is the time the job is relative to (a post's scheduled_time); rescheduling
+    the key keeps the job the same distance from the new anchor.
+    """
+    client = _client()
+    if client is None:
+        return False
+    due = _epoch(due_at)
+    job_id = f"{key}:{task_name}" if key else uuid.uuid4().hex
+    payload = json.dumps({
+        "task": task_name,
+        "kwargs": kwargs,
+        "key": key,
+        "offset": due - _epoch(anchor) if anchor is not None else 0.0,
+    })
+    try:
+        pipe = client.pipeline()
+        pipe.hset(_JOBS_KEY, job_id, payload)
+        pipe.zadd(_DUE_KEY, {job_id: due})
+        if key:
+            pipe.sadd(_KEY_PREFIX + key, job_id)
+        pipe.execute()
+        return True
+    except Exception as e:
+        log_warning("Could not park delayed task in Redis", exc=e, task_name=task_name)
+        return False
+
+
+def _jobs_for_key(client, key: str) -> list[str]:
+    return [i.decode() if isinstance(i, bytes) else i for i in client.smembers(_KEY_PREFIX + key)]
+
+
+def cancel(key: str) -> int:
+    """Drop every pending job filed under ``key``. Returns how many were removed."""
+    client = _client()
+    if client is None:
+        return 0
+    try:
+        job_ids = _jobs_for_key(client, key)
+        if not job_ids:
+            return 0
+        pipe = client.pipeline()
+        pipe.zrem(_DUE_KEY, *job_ids)
+        pipe.hdel(_JOBS_KEY, *job_ids)
+        pipe.zrem(_PROCESSING_KEY, *job_ids)
+        pipe.hdel(_LEASE_DUE_KEY, *job_ids)
+        pipe.delete(_KEY_PREFIX + key)
+        removed = pipe.execute()[0]
+        return int(removed or 0)
+    except Exception as e:
+        log_warning("Could not cancel delayed tasks", exc=e, key=key)
+        return 0
+
+
+def reschedule(key: str, anchor: datetime) -> int:
+    """Move every pending job under ``key`` to ``anchor`` plus its own offset.
+
+    Returns how many jobs moved (0 when none are pending, e.g. the post is not claimed yet).
+    """
+    client = _client()
+    if client is None:
+        return 0
+    try:
+        job_ids = _jobs_for_key(client, key)
+        if not job_ids:
+            return 0
+        base = _epoch(anchor)
+        moved = {}
+        for job_id, payload in zip(job_ids, client.hmget(_JOBS_KEY, job_ids)):
+            if payload is not None:
+                moved[job_id] = base + float(json.loads(payload).get("offset") or 0.0)
+        if moved:
+            # XX: only jobs still pending (a poller may have popped one meanwhile)
+            client.zadd(_DUE_KEY, moved, xx=True)
+        return len(moved)
+    except Exception as e:
+        log_warning("Could not reschedule delayed tasks", exc=e, key=key)
+        return 0
+
+
+def pending(key: str) -> list[DelayedJob]:
+    """Jobs still waiting under ``key``, soonest first."""
+    client = _client()
+    if client is None:
+        return []
+    try:
+        job_ids = _jobs_for_key(client, key)
+        if not job_ids:
+            return []
+        scores = client.zmscore(_DUE_KEY, job_ids)
+        jobs = []
+        for job_id, payload, due in zip(job_ids, client.hmget(_JOBS_KEY, job_ids), scores):
+            if payload is not None and due is not None:
+                jobs.append(_job(job_id, due, payload))
+        return sorted(jobs, key=lambda job: job.due)
+    except Exception as e:
+        log_warning("Could not read delayed tasks", exc=e, key=key)
+        return []
+
+
+def _job(job_id, due, payload) -> DelayedJob:
+    data = json.loads(payload)
+    return DelayedJob(
+        id=job_id.decode() if isinstance(job_id, bytes) else job_id,
+        task=data["task"],
+        kwargs=data.get("kwargs") or {},
+        due=float(due),
+        key=data.get("key"),
+        offset=float(data.get("offset") or 0.0),
+    )
+
+
+def pop_due(now: Optional[float] = None, limit: int = 100) -> list[DelayedJob]:
+    """Atomically lease up to ``limit`` jobs whose due time has passed.
+
+    Each must then be ``ack``-ed once sent, or ``restore``-d; one that is neither is put
+    back by a poll after ``DELAYED_DISPATCH_LEASE_SECONDS``.
+    """
+    client = _client()
+    if client is None:
+        return []
+    now = time.time() if now is None else now
+    try:
+        flat = client.register_script(_POP_DUE_LUA)(
+            keys=[_DUE_KEY, _JOBS_KEY, _PROCESSING_KEY, _LEASE_DUE_KEY],
+            args=[now, limit, now + lease_seconds()])
+    except Exception as e:
+        log_warning("Could not pop due delayed tasks", exc=e)
+        return []
+    return [_job(flat[i], flat[i + 1], flat[i + 2]) for i in range(0, len(flat), 3)]
+
+
+def ack(job: DelayedJob) -> bool:
+    """Delete a leased job the broker has accepted."""
+    client = _client()
+    if client is None:
+        return False
+    try:
+        return bool(client.register_script(_ACK_LUA)(
+            keys=[_PROCESSING_KEY, _LEASE_DUE_KEY, _DUE_KEY, _JOBS_KEY], args=[job.id, _KEY_PREFIX]))
+    except Exception as e:
+        # The lease expires and the job is sent again: at least once, never lost
+        log_warning("Could not delete sent delayed task", exc=e, task_name=job.task, key=job.key)
+        return False
+
+
+def restore(job: DelayedJob) -> bool:
+    """End a job's lease unsent (e.g. the broker refused it) so the next poll retries it."""
+    client = _client()
+    if client is None:
+        return False
+    try:
+        return bool(client.register_script(_RELEASE_LUA)(
+            keys=[_PROCESSING_KEY, _LEASE_DUE_KEY, _DUE_KEY], args=[job.id, job.due]))
+    except Exception as e:
+        log_warning("Could not restore delayed task", exc=e, task_name=job.task)
+        return False
+
+
+def dispatch_due(send, limit: int = 100, now: Optional[float] = None) -> dict:
+    """Send every due job through ``send(task_name, kwargs)`` and record its lateness.
+
+    Keeps popping while batches come back full. A job is deleted only once ``send``
+    returns; one whose send raises is restored and retried on the next poll. Returns
+    ``{"dispatched", "failed", "max_lateness"}``.
+    """
+    dispatched = failed = 0
+    lateness_total = max_lateness = 0.0
+    while True:
+        now_ = time.time() if now is None else now
+        jobs = pop_due(now=now_, limit=limit)
+        for job in jobs:
+            try:
+                send(job.task, job.kwargs)
+            except Exception as e:
+                failed += 1
+                log_warning("Could not send delayed task; will retry", exc=e, task_name=job.task, key=job.key)
+                restore(job)
+                continue
+            ack(job)
+            lateness = max(0.0, now_ - job.due)
+            dispatched += 1
+            lateness_total += lateness
+            max_lateness = max(max_lateness, lateness)
+            if lateness > late_warning_seconds():
+                log_warning(f"Delayed task dispatched {lateness:.0f}s late", task_name=job.task, key=job.key)
+        if len(jobs) < limit or failed:
+            break
+
+    if dispatched:
+        _record_lateness(dispatched, lateness_total, max_lateness)
+    return {"dispatched": dispatched, "failed": failed, "max_lateness": round(max_lateness, 3)}
+
+
+def _record_lateness(dispatched: int, lateness_total: float, max_lateness: float) -> None:
+    """Accumulate dispatch counts and lateness in Redis so every process reports the same totals."""
+    client = _client()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline()
+        pipe.hincrby(_STATS_KEY, "dispatched", dispatched)
+        pipe.hincrbyfloat(_STATS_KEY, "lateness_seconds", lateness_total)
+        pipe.hset(_STATS_KEY, "last_max_lateness_seconds", max_lateness)
+        pipe.execute()
+    except Exception:
+        pass
+
+
+def get_delayed_dispatch_stats() -> dict:
+    """Pending and leased job counts, how overdue the oldest pending one is, and cumulative
+    dispatch lateness."""
+    stats = {"pending": 0, "leased": 0, "overdue_seconds": 0.0, "dispatched": 0,
+             "lateness_seconds": 0.0, "last_max_lateness_seconds": 0.0}
+    client = _client()
+    if client is None:
+        return stats
+    try:
+        stats["pending"] = int(client.zcard(_DUE_KEY))
+        stats["leased"] = int(client.zcard(_PROCESSING_KEY))
+        oldest = client.zrange(_DUE_KEY, 0, 0, withscores=True)
+        if oldest:
+            stats["overdue_seconds"] = round(max(0.0, time.time() - float(oldest[0][1])), 3)
+        totals = {(k.decode() if isinstance(k, bytes) else k): v
+                  for k, v in (client.hgetall(_STATS_KEY) or {}).items()}
+        stats["dispatched"] = int(totals.get("dispatched", 0))
+        stats["lateness_seconds"] = float(totals.get("lateness_seconds", 0.0))
+        stats["last_max_lateness_seconds"] = float(totals.get("last_max_lateness_seconds", 0.0))
+    except Exception:
+        pass
+    return stats
@@ -0,0 +1,336 @@
+"""Durable, budgeted engagement sessions for the looping Selenium tasks.
+
+``automate_commenting``, ``automate_reply_commenting``, ``automate_appreciation_dms_for_user``
+and ``automate_profile_viewer_engagement`` run one pass of their activity and then come
+back later until their ``loop_for_duration`` budget is spent. An ``EngagementSession``
+drives that loop:
+
+- while the wait before the next pass is short (``ENGAGEMENT_SESSION_INLINE_WAIT_SECONDS``)
+  the next pass runs in the same browser session, so Chrome is not torn down and logged in
+  again, for at most ``ENGAGEMENT_SESSION_MAX_HOLD_SECONDS`` before the browser slot is
+  handed back to other users;
+- longer waits re-enqueue the task with ``countdown`` and a ``session`` kwarg naming the
+  session it continues.
+
+The budget (as an absolute deadline), the pass count, the task kwargs and the id of the
+message that owns the session next are checkpointed per (activity, user) in Redis:
+
+- ``engagement:session:<activity>:<user_id>`` — hash with the checkpoint
+- ``engagement:due`` — sorted set of sessions, scored by when they should next be heard from
+
+A worker that dies mid-session leaves its checkpoint behind; ``resume_lost`` (the
+``resume-engagement-sessions`` beat entry) re-sends it with the budget that is left. A
+message that no longer owns its session (superseded by a newer run, or already resumed
+elsewhere) exits before opening a browser. Per-pass latency and reuse counters are kept
+per activity for /metrics.
+
+Fails open: without Redis the loop runs from the task kwargs alone, as before.
+"""
+
+import json
+import os
+import time
+import uuid
+from typing import Callable, Optional
+
+from cqc_lem.utilities.logger import log_info, log_warning, myprint
+from cqc_lem.utilities.redis_client import redis_client
+
+_SESSION_PREFIX = "engagement:session:"
+_DUE_KEY = "engagement:due"
+_STATS_KEY = "engagement:stats"
+
+_STAT_FIELDS = ("iterations", "iteration_seconds", "last_iteration_seconds", "reused", "rescheduled",
+                "resumed")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def inline_wait_seconds() -> float:
+    """Waits up to this long are spent in the open browser instead of re-enqueueing."""
+    return _env_float("ENGAGEMENT_SESSION_INLINE_WAIT_SECONDS", 120)
+
+
+def max_hold_seconds() -> float:
+    """How long one run may keep its browser across passes before yielding the slot."""
+    return _env_float("ENGAGEMENT_SESSION_MAX_HOLD_SECONDS", 900)
+
+
+def stale_seconds() -> float:
+    """A session not heard from this long after it was due is treated as lost."""
+    return _env_float("ENGAGEMENT_SESSION_STALE_SECONDS", 3600)
+
+
+def _s(value):
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def _load(client, key: str) -> Optional[dict]:
+    raw = client.hgetall(key) or {}
+    if not raw:
+        return None
+    state = {_s(k): _s(v) for k, v in raw.items()}
+    state["kwargs"] = json.loads(state.get("kwargs") or "{}")
+    state["deadline"] = float(state.get("deadline") or 0)
+    state["iteration"] = int(state.get("iteration") or 0)
+    return state
+
+
+def _record(activity: str, **values) -> None:
+    client = redis_client()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline()
+        for name, value in values.items():
+            if name == "last_iteration_seconds":
+                pipe.hset(_STATS_KEY, f"{activity}:{name}", value)
+            elif isinstance(value, float):
+                pipe.hincrbyfloat(_STATS_KEY, f"{activity}:{name}", value)
+            else:
+                pipe.hincrby(_STATS_KEY, f"{activity}:{name}", value)
+        pipe.execute()
+    except Exception:
+        pass
+
+
+class EngagementSession:
+    """One (activity, user) loop: its deadline, pass count and the kwargs to continue with."""
+
+    def __init__(self, task, activity: str, kwargs: dict, session_id: str, deadline: Optional[float],
+                 iteration: int = 0, scope=None):
+        self.task = task
+        self.activity = activity
+        self.kwargs = dict(kwargs)
+        self.session_id = session_id
+        self.deadline = deadline
+        self.iteration = iteration
+        self.user_id = kwargs.get("user_id")
+        member = f"{activity}:{scope}:{self.user_id}" if scope is not None else f"{activity}:{self.user_id}"
+        self.member = member
+        self.key = _SESSION_PREFIX + member
+
+    @classmethod
+    def open(cls, task, activity: str, kwargs: dict, scope=None,
+             now: Optional[float] = None) -> Optional["EngagementSession"]:
+        """Start or resume the session for a task run; None when this message is stale.
+
+        ``kwargs`` are the task's own kwargs. A run without ``loop_for_duration`` is a single
+        pass and is not checkpointed. ``scope`` separates sessions of one user that may run
+        side by side (e.g. reply commenting per post).
+        """
+        now = time.time() if now is None else now
+        task_id = getattr(task.request, "id", None)
+        continues = kwargs.get("session")
+        budget = kwargs.get("loop_for_duration")
+        session_id = continues or task_id or uuid.uuid4().hex
+        session = cls(task, activity, kwargs, session_id, now + budget if budget else None, scope=scope)
+        if not budget:
+            return session
+
+        client = redis_client()
+        if client is None:
+            return session
+        try:
+            state = _load(client, session.key)
+        except Exception as e:
+            log_warning("Could not read engagement checkpoint; starting from task kwargs", exc=e,
+                        user_id=session.user_id)
+            return session
+
+        owned = state is not None and task_id is not None and state.get("task_id") == task_id
+        if state is not None and continues and (state.get("session_id") != continues or not owned):
+            log_info(f"Skipping {task.name}: session {continues} was superseded or resumed elsewhere",
+                     user_id=session.user_id, task_name=task.name)
+            return None
+        if owned:
+            # Our own message again: a scheduled continuation, a resume, or a redelivery
+            # after the worker died
+            session.session_id = state["session_id"]
+            if state["deadline"] <= now:
+                session.finish()
+                return None
+            if not continues:
+                _record(activity, resumed=1)
+            session.deadline = state["deadline"]
+            session.iteration = state["iteration"]
+            session.kwargs.update(state["kwargs"])
+        session._checkpoint(task_id, due_by=now + stale_seconds(), now=now)
+        return session
+
+    def remaining(self, now: Optional[float] = None) -> float:
+        if self.deadline is None:
+            return 0.0
+        return self.deadline - (time.time() if now is None else now)
+
+    def run(self, iteration: Callable[[], str], next_wait: Optional[Callable[["EngagementSession"], float]] = None):
+        """Run ``iteration`` until the budget is spent or the next wait is too long to hold
+        the browser for, then checkpoint and re-enqueue. Returns the last pass's result.
+
+        ``next_wait`` returns the seconds before the next pass (default: ``future_forward``)
+        and may update ``self.kwargs`` to carry state into it.
+        """
+        held_since = time.monotonic()
+        while True:
+            started = time.monotonic()
+            try:
+                result = iteration()
+            except Exception:
+                self.finish()
+                raise
+            took = time.monotonic() - started
+            self.iteration += 1
+            _record(self.activity, iterations=1, iteration_seconds=float(took), last_iteration_seconds=took)
+
+            if self.deadline is None:
+                return result
+            wait = float(next_wait(self) if next_wait else self.kwargs.get("future_forward") or 0)
+            now = time.time()
+            if now + wait > self.deadline:
+                myprint(f"Loop duration reached. Stopping {self.task.name} task...")
+                self.finish()
+                return result
+            if wait <= inline_wait_seconds() and time.monotonic() - held_since + wait < max_hold_seconds():
+                myprint(f"Running {self.activity} pass {self.iteration + 1} in this browser session "
+                        f"in {wait:.0f} seconds...")
+                self._checkpoint(getattr(self.task.request, "id", None), due_by=now + wait + stale_seconds(),
+                                 now=now)
+                _record(self.activity, reused=1)
+                time.sleep(wait)
+                continue
+            self._reschedule(wait, now)
+            return result
+
+    def continuation_kwargs(self, wait: float, now: Optional[float] = None) -> dict:
+        kwargs = dict(self.kwargs)
+        kwargs["loop_for_duration"] = max(0, round(self.remaining(now) - wait))
+        kwargs["session"] = self.session_id
+        return kwargs
+
+    def _reschedule(self, wait: float, now: float) -> None:
+        next_id = str(uuid.uuid4())
+        kwargs = self.continuation_kwargs(wait, now)
+        self._checkpoint(next_id, due_by=now + wait + stale_seconds(), now=now, kwargs=kwargs)
+        myprint(f"Adding {self.task.name} back to queue for {wait:.0f} seconds in the future...")
+        self.task.apply_async(kwargs=kwargs, countdown=wait, task_id=next_id)
+        _record(self.activity, rescheduled=1)
+
+    def _checkpoint(self, task_id: Optional[str], due_by: float, now: float, kwargs: Optional[dict] = None) -> None:
+        client = redis_client()
+        if client is None or self.deadline is None:
+            return
+        try:
+            pipe = client.pipeline()
+            pipe.hset(self.key, mapping={
+                "session_id": self.session_id,
+                "task": self.task.name,
+                "task_id": task_id or "",
+                "kwargs": json.dumps(kwargs if kwargs is not None else self.continuation_kwargs(0, now),
+                                     default=str),
+                "deadline": self.deadline,
+                "iteration": self.iteration,
+                "heartbeat_at": now,
+            })
+            pipe.expire(self.key, max(1, int(self.deadline - now + stale_seconds())))
+            pipe.zadd(_DUE_KEY, {self.member: due_by})
+            pipe.execute()
+        except Exception as e:
+            log_warning("Could not checkpoint engagement session", exc=e, user_id=self.user_id)
+
+    def finish(self) -> None:
+        """Drop the checkpoint, unless a newer session for the same activity replaced it."""
+        client = redis_client()
+        if client is None or self.deadline is None:
+            return
+        try:
+            if _s(client.hget(self.key, "session_id") or "") != self.session_id:
+                return
+            pipe = client.pipeline()
+            pipe.delete(self.key)
+            pipe.zrem(_DUE_KEY, self.member)
+            pipe.execute()
+        except Exception as e:
+            log_warning("Could not clear engagement checkpoint", exc=e, user_id=self.user_id)
+
+
+def resume_lost(send: Callable[[str, dict, str], None], now: Optional[float] = None, limit: int = 100) -> dict:
+    """Re-send sessions whose worker stopped reporting, with the budget they have left.
+
+    ``send(task_name, kwargs, task_id)`` publishes the message. Sessions past their
+    deadline are dropped.
+    """
+    result = {"resumed": 0, "expired": 0}
+    client = redis_client()
+    if client is None:
+        return result
+    now = time.time() if now is None else now
+    try:
+        members = [_s(m) for m in client.zrangebyscore(_DUE_KEY, "-inf", now, start=0, num=limit)]
+    except Exception as e:
+        log_warning("Could not read engagement sessions to resume", exc=e)
+        return result
+
+    for member in members:
+        key = _SESSION_PREFIX + member
+        try:
+            state = _load(client, key)
+            if state is None or state["deadline"] <= now:
+                client.delete(key)
+                client.zrem(_DUE_KEY, member)
+                result["expired"] += 1
+                continue
+            next_id = str(uuid.uuid4())
+            kwargs = {**state["kwargs"], "loop_for_duration": round(state["deadline"] - now),
+                      "session": state["session_id"]}
+            pipe = client.pipeline()
+            pipe.hset(key, mapping={"task_id": next_id, "kwargs": json.dumps(kwargs, default=str)})
+            pipe.zadd(_DUE_KEY, {member: now + stale_seconds()})
+            pipe.execute()
+            send(state["task"], kwargs, next_id)
+            _record(member.split(":", 1)[0], resumed=1)
+            result["resumed"] += 1
+        except Exception as e:
+            log_warning("Could not resume engagement session", exc=e, session=member)
+    return result
+
+
+def get_session_stats() -> dict[str, dict]:
+    """Per activity: sessions checkpointed, passes run, pass latency and reuse counters."""
+    stats = {}
+    client = redis_client()
+    if client is None:
+        return stats
+
+    def _activity(name):
+        return stats.setdefault(name, {"active": 0, **{f: 0 for f in _STAT_FIELDS}})
+
+    try:
+        for member in client.zrange(_DUE_KEY, 0, -1):
+            _activity(_s(member).split(":", 1)[0])["active"] += 1
+        for field, value in (client.hgetall(_STATS_KEY) or {}).items():
+            activity, _, name = _s(field).rpartition(":")
+            if name in _STAT_FIELDS:
+                _activity(activity)[name] = float(value) if "seconds" in name else int(value)
+    except Exception:
+        pass
+    return stats
+
+
+def prometheus_gauges() -> dict[str, float]:
+    """``get_session_stats`` flattened to labelled gauges for /metrics."""
+    gauges = {}
+    for activity, values in get_session_stats().items():
+        for metric, name in (("cqc_lem_engagement_sessions_active", "active"),
+                             ("cqc_lem_engagement_iterations_total", "iterations"),
+                             ("cqc_lem_engagement_iteration_seconds_total", "iteration_seconds"),
+                             ("cqc_lem_engagement_last_iteration_seconds", "last_iteration_seconds"),
+                             ("cqc_lem_engagement_browser_reused_total", "reused"),
+                             ("cqc_lem_engagement_rescheduled_total", "rescheduled"),
+                             ("cqc_lem_engagement_resumed_total", "resumed")):
+            gauges[f'{metric}{{activity="{activity}"}}'] = values[name]
+    return gauges
@@ -75,6 +75,8 @@ C2PA_KEY_PATH = get_constant_from_env('C2PA_KEY_PATH', default_value='')
 TZ = get_constant_from_env('TZ', default_value='UTC')
 CQC_LEM_CHECK_SCHEDULE_DELTA_MINUTES = int(get_constant_from_env('CQC_LEM_CHECK_SCHEDULE_DELTA_MINUTES', default_value='5'))
 CQC_LEM_POST_TIME_DELTA_MINUTES = int(get_constant_from_env('CQC_LEM_POST_TIME_DELTA_MINUTES', default_value='20'))
+# Most due posts one auto_check_scheduled_posts claim transaction flips to 'scheduled'
+CQC_LEM_POST_CLAIM_BATCH = int(get_constant_from_env('CQC_LEM_POST_CLAIM_BATCH', default_value='200'))
 API_PORT=get_constant_from_env('API_PORT', default_value='8000')
 DEVICE_FARM_PROJECT_ARN=get_constant_from_env('DEVICE_FARM_PROJECT_ARN')
 TEST_GRID_PROJECT_ARN=get_constant_from_env('TEST_GRID_PROJECT_ARN')
@@ -161,5 +163,8 @@ ADMIN_SECRET = get_constant_from_env('ADMIN_SECRET')
 # (local/dev) so only deployments that set it enforce token auth.
 API_ACCESS_TOKENS = get_constant_from_env('API_ACCESS_TOKENS', default_value='')
 
+# Bearer token for GET /metrics (Prometheus scrape). Empty leaves it open (local/dev).
+METRICS_TOKEN = get_constant_from_env('METRICS_TOKEN', default_value='')
+
 # Set other constants here
 USE_DOCKER_BROWSER = isTrue(get_constant_from_env('USE_DOCKER_BROWSER', default_value='True'))
@@ -0,0 +1,217 @@
+"""Proactive pacing of LinkedIn actions with Redis token buckets.
+
+The 429 breaker in ``rate_limit`` only reacts once LinkedIn has already pushed back.
+Here every browser action spends a token first, from two buckets at once:
+
+- one per egress route (``proxy.egress_id`` of the proxy ``resolve_proxy`` picks), since
+  LinkedIn limits by IP and every user behind one proxy shares its allowance, and
+- one per user, so a single account never looks busier than a person would.
+
+Each action class (``feed`` load, ``profile_view``, ``comment``, ``dm``, ``invite``) has its
+own budget, given as ``action:count/period`` lists in ``LINKEDIN_EGRESS_BUDGETS`` and
+``LINKEDIN_USER_BUDGETS`` (period ``s``, ``m``, ``h`` or ``d``); a bucket holds ``count``
+tokens and refills at ``count`` per ``period``. An action missing from a list is not paced
+at that level.
+
+``paced`` sits on the Selenium tasks: before a browser is launched it takes the feed-load
+token the login needs (and the task's own action token), and when a bucket is empty — or
+the egress is in its 429 cooldown — the task is retried once a token will be there rather
+than opening Chrome only to trip the limit. Looping tasks take a token per action as they
+go and end the pass early when they run out.
+
+One Lua script refills, checks and spends every bucket involved, so concurrent workers
+never overspend. Fails open: without Redis every action proceeds, as before.
+"""
+
+import functools
+import os
+import time
+from typing import Optional
+
+from cqc_lem.utilities.linkedin.rate_limit import cooldown_key
+from cqc_lem.utilities.logger import log_info, log_warning
+from cqc_lem.utilities.proxy import egress_id, resolve_proxy
+from cqc_lem.utilities.redis_client import redis_client
+
+ACTIONS = ("feed", "profile_view", "comment", "dm", "invite")
+
+_BUCKET_PREFIX = "linkedin:pacing:"
+_STATS_KEY = "linkedin:pacing:stats"
+
+_DEFAULT_EGRESS_BUDGETS = "feed:120/h,profile_view:80/h,comment:40/h,dm:30/h,invite:20/h"
+_DEFAULT_USER_BUDGETS = "feed:30/h,profile_view:25/h,comment:12/h,dm:10/h,invite:8/h"
+
+_PERIOD_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# KEYS[1]: the egress's 429 cooldown key, then one bucket hash per budget.
+# ARGV: now, then capacity, refill per second and cost for each bucket. A cost of 0 only
+# checks that a token is there. Returns {1, '0'} when every bucket could pay (and spends),
+# else {0, seconds until it could}.
+_TAKE_LUA = """
+local now = tonumber(ARGV[1])
+local cooldown = redis.call('TTL', KEYS[1])
+if cooldown > 0 then
+    return {0, tostring(cooldown)}
+end
+local wait, levels = 0, {}
+for i = 2, #KEYS do
+    local at = 2 + (i - 2) * 3
+    local capacity, rate, cost = tonumber(ARGV[at]), tonumber(ARGV[at + 1]), tonumber(ARGV[at + 2])
+    local bucket = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local since = now - (tonumber(bucket[2]) or now)
+    tokens = math.min(capacity, tokens + math.max(0, since) * rate)
+    levels[i] = tokens
+    local need = math.max(cost, 1)
+    if tokens < need then
+        wait = math.max(wait, (need - tokens) / rate)
+    end
+end
+if wait > 0 then
+    return {0, tostring(wait)}
+end
+for i = 2, #KEYS do
+    local at = 2 + (i - 2) * 3
+    local capacity, rate, cost = tonumber(ARGV[at]), tonumber(ARGV[at + 1]), tonumber(ARGV[at + 2])
+    redis.call('HSET', KEYS[i], 'tokens', levels[i] - cost, 'ts', now)
+    redis.call('EXPIRE', KEYS[i], math.ceil(capacity / rate) + 60)
+end
+return {1, '0'}
+"""
+
+
+def pacing_enabled() -> bool:
+    return os.getenv("LINKEDIN_PACING_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+
+
+def _budgets(env_name: str, default: str) -> dict[str, tuple[float, float]]:
+    """``action:count/period`` list as ``{action: (capacity, tokens per second)}``."""
+    budgets = {}
+    for item in os.getenv(env_name, default).split(","):
+        action, _, rule = item.partition(":")
+        count, _, period = rule.partition("/")
+        try:
+            capacity = float(count)
+            seconds = _PERIOD_SECONDS[period.strip().lower() or "h"]
+        except (ValueError, KeyError):
+            continue
+        if capacity > 0:
+            budgets[action.strip().lower()] = (capacity, capacity / seconds)
+    return budgets
+
+
+def egress_budgets() -> dict[str, tuple[float, float]]:
+    return _budgets("LINKEDIN_EGRESS_BUDGETS", _DEFAULT_EGRESS_BUDGETS)
+
+
+def user_budgets() -> dict[str, tuple[float, float]]:
+    return _budgets("LINKEDIN_USER_BUDGETS", _DEFAULT_USER_BUDGETS)
+
+
+def user_egress(user_id: int) -> str:
+    """Egress id of the proxy a browser session for ``user_id`` leaves through (as
+    ``selenium_util.get_docker_driver`` resolves it)."""
+    from cqc_lem.utilities.db import get_user_geo, get_user_proxy
+    geo = get_user_geo(user_id) or {}
+    return egress_id(resolve_proxy(get_user_proxy(user_id), geo.get("country")))
+
+
+def _client():
+    return redis_client() if pacing_enabled() else None
+
+
+def take(costs: dict[str, int], user_id: int, egress: Optional[str] = None, now: Optional[float] = None) -> float:
+    """Spend ``costs`` (``{action: tokens}``) from the egress and user buckets together.
+
+    Returns 0.0 when they were spent, else the seconds until they could be (nothing is
+    spent then). A cost of 0 only checks the action has a token left.
+    """
+    client = _client()
+    if client is None:
+        return 0.0
+    try:
+        if egress is None:
+            egress = user_egress(user_id)
+        keys, args = [cooldown_key(egress)], [time.time() if now is None else now]
+        for scope, budgets in ((f"egress:{egress}", egress_budgets()), (f"user:{user_id}", user_budgets())):
+            for action, cost in costs.items():
+                if action in budgets:
+                    keys.append(f"{_BUCKET_PREFIX}{scope}:{action}")
+                    args.extend([*budgets[action], cost])
+        granted, detail = client.register_script(_TAKE_LUA)(keys=keys, args=args)
+    except Exception as e:
+        log_warning("LinkedIn pacing check failed; proceeding", exc=e, user_id=user_id)
+        return 0.0
+
+    wait = 0.0 if int(granted) else float(detail.decode() if isinstance(detail, bytes) else detail)
+    _record(client, costs, wait)
+    return wait
+
+
+def acquire_token(action: str, user_id: int, egress: Optional[str] = None) -> float:
+    """Spend one ``action`` token; 0.0 when spent, else seconds until one is available."""
+    return take({action: 1}, user_id, egress)
+
+
+def _record(client, costs: dict[str, int], wait: float) -> None:
+    try:
+        pipe = client.pipeline()
+        for action in costs:
+            pipe.hincrby(_STATS_KEY, f"{action}:{'deferred' if wait else 'granted'}", 1)
+        pipe.execute()
+    except Exception:
+        pass
+
+
+def paced(action: str, spend: bool = True):
+    """Decorator for a bound Selenium task taking ``user_id``: take the login's feed-load
+    token (plus one ``action`` token when ``spend``; otherwise just check one is left)
+    before the browser opens, or retry the task once they are available.
+
+    Goes above ``@fair_share_slot`` so a paced-out task never holds a browser slot.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            user_id = kwargs.get("user_id", args[0] if args else None)
+            costs = {"feed": 1}
+            costs[action] = costs.get(action, 0) + (1 if spend else 0)
+            wait = take(costs, user_id)
+            if wait:
+                countdown = max(1, round(wait))
+                log_info(f"Pacing {self.name} for {countdown}s ({action} budget)", user_id=user_id,
+                         task_name=self.name)
+                # retries=... bypasses the QueueOnce lock check, so the deferred run is never
+                # dropped as a duplicate of itself
+                raise self.retry(countdown=countdown, max_retries=None)
+            return func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def get_pacing_stats() -> dict[str, dict[str, int]]:
+    """Tokens granted and requests deferred per action class."""
+    stats = {action: {"granted": 0, "deferred": 0} for action in ACTIONS}
+    client = _client()
+    if client is None:
+        return stats
+    try:
+        for field, value in (client.hgetall(_STATS_KEY) or {}).items():
+            field = field.decode() if isinstance(field, bytes) else str(field)
+            action, _, outcome = field.partition(":")
+            if outcome in ("granted", "deferred"):
+                stats.setdefault(action, {"granted": 0, "deferred": 0})[outcome] = int(value)
+    except Exception:
+        pass
+    return stats
+
+
+def prometheus_gauges() -> dict[str, float]:
+    """``get_pacing_stats`` flattened to labelled gauges for /metrics."""
+    gauges = {}
+    for action, counts in get_pacing_stats().items():
+        gauges[f'cqc_lem_linkedin_pacing_granted_total{{action="{action}"}}'] = counts["granted"]
+        gauges[f'cqc_lem_linkedin_pacing_deferred_total{{action="{action}"}}'] = counts["deferred"]
+    return gauges
@@ -1,19 +1,25 @@
-"""Shared circuit breaker for LinkedIn HTTP 429 rate-limiting.
+"""Per-egress circuit breaker for LinkedIn HTTP 429 rate-limiting.
 
 LinkedIn rate-limits by egress IP, so a 429 hit by one engagement task means every
-other Selenium task (comments, replies, viewer DMs, appreciation DMs) will also be
-throttled. Without coordination each task independently spins up a browser, navigates
-to the feed, and re-trips the limit — which prolongs the block. This breaker records
-the 429 in Redis with a cooldown TTL so subsequent tasks skip the LinkedIn navigation
-until it expires. Fails open: if Redis is unavailable the breaker no-ops and callers
-behave as before.
+other Selenium task leaving through the same proxy (comments, replies, viewer DMs,
+appreciation DMs) will also be throttled. Without coordination each task independently
+spins up a browser, navigates to the feed, and re-trips the limit — which prolongs the
+block. This breaker records the 429 in Redis with a cooldown TTL, keyed by the egress
+route (``proxy.egress_id``), so subsequent tasks on that egress skip the LinkedIn
+navigation until it expires while users on other proxies carry on. Fails open: if Redis
+is unavailable the breaker no-ops and callers behave as before.
+
+Proactive pacing (token buckets per egress and per user) lives in ``pacing``; this
+breaker is what it falls back on once LinkedIn has already pushed back.
 """
 
 import os
 
 from cqc_lem.utilities.logger import log_warning
+from cqc_lem.utilities.proxy import DIRECT_EGRESS
+from cqc_lem.utilities.redis_client import redis_client
 
-_COOLDOWN_KEY = "linkedin:429_cooldown"
+_COOLDOWN_PREFIX = "linkedin:429_cooldown:"
 _DEFAULT_COOLDOWN_SECONDS = 1800  # 30 min
 
 
@@ -33,56 +39,50 @@ def _cooldown_seconds() -> int:
 
 
 def _redis_client():
-    """Redis handle for the breaker, or None if unavailable (breaker then no-ops).
+    """Redis handle for the breaker, or None if unavailable (breaker then no-ops)."""
+    return redis_client()
 
-    Uses the Celery broker URL when it points at Redis; on AWS the broker is SQS and
-    the result backend is Redis, so fall back to that, then to the local default.
-    """
-    try:
-        import redis
-    except Exception:
-        return None
-    url = os.getenv("CELERY_BROKER_URL", "")
-    if not url.startswith("redis"):
-        url = os.getenv("CELERY_RESULT_BACKEND", "")
-    if not url.startswith("redis"):
-        url = f"redis://redis:{os.getenv('REDIS_PORT', '6379')}/0"
-    try:
-        return redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
-    except Exception:
-        return None
+
+def cooldown_key(egress: str = None) -> str:
+    return _COOLDOWN_PREFIX + (egress or DIRECT_EGRESS)
+
+
+def driver_egress(driver) -> str:
+    """The egress a browser session was created on (``get_docker_driver`` tags it)."""
+    egress = getattr(driver, "linkedin_egress", None)
+    return egress if isinstance(egress, str) else DIRECT_EGRESS
 
 
-def mark_rate_limited(reason: str = "") -> None:
+def mark_rate_limited(reason: str = "", egress: str = None) -> None:
     seconds = _cooldown_seconds()
     client = _redis_client()
     if client is None:
         return
     try:
-        client.set(_COOLDOWN_KEY, reason or "429", ex=seconds)
-        log_warning(f"LinkedIn 429 circuit breaker OPEN for {seconds}s — Selenium engagement paused",
-                    action_type="rate_limit", http_status=429)
+        client.set(cooldown_key(egress), reason or "429", ex=seconds)
+        log_warning(f"LinkedIn 429 circuit breaker OPEN for {seconds}s on egress {egress or DIRECT_EGRESS} — "
+                    "Selenium engagement through it paused", action_type="rate_limit", http_status=429)
     except Exception as e:
         log_warning("Failed to set LinkedIn 429 circuit breaker", exc=e, action_type="rate_limit")
 
 
-def rate_limit_cooldown_remaining() -> int:
-    """Seconds left on the breaker, or 0 if closed / Redis unavailable."""
+def rate_limit_cooldown_remaining(egress: str = None) -> int:
+    """Seconds left on the egress's breaker, or 0 if closed / Redis unavailable."""
     client = _redis_client()
     if client is None:
         return 0
     try:
-        ttl = client.ttl(_COOLDOWN_KEY)
+        ttl = client.ttl(cooldown_key(egress))
     except Exception:
         return 0
     return ttl if ttl and ttl > 0 else 0
 
 
-def clear_rate_limit() -> None:
+def clear_rate_limit(egress: str = None) -> None:
     client = _redis_client()
     if client is None:
         return
     try:
-        client.delete(_COOLDOWN_KEY)
+        client.delete(cooldown_key(egress))
     except Exception:
         pass
@@ -74,6 +74,26 @@ def track_api_call(
     )
 
 
+def track_db_calls(function: str, calls: int, errors: int, rows: int, wall_ms: float,
+                   acquire_ms: float, execute_ms: float, max_ms: float) -> None:
+    """One event per db helper per publish interval (see utilities.db_metrics)."""
+    posthog.capture(
+        distinct_id="system",
+        event="db_calls",
+        properties={
+            "function": function,
+            "calls": calls,
+            "errors": errors,
+            "rows": rows,
+            "wall_ms": wall_ms,
+            "avg_ms": round(wall_ms / calls, 3) if calls else 0.0,
+            "acquire_ms": acquire_ms,
+            "execute_ms": execute_ms,
+            "max_ms": max_ms,
+        },
+    )
+
+
 def llm_tracked(model_alias: str):
     """Decorator that wraps an LLM call and tracks usage via PostHog."""
     def decorator(fn):
@@ -0,0 +1,282 @@
+"""Non-blocking celery-once locks that coalesce duplicates into the queued task.
+
+celery-once's Redis backend takes a ``redis.lock.Lock`` per task key and, configured
+blocking, makes a duplicate ``apply_async`` wait up to ``blocking_timeout`` for it — which
+stalls ``auto_check_scheduled_posts`` mid-sweep and API requests enqueueing admin tasks.
+Here the lock is a plain ``SET NX`` whose value is the id of the task holding it:
+
+- a duplicate returns at once with that task's ``AsyncResult`` (``graceful`` tasks), so the
+  caller gets the id of the run that will do the work, or raises ``AlreadyQueued`` carrying
+  it (non-graceful tasks);
+- a lock is only released by the task that holds it, so a late ``after_return`` never frees
+  a newer run's lock, and a publish that fails releases the lock it just took.
+
+Every lock is also filed in ``once:locks`` (scored by when it was taken). ``reap_stale``
+(the ``reap-once-locks`` beat entry) releases locks whose task the result backend already
+reports finished — a pool process killed mid-task is recorded as failed, but never gets to
+``after_return`` — instead of leaving duplicates coalescing into it until the lock expires.
+Acquisitions, hits (duplicates coalesced or refused), time spent taking locks and stale
+locks reaped are counted per task for /metrics.
+
+Fails open: without Redis every task is enqueued, without deduplication.
+"""
+
+import os
+import time
+from typing import Callable, Optional
+
+from celery import Task, states
+from celery.utils import uuid
+from celery_once import AlreadyQueued as _AlreadyQueued
+from celery_once import QueueOnce as _QueueOnce
+
+from cqc_lem.utilities.logger import log_debug, log_warning
+from cqc_lem.utilities.redis_client import redis_client
+
+_LOCKS_KEY = "once:locks"
+_STATS_KEY = "once:stats"
+
+_STAT_FIELDS = ("acquired", "hits", "wait_seconds", "stale")
+
+# KEYS[1]: the task's lock, KEYS[2]: the lock index. ARGV: task id, timeout, now, index member.
+# Returns {1, task id} when taken, else {0, holder's task id, milliseconds it has left}.
+_ACQUIRE_LUA = """
+local held = redis.call('GET', KEYS[1])
+if held then
+    return {0, held, redis.call('PTTL', KEYS[1])}
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[4])
+return {1, ARGV[1]}
+"""
+
+# KEYS as above. ARGV: task id ('' releases whoever holds it), index member. Returns 1 when
+# the lock was released.
+_RELEASE_LUA = """
+local held = redis.call('GET', KEYS[1])
+if not held then
+    redis.call('ZREM', KEYS[2], ARGV[2])
+    return 0
+end
+if ARGV[1] ~= '' and held ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2], ARGV[2])
+return 1
+"""
+
+
+def reap_after_seconds() -> float:
+    """Locks younger than this are never checked for staleness."""
+    try:
+        return float(os.getenv("ONCE_LOCK_REAP_AFTER_SECONDS", "120"))
+    except ValueError:
+        return 120.0
+
+
+def _s(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def _member(task_name: str, key: str) -> str:
+    # Task names never contain '|', so the first one splits the member back apart
+    return f"{task_name}|{key}"
+
+
+def _label(task_name: str) -> str:
+    return task_name.rsplit(".", 1)[-1]
+
+
+def _record(task_name: str, **values) -> None:
+    client = redis_client()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline()
+        for name, value in values.items():
+            field = f"{_label(task_name)}:{name}"
+            if isinstance(value, float):
+                pipe.hincrbyfloat(_STATS_KEY, field, value)
+            else:
+                pipe.hincrby(_STATS_KEY, field, value)
+        pipe.execute()
+    except Exception:
+        pass
+
+
+class AlreadyQueued(_AlreadyQueued):
+    """celery-once's ``AlreadyQueued``, plus the id of the task holding the lock."""
+
+    def __init__(self, countdown: float, task_id: Optional[str] = None):
+        super().__init__(countdown)
+        self.task_id = task_id
+
+
+class RedisOnceBackend:
+    """celery-once backend over the shared Redis handle: locks never block and remember
+    which task holds them. ``settings`` is accepted for interface compatibility."""
+
+    def __init__(self, settings: Optional[dict] = None):
+        self.settings = settings or {}
+
+    def lock(self, key: str, task_id: str, timeout: int, task_name: str = "") -> Optional[tuple[str, float]]:
+        """Take ``key`` for ``task_id``. None when taken (or Redis is unavailable), else
+        ``(holder task id, seconds its lock has left)``."""
+        client = redis_client()
+        if client is None:
+            return None
+        try:
+            acquired, holder, *rest = client.register_script(_ACQUIRE_LUA)(
+                keys=[key, _LOCKS_KEY], args=[task_id, int(timeout), time.time(), _member(task_name, key)])
+        except Exception as e:
+            log_warning("Could not take task lock; enqueueing without it", exc=e, task_name=task_name)
+            return None
+        if int(acquired):
+            return None
+        return _s(holder), (max(0.0, int(rest[0]) / 1000.0) if rest else 0.0)
+
+    def release(self, key: str, task_id: Optional[str] = None, task_name: str = "") -> bool:
+        """Release ``key`` if ``task_id`` holds it (any holder when ``task_id`` is None)."""
+        client = redis_client()
+        if client is None:
+            return False
+        try:
+            return bool(client.register_script(_RELEASE_LUA)(
+                keys=[key, _LOCKS_KEY], args=[task_id or "", _member(task_name, key)]))
+        except Exception as e:
+            log_warning("Could not release task lock", exc=e, task_name=task_name)
+            return False
+
+    # celery-once backend interface, for the stock QueueOnce
+
+    def raise_or_lock(self, key: str, timeout: int) -> None:
+        held = self.lock(key, uuid(), timeout)
+        if held is not None:
+            raise AlreadyQueued(held[1], held[0])
+
+    def clear_lock(self, key: str) -> bool:
+        return self.release(key)
+
+
+class QueueOnce(_QueueOnce):
+    """``celery_once.QueueOnce`` that never waits on a lock.
+
+    A duplicate of a ``graceful`` task returns the ``AsyncResult`` of the task already
+    queued; a non-graceful one raises ``AlreadyQueued`` with that task's id.
+    """
+
+    abstract = True
+
+    @property
+    def once_backend(self) -> RedisOnceBackend:
+        return RedisOnceBackend(self.once_config.get('settings'))
+
+    def apply_async(self, args=None, kwargs=None, **options):
+        if options.get('retries'):
+            # A retry is the lock holder coming back, so it never checks the lock
+            return Task.apply_async(self, args, kwargs, **options)
+
+        once_options = options.get('once', {})
+        graceful = once_options.get('graceful', self.once.get('graceful', False))
+        timeout = once_options.get('timeout', self.once.get('timeout', self.default_timeout))
+        key = self.get_key(args, kwargs)
+        task_id = options.setdefault('task_id', uuid())
+        backend = self.once_backend
+
+        started = time.monotonic()
+        held = backend.lock(key, task_id, timeout, self.name)
+        waited = time.monotonic() - started
+        if held is not None:
+            holder, countdown = held
+            _record(self.name, hits=1, wait_seconds=waited)
+            log_debug(f"{self.name} already queued as {holder}", task_name=self.name)
+            if not graceful:
+                raise AlreadyQueued(countdown, holder)
+            return self.AsyncResult(holder)
+
+        _record(self.name, acquired=1, wait_seconds=waited)
+        try:
+            return Task.apply_async(self, args, kwargs, **options)
+        except Exception:
+            # Nothing was queued, so nothing would ever release the lock
+            backend.release(key, task_id, self.name)
+            raise
+
+    def __call__(self, *args, **kwargs):
+        if self.unlock_before_run():
+            self.once_backend.release(self.get_key(args, kwargs), self.request.id, self.name)
+        return Task.__call__(self, *args, **kwargs)
+
+    def after_return(self, status, retval, task_id, args, kwargs, einfo):
+        if not self.unlock_before_run():
+            self.once_backend.release(self.get_key(args, kwargs), task_id, self.name)
+
+
+def reap_stale(state_of: Callable[[str], str], now: Optional[float] = None, limit: int = 200) -> dict:
+    """Release locks whose task has finished without releasing them.
+
+    ``state_of(task_id)`` returns the task's Celery state. Only locks older than
+    ``ONCE_LOCK_REAP_AFTER_SECONDS`` are checked; index entries of locks that have expired
+    are dropped.
+    """
+    result = {"reaped": 0, "expired": 0}
+    client = redis_client()
+    if client is None:
+        return result
+    now = time.time() if now is None else now
+    try:
+        members = [_s(m) for m in client.zrangebyscore(_LOCKS_KEY, "-inf", now - reap_after_seconds(),
+                                                        start=0, num=limit)]
+    except Exception as e:
+        log_warning("Could not read task locks to reap", exc=e)
+        return result
+
+    backend = RedisOnceBackend()
+    for member in members:
+        task_name, _, key = member.partition("|")
+        try:
+            holder = client.get(key)
+            if holder is None:
+                client.zrem(_LOCKS_KEY, member)
+                result["expired"] += 1
+                continue
+            holder = _s(holder)
+            if state_of(holder) in states.READY_STATES and backend.release(key, holder, task_name):
+                _record(task_name, stale=1)
+                result["reaped"] += 1
+        except Exception as e:
+            log_warning("Could not check task lock", exc=e, task_name=task_name)
+    return result
+
+
+def get_lock_stats() -> dict:
+    """Locks held, plus per task: locks taken, duplicate hits, seconds spent taking locks
+    and stale locks reaped."""
+    stats = {"held": 0, "tasks": {}}
+    client = redis_client()
+    if client is None:
+        return stats
+    try:
+        stats["held"] = int(client.zcard(_LOCKS_KEY) or 0)
+        for field, value in (client.hgetall(_STATS_KEY) or {}).items():
+            task, _, name = _s(field).rpartition(":")
+            if name in _STAT_FIELDS:
+                counts = stats["tasks"].setdefault(task, {f: 0 for f in _STAT_FIELDS})
+                counts[name] = float(value) if name == "wait_seconds" else int(value)
+    except Exception:
+        pass
+    return stats
+
+
+def prometheus_gauges() -> dict[str, float]:
+    """``get_lock_stats`` flattened to labelled gauges for /metrics."""
+    stats = get_lock_stats()
+    gauges = {"cqc_lem_once_locks_held": stats["held"]}
+    for task, counts in stats["tasks"].items():
+        for metric, name in (("cqc_lem_once_lock_acquired_total", "acquired"),
+                             ("cqc_lem_once_lock_hits_total", "hits"),
+                             ("cqc_lem_once_lock_wait_seconds_total", "wait_seconds"),
+                             ("cqc_lem_once_lock_stale_total", "stale")):
+            gauges[f'{metric}{{task="{task}"}}'] = counts[name]
+    return gauges
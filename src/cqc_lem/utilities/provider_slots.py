@@ -0,0 +1,137 @@
+"""Bounded concurrency per external content provider (LLM, Flux images, Runway video).
+
+Weekly content creation runs one task per planned post (``run_content_plan``), so a large
+fan-out could otherwise fire hundreds of Runway generations at once and trip the
+provider's own concurrency limits. Before a post task starts it takes a lease on every
+provider its post type needs (``providers_for_post_type``); when any of them is at its
+limit (``CONTENT_PROVIDER_CONCURRENCY``, e.g. ``llm:8,flux:4,runway:2``) the task is
+retried a little later instead of occupying a worker while it waits.
+
+Leases are members of one Redis sorted set per provider, scored by expiry, so a worker
+that dies holding one frees it after ``CONTENT_PROVIDER_LEASE_SECONDS``. One Lua script
+checks and takes all of a task's leases together, so two workers never both take the
+last slot and a task never holds half of what it needs.
+
+Fails open: without Redis every task runs, as before.
+"""
+
+import os
+import time
+from typing import Optional
+
+from cqc_lem.utilities.logger import log_warning
+from cqc_lem.utilities.redis_client import redis_client
+
+_SLOTS_PREFIX = "provider:slots:"
+
+_DEFAULT_LIMITS = "llm:8,flux:4,runway:2"
+
+# Providers each post type calls while its content is created
+_PROVIDERS_BY_POST_TYPE = {
+    "text": ("llm",),
+    "carousel": ("llm", "flux"),
+    "video": ("llm", "flux", "runway"),
+}
+
+# KEYS: one lease set per provider. ARGV: holder, now, expires at, then one limit per key.
+# Returns 0 when every lease was taken, else the 1-based index of the first full provider.
+_ACQUIRE_LUA = """
+local holder, now, expires = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now)
+    local limit = tonumber(ARGV[3 + i])
+    if limit > 0 and redis.call('ZSCORE', key, holder) == false
+            and redis.call('ZCARD', key) >= limit then
+        return i
+    end
+end
+for _, key in ipairs(KEYS) do
+    redis.call('ZADD', key, expires, holder)
+end
+return 0
+"""
+
+
+def provider_limits() -> dict[str, int]:
+    """``CONTENT_PROVIDER_CONCURRENCY`` as ``{provider: limit}``; 0 means unlimited."""
+    limits = {}
+    for item in os.getenv("CONTENT_PROVIDER_CONCURRENCY", _DEFAULT_LIMITS).split(","):
+        name, _, value = item.partition(":")
+        try:
+            limits[name.strip().lower()] = int(value)
+        except ValueError:
+            continue
+    return limits
+
+
+def lease_seconds() -> float:
+    try:
+        return float(os.getenv("CONTENT_PROVIDER_LEASE_SECONDS", "1800"))
+    except ValueError:
+        return 1800.0
+
+
+def defer_seconds() -> float:
+    """How long a task waits before asking again when a provider is full."""
+    try:
+        return float(os.getenv("CONTENT_PROVIDER_DEFER_SECONDS", "60"))
+    except ValueError:
+        return 60.0
+
+
+def providers_for_post_type(post_type) -> tuple[str, ...]:
+    return _PROVIDERS_BY_POST_TYPE.get(str(post_type or "text").lower(), ("llm",))
+
+
+def acquire(providers: tuple[str, ...], holder: str, now: Optional[float] = None) -> Optional[str]:
+    """Lease one slot on every provider for ``holder``.
+
+    Returns None when the task may run, or the name of the provider that is full.
+    """
+    if not providers:
+        return None
+    client = redis_client()
+    if client is None:
+        return None
+    now = time.time() if now is None else now
+    limits = provider_limits()
+    try:
+        full = client.register_script(_ACQUIRE_LUA)(
+            keys=[_SLOTS_PREFIX + p for p in providers],
+            args=[holder, now, now + lease_seconds(), *[limits.get(p, 0) for p in providers]])
+    except Exception as e:
+        log_warning("Provider slot check failed; running without a limit", exc=e, holder=holder)
+        return None
+    return providers[int(full) - 1] if int(full or 0) else None
+
+
+def release(providers: tuple[str, ...], holder: str) -> None:
+    client = redis_client()
+    if client is None or not providers:
+        return
+    try:
+        pipe = client.pipeline()
+        for provider in providers:
+            pipe.zrem(_SLOTS_PREFIX + provider, holder)
+        pipe.execute()
+    except Exception as e:
+        log_warning("Could not release provider slots", exc=e, holder=holder)
+
+
+def get_provider_slot_stats(now: Optional[float] = None) -> dict[str, dict]:
+    """Leases held and the configured limit per provider."""
+    limits = provider_limits()
+    stats = {p: {"in_use": 0, "limit": limit} for p, limit in limits.items()}
+    client = redis_client()
+    if client is None:
+        return stats
+    now = time.time() if now is None else now
+    try:
+        pipe = client.pipeline()
+        for provider in stats:
+            pipe.zcount(_SLOTS_PREFIX + provider, now, "+inf")
+        for provider, in_use in zip(stats, pipe.execute()):
+            stats[provider]["in_use"] = int(in_use or 0)
+    except Exception:
+        pass
+    return stats
@@ -23,12 +23,16 @@ cheap AWS/VPS egress nodes cover the whole user base — cost scales with region
 not users).
 """
 
+import hashlib
 import json
 import os
 from typing import Optional
 
 from cqc_lem.utilities.logger import myprint
 
+# Egress id for sessions that leave straight from the host
+DIRECT_EGRESS = "direct"
+
 
 def _region_proxies() -> dict:
     raw = (os.getenv("REGION_PROXIES") or "").strip()
@@ -58,3 +62,10 @@ def resolve_proxy(explicit_proxy: Optional[str], country: Optional[str]) -> Opti
             return default
 
     return os.getenv("PROXY_URL") or None
+
+
+def egress_id(proxy_url: Optional[str]) -> str:
+    """Stable, credential-free name for an egress route, for keying per-egress state in Redis."""
+    if not proxy_url:
+        return DIRECT_EGRESS
+    return hashlib.sha1(proxy_url.encode()).hexdigest()[:12]
@@ -0,0 +1,164 @@
+"""Background queue-depth telemetry for Celery worker and beat processes.
+
+Queue lengths used to be read and pushed to CloudWatch from the ``task_sent`` /
+``task_received`` / ``task_success`` signals: a broker round trip, a boto3 client and a
+synchronous ``put_metric_data`` on every dispatch. Instead, one daemon thread per process
+samples every queue on an interval (``QUEUE_METRICS_INTERVAL_SECONDS``) and ships the
+whole sample in a single ``put_metric_data`` call to the ``cqc-lem/celery_queue``
+namespace, one ``QueueName`` dimension per queue. Without AWS it serves the latest sample
+in Prometheus text format on ``QUEUE_METRICS_PORT`` instead.
+
+A sampler's fixed ``dimensions`` are added to every datum (and label), so state held by
+one process — e.g. a worker's reserved tasks, under ``Worker`` — is kept apart from the
+same metric reported by every other process instead of overwriting it.
+
+The sample itself comes from the caller (``my_celery.sample_queue_depths``), so this
+module has no Celery dependency: ``{queue: {metric: value}}``.
+"""
+
+import os
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from cqc_lem.utilities.logger import logger
+from cqc_lem.utilities.utils import get_cloudwatch_client
+
+NAMESPACE = "cqc-lem/celery_queue"
+
+_PROMETHEUS_NAMES = {
+    "QueueLength": "cqc_lem_celery_queue_length",
+    "ReservedTasks": "cqc_lem_celery_reserved_tasks",
+    "EtaTasks": "cqc_lem_celery_eta_tasks",
+    "ActiveTasks": "cqc_lem_celery_active_tasks",
+    "DelayedTasks": "cqc_lem_celery_delayed_tasks",
+}
+
+
+def sample_interval() -> float:
+    try:
+        return float(os.getenv("QUEUE_METRICS_INTERVAL_SECONDS", "60"))
+    except ValueError:
+        return 60.0
+
+
+def prometheus_port() -> int:
+    """Port for the local Prometheus endpoint when AWS is not configured (0 = off)."""
+    try:
+        return int(os.getenv("QUEUE_METRICS_PORT", "9540"))
+    except ValueError:
+        return 9540
+
+
+def metric_data(sample: dict[str, dict[str, float]], timestamp: Optional[datetime] = None,
+                dimensions: Optional[dict[str, str]] = None) -> list[dict]:
+    """CloudWatch MetricData entries for one sample."""
+    timestamp = timestamp or datetime.now(timezone.utc)
+    extra = [{'Name': name, 'Value': value} for name, value in (dimensions or {}).items()]
+    return [
+        {
+            'MetricName': metric,
+            'Value': value,
+            'Unit': 'Count',
+            'Timestamp': timestamp,
+            'Dimensions': [{'Name': 'QueueName', 'Value': queue}, *extra],
+        }
+        for queue, metrics in sorted(sample.items())
+        for metric, value in sorted(metrics.items())
+    ]
+
+
+def render_prometheus(sample: dict[str, dict[str, float]], labels: Optional[dict[str, str]] = None) -> str:
+    extra = "".join(f',{name.lower()}="{value}"' for name, value in (labels or {}).items())
+    lines = []
+    by_metric: dict[str, list[tuple[str, float]]] = {}
+    for queue, metrics in sample.items():
+        for metric, value in metrics.items():
+            by_metric.setdefault(metric, []).append((queue, value))
+    for metric in sorted(by_metric):
+        name = _PROMETHEUS_NAMES.get(metric, f"cqc_lem_celery_{metric.lower()}")
+        lines.append(f"# TYPE {name} gauge")
+        for queue, value in sorted(by_metric[metric]):
+            lines.append(f'{name}{{queue="{queue}"{extra}}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+class QueueSampler:
+    """Samples queue depths every ``interval`` seconds on a daemon thread and ships them."""
+
+    def __init__(self, sample: Callable[[], dict[str, dict[str, float]]], interval: Optional[float] = None,
+                 aws_region: Optional[str] = None, dimensions: Optional[dict[str, str]] = None):
+        self._sample = sample
+        self._interval = sample_interval() if interval is None else interval
+        self._aws_region = aws_region
+        self._dimensions = dimensions or {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._server: Optional[ThreadingHTTPServer] = None
+        self.latest: dict[str, dict[str, float]] = {}
+
+    def tick(self) -> dict[str, dict[str, float]]:
+        """Take one sample and ship it. Never raises."""
+        try:
+            self.latest = self._sample() or {}
+        except Exception as e:
+            logger.error(f"Failed to sample queue depths: {e}")
+            return self.latest
+        if self._aws_region and self.latest:
+            self._put(self.latest)
+        return self.latest
+
+    def _put(self, sample: dict[str, dict[str, float]]) -> None:
+        data = metric_data(sample, dimensions=self._dimensions)
+        try:
+            cloudwatch = get_cloudwatch_client(self._aws_region)
+            # PutMetricData takes up to 1000 entries; one call covers every queue
+            cloudwatch.put_metric_data(Namespace=NAMESPACE, MetricData=data[:1000])
+        except Exception as e:
+            logger.error(f"Failed to publish queue metrics: {e}")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.tick()
+            self._stop.wait(self._interval)
+
+    def start(self) -> None:
+        if self._thread is not None or self._interval <= 0:
+            return
+        if not self._aws_region:
+            self._serve_prometheus()
+        self._thread = threading.Thread(target=self._run, name="queue-metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _serve_prometheus(self) -> None:
+        port = prometheus_port()
+        if port <= 0:
+            return
+        sampler = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = render_prometheus(sampler.latest, sampler._dimensions).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer(("0.0.0.0", port), _Handler)
+        except OSError as e:
+            logger.warning(f"Queue metrics endpoint not started on port {port}: {e}")
+            return
+        threading.Thread(target=self._server.serve_forever, name="queue-metrics-http", daemon=True).start()
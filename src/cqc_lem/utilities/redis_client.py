@@ -0,0 +1,48 @@
+"""Shared Redis handle for the small coordination features (rate-limit breaker, caches).
+
+Every caller fails open: ``redis_client()`` returns None when the ``redis`` package or
+server URL is unavailable, and callers fall back to their single-process behaviour.
+"""
+
+import os
+
+
+def redis_url() -> str:
+    """Redis URL to coordinate through.
+
+    Uses the Celery broker URL when it points at Redis; on AWS the broker is SQS and the
+    result backend is Redis, so fall back to that, then to the local default.
+    """
+    url = os.getenv("CELERY_BROKER_URL", "")
+    if not url.startswith("redis"):
+        url = os.getenv("CELERY_RESULT_BACKEND", "")
+    if not url.startswith("redis"):
+        url = f"redis://redis:{os.getenv('REDIS_PORT', '6379')}/0"
+    return url
+
+
+def redis_client():
+    """Redis handle, or None if the client library or URL is unusable."""
+    try:
+        import redis
+    except Exception:
+        return None
+    try:
+        return redis.Redis.from_url(redis_url(), socket_timeout=2, socket_connect_timeout=2)
+    except Exception:
+        return None
+
+
+def async_redis_client():
+    """``redis.asyncio`` handle for code running on an event loop, or None as above.
+
+    Its connections belong to the loop that first uses them, so keep one per loop.
+    """
+    try:
+        from redis import asyncio as aioredis
+    except Exception:
+        return None
+    try:
+        return aioredis.Redis.from_url(redis_url(), socket_timeout=2, socket_connect_timeout=2)
+    except Exception:
+        return None
@@ -0,0 +1,334 @@
+"""Per-user fair-share admission for browser (Selenium) tasks.
+
+Every Selenium task shares the one ``selenium`` queue and a handful of Chrome slots, so a
+user whose commenting / viewer loops keep re-queueing themselves can hold the browser
+while everyone else's work waits behind it. Before a task opens a browser it asks for a
+slot here; when the answer is no it is retried a little later (``defer_seconds``), so the
+worker moves on to the next message instead of launching Chrome.
+
+A slot is granted only when
+
+- the user is under their concurrency cap (``SELENIUM_USER_CAP``, per tier via
+  ``SELENIUM_TIER_CAPS``),
+- fewer than ``SELENIUM_FAIR_SHARE_SLOTS`` leases are held overall (0 = no global cap), and
+- no other contending user (one deferred for a shared slot, or with browser tasks queued)
+  is further behind in virtual time. Each admission advances the user's virtual time by
+  ``1 / weight`` (``SELENIUM_TIER_WEIGHTS``), which gives weighted round-robin between
+  the users that actually have work waiting.
+
+Queued work is counted per user as tasks are published to and picked up from the
+``selenium`` queue (``note_queued``, wired to Celery signals in my_celery).
+
+State lives in Redis so every selenium worker sees the same picture; one Lua script does
+the whole check-and-lease so two workers never both take the last slot. Leases expire
+after ``SELENIUM_FAIR_SHARE_LEASE_SECONDS`` in case a worker dies holding one. Wait time
+from first deferral to admission is accumulated per user for /metrics.
+
+Fails open: without Redis every task is admitted, as before.
+"""
+
+import functools
+import os
+import time
+from typing import NamedTuple, Optional
+
+from cqc_lem.utilities.logger import log_info, log_warning
+from cqc_lem.utilities.redis_client import redis_client
+
+_LEASES_KEY = "selenium:leases"
+_USER_LEASES_PREFIX = "selenium:leases:"
+_WAIT_SINCE_KEY = "selenium:wait_since"
+_WAIT_SEEN_KEY = "selenium:wait_seen"
+_CONTENDERS_KEY = "selenium:contenders"
+_VTIME_KEY = "selenium:vtime"
+_QUEUED_KEY = "selenium:queued"
+_QUEUED_SEEN_KEY = "selenium:queued_seen"
+_WAIT_STATS_KEY = "selenium:wait_stats"
+
+_DEFAULT_TIER_WEIGHTS = "free_trial:1,starter:1,professional:2,enterprise:3"
+
+# KEYS: leases, user leases, wait since, wait seen, contenders, vtime, queued, queued seen
+# ARGV: user, task id, now, lease ttl, cap, slots, weight, stale after
+# Returns {1, seconds waited} when admitted, {0, reason} when deferred.
+_ADMIT_LUA = """
+local user, member = ARGV[1], ARGV[1] .. '|' .. ARGV[2]
+local now, ttl = tonumber(ARGV[3]), tonumber(ARGV[4])
+local cap, slots, weight = tonumber(ARGV[5]), tonumber(ARGV[6]), tonumber(ARGV[7])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+for _, gone in ipairs(redis.call('ZRANGEBYSCORE', KEYS[4], '-inf', now - tonumber(ARGV[8]))) do
+    redis.call('HDEL', KEYS[3], gone)
+    redis.call('ZREM', KEYS[4], gone)
+    redis.call('ZREM', KEYS[5], gone)
+end
+
+if redis.call('ZSCORE', KEYS[1], member) then
+    redis.call('ZADD', KEYS[1], now + ttl, member)
+    redis.call('ZADD', KEYS[2], now + ttl, member)
+    return {1, '0'}
+end
+
+local clock = tonumber(redis.call('HGET', KEYS[6], '_clock') or '0')
+local mine = math.max(tonumber(redis.call('HGET', KEYS[6], user) or '0'), clock)
+local function behind(other)
+    if other == user then
+        return false
+    end
+    return math.max(tonumber(redis.call('HGET', KEYS[6], other) or '0'), clock) < mine
+end
+
+local reason = false
+if redis.call('ZCARD', KEYS[2]) >= cap then
+    reason = 'cap'
+elseif slots > 0 and redis.call('ZCARD', KEYS[1]) >= slots then
+    reason = 'busy'
+else
+    -- contenders: users deferred for a shared slot, and users with browser work recently
+    -- queued (a stale queued count from a purged message stops counting after ARGV[8])
+    for _, other in ipairs(redis.call('ZRANGE', KEYS[5], 0, -1)) do
+        if behind(other) then
+            reason = 'turn'
+            break
+        end
+    end
+    if not reason then
+        local recent = redis.call('ZRANGEBYSCORE', KEYS[8], now - tonumber(ARGV[8]), '+inf')
+        for _, other in ipairs(recent) do
+            if tonumber(redis.call('HGET', KEYS[7], other) or '0') > 0 and behind(other) then
+                reason = 'turn'
+                break
+            end
+        end
+    end
+end
+
+if reason then
+    redis.call('HSETNX', KEYS[3], user, now)
+    redis.call('ZADD', KEYS[4], now, user)
+    -- only users held back by a shared slot compete for turns; a capped user waits on itself
+    if reason ~= 'cap' then
+        redis.call('ZADD', KEYS[5], now, user)
+    end
+    return {0, reason}
+end
+
+redis.call('ZADD', KEYS[1], now + ttl, member)
+redis.call('ZADD', KEYS[2], now + ttl, member)
+redis.call('EXPIRE', KEYS[2], ttl)
+redis.call('HSET', KEYS[6], '_clock', mine)
+redis.call('HSET', KEYS[6], user, mine + 1 / weight)
+local since = redis.call('HGET', KEYS[3], user)
+redis.call('HDEL', KEYS[3], user)
+redis.call('ZREM', KEYS[4], user)
+redis.call('ZREM', KEYS[5], user)
+return {1, tostring(since and (now - tonumber(since)) or 0)}
+"""
+
+
+class Slot(NamedTuple):
+    user_id: int
+    task_id: str
+    waited: float
+
+
+def fair_share_enabled() -> bool:
+    return os.getenv("SELENIUM_FAIR_SHARE_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def slots() -> int:
+    """Browser leases allowed at once across all users (0 = only per-user caps apply)."""
+    return int(_env_float("SELENIUM_FAIR_SHARE_SLOTS", 0))
+
+
+def defer_seconds() -> float:
+    """How long a deferred task waits before asking again."""
+    return _env_float("SELENIUM_FAIR_SHARE_DEFER_SECONDS", 30)
+
+
+def lease_seconds() -> float:
+    return _env_float("SELENIUM_FAIR_SHARE_LEASE_SECONDS", 3600)
+
+
+def stale_seconds() -> float:
+    """A waiting user not seen again for this long stops holding back other users."""
+    return _env_float("SELENIUM_FAIR_SHARE_STALE_SECONDS", 300)
+
+
+def _tier_map(env_name: str, default: str) -> dict[str, float]:
+    parsed = {}
+    for item in os.getenv(env_name, default).split(","):
+        tier, _, value = item.partition(":")
+        try:
+            parsed[tier.strip()] = float(value)
+        except ValueError:
+            continue
+    return parsed
+
+
+def tier_weight(tier: Optional[str]) -> float:
+    weight = _tier_map("SELENIUM_TIER_WEIGHTS", _DEFAULT_TIER_WEIGHTS).get(tier or "", 1.0)
+    return weight if weight > 0 else 1.0
+
+
+def tier_cap(tier: Optional[str]) -> int:
+    default = int(_env_float("SELENIUM_USER_CAP", 1))
+    return int(_tier_map("SELENIUM_TIER_CAPS", "").get(tier or "", default))
+
+
+def _user_tier(user_id: int) -> Optional[str]:
+    from cqc_lem.utilities.db import get_user_subscription_info
+    info = get_user_subscription_info(user_id) or {}
+    return info.get("subscription_tier")
+
+
+def _client():
+    return redis_client() if fair_share_enabled() else None
+
+
+def acquire_slot(user_id: int, task_id: str, tier: Optional[str] = None,
+                 now: Optional[float] = None) -> tuple[Optional[Slot], Optional[str]]:
+    """Try to lease a browser slot for ``user_id``.
+
+    Returns ``(slot, None)`` when admitted and ``(None, reason)`` when the task should be
+    deferred; reason is ``cap``, ``busy`` or ``turn``. Admits on any Redis failure.
+    """
+    client = _client()
+    if client is None:
+        return Slot(user_id, task_id, 0.0), None
+    if tier is None:
+        tier = _user_tier(user_id)
+    now = time.time() if now is None else now
+    try:
+        admitted, detail = client.register_script(_ADMIT_LUA)(
+            keys=[_LEASES_KEY, f"{_USER_LEASES_PREFIX}{user_id}", _WAIT_SINCE_KEY, _WAIT_SEEN_KEY,
+                  _CONTENDERS_KEY, _VTIME_KEY, _QUEUED_KEY, _QUEUED_SEEN_KEY],
+            args=[user_id, task_id, now, lease_seconds(), tier_cap(tier), slots(), tier_weight(tier),
+                  stale_seconds()])
+    except Exception as e:
+        log_warning("Selenium fair-share check failed; admitting", exc=e, user_id=user_id)
+        return Slot(user_id, task_id, 0.0), None
+
+    detail = detail.decode() if isinstance(detail, bytes) else str(detail)
+    if not int(admitted):
+        return None, detail
+    waited = float(detail)
+    if waited:
+        _record_wait(client, user_id, waited)
+    return Slot(user_id, task_id, waited), None
+
+
+def release_slot(slot: Slot) -> None:
+    client = _client()
+    if client is None:
+        return
+    member = f"{slot.user_id}|{slot.task_id}"
+    try:
+        pipe = client.pipeline()
+        pipe.zrem(_LEASES_KEY, member)
+        pipe.zrem(f"{_USER_LEASES_PREFIX}{slot.user_id}", member)
+        pipe.execute()
+    except Exception as e:
+        log_warning("Could not release selenium slot (lease will expire)", exc=e, user_id=slot.user_id)
+
+
+def _record_wait(client, user_id: int, waited: float) -> None:
+    try:
+        pipe = client.pipeline()
+        pipe.hincrby(_WAIT_STATS_KEY, f"{user_id}:admitted_after_wait", 1)
+        pipe.hincrbyfloat(_WAIT_STATS_KEY, f"{user_id}:wait_seconds", waited)
+        pipe.execute()
+    except Exception:
+        pass
+
+
+def note_queued(user_id: int, delta: int = 1) -> None:
+    """Count a browser task published (+1) or picked up (-1) for ``user_id``."""
+    client = _client()
+    if client is None:
+        return
+    try:
+        if delta > 0:
+            client.zadd(_QUEUED_SEEN_KEY, {user_id: time.time()})
+        if client.hincrby(_QUEUED_KEY, user_id, delta) <= 0:
+            client.hdel(_QUEUED_KEY, user_id)
+            client.zrem(_QUEUED_SEEN_KEY, user_id)
+    except Exception:
+        pass
+
+
+def fair_share_slot(func):
+    """Decorator for a bound Selenium task taking ``user_id``: lease a browser slot for the
+    run, or retry the task in ``defer_seconds`` without opening a browser.
+
+    Sits under the ``@shared_task.task`` decorator so QueueOnce still sees the task's own
+    signature.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        user_id = kwargs.get("user_id", args[0] if args else None)
+        slot, reason = acquire_slot(user_id, self.request.id or "")
+        if slot is None:
+            log_info(f"Deferring {self.name} for {defer_seconds():.0f}s ({reason})", user_id=user_id,
+                     task_name=self.name)
+            # retries=... bypasses the QueueOnce lock check, so the deferred run is never
+            # dropped as a duplicate of itself
+            raise self.retry(countdown=defer_seconds(), max_retries=None)
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            release_slot(slot)
+
+    return wrapper
+
+
+def get_fair_share_stats() -> dict:
+    """Per-user in-flight leases, queued tasks, current wait and accumulated wait time."""
+    stats = {"inflight": {}, "queued": {}, "waiting_seconds": {}, "wait_seconds_total": {},
+             "admitted_after_wait": {}}
+    client = _client()
+    if client is None:
+        return stats
+    now = time.time()
+
+    def _s(value):
+        return value.decode() if isinstance(value, bytes) else str(value)
+
+    try:
+        for member, expiry in client.zrange(_LEASES_KEY, 0, -1, withscores=True):
+            if float(expiry) > now:
+                user = _s(member).split("|", 1)[0]
+                stats["inflight"][user] = stats["inflight"].get(user, 0) + 1
+        stats["queued"] = {_s(k): int(v) for k, v in (client.hgetall(_QUEUED_KEY) or {}).items()}
+        stats["waiting_seconds"] = {_s(k): round(now - float(v), 3)
+                                    for k, v in (client.hgetall(_WAIT_SINCE_KEY) or {}).items()}
+        for field, value in (client.hgetall(_WAIT_STATS_KEY) or {}).items():
+            user, _, metric = _s(field).partition(":")
+            if metric == "wait_seconds":
+                stats["wait_seconds_total"][user] = float(value)
+            elif metric == "admitted_after_wait":
+                stats["admitted_after_wait"][user] = int(value)
+    except Exception:
+        pass
+    return stats
+
+
+def prometheus_gauges() -> dict[str, float]:
+    """``get_fair_share_stats`` flattened to labelled gauges for /metrics."""
+    stats = get_fair_share_stats()
+    gauges = {}
+    for metric, key in (("cqc_lem_selenium_inflight", "inflight"),
+                        ("cqc_lem_selenium_queued", "queued"),
+                        ("cqc_lem_selenium_waiting_seconds", "waiting_seconds"),
+                        ("cqc_lem_selenium_wait_seconds_total", "wait_seconds_total"),
+                        ("cqc_lem_selenium_admitted_after_wait_total", "admitted_after_wait")):
+        for user, value in stats[key].items():
+            gauges[f'{metric}{{user_id="{user}"}}'] = value
+    return gauges
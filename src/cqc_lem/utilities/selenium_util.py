@@ -116,7 +116,7 @@ def get_docker_driver(headless: bool = True, session_name: str = "ChromeTests",
 
     # Resolve egress proxy with zero user setup: explicit override → regional proxy
     # matched to the user's country → global default → none (direct egress).
-    from cqc_lem.utilities.proxy import resolve_proxy
+    from cqc_lem.utilities.proxy import egress_id, resolve_proxy
     effective_proxy = resolve_proxy(user_proxy, user_country)
 
     options = getBaseOptions()
@@ -134,6 +134,8 @@ def get_docker_driver(headless: bool = True, session_name: str = "ChromeTests",
 
     driver = webdriver.Remote(command_executor=remote_url, options=options)
     driver.set_window_size(1920, 1080)
+    # Per-egress LinkedIn state (429 breaker, pacing buckets) is keyed by this
+    driver.linkedin_egress = egress_id(effective_proxy)
 
     # Stealth: scrub the most-checked automation tells before any page script runs.
     # navigator.webdriver=undefined (the #1 signal), a realistic navigator.languages
@@ -0,0 +1,273 @@
+"""Cache of validated session tokens for the API auth path.
+
+Nearly every authenticated endpoint resolves its ``session_token`` through
+``db.get_session_user_id``; this keeps ``(user_id, expires_at)`` for recently validated
+tokens so most requests skip the ``sessions`` query. Entries never outlive the session's
+own ``expires_at``.
+
+Two tiers:
+
+- an in-process LRU (always on), and
+- optionally Redis (``SESSION_CACHE_REDIS=true``), shared by every API replica so a logout
+  on one replica is seen by all. With Redis on, the in-process tier only holds entries for
+  a few seconds, which bounds how long another replica can keep honouring a deleted
+  session. Redis failures fall back to the database.
+
+Without Redis a replica never hears of a logout or deleted user elsewhere, so the TTL
+itself defaults to those few seconds. Each user's cached tokens are indexed so
+``evict_user`` can drop them all when the user is deleted. Code on the event loop uses
+``aget`` / ``aset`` / ``aevict``, which reach Redis through ``redis.asyncio``.
+
+Tokens are only ever stored hashed.
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from cqc_lem.utilities.redis_client import async_redis_client, redis_client
+from cqc_lem.utilities.ttl_cache import TTLCache
+
+_REDIS_PREFIX = "session:"
+_REDIS_USER_PREFIX = "session:user:"
+_LOCAL_TTL_WITH_REDIS = 5.0
+
+
+def session_cache_ttl() -> float:
+    """Longest a validated token is trusted without re-reading ``sessions`` (0 disables).
+
+    300s with Redis on; otherwise only the few seconds the in-process tier may lag.
+    """
+    default = 300.0 if session_cache_uses_redis() else _LOCAL_TTL_WITH_REDIS
+    try:
+        return float(os.getenv("SESSION_CACHE_TTL_SECONDS", str(default)))
+    except ValueError:
+        return default
+
+
+def session_cache_uses_redis() -> bool:
+    return os.getenv("SESSION_CACHE_REDIS", "false").strip().lower() in ("1", "true", "yes")
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _epoch(expires_at: Optional[datetime]) -> Optional[float]:
+    if expires_at is None:
+        return None
+    if expires_at.tzinfo is None:  # DATETIME columns come back naive, stored as UTC
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at.timestamp()
+
+
+class SessionCache:
+    """Token -> user_id cache bounded by both a TTL and each session's ``expires_at``."""
+
+    def __init__(self, ttl: float, use_redis: bool = False, maxsize: int = 4096):
+        self._ttl = ttl
+        self._use_redis = use_redis
+        self._local_ttl_max = min(ttl, _LOCAL_TTL_WITH_REDIS) if use_redis else ttl
+        self._local = TTLCache(maxsize=maxsize, ttl=self._local_ttl_max)
+        self._lock = threading.Lock()
+        self._redis = None
+        self._aredis = None  # (event loop, redis.asyncio client)
+        self._redis_hits = 0
+        self._db_lookups = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._ttl > 0
+
+    def _redis_handle(self):
+        if not self._use_redis:
+            return None
+        if self._redis is None:
+            self._redis = redis_client()
+        return self._redis
+
+    def _async_redis_handle(self):
+        if not self._use_redis:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._aredis is None or self._aredis[0] is not loop:
+            self._aredis = (loop, async_redis_client())
+        return self._aredis[1]
+
+    def get(self, token: str) -> Optional[int]:
+        """Cached user_id for a still-valid token, or None (caller must check the database)."""
+        if not self.enabled:
+            return None
+        key = _token_key(token)
+        user_id = self._local_get(key)
+        if user_id is not None:
+            return user_id
+        client = self._redis_handle()
+        raw = None
+        if client is not None:
+            try:
+                raw = client.get(_REDIS_PREFIX + key)
+            except Exception:
+                pass
+        return self._redis_hit(key, raw)
+
+    async def aget(self, token: str) -> Optional[int]:
+        """``get`` for code on the event loop: Redis is read without blocking it."""
+        if not self.enabled:
+            return None
+        key = _token_key(token)
+        user_id = self._local_get(key)
+        if user_id is not None:
+            return user_id
+        client = self._async_redis_handle()
+        raw = None
+        if client is not None:
+            try:
+                raw = await client.get(_REDIS_PREFIX + key)
+            except Exception:
+                pass
+        return self._redis_hit(key, raw)
+
+    def set(self, token: str, user_id: int, expires_at: Optional[datetime] = None) -> None:
+        """Remember a token the database just validated."""
+        entry = self._local_set(token, user_id, expires_at)
+        client = self._redis_handle() if entry else None
+        if client is not None:
+            try:
+                pipe = client.pipeline()
+                self._queue_redis_set(pipe, *entry)
+                pipe.execute()
+            except Exception:
+                pass
+
+    async def aset(self, token: str, user_id: int, expires_at: Optional[datetime] = None) -> None:
+        """``set`` for code on the event loop."""
+        entry = self._local_set(token, user_id, expires_at)
+        client = self._async_redis_handle() if entry else None
+        if client is not None:
+            try:
+                pipe = client.pipeline()
+                self._queue_redis_set(pipe, *entry)
+                await pipe.execute()
+            except Exception:
+                pass
+
+    def evict(self, token: str) -> None:
+        """Forget a token everywhere (logout / session deletion)."""
+        key = _token_key(token)
+        self._local.pop(key)
+        client = self._redis_handle()
+        if client is not None:
+            try:
+                client.delete(_REDIS_PREFIX + key)
+            except Exception:
+                pass
+
+    async def aevict(self, token: str) -> None:
+        """``evict`` for code on the event loop."""
+        key = _token_key(token)
+        self._local.pop(key)
+        client = self._async_redis_handle()
+        if client is not None:
+            try:
+                await client.delete(_REDIS_PREFIX + key)
+            except Exception:
+                pass
+
+    def evict_user(self, user_id: int) -> None:
+        """Forget every token of ``user_id`` (the user was deleted)."""
+        self._local.pop_where(lambda entry: entry[0] == user_id)
+        client = self._redis_handle()
+        if client is not None:
+            try:
+                index = f"{_REDIS_USER_PREFIX}{user_id}"
+                keys = [_REDIS_PREFIX + (k.decode() if isinstance(k, bytes) else k) for k in client.smembers(index)]
+                client.delete(index, *keys)
+            except Exception:
+                pass
+
+    def clear(self) -> None:
+        """Drop the in-process tier and reset counters (Redis entries expire on their own)."""
+        self._local.clear()
+        with self._lock:
+            self._redis = None
+            self._redis_hits = 0
+            self._db_lookups = 0
+
+    def stats(self) -> dict:
+        local = self._local.stats()
+        with self._lock:
+            redis_hits, db_lookups = self._redis_hits, self._db_lookups
+        hits = local["hits"] + redis_hits
+        lookups = hits + db_lookups
+        return {
+            "size": local["size"],
+            "maxsize": local["maxsize"],
+            "local_hits": local["hits"],
+            "redis_hits": redis_hits,
+            "hits": hits,
+            "misses": db_lookups,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "redis": self._use_redis,
+        }
+
+    def _local_ttl(self, expires: Optional[float], now: float) -> float:
+        if expires is None:
+            return self._local_ttl_max
+        return max(0.0, min(self._local_ttl_max, expires - now))
+
+    def _local_get(self, key: str) -> Optional[int]:
+        entry = self._local.get(key)
+        if entry is not None:
+            user_id, expires = entry
+            if expires is None or expires > time.time():
+                return user_id
+            self._local.pop(key)
+        return None
+
+    def _redis_hit(self, key: str, raw) -> Optional[int]:
+        """Count the lookup and cache a Redis entry locally; None when it must go to the database."""
+        entry = _parse_redis_entry(raw)
+        now = time.time()
+        if entry is not None and (entry[1] is None or entry[1] > now):
+            with self._lock:
+                self._redis_hits += 1
+            self._local.set(key, entry, ttl=self._local_ttl(entry[1], now))
+            return entry[0]
+        with self._lock:
+            self._db_lookups += 1
+        return None
+
+    def _local_set(self, token: str, user_id: int, expires_at: Optional[datetime]) -> Optional[tuple]:
+        """Cache locally; returns ``(key, user_id, expires, ttl)`` for Redis, None if not cached."""
+        if not self.enabled:
+            return None
+        key = _token_key(token)
+        now = time.time()
+        expires = _epoch(expires_at)
+        ttl = self._ttl if expires is None else min(self._ttl, expires - now)
+        if ttl <= 0:
+            return None
+        self._local.set(key, (user_id, expires), ttl=self._local_ttl(expires, now))
+        return key, user_id, expires, ttl
+
+    def _queue_redis_set(self, pipe, key: str, user_id: int, expires: Optional[float], ttl: float) -> None:
+        pipe.set(_REDIS_PREFIX + key, f"{user_id}:{'' if expires is None else expires}", ex=max(1, int(ttl)))
+        # Index the token under its user for evict_user; no token outlives the cache TTL
+        index = f"{_REDIS_USER_PREFIX}{user_id}"
+        pipe.sadd(index, key)
+        pipe.expire(index, max(1, int(self._ttl)))
+
+
+def _parse_redis_entry(raw) -> Optional[tuple]:
+    if not raw:
+        return None
+    try:
+        user_id, expires = (raw.decode() if isinstance(raw, bytes) else raw).split(":", 1)
+        return int(user_id), (float(expires) if expires else None)
+    except ValueError:
+        return None
@@ -0,0 +1,86 @@
+"""Small thread-safe, bounded LRU cache with per-entry TTL and hit/miss counters.
+
+Used by db.py to cache hot per-user lookups in-process. Entries are dropped after a fork
+so a Celery child never serves values cached (and possibly invalidated since) by its
+parent.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU mapping of at most ``maxsize`` entries, each valid for ``ttl`` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._maxsize = max(1, maxsize)
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._reset_state()
+
+    def _reset_state(self) -> None:
+        self._pid = os.getpid()
+        self._data: OrderedDict = OrderedDict()  # key -> (expires_at, value)
+        self._hits = 0
+        self._misses = 0
+
+    def _check_pid(self) -> None:
+        if self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self._reset_state()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        self._check_pid()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self._hits += 1
+                    return value
+                del self._data[key]
+            self._misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: float = None) -> None:
+        self._check_pid()
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self._ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._check_pid()
+        with self._lock:
+            self._data.pop(key, None)
+
+    def pop_where(self, predicate: Callable[[Any], bool]) -> int:
+        """Drop every entry whose value matches ``predicate``. Returns how many were dropped."""
+        self._check_pid()
+        with self._lock:
+            keys = [key for key, (_, value) in self._data.items() if predicate(value)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset_state()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._data),
+                "maxsize": self._maxsize,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
@@ -30,9 +30,39 @@ def setup_test_environment():
     os.environ.setdefault("DB_NAME", "test_db")
     os.environ.setdefault("CELERY_BROKER_URL", "redis://localhost:6379/0")
     os.environ.setdefault("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+    # Post tasks fall back to Celery ETAs unless a test opts into the Redis dispatcher
+    os.environ.setdefault("DELAYED_DISPATCH_ENABLED", "false")
+    # Selenium tasks run without the Redis fair-share admission unless a test opts in
+    os.environ.setdefault("SELENIUM_FAIR_SHARE_ENABLED", "false")
+    # ...and without LinkedIn token-bucket pacing
+    os.environ.setdefault("LINKEDIN_PACING_ENABLED", "false")
     os.environ.setdefault("PEXELS_API_KEY", "test-pexels-api-key-12345")
 
 
+@pytest.fixture(autouse=True)
+def reset_db_pool():
+    """Start every test with an empty MySQL pool, log buffer, settings/session caches and
+    db metrics so a MagicMock connection, buffered log row or cached row never leaks into
+    the next test."""
+    import sys
+
+    def _reset():
+        db_module = sys.modules.get("cqc_lem.utilities.db")
+        if db_module is not None:
+            db_module.reset_db_pool()
+            db_module.reset_log_buffer()
+            db_module.reset_user_settings_cache()
+            db_module.reset_session_cache()
+            db_module.invalidate_post_stats()
+        metrics_module = sys.modules.get("cqc_lem.utilities.db_metrics")
+        if metrics_module is not None:
+            metrics_module.registry.reset()
+
+    _reset()
+    yield
+    _reset()
+
+
 @pytest.fixture
 def mock_openai_client():
     """Mock OpenAI client for testing AI-related functions."""
@@ -64,6 +94,29 @@ def mock_database_connection():
         }
 
 
+@pytest.fixture
+def fake_redis():
+    """In-memory Redis that runs Lua (fakeredis[lua]), so the Redis coordination modules'
+    scripts execute for real. Patch the module's ``redis_client`` to return it."""
+    import fakeredis
+
+    return fakeredis.FakeStrictRedis()
+
+
+@pytest.fixture
+def user_settings_row():
+    """Factory for the dict row get_user_settings() reads from the users table."""
+    def _row(**overrides):
+        row = {
+            "timezone": None, "blog_url": None, "sitemap_url": None, "company_linked_in_url": None,
+            "proxy_url": None, "latitude": None, "longitude": None, "locale": None, "city": None,
+            "country": None, "last_login_inactivate_delay": None, "auto_schedule_posts": 1,
+        }
+        row.update(overrides)
+        return row
+    return _row
+
+
 @pytest.fixture
 def mock_selenium_driver():
     """Mock Selenium WebDriver for testing browser automation."""
@@ -63,7 +63,7 @@ class TestSchedulePostEndpoint:
 @pytest.mark.integration
 class TestGetPostsEndpoint:
     def test_get_posts_returns_200_with_posts(self):
-        with patch("cqc_lem.api.main.get_post_by_email") as mock_posts:
+        with patch("cqc_lem.utilities.db_async.get_post_by_email") as mock_posts:
             from fastapi.testclient import TestClient
             from cqc_lem.api.main import app
 
@@ -87,7 +87,7 @@ class TestGetPostsEndpoint:
             assert len(body["detail"]["posts"]) == 1
 
     def test_get_posts_returns_200_with_empty_list_when_no_posts(self):
-        with patch("cqc_lem.api.main.get_post_by_email") as mock_posts:
+        with patch("cqc_lem.utilities.db_async.get_post_by_email") as mock_posts:
             from fastapi.testclient import TestClient
             from cqc_lem.api.main import app
 
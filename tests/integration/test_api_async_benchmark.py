@@ -0,0 +1,107 @@
+"""Load test: GET /api/posts/ on the aiomysql path vs. the old threadpool path.
+
+Fires API_BENCH_REQUESTS (default 500) requests, API_BENCH_CONCURRENCY (default 100) at a
+time, at the ASGI app in-process, once with ``db_async`` on aiomysql and once with
+aiomysql hidden so every query runs the sync ``db`` helper in a worker thread (what the
+``def`` endpoint did). Both paths get the same number of MySQL connections. Throughput and
+p50/p95 latency are printed for review; the assertion only guards against the async path
+regressing below the threaded one. Skipped when aiomysql is not installed or MySQL is
+unreachable.
+
+    poetry run pytest tests/integration/test_api_async_benchmark.py -m slow -s
+"""
+import asyncio
+import os
+import statistics
+import time
+from unittest.mock import patch
+
+import pytest
+
+pytestmark = [pytest.mark.integration, pytest.mark.slow, pytest.mark.requires_database]
+
+
+def _requests() -> int:
+    return int(os.getenv("API_BENCH_REQUESTS", "500"))
+
+
+def _concurrency() -> int:
+    return int(os.getenv("API_BENCH_CONCURRENCY", "100"))
+
+
+@pytest.fixture(scope="module")
+def benchmark_email():
+    pytest.importorskip("aiomysql")
+    pytest.importorskip("httpx")
+    from cqc_lem.utilities import db
+
+    try:
+        connection = db.get_db_connection()
+    except Exception as e:  # unreachable server or MYSQL_* settings missing
+        pytest.skip(f"MySQL not reachable: {e}")
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT email FROM users ORDER BY id LIMIT 1")
+        row = cursor.fetchone()
+    except Exception as e:
+        pytest.skip(f"Schema not migrated: {e}")
+    finally:
+        cursor.close()
+        connection.close()
+    if row is None:
+        pytest.skip("No users row to page posts for")
+    yield row[0]
+    db.reset_db_pool()
+
+
+async def _load(email: str) -> tuple[float, list[float]]:
+    import httpx
+
+    from cqc_lem.api.main import app
+    from cqc_lem.utilities import db_async
+
+    semaphore = asyncio.Semaphore(_concurrency())
+    latencies: list[float] = []
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get("/api/posts/", params={"email": email, "page_size": 25,
+                                                                   "include_total": "false"})
+                latencies.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200
+
+        await one()  # warm the pool
+        latencies.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(_requests())))
+        elapsed = time.perf_counter() - started
+
+    await db_async.close_pool()
+    return _requests() / elapsed, latencies
+
+
+def _p95(latencies: list[float]) -> float:
+    return statistics.quantiles(latencies, n=20)[-1]
+
+
+def test_async_endpoint_throughput(benchmark_email, monkeypatch, record_property):
+    from cqc_lem.utilities.db_pool import pool_size
+
+    monkeypatch.setenv("MYSQL_ASYNC_POOL_SIZE", str(pool_size()))
+    monkeypatch.setattr("cqc_lem.api.main._API_ACCESS_TOKEN_SET", set())
+
+    with patch("cqc_lem.utilities.db_async.aiomysql", None):
+        threaded_rps, threaded = asyncio.run(_load(benchmark_email))
+    async_rps, native = asyncio.run(_load(benchmark_email))
+
+    record_property("threaded_rps", round(threaded_rps, 1))
+    record_property("async_rps", round(async_rps, 1))
+    print(f"\n{_requests()} x GET /api/posts/ @ {_concurrency()} concurrent, {pool_size()} connections\n"  # noqa: T201 — summary for -s runs
+          f"  threaded: {threaded_rps:.0f} req/s | p50 {statistics.median(threaded):.1f}ms "
+          f"p95 {_p95(threaded):.1f}ms\n"
+          f"  aiomysql: {async_rps:.0f} req/s | p50 {statistics.median(native):.1f}ms "
+          f"p95 {_p95(native):.1f}ms")
+
+    assert async_rps >= threaded_rps * 0.9
@@ -26,9 +26,9 @@ def _client():
 @pytest.mark.integration
 class TestAvatarCreditsEndpoint:
     def test_get_credits_returns_balance_and_active_avatar(self):
-        with patch("cqc_lem.api.main.get_session_user_id", return_value=USER_ID), \
-             patch("cqc_lem.api.main.get_avatar_credit_balance", return_value=3), \
-             patch("cqc_lem.api.main.get_active_avatar", return_value=None):
+        with patch("cqc_lem.utilities.db_async.get_session_user_id", return_value=USER_ID), \
+             patch("cqc_lem.utilities.db_async.get_avatar_credit_balance", return_value=3), \
+             patch("cqc_lem.utilities.db_async.get_active_avatar", return_value=None):
             r = _client().get("/api/avatar/credits", params={"session_token": SESSION})
 
         assert r.status_code == 200
@@ -37,7 +37,7 @@ class TestAvatarCreditsEndpoint:
         assert detail["active_avatar"] is None
 
     def test_get_credits_returns_401_for_invalid_session(self):
-        with patch("cqc_lem.api.main.get_session_user_id", return_value=None):
+        with patch("cqc_lem.utilities.db_async.get_session_user_id", return_value=None):
             r = _client().get("/api/avatar/credits", params={"session_token": "bad"})
 
         assert r.status_code == 401
@@ -47,9 +47,9 @@ class TestAvatarCreditsEndpoint:
             "id": 1, "training_id": "train-1", "model_ref": "user/model:v1",
             "trigger_word": "LEMAVTR42", "status": "succeeded",
         }
-        with patch("cqc_lem.api.main.get_session_user_id", return_value=USER_ID), \
-             patch("cqc_lem.api.main.get_avatar_credit_balance", return_value=2), \
-             patch("cqc_lem.api.main.get_active_avatar", return_value=active):
+        with patch("cqc_lem.utilities.db_async.get_session_user_id", return_value=USER_ID), \
+             patch("cqc_lem.utilities.db_async.get_avatar_credit_balance", return_value=2), \
+             patch("cqc_lem.utilities.db_async.get_active_avatar", return_value=active):
             r = _client().get("/api/avatar/credits", params={"session_token": SESSION})
 
         assert r.status_code == 200
@@ -104,8 +104,8 @@ class TestAvatarCreditCheckoutEndpoint:
 @pytest.mark.integration
 class TestAvatarTrainingEndpoint:
     def test_returns_402_when_no_credits(self):
-        with patch("cqc_lem.api.main.get_session_user_id", return_value=USER_ID), \
-             patch("cqc_lem.api.main.get_avatar_credit_balance", return_value=0):
+        with patch("cqc_lem.utilities.db_async.get_session_user_id", return_value=USER_ID), \
+             patch("cqc_lem.utilities.db_async.get_avatar_credit_balance", return_value=0):
             r = _client().post(
                 "/api/avatar/training",
                 data={"session_token": SESSION, "trigger_word": "LEMAVTR42"},
@@ -116,7 +116,7 @@ class TestAvatarTrainingEndpoint:
         assert "credits" in r.json()["detail"].lower()
 
     def test_returns_401_for_invalid_session(self):
-        with patch("cqc_lem.api.main.get_session_user_id", return_value=None):
+        with patch("cqc_lem.utilities.db_async.get_session_user_id", return_value=None):
             r = _client().post(
                 "/api/avatar/training",
                 data={"session_token": "bad", "trigger_word": "TOK"},
@@ -127,13 +127,14 @@ class TestAvatarTrainingEndpoint:
 
     def test_returns_200_and_deducts_credit_when_training_starts(self):
         mock_training_id = "train-success-001"
-        with patch("cqc_lem.api.main.get_session_user_id", return_value=USER_ID), \
-             patch("cqc_lem.api.main.get_avatar_credit_balance", return_value=2), \
+        with patch("cqc_lem.utilities.db_async.get_session_user_id", return_value=USER_ID), \
+             patch("cqc_lem.utilities.db_async.get_avatar_credit_balance", return_value=2), \
              patch(
                  "cqc_lem.utilities.avatar.replicate_avatar.start_avatar_training",
                  return_value=mock_training_id,
              ), \
              patch("cqc_lem.api.main.deduct_avatar_credit", return_value=True) as mock_deduct, \
+             patch("cqc_lem.api.main.link_avatar_credit_to_training") as mock_link, \
              patch("cqc_lem.api.main.insert_avatar_training", return_value=5):
             r = _client().post(
                 "/api/avatar/training",
@@ -143,14 +144,47 @@ class TestAvatarTrainingEndpoint:
 
         assert r.status_code == 200
         assert r.json()["detail"]["training_id"] == mock_training_id
-        mock_deduct.assert_called_once_with(USER_ID, mock_training_id)
+        mock_deduct.assert_called_once_with(USER_ID)
+        mock_link.assert_called_once_with(USER_ID, mock_training_id)
+
+    def test_returns_402_without_training_when_the_credit_cannot_be_reserved(self):
+        with patch("cqc_lem.utilities.db_async.get_session_user_id", return_value=USER_ID), \
+             patch("cqc_lem.utilities.db_async.get_avatar_credit_balance", return_value=1), \
+             patch("cqc_lem.utilities.avatar.replicate_avatar.start_avatar_training") as mock_start, \
+             patch("cqc_lem.api.main.deduct_avatar_credit", return_value=False):
+            r = _client().post(
+                "/api/avatar/training",
+                data={"session_token": SESSION, "trigger_word": "LEMAVTR42"},
+                files={"photos": ("photos.zip", _make_zip(), "application/zip")},
+            )
+
+        assert r.status_code == 402
+        mock_start.assert_not_called()
+
+    def test_refunds_the_reserved_credit_when_training_fails_to_start(self):
+        with patch("cqc_lem.utilities.db_async.get_session_user_id", return_value=USER_ID), \
+             patch("cqc_lem.utilities.db_async.get_avatar_credit_balance", return_value=1), \
+             patch("cqc_lem.utilities.avatar.replicate_avatar.start_avatar_training",
+                   side_effect=RuntimeError("replicate down")), \
+             patch("cqc_lem.api.main.deduct_avatar_credit", return_value=True), \
+             patch("cqc_lem.api.main.refund_avatar_credit", return_value=True) as mock_refund, \
+             patch("cqc_lem.api.main.insert_avatar_training") as mock_insert:
+            r = _client().post(
+                "/api/avatar/training",
+                data={"session_token": SESSION, "trigger_word": "LEMAVTR42"},
+                files={"photos": ("photos.zip", _make_zip(), "application/zip")},
+            )
+
+        assert r.status_code == 500
+        mock_refund.assert_called_once_with(USER_ID)
+        mock_insert.assert_not_called()
 
 
 @pytest.mark.integration
 class TestListAvatarTrainings:
     def test_returns_empty_list_when_no_trainings(self):
-        with patch("cqc_lem.api.main.get_session_user_id", return_value=USER_ID), \
-             patch("cqc_lem.api.main.get_avatar_trainings", return_value=[]):
+        with patch("cqc_lem.utilities.db_async.get_session_user_id", return_value=USER_ID), \
+             patch("cqc_lem.utilities.db_async.get_avatar_trainings", return_value=[]):
             r = _client().get("/api/avatar/trainings", params={"session_token": SESSION})
 
         assert r.status_code == 200
@@ -165,8 +199,8 @@ class TestListAvatarTrainings:
                 "updated_at": "2026-01-01T00:00:00",
             }
         ]
-        with patch("cqc_lem.api.main.get_session_user_id", return_value=USER_ID), \
-             patch("cqc_lem.api.main.get_avatar_trainings", return_value=trainings):
+        with patch("cqc_lem.utilities.db_async.get_session_user_id", return_value=USER_ID), \
+             patch("cqc_lem.utilities.db_async.get_avatar_trainings", return_value=trainings):
             r = _client().get("/api/avatar/trainings", params={"session_token": SESSION})
 
         assert r.status_code == 200
@@ -19,25 +19,26 @@ class TestPlanContentForUser:
         fixed_now = datetime(2026, 6, 1, 0, 0, 0)
         with patch('cqc_lem.app.run_content_plan.datetime') as mock_dt, \
              patch('cqc_lem.app.run_content_plan.get_last_planned_post_date_for_user', return_value=None), \
-             patch('cqc_lem.app.run_content_plan.insert_planned_post', return_value=True) as mock_insert:
+             patch('cqc_lem.app.run_content_plan.insert_planned_posts', side_effect=lambda u, rows: len(rows)) as mock_insert:
             mock_dt.now.return_value = fixed_now
             mock_dt.combine = datetime.combine
             plan_content_for_user(user_id=1)
-            assert mock_insert.call_count >= 20, f"Expected at least 20 planned posts, got {mock_insert.call_count}"
+            rows = mock_insert.call_args.args[1]
+            assert len(rows) >= 20, f"Expected at least 20 planned posts, got {len(rows)}"
 
     def test_plan_content_balanced_post_types(self, mock_database_connection):
         """plan_content_for_user should use multiple post types."""
         from cqc_lem.app.run_content_plan import plan_content_for_user
         inserted_types = []
-        def capture_insert(user_id, scheduled_time, post_type, buyer_stage):
-            inserted_types.append(post_type)
-            return True
+        def capture_insert(user_id, rows):
+            inserted_types.extend(post_type for _, post_type, _ in rows)
+            return len(rows)
         # Freeze to June 1 so target_posts is large enough to span multiple types;
         # without this the test breaks near month-end when only ~1 post is planned.
         fixed_now = datetime(2026, 6, 1, 0, 0, 0)
         with patch('cqc_lem.app.run_content_plan.datetime') as mock_dt, \
              patch('cqc_lem.app.run_content_plan.get_last_planned_post_date_for_user', return_value=None), \
-             patch('cqc_lem.app.run_content_plan.insert_planned_post', side_effect=capture_insert):
+             patch('cqc_lem.app.run_content_plan.insert_planned_posts', side_effect=capture_insert):
             mock_dt.now.return_value = fixed_now
             mock_dt.combine = datetime.combine
             plan_content_for_user(user_id=1)
@@ -52,15 +53,15 @@ class TestPlanContentForUser:
         from cqc_lem.utilities.utils import get_best_posting_times
 
         captured = []
-        def cap(user_id, scheduled_time, post_type, buyer_stage):
-            captured.append(scheduled_time)
-            return True
+        def cap(user_id, rows):
+            captured.extend(scheduled_time for scheduled_time, _, _ in rows)
+            return len(rows)
 
         fixed_now = datetime(2026, 6, 1, 0, 0, 0)
         with patch('cqc_lem.app.run_content_plan.datetime') as mock_dt, \
              patch('cqc_lem.app.run_content_plan.get_last_planned_post_date_for_user', return_value=None), \
              patch('cqc_lem.app.run_content_plan.get_user_timezone', return_value='America/New_York'), \
-             patch('cqc_lem.app.run_content_plan.insert_planned_post', side_effect=cap):
+             patch('cqc_lem.app.run_content_plan.insert_planned_posts', side_effect=cap):
             mock_dt.now.return_value = fixed_now
             mock_dt.combine = datetime.combine
             plan_content_for_user(user_id=1)
@@ -83,14 +84,21 @@ class TestPlanContentForUser:
 
 @pytest.mark.integration
 class TestAutoGenerateContent:
-    def test_auto_generate_calls_task_for_each_active_user(self, mock_database_connection):
-        """auto_generate_content should dispatch plan_content_for_user for each active user."""
+    def test_auto_generate_plans_each_active_user_in_one_batch(self, mock_database_connection):
+        """auto_generate_content should plan every active user and persist them in one batch insert."""
         from cqc_lem.app.run_content_plan import auto_generate_content
-        with patch('cqc_lem.app.run_content_plan.get_active_user_ids', return_value=[1, 2]), \
-             patch('cqc_lem.app.run_content_plan.plan_content_for_user') as mock_plan:
-            mock_plan.apply_async = MagicMock()
+        fixed_now = datetime(2026, 6, 1, 0, 0, 0)
+        with patch('cqc_lem.app.run_content_plan.datetime') as mock_dt, \
+             patch('cqc_lem.app.run_content_plan.iter_active_users', return_value=iter([{'id': 1}, {'id': 2}])), \
+             patch('cqc_lem.app.run_content_plan.get_post_type_counts_for_users', return_value={}), \
+             patch('cqc_lem.app.run_content_plan.get_last_planned_post_dates', return_value={}), \
+             patch('cqc_lem.app.run_content_plan.get_user_timezone', return_value='UTC'), \
+             patch('cqc_lem.app.run_content_plan.insert_planned_posts_batch', return_value=58) as mock_batch:
+            mock_dt.now.return_value = fixed_now
+            mock_dt.combine = datetime.combine
             auto_generate_content()
-            assert mock_plan.apply_async.call_count == 2
+            mock_batch.assert_called_once()
+            assert set(mock_batch.call_args.args[0]) == {1, 2}
 
 
 @pytest.mark.integration
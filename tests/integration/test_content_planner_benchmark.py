@@ -0,0 +1,55 @@
+"""Benchmark: batch content planner (build_content_plans) for a simulated 10k-user base.
+
+The grouped reads are replaced with synthetic per-user data, so this measures the
+planning itself — apportionment, shuffles, posting times and timezone conversion — and
+needs no database. Timings are printed for review; the assertion guards the "seconds,
+not hours" budget the batch planner exists for.
+
+    poetry run pytest tests/integration/test_content_planner_benchmark.py -m slow -s
+"""
+import random
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+
+pytestmark = [pytest.mark.integration, pytest.mark.slow]
+
+_USERS = 10_000
+_TIMEZONES = ["UTC", "America/New_York", "America/Chicago", "America/Los_Angeles",
+              "Europe/London", "Europe/Berlin", "Asia/Kolkata", "Australia/Sydney"]
+
+
+def _synthetic_users(now: datetime):
+    rng = random.Random(7)
+    counts, last_dates, timezones = {}, {}, {}
+    for user_id in range(1, _USERS + 1):
+        counts[user_id] = {t: rng.randint(0, 40) for t in ("carousel", "text", "video") if rng.random() > 0.1}
+        if rng.random() > 0.3:
+            last_dates[user_id] = now + timedelta(days=rng.randint(-10, 45))
+        timezones[user_id] = rng.choice(_TIMEZONES)
+    return counts, last_dates, timezones
+
+
+def test_plans_10k_users_in_seconds():
+    from cqc_lem.app.run_content_plan import build_content_plans
+
+    now = datetime(2026, 10, 5, 12, 0)
+    counts, last_dates, timezones = _synthetic_users(now)
+    user_ids = list(range(1, _USERS + 1))
+
+    with patch("cqc_lem.app.run_content_plan.get_post_type_counts_for_users", return_value=counts), \
+         patch("cqc_lem.app.run_content_plan.get_last_planned_post_dates", return_value=last_dates), \
+         patch("cqc_lem.app.run_content_plan.get_user_timezone", side_effect=timezones.__getitem__):
+        t0 = time.perf_counter()
+        plans = build_content_plans(user_ids, now=now)
+        elapsed = time.perf_counter() - t0
+
+    posts = sum(len(plan) for plan in plans.values())
+    print(f"\n{_USERS} users | {posts} planned posts | {elapsed:.2f}s "  # noqa: T201 — summary for -s runs
+          f"({elapsed / _USERS * 1e6:.0f}µs per user)")
+
+    assert len(plans) == _USERS
+    assert posts > 0
+    assert elapsed < 30
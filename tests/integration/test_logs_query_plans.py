@@ -0,0 +1,192 @@
+"""Query-plan and latency regression suite for the db.py lookups on the logs table.
+
+Loads a synthetic logs table (LOGS_PLAN_ROWS rows, default 2,000,000) into a scratch copy
+of ``logs`` in a real MySQL, applies the V34 index migration to it, then for every db.py
+query that reads logs:
+
+- asserts EXPLAIN picks an index (no full table scan), and
+- records p50/p99 latency (printed, and attached to the JUnit report via record_property),
+  failing when p99 exceeds LOGS_QUERY_P99_BUDGET_MS.
+
+The SQL under test is captured from the db.py functions themselves, so a query edit that
+defeats the indexes fails here. Requires the Flyway schema (``logs`` table) — skipped
+automatically when MySQL is unreachable.
+
+    poetry run pytest tests/integration/test_logs_query_plans.py -m slow -s
+"""
+import os
+import random
+import re
+import statistics
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import mysql.connector
+import pytest
+from mysql.connector import errorcode
+
+pytestmark = [pytest.mark.integration, pytest.mark.slow, pytest.mark.requires_database]
+
+_SCRATCH_TABLE = "logs_plan_check"
+_MIGRATION = Path(__file__).resolve().parents[2] / "compose" / "local" / "database" / "migrations" / \
+             "V34__add_logs_engagement_indexes.sql"
+_USERS = 500
+_URLS = 200_000
+_POSTS = 100_000
+_SAMPLES = 200
+
+_DIGITS = "(SELECT 0 d UNION ALL SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3 UNION ALL SELECT 4 " \
+          "UNION ALL SELECT 5 UNION ALL SELECT 6 UNION ALL SELECT 7 UNION ALL SELECT 8 UNION ALL SELECT 9)"
+
+
+def _rows() -> int:
+    return int(os.getenv("LOGS_PLAN_ROWS", "2000000"))
+
+
+def _p99_budget_ms() -> float:
+    return float(os.getenv("LOGS_QUERY_P99_BUDGET_MS", "50"))
+
+
+def _url(n: int) -> str:
+    return f"https://www.linkedin.com/feed/update/urn:li:activity:{7000000000000000000 + n}"
+
+
+@pytest.fixture(scope="module")
+def scratch_logs():
+    """Connection to MySQL with a populated, migrated scratch copy of ``logs``."""
+    from cqc_lem.utilities import db
+
+    try:
+        connection = db.get_db_connection()
+    except Exception as e:  # unreachable server or MYSQL_* settings missing
+        pytest.skip(f"MySQL not reachable: {e}")
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"DROP TABLE IF EXISTS {_SCRATCH_TABLE}")
+        # LIKE copies columns and indexes but not the FKs, so synthetic ids need no parents
+        cursor.execute(f"CREATE TABLE {_SCRATCH_TABLE} LIKE logs")
+    except mysql.connector.Error as e:
+        cursor.close()
+        connection.close()
+        pytest.skip(f"Schema not migrated: {e}")
+
+    for statement in _migration_statements():
+        try:
+            cursor.execute(statement)
+        except mysql.connector.Error as e:
+            if e.errno != errorcode.ER_DUP_KEYNAME:  # already migrated
+                raise
+
+    # Generate rows server-side, one million-row block at a time
+    total = _rows()
+    for block in range(0, total, 1_000_000):
+        cursor.execute(f"""
+            INSERT INTO {_SCRATCH_TABLE} (user_id, action_type, post_id, post_url, message, result, created_at)
+            SELECT 1 + n % {_USERS},
+                   ELT(1 + (n DIV 7) % 5, 'comment', 'dm', 'reply', 'post', 'engaged'),
+                   IF((n DIV 7) % 5 = 3, 1 + n % {_POSTS}, NULL),
+                   CONCAT('https://www.linkedin.com/feed/update/urn:li:activity:', 7000000000000000000 + (n * 7919) % {_URLS}),
+                   'synthetic',
+                   IF((n DIV 3) % 10 = 0, 'failure', 'success'),
+                   NOW() - INTERVAL (n % 525600) MINUTE
+            FROM (
+                SELECT {block} + a.d + b.d * 10 + c.d * 100 + d.d * 1000 + e.d * 10000 + f.d * 100000 AS n
+                FROM {_DIGITS} a, {_DIGITS} b, {_DIGITS} c, {_DIGITS} d, {_DIGITS} e, {_DIGITS} f
+            ) seq
+            WHERE n < %s
+        """, (total,))
+        connection.commit()
+    cursor.execute(f"ANALYZE TABLE {_SCRATCH_TABLE}")
+    cursor.fetchall()
+    cursor.close()
+
+    yield connection
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"DROP TABLE IF EXISTS {_SCRATCH_TABLE}")
+    finally:
+        cursor.close()
+        connection.close()
+        db.reset_db_pool()
+
+
+def _migration_statements() -> list[str]:
+    sql = re.sub(r"--[^\n]*", "", _MIGRATION.read_text())
+    return [re.sub(r"\blogs\b", _SCRATCH_TABLE, s.strip()) for s in sql.split(";") if s.strip()]
+
+
+def _capture_sql(func, *args) -> tuple[str, tuple]:
+    """Run a db.py reader against a mock connection and return the SQL it executed."""
+    connection = MagicMock()
+    cursor = connection.cursor.return_value
+    cursor.fetchone.return_value = (0,)
+    cursor.fetchall.return_value = []
+    with patch("cqc_lem.utilities.db.get_db_connection", return_value=connection):
+        func(*args)
+    sql, params = cursor.execute.call_args.args
+    return re.sub(r"\bFROM logs\b", f"FROM {_SCRATCH_TABLE}", sql), tuple(params)
+
+
+def _queries() -> dict:
+    from cqc_lem.utilities import db
+
+    url = _url(42)
+    return {
+        "has_user_commented_on_post_url": _capture_sql(db.has_user_commented_on_post_url, 7, url),
+        "has_engaged_url_with_x_days": _capture_sql(db.has_engaged_url_with_x_days, 7, url, 1),
+        "get_dm_history_for_profile": _capture_sql(db.get_dm_history_for_profile, 7, url),
+        "get_post_url_from_log_for_user": _capture_sql(db.get_post_url_from_log_for_user, 7, 42),
+        "get_post_message_from_log_for_user": _capture_sql(db.get_post_message_from_log_for_user, 7, 42),
+        "get_recent_logs": _capture_sql(db.get_recent_logs, 7, 20),
+    }
+
+
+def _randomize(name: str, params: tuple) -> tuple:
+    """Swap the user/url/post parameters for random synthetic ones, keeping enums and limits."""
+    user_id = random.randint(1, _USERS)
+    if name in ("get_post_url_from_log_for_user", "get_post_message_from_log_for_user"):
+        return (user_id, random.randint(1, _POSTS)) + params[2:]
+    if name == "get_recent_logs":
+        return (user_id,) + params[1:]
+    return (user_id, _url(random.randrange(_URLS))) + params[2:]
+
+
+@pytest.mark.parametrize("name", [
+    "has_user_commented_on_post_url",
+    "has_engaged_url_with_x_days",
+    "get_dm_history_for_profile",
+    "get_post_url_from_log_for_user",
+    "get_post_message_from_log_for_user",
+    "get_recent_logs",
+])
+def test_logs_query_uses_index_and_meets_latency_budget(scratch_logs, name, record_property):
+    sql, params = _queries()[name]
+    cursor = scratch_logs.cursor(dictionary=True)
+    try:
+        cursor.execute(f"EXPLAIN {sql}", params)
+        plan = cursor.fetchall()
+        logs_rows = [row for row in plan if row["table"] == _SCRATCH_TABLE]
+        assert logs_rows, f"{name}: EXPLAIN did not reference {_SCRATCH_TABLE}: {plan}"
+        for row in logs_rows:
+            assert row["type"] != "ALL" and row["key"], f"{name}: full scan — {row}"
+
+        timings = []
+        for _ in range(_SAMPLES):
+            started = time.perf_counter()
+            cursor.execute(sql, _randomize(name, params))
+            cursor.fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+    finally:
+        cursor.close()
+
+    p50 = statistics.median(timings)
+    p99 = statistics.quantiles(timings, n=100)[98]
+    record_property(f"{name}_index", logs_rows[0]["key"])
+    record_property(f"{name}_p50_ms", round(p50, 3))
+    record_property(f"{name}_p99_ms", round(p99, 3))
+    print(f"\n{name}: key={logs_rows[0]['key']} p50={p50:.2f}ms p99={p99:.2f}ms over {_rows()} rows")  # noqa: T201 — summary for -s runs
+
+    assert p99 <= _p99_budget_ms(), f"{name}: p99 {p99:.2f}ms exceeds {_p99_budget_ms()}ms budget"
@@ -0,0 +1,99 @@
+"""Benchmark: per-row insert_planned_post vs. bulk insert_planned_posts / insert_planned_posts_batch.
+
+Runs against a real MySQL with the Flyway schema applied (e.g. the local docker-compose
+stack: ``docker compose up mysql_db flyway``). Skipped automatically when the database is
+unreachable or the ``posts`` table does not exist. Timings are printed for review; the
+assertion only guards against the bulk path regressing to per-row cost.
+
+    poetry run pytest tests/integration/test_planned_post_insert_benchmark.py -m slow -s
+"""
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+import pytest
+
+pytestmark = [pytest.mark.integration, pytest.mark.slow, pytest.mark.requires_database]
+
+_USERS = 10
+_DAYS = 30
+
+
+@pytest.fixture
+def benchmark_user_id():
+    from cqc_lem.utilities import db
+
+    try:
+        connection = db.get_db_connection()
+    except Exception as e:  # unreachable server or MYSQL_* settings missing
+        pytest.skip(f"MySQL not reachable: {e}")
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT id FROM users ORDER BY id LIMIT 1")
+        row = cursor.fetchone()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM posts")
+        max_post_id = cursor.fetchone()[0]
+    except mysql.connector.Error as e:
+        pytest.skip(f"Schema not migrated: {e}")
+    finally:
+        cursor.close()
+        connection.close()
+    if row is None:
+        pytest.skip("No users row to attach benchmark posts to")
+
+    yield row[0]
+
+    # Remove every post created by the benchmark
+    connection = db.get_db_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("DELETE FROM posts WHERE user_id = %s AND id > %s", (row[0], max_post_id))
+        connection.commit()
+    finally:
+        cursor.close()
+        connection.close()
+        db.reset_db_pool()
+
+
+def _plan(start: datetime):
+    from cqc_lem.utilities.db import PostType
+
+    types = [PostType.TEXT, PostType.CAROUSEL, PostType.VIDEO]
+    stages = ["awareness", "consideration", "decision"]
+    return [(start + timedelta(days=day), types[day % 3], stages[day % 3]) for day in range(_DAYS)]
+
+
+def test_bulk_insert_outperforms_per_row(benchmark_user_id):
+    from cqc_lem.utilities.db import (
+        insert_planned_post,
+        insert_planned_posts,
+        insert_planned_posts_batch,
+    )
+
+    start = datetime(2099, 1, 1, 14, 0)
+    # Every "user" maps to the same real user row so FK constraints hold.
+    plans = [_plan(start + timedelta(days=31 * i)) for i in range(_USERS)]
+
+    t0 = time.perf_counter()
+    for rows in plans:
+        for scheduled_time, post_type, stage in rows:
+            assert insert_planned_post(benchmark_user_id, scheduled_time, post_type, stage)
+    per_row = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for rows in plans:
+        assert insert_planned_posts(benchmark_user_id, rows) == _DAYS
+    per_user = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    all_rows = [row for rows in plans for row in rows]
+    assert insert_planned_posts_batch({benchmark_user_id: all_rows}) == _USERS * _DAYS
+    batched = time.perf_counter() - t0
+
+    total = _USERS * _DAYS
+    print(f"\n{total} planned posts | per-row: {per_row * 1000:.1f}ms | "  # noqa: T201 — summary for -s runs
+          f"per-user bulk: {per_user * 1000:.1f}ms | cross-user batch: {batched * 1000:.1f}ms")
+
+    assert per_user < per_row
+    assert batched < per_row
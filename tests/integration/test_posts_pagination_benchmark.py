@@ -0,0 +1,161 @@
+"""Benchmark: OFFSET vs. keyset (cursor) pages of get_posts for a user with 100k posts.
+
+Generates POSTS_BENCH_ROWS (default 100,000) posts server-side for the first users row,
+applies the V35 pagination indexes if the schema predates them, then times a deep page
+fetched by OFFSET against the same page fetched by cursor, plus COUNT(*) against the
+cached status histogram. Timings are printed for review; the assertions only guard
+against the keyset path regressing to OFFSET cost. Skipped automatically when MySQL is
+unreachable or the schema is not migrated.
+
+    poetry run pytest tests/integration/test_posts_pagination_benchmark.py -m slow -s
+"""
+import os
+import re
+import statistics
+import time
+from pathlib import Path
+
+import mysql.connector
+import pytest
+from mysql.connector import errorcode
+
+pytestmark = [pytest.mark.integration, pytest.mark.slow, pytest.mark.requires_database]
+
+_MIGRATION = Path(__file__).resolve().parents[2] / "compose" / "local" / "database" / "migrations" / \
+             "V35__add_posts_pagination_indexes.sql"
+_PAGE_SIZE = 25
+_SAMPLES = 20
+
+_DIGITS = "(SELECT 0 d UNION ALL SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3 UNION ALL SELECT 4 " \
+          "UNION ALL SELECT 5 UNION ALL SELECT 6 UNION ALL SELECT 7 UNION ALL SELECT 8 UNION ALL SELECT 9)"
+
+
+def _rows() -> int:
+    return int(os.getenv("POSTS_BENCH_ROWS", "100000"))
+
+
+@pytest.fixture(scope="module")
+def benchmark_user_id():
+    from cqc_lem.utilities import db
+
+    try:
+        connection = db.get_db_connection()
+    except Exception as e:  # unreachable server or MYSQL_* settings missing
+        pytest.skip(f"MySQL not reachable: {e}")
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT id FROM users ORDER BY id LIMIT 1")
+        row = cursor.fetchone()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM posts")
+        max_post_id = cursor.fetchone()[0]
+    except mysql.connector.Error as e:
+        cursor.close()
+        connection.close()
+        pytest.skip(f"Schema not migrated: {e}")
+    if row is None:
+        cursor.close()
+        connection.close()
+        pytest.skip("No users row to attach benchmark posts to")
+    user_id = row[0]
+
+    for statement in _migration_statements():
+        try:
+            cursor.execute(statement)
+        except mysql.connector.Error as e:
+            if e.errno != errorcode.ER_DUP_KEYNAME:  # already migrated
+                raise
+
+    # Ten posts per scheduled minute so (scheduled_time, id) ties are exercised
+    cursor.execute(f"""
+        INSERT INTO posts (user_id, post_type, content, status, scheduled_time)
+        SELECT %s,
+               ELT(1 + n % 3, 'text', 'carousel', 'video'),
+               'benchmark',
+               ELT(1 + n % 4, 'pending', 'approved', 'posted', 'rejected'),
+               '2099-01-01' + INTERVAL (n DIV 10) MINUTE
+        FROM (
+            SELECT a.d + b.d * 10 + c.d * 100 + d.d * 1000 + e.d * 10000 + f.d * 100000 AS n
+            FROM {_DIGITS} a, {_DIGITS} b, {_DIGITS} c, {_DIGITS} d, {_DIGITS} e, {_DIGITS} f
+        ) seq
+        WHERE n < %s
+    """, (user_id, _rows()))
+    connection.commit()
+    cursor.execute("ANALYZE TABLE posts")
+    cursor.fetchall()
+    cursor.close()
+    connection.close()
+
+    yield user_id
+
+    connection = db.get_db_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute("DELETE FROM posts WHERE user_id = %s AND id > %s", (user_id, max_post_id))
+        connection.commit()
+    finally:
+        cursor.close()
+        connection.close()
+        db.reset_db_pool()
+
+
+def _migration_statements() -> list[str]:
+    sql = re.sub(r"--[^\n]*", "", _MIGRATION.read_text())
+    return [s.strip() for s in sql.split(";") if s.strip()]
+
+
+def _median_ms(func) -> float:
+    timings = []
+    for _ in range(_SAMPLES):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def test_deep_cursor_page_outperforms_offset(benchmark_user_id, record_property):
+    from cqc_lem.utilities import db
+
+    depth = _rows() * 9 // 10
+    offset_page, _ = db.get_posts(benchmark_user_id, limit=_PAGE_SIZE, offset=depth, include_total=False)
+    previous, _ = db.get_posts(benchmark_user_id, limit=1, offset=depth - 1, include_total=False)
+    cursor = db.encode_post_cursor(previous[0])
+    cursor_page, _ = db.get_posts(benchmark_user_id, limit=_PAGE_SIZE, cursor=cursor, include_total=False)
+    assert [p["id"] for p in cursor_page] == [p["id"] for p in offset_page]
+
+    offset_ms = _median_ms(lambda: db.get_posts(benchmark_user_id, limit=_PAGE_SIZE, offset=depth,
+                                                include_total=False))
+    cursor_ms = _median_ms(lambda: db.get_posts(benchmark_user_id, limit=_PAGE_SIZE, cursor=cursor,
+                                                include_total=False))
+
+    record_property("offset_page_ms", round(offset_ms, 3))
+    record_property("cursor_page_ms", round(cursor_ms, 3))
+    print(f"\npage at row {depth} of {_rows()}: OFFSET {offset_ms:.2f}ms | cursor {cursor_ms:.2f}ms")  # noqa: T201 — summary for -s runs
+
+    assert cursor_ms < offset_ms
+
+
+def test_cached_histogram_outperforms_count(benchmark_user_id, record_property):
+    from cqc_lem.utilities import db
+
+    def count_all():
+        connection = db.get_db_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT COUNT(*) FROM posts WHERE user_id = %s", (benchmark_user_id,))
+            return cursor.fetchone()[0]
+        finally:
+            cursor.close()
+            connection.close()
+
+    db.invalidate_post_stats(benchmark_user_id)
+    assert sum(db.get_post_status_counts(benchmark_user_id).values()) == count_all()
+
+    count_ms = _median_ms(count_all)
+    cached_ms = _median_ms(lambda: db.get_post_status_counts(benchmark_user_id))
+
+    record_property("count_ms", round(count_ms, 3))
+    record_property("cached_histogram_ms", round(cached_ms, 3))
+    print(f"\ntotal for {_rows()} posts: COUNT(*) {count_ms:.2f}ms | cached histogram {cached_ms:.4f}ms")  # noqa: T201 — summary for -s runs
+
+    assert cached_ms < count_ms
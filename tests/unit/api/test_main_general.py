@@ -1,12 +1,13 @@
 """Unit tests for general FastAPI endpoints in cqc_lem.api.main."""
 
 import pytest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 from datetime import datetime
 
 pytestmark = pytest.mark.unit
 
 _MAIN = "cqc_lem.api.main"
+_ADB = "cqc_lem.utilities.db_async"
 
 
 @pytest.fixture(scope="module")
@@ -43,18 +44,20 @@ class TestDashboardStats:
         assert resp.status_code == 422
 
     def test_empty_email_returns_400(self, client):
-        with patch(f"{_MAIN}.get_user_id", return_value=None):
+        with patch(f"{_ADB}.get_user_id", return_value=None):
             resp = client.get(self.BASE, params={"email": ""})
         assert resp.status_code == 400
 
     def test_unknown_user_returns_403(self, client):
-        with patch(f"{_MAIN}.get_user_id", return_value=None):
+        with patch(f"{_ADB}.get_user_id", return_value=None):
             resp = client.get(self.BASE, params={"email": "ghost@example.com"})
         assert resp.status_code == 403
 
     def test_known_user_with_no_posts_returns_zeros(self, client):
-        with patch(f"{_MAIN}.get_user_id", return_value=1), \
-             patch(f"{_MAIN}.get_posts", return_value=([], 0)):
+        stats = {"scheduled_this_week": 0, "pending_review": 0, "posted_total": 0, "total": 0,
+                 "by_status": {}, "by_type": {}}
+        with patch(f"{_ADB}.get_user_id", return_value=1), \
+             patch(f"{_ADB}.get_post_dashboard_stats", return_value=stats):
             resp = client.get(self.BASE, params={"email": "user@example.com"})
         assert resp.status_code == 200
         detail = resp.json()["detail"]
@@ -62,34 +65,26 @@ class TestDashboardStats:
         assert detail["pending_review"] == 0
         assert detail["posted_total"] == 0
 
-    def test_start_of_month_does_not_crash(self, client):
-        # Regression: week_start was computed with replace(day=day-weekday()), which
-        # goes out of range in the first days of a month (Wed the 1st → day=-1 → 500).
-        class _FixedDatetime(datetime):
-            @classmethod
-            def now(cls, tz=None):
-                return datetime(2026, 7, 1, tzinfo=tz)  # Wednesday the 1st
-
-        with patch(f"{_MAIN}.get_user_id", return_value=1), \
-             patch(f"{_MAIN}.get_posts", return_value=([], 0)), \
-             patch(f"{_MAIN}.datetime", _FixedDatetime):
-            resp = client.get(self.BASE, params={"email": "user@example.com"})
-        assert resp.status_code == 200
-
-    def test_posted_total_counted_correctly(self, client):
-        from cqc_lem.utilities.db import PostStatus
-        posts = [
-            {"status": PostStatus.POSTED, "scheduled_time": None},
-            {"status": PostStatus.POSTED, "scheduled_time": None},
-            {"status": PostStatus.PENDING, "scheduled_time": None},
-        ]
-        with patch(f"{_MAIN}.get_user_id", return_value=1), \
-             patch(f"{_MAIN}.get_posts", return_value=(posts, 3)):
+    def test_returns_aggregates_from_db(self, client):
+        stats = {"scheduled_this_week": 4, "pending_review": 1, "posted_total": 2, "total": 3,
+                 "by_status": {"posted": 2, "pending": 1}, "by_type": {"text": 3},
+                 "week_start": datetime(2026, 6, 29)}
+        with patch(f"{_ADB}.get_user_id", return_value=1), \
+             patch(f"{_ADB}.get_post_dashboard_stats", return_value=stats) as mock_stats:
             resp = client.get(self.BASE, params={"email": "user@example.com"})
         assert resp.status_code == 200
         detail = resp.json()["detail"]
         assert detail["posted_total"] == 2
         assert detail["pending_review"] == 1
+        assert detail["by_status"] == {"posted": 2, "pending": 1}
+        assert "week_start" not in detail
+        mock_stats.assert_called_once_with(1)
+
+    def test_db_error_returns_500(self, client):
+        with patch(f"{_ADB}.get_user_id", return_value=1), \
+             patch(f"{_ADB}.get_post_dashboard_stats", return_value=None):
+            resp = client.get(self.BASE, params={"email": "user@example.com"})
+        assert resp.status_code == 500
 
 
 # ---------------------------------------------------------------------------
@@ -210,13 +205,13 @@ class TestAuthCheckSession:
     BASE = "/api/auth/session"
 
     def test_invalid_session_token_returns_401(self, client):
-        with patch(f"{_MAIN}.get_session_user_id", return_value=None):
+        with patch(f"{_ADB}.get_session_user_id", return_value=None):
             resp = client.get(self.BASE, params={"session_token": "bad-token"})
         assert resp.status_code == 401
 
     def test_valid_session_returns_user_id_and_email(self, client):
-        with patch(f"{_MAIN}.get_session_user_id", return_value=7), \
-             patch(f"{_MAIN}.get_user_email", return_value="me@example.com"):
+        with patch(f"{_ADB}.get_session_user_id", return_value=7), \
+             patch(f"{_ADB}.get_user_email", return_value="me@example.com"):
             resp = client.get(self.BASE, params={"session_token": "valid-token-abc"})
         assert resp.status_code == 200
         detail = resp.json()["detail"]
@@ -232,7 +227,7 @@ class TestGetUserSettings:
     BASE = "/api/user/settings"
 
     def test_invalid_session_returns_401(self, client):
-        with patch(f"{_MAIN}.get_session_user_id", return_value=None):
+        with patch(f"{_ADB}.get_session_user_id", return_value=None):
             resp = client.get(self.BASE, params={"session_token": "bad-token"})
         assert resp.status_code == 401
 
@@ -245,37 +240,34 @@ class TestGetUserSettings:
             "trial_ends_at": None,
             "stripe_customer_id": "cus_abc",
         }
-        prefs = {
-            "last_login_inactivate_delay": 90,
-            "auto_schedule_posts": False,
-        }
-        with patch(f"{_MAIN}.get_session_user_id", return_value=5), \
-             patch(f"{_MAIN}.get_user_subscription_info", return_value=sub), \
-             patch(f"{_MAIN}.get_user_preferences", return_value=prefs), \
-             patch(f"{_MAIN}.get_user_blog_url", return_value="https://blog.example.com"), \
-             patch(f"{_MAIN}.get_user_sitemap_url", return_value="https://blog.example.com/sitemap.xml"), \
-             patch(f"{_MAIN}.get_company_linked_in_url_for_user", return_value=None):
+        settings = MagicMock(last_login_inactivate_delay=90, auto_schedule_posts=False,
+                             blog_url="https://blog.example.com",
+                             sitemap_url="https://blog.example.com/sitemap.xml",
+                             company_linked_in_url=None)
+        with patch(f"{_ADB}.get_session_user_id", return_value=5), \
+             patch(f"{_ADB}.get_user_subscription_info", return_value=sub), \
+             patch(f"{_ADB}.get_user_settings", return_value=settings):
             resp = client.get(self.BASE, params={"session_token": "valid-tok"})
         assert resp.status_code == 200
         detail = resp.json()["detail"]
         assert detail["subscription"]["status"] == "active"
         assert detail["subscription"]["tier"] == "starter"
         assert detail["preferences"]["last_login_inactivate_delay"] == 90
+        assert detail["preferences"]["auto_schedule_posts"] is False
         assert detail["blog_url"] == "https://blog.example.com"
         assert detail["sitemap_url"] == "https://blog.example.com/sitemap.xml"
 
     def test_none_subscription_returns_null_subscription(self, client):
-        with patch(f"{_MAIN}.get_session_user_id", return_value=5), \
-             patch(f"{_MAIN}.get_user_subscription_info", return_value=None), \
-             patch(f"{_MAIN}.get_user_preferences", return_value=None), \
-             patch(f"{_MAIN}.get_user_blog_url", return_value=None), \
-             patch(f"{_MAIN}.get_user_sitemap_url", return_value=None), \
-             patch(f"{_MAIN}.get_company_linked_in_url_for_user", return_value=None):
+        with patch(f"{_ADB}.get_session_user_id", return_value=5), \
+             patch(f"{_ADB}.get_user_subscription_info", return_value=None), \
+             patch(f"{_ADB}.get_user_settings", return_value=None):
             resp = client.get(self.BASE, params={"session_token": "valid-tok"})
         assert resp.status_code == 200
         detail = resp.json()["detail"]
         assert detail["subscription"] is None
-        assert detail["preferences"] is None
+        # Missing settings row falls back to the get_user_preferences defaults
+        assert detail["preferences"]["auto_schedule_posts"] is True
+        assert detail["blog_url"] is None
 
 
 class TestVerificationPinInbound:
@@ -318,3 +310,22 @@ class TestVerificationPinInbound:
         # Under the public prefix — must not 401/403 even with no auth header.
         resp = client.post(self.BASE, data={"to": "x", "text": "y"})
         assert resp.status_code == 200
+
+
+# ---------------------------------------------------------------------------
+# GET /metrics
+# ---------------------------------------------------------------------------
+
+class TestMetrics:
+    def test_prometheus_text_served_outside_api(self, client):
+        resp = client.get("/metrics")
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/plain")
+        assert "cqc_lem_db_pool_idle" in resp.text
+        assert "cqc_lem_delayed_tasks_pending 0" in resp.text
+
+    def test_requires_metrics_token_when_configured(self, client):
+        with patch(f"{_MAIN}.METRICS_TOKEN", "scrape-me"):
+            assert client.get("/metrics").status_code == 401
+            resp = client.get("/metrics", headers={"Authorization": "Bearer scrape-me"})
+        assert resp.status_code == 200
@@ -11,6 +11,7 @@ from unittest.mock import patch
 pytestmark = pytest.mark.unit
 
 _DB = "cqc_lem.api.main"
+_ADB = "cqc_lem.utilities.db_async"
 
 _SAMPLE_POST = {
     "id": 1,
@@ -59,7 +60,7 @@ def client():
 class TestGetPostsForEmail:
 
     def test_returns_200_with_posts(self, client):
-        with patch(f"{_DB}.get_post_by_email", return_value=([_SAMPLE_POST], 1)):
+        with patch(f"{_ADB}.get_post_by_email", return_value=([_SAMPLE_POST], 1)):
             resp = client.get("/api/posts/", params={"email": "test@example.com"})
         assert resp.status_code == 200
         body = resp.json()
@@ -79,7 +80,7 @@ class TestGetPostsForEmail:
         assert resp.status_code == 422
 
     def test_pagination_params_forwarded(self, client):
-        with patch(f"{_DB}.get_post_by_email", return_value=([], 0)) as mock_get:
+        with patch(f"{_ADB}.get_post_by_email", return_value=([], 0)) as mock_get:
             resp = client.get(
                 "/api/posts/",
                 params={"email": "test@example.com", "page": 2, "page_size": 5},
@@ -95,10 +96,12 @@ class TestGetPostsForEmail:
             offset=5,
             sort_order="asc",
             status_filter=None,
+            cursor=None,
+            include_total=True,
         )
 
     def test_sort_order_desc(self, client):
-        with patch(f"{_DB}.get_post_by_email", return_value=([], 0)) as mock_get:
+        with patch(f"{_ADB}.get_post_by_email", return_value=([], 0)) as mock_get:
             resp = client.get(
                 "/api/posts/",
                 params={"email": "test@example.com", "sort_order": "desc"},
@@ -110,10 +113,12 @@ class TestGetPostsForEmail:
             offset=0,
             sort_order="desc",
             status_filter=None,
+            cursor=None,
+            include_total=True,
         )
 
     def test_status_filter_forwarded(self, client):
-        with patch(f"{_DB}.get_post_by_email", return_value=([_SAMPLE_POST], 1)) as mock_get:
+        with patch(f"{_ADB}.get_post_by_email", return_value=([_SAMPLE_POST], 1)) as mock_get:
             resp = client.get(
                 "/api/posts/",
                 params={"email": "test@example.com", "status_filter": "pending"},
@@ -125,19 +130,42 @@ class TestGetPostsForEmail:
             offset=0,
             sort_order="asc",
             status_filter="pending",
+            cursor=None,
+            include_total=True,
         )
 
+    def test_full_page_returns_next_cursor_that_is_forwarded(self, client):
+        with patch(f"{_ADB}.get_post_by_email", return_value=([_SAMPLE_POST], 40)):
+            resp = client.get("/api/posts/", params={"email": "test@example.com", "page_size": 1})
+        next_cursor = resp.json()["detail"]["next_cursor"]
+        assert next_cursor
+
+        with patch(f"{_ADB}.get_post_by_email", return_value=([], None)) as mock_get:
+            resp = client.get(
+                "/api/posts/",
+                params={"email": "test@example.com", "cursor": next_cursor, "include_total": False},
+            )
+        assert resp.status_code == 200
+        assert resp.json()["detail"]["next_cursor"] is None
+        assert mock_get.call_args.kwargs["cursor"] == next_cursor
+        assert mock_get.call_args.kwargs["include_total"] is False
+
+    def test_malformed_cursor_returns_400(self, client):
+        with patch(f"{_ADB}.get_post_by_email", side_effect=ValueError("Invalid posts cursor")):
+            resp = client.get("/api/posts/", params={"email": "test@example.com", "cursor": "junk"})
+        assert resp.status_code == 400
+
     def test_carousel_slides_json_string_parsed(self, client):
         """carousel_slides stored as a JSON string should be decoded to a list."""
         post_with_slides = dict(_SAMPLE_POST, carousel_slides='["slide1.png", "slide2.png"]')
-        with patch(f"{_DB}.get_post_by_email", return_value=([post_with_slides], 1)):
+        with patch(f"{_ADB}.get_post_by_email", return_value=([post_with_slides], 1)):
             resp = client.get("/api/posts/", params={"email": "test@example.com"})
         assert resp.status_code == 200
         slides = resp.json()["detail"]["posts"][0]["carousel_slides"]
         assert slides == ["slide1.png", "slide2.png"]
 
     def test_empty_posts_list_returns_200(self, client):
-        with patch(f"{_DB}.get_post_by_email", return_value=([], 0)):
+        with patch(f"{_ADB}.get_post_by_email", return_value=([], 0)):
             resp = client.get("/api/posts/", params={"email": "test@example.com"})
         assert resp.status_code == 200
         assert resp.json()["detail"]["total"] == 0
@@ -193,6 +221,27 @@ class TestBulkUpdatePostsEndpoint:
         mock_update.assert_called_once()
 
 
+    def test_retimed_posts_move_their_parked_tasks(self, client):
+        with patch(f"{_DB}.bulk_update_posts", return_value=True), \
+             patch(f"{_DB}.delayed_dispatch.reschedule") as mock_reschedule, \
+             patch(f"{_DB}.delayed_dispatch.cancel") as mock_cancel:
+            client.post(
+                "/api/posts/bulk_update/",
+                json={"post_ids": [4, 5], "scheduled_datetime": "2024-07-01T09:00:00"},
+            )
+        assert [c.args[0] for c in mock_reschedule.call_args_list] == ["post:4", "post:5"]
+        mock_cancel.assert_not_called()
+
+    def test_unscheduled_posts_cancel_their_parked_tasks(self, client):
+        with patch(f"{_DB}.bulk_update_posts", return_value=True), \
+             patch(f"{_DB}.delayed_dispatch.cancel") as mock_cancel:
+            client.post(
+                "/api/posts/bulk_update/",
+                json={"post_ids": [3], "status": "pending"},
+            )
+        mock_cancel.assert_called_once_with("post:3")
+
+
 # ---------------------------------------------------------------------------
 # DELETE /api/posts/
 # ---------------------------------------------------------------------------
@@ -226,6 +275,12 @@ class TestDeletePostsEndpoint:
             )
         assert resp.status_code == 405
 
+    def test_deleted_posts_cancel_their_parked_tasks(self, client):
+        with patch(f"{_DB}.soft_delete_posts", return_value=True), \
+             patch(f"{_DB}.delayed_dispatch.cancel") as mock_cancel:
+            client.request("DELETE", "/api/posts/", json={"post_ids": [7, 8]})
+        assert [c.args[0] for c in mock_cancel.call_args_list] == ["post:7", "post:8"]
+
     def test_calls_soft_delete_with_correct_ids(self, client):
         with patch(f"{_DB}.soft_delete_posts", return_value=True) as mock_delete:
             client.request(
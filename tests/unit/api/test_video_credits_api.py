@@ -30,13 +30,13 @@ def client():
 
 class TestBalance:
     def test_401(self, client):
-        with patch("cqc_lem.api.main.get_session_user_id", return_value=None):
+        with patch("cqc_lem.utilities.db_async.get_session_user_id", return_value=None):
             r = client.get("/api/video/credits", params={"session_token": "x"})
         assert r.status_code == 401
 
     def test_200(self, client):
-        with patch("cqc_lem.api.main.get_session_user_id", return_value=1), \
-             patch("cqc_lem.api.main.get_video_credit_balance", return_value=12):
+        with patch("cqc_lem.utilities.db_async.get_session_user_id", return_value=1), \
+             patch("cqc_lem.utilities.db_async.get_video_credit_balance", return_value=12):
             r = client.get("/api/video/credits", params={"session_token": "x"})
         assert r.status_code == 200 and r.json()["detail"]["balance"] == 12
 
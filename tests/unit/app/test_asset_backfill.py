@@ -61,7 +61,7 @@ class TestBackfillTask:
                 (5, 1, 'carousel', 'awareness', 't'),
                 (4, 1, 'text', 'awareness', 't')]
         vid, car = MagicMock(), MagicMock()
-        with patch("cqc_lem.utilities.db.get_unposted_posts_missing_assets", return_value=rows), \
+        with patch("cqc_lem.utilities.db.iter_unposted_posts_missing_assets", return_value=iter(rows)), \
              patch("cqc_lem.app.run_content_plan.regenerate_post_video_task", vid), \
              patch("cqc_lem.app.run_content_plan.regenerate_post_carousel_task", car):
             from cqc_lem.app.run_scheduler import auto_backfill_missing_assets
@@ -71,6 +71,6 @@ class TestBackfillTask:
         assert "Queued 2" in result
 
     def test_no_missing_posts(self):
-        with patch("cqc_lem.utilities.db.get_unposted_posts_missing_assets", return_value=[]):
+        with patch("cqc_lem.utilities.db.iter_unposted_posts_missing_assets", return_value=iter([])):
             from cqc_lem.app.run_scheduler import auto_backfill_missing_assets
             assert "Queued 0" in auto_backfill_missing_assets()
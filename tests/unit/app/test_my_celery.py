@@ -1,8 +1,10 @@
 """Unit tests for cqc_lem.app.my_celery CloudWatch guard logic."""
 
-import pytest
 from unittest.mock import MagicMock, patch
 
+import pytest
+from kombu import Queue
+
 pytestmark = pytest.mark.unit
 
 _MOD = "cqc_lem.app.my_celery"
@@ -65,14 +67,16 @@ class TestGetQueueMetric:
 
 
 # ---------------------------------------------------------------------------
-# update_queue_length_metric
+# sample_queue_depths
 # ---------------------------------------------------------------------------
 
-class TestUpdateQueueLengthMetric:
-    def _make_celery_app_mock(self, queue_len: int = 5) -> MagicMock:
+class TestSampleQueueDepths:
+    _QUEUES = (Queue("celery"), Queue("selenium"))
+
+    def _make_celery_app_mock(self, lengths: list) -> MagicMock:
         """Return a mock Celery app whose pool.acquire() context manager yields a Redis client."""
         redis_client = MagicMock()
-        redis_client.llen.return_value = queue_len
+        redis_client.pipeline.return_value.execute.return_value = lengths
 
         channel = MagicMock()
         channel.client = redis_client
@@ -88,44 +92,67 @@ class TestUpdateQueueLengthMetric:
         app_mock.pool = pool
         return app_mock
 
-    def test_skips_cloudwatch_when_aws_region_is_none(self):
-        """No CloudWatch call when AWS_REGION is None — no region error spammed in logs."""
-        app_mock = self._make_celery_app_mock(queue_len=2)
-
-        with patch(f"{_MOD}.AWS_REGION", None), \
-             patch(f"{_MOD}.app", app_mock), \
-             patch(f"{_MOD}.get_cloudwatch_client") as mock_cw:
-            from cqc_lem.app.my_celery import update_queue_length_metric
-
-            result = update_queue_length_metric(sender=MagicMock())
-
-        assert result == 2
+    def test_every_queue_read_in_one_pipeline(self):
+        """Both broker queues are measured with a single pipelined round trip."""
+        app_mock = self._make_celery_app_mock([4, 1])
+
+        with patch(f"{_MOD}.app", app_mock), \
+             patch(f"{_MOD}.celeryconfig.task_queues", self._QUEUES), \
+             patch(f"{_MOD}.broker_url", "redis://redis:6379/0"), \
+             patch(f"{_MOD}.get_delayed_dispatch_stats", return_value={"pending": 9}):
+            from cqc_lem.app.my_celery import sample_queue_depths
+
+            sample = sample_queue_depths()
+
+        assert sample == {"celery": {"QueueLength": 4}, "selenium": {"QueueLength": 1},
+                          "delayed": {"DelayedTasks": 9}}
+        redis = app_mock.pool.acquire.return_value.__enter__.return_value.default_channel.client
+        redis.pipeline.return_value.execute.assert_called_once()
+
+    def test_worker_state_counted_per_queue(self):
+        """Reserved, ETA and active requests are attributed to the queue they came from."""
+        def _request(queue, eta=None):
+            return MagicMock(delivery_info={"routing_key": queue}, eta=eta)
+
+        reserved = {_request("celery"), _request("celery", eta="2026-10-18T12:00:00"), _request("selenium")}
+        active = {_request("selenium")}
+
+        with patch(f"{_MOD}.celeryconfig.task_queues", self._QUEUES), \
+             patch(f"{_MOD}.get_delayed_dispatch_stats") as mock_delayed, \
+             patch("celery.worker.state.reserved_requests", reserved), \
+             patch("celery.worker.state.active_requests", active):
+            from cqc_lem.app.my_celery import sample_worker_state
+
+            sample = sample_worker_state()
+
+        # Only this worker's own state: broker lengths and the delayed backlog come from beat
+        assert sample == {"celery": {"ReservedTasks": 1, "EtaTasks": 1, "ActiveTasks": 0},
+                          "selenium": {"ReservedTasks": 1, "EtaTasks": 0, "ActiveTasks": 1}}
+        mock_delayed.assert_not_called()
+
+    def test_worker_publishes_under_its_hostname_and_beat_publishes_the_broker(self):
+        """Each worker's series carries a Worker dimension; QueueLength is beat's alone."""
+        import cqc_lem.app.my_celery as my_celery
+
+        with patch(f"{_MOD}._queue_sampler", None), \
+             patch(f"{_MOD}.queue_metrics.QueueSampler") as mock_sampler:
+            my_celery.start_worker_queue_sampler(sender=MagicMock(hostname="llm-worker@ip-10-0-1-7"))
+            my_celery._queue_sampler = None
+            my_celery.start_beat_queue_sampler()
+
+        worker_call, beat_call = mock_sampler.call_args_list
+        assert worker_call.args == (my_celery.sample_worker_state,)
+        assert worker_call.kwargs["dimensions"] == {"Worker": "llm-worker@ip-10-0-1-7"}
+        assert beat_call.args == (my_celery.sample_queue_depths,)
+        assert beat_call.kwargs["dimensions"] is None
+
+    def test_task_signals_no_longer_touch_the_broker(self):
+        """Sending a task must not trigger a queue read or a CloudWatch call."""
+        from celery.signals import task_sent
+
+        import cqc_lem.app.my_celery as my_celery
+
+        assert not hasattr(my_celery, "update_queue_length_metric")
+        with patch(f"{_MOD}.get_cloudwatch_client") as mock_cw:
+            task_sent.send(sender="cqc_lem.app.run_scheduler.post_to_linkedin")
         mock_cw.assert_not_called()
-
-    def test_publishes_metric_when_aws_region_is_set(self):
-        """Metric is published to CloudWatch when AWS_REGION is configured."""
-        app_mock = self._make_celery_app_mock(queue_len=7)
-        mock_cw_client = MagicMock()
-
-        with patch(f"{_MOD}.AWS_REGION", "us-east-1"), \
-             patch(f"{_MOD}.app", app_mock), \
-             patch(f"{_MOD}.get_cloudwatch_client", return_value=mock_cw_client):
-            from cqc_lem.app.my_celery import update_queue_length_metric
-
-            result = update_queue_length_metric(sender=MagicMock())
-
-        assert result == 7
-        mock_cw_client.put_metric_data.assert_called_once()
-
-    def test_logs_error_but_does_not_raise_on_cloudwatch_failure(self):
-        """CloudWatch errors are caught and logged; the function still returns total_tasks."""
-        app_mock = self._make_celery_app_mock(queue_len=3)
-
-        with patch(f"{_MOD}.AWS_REGION", "us-east-1"), \
-             patch(f"{_MOD}.app", app_mock), \
-             patch(f"{_MOD}.get_cloudwatch_client", side_effect=Exception("timeout")):
-            from cqc_lem.app.my_celery import update_queue_length_metric
-
-            result = update_queue_length_metric(sender=MagicMock())
-
-        assert result == 3
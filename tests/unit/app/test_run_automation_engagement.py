@@ -0,0 +1,55 @@
+"""Unit tests for the looping engagement tasks running through EngagementSession."""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+_MOD = "cqc_lem.app.run_automation"
+
+
+class TestEngagementLoops:
+    def test_stale_continuation_exits_before_opening_a_browser(self):
+        with patch(f"{_MOD}.EngagementSession.open", return_value=None), \
+             patch(f"{_MOD}.get_current_profile") as mock_profile:
+            from cqc_lem.app.run_automation import automate_commenting
+
+            result = automate_commenting.run(user_id=1, loop_for_duration=600, session="sess-1")
+
+        assert "continues elsewhere" in result
+        mock_profile.assert_not_called()
+
+    def test_passes_share_one_browser_session(self):
+        driver, wait, profile = MagicMock(), MagicMock(), MagicMock()
+        session = MagicMock()
+        session.run.side_effect = lambda iteration, next_wait=None: [iteration(), iteration()][-1]
+        with patch(f"{_MOD}.EngagementSession.open", return_value=session) as mock_open, \
+             patch(f"{_MOD}.get_current_profile", return_value=(driver, wait, "a@b.c", profile)) as mock_profile, \
+             patch(f"{_MOD}._engage_recent_profile_viewers", return_value="done") as mock_pass, \
+             patch(f"{_MOD}.quit_gracefully") as mock_quit:
+            from cqc_lem.app.run_automation import automate_profile_viewer_engagement
+
+            assert automate_profile_viewer_engagement.run(user_id=1, loop_for_duration=600) == "done"
+
+        assert mock_open.call_args.args[1:] == ("profile_viewers", {
+            'user_id': 1, 'loop_for_duration': 600, 'future_forward': 60, 'session': None})
+        assert mock_pass.call_count == 2
+        mock_profile.assert_called_once()
+        mock_quit.assert_called_once_with(driver)
+
+    @pytest.mark.parametrize("step, remaining, expected_step, wait", [
+        (0, 86000, 1, 300),
+        (5, 86000, 5, 3600),
+        (0, 600, 0, 0),
+        (2, 600, 2, 600),
+    ])
+    def test_reply_backoff(self, step, remaining, expected_step, wait):
+        from cqc_lem.app.run_automation import _reply_comment_backoff
+
+        session = MagicMock()
+        session.kwargs = {'future_forward': step}
+        session.remaining.return_value = remaining
+
+        assert _reply_comment_backoff(session) == wait
+        assert session.kwargs['future_forward'] == expected_step
@@ -12,93 +12,140 @@ class _MondayDatetime(_real_datetime):
 
 
 class TestAutoCreateWeeklyContent:
-    """Tests for auto_create_weekly_content — verifies None/empty guards and content-None skip."""
+    """Tests for auto_create_weekly_content — verifies empty-stream guard and the per-post fan-out."""
 
     @pytest.fixture(autouse=True)
     def pin_to_weekday(self, monkeypatch):
         """Pin datetime.now() to a Monday so tests are day-of-week agnostic.
 
-        Without this, tests that only mock get_planned_posts_for_current_week fail on
-        weekends (weekday >= 5) because the production code calls the next-week variant
-        instead, which hits an unmocked DB call in CI.
+        Without this, the production code streams next week's plan (weekday >= 5) on
+        weekends, and assertions on the week requested would depend on the CI clock.
         """
         monkeypatch.setattr('cqc_lem.app.run_content_plan.datetime', _MondayDatetime)
 
-    @patch('cqc_lem.app.run_content_plan.get_planned_posts_for_next_week', return_value=None)
-    @patch('cqc_lem.app.run_content_plan.get_planned_posts_for_current_week', return_value=None)
-    def test_does_not_crash_when_planned_posts_is_none(self, mock_current, mock_next):
+    @staticmethod
+    def _planned(user_id, post_id, post_type='text', stage='awareness'):
+        from cqc_lem.utilities.db import PlannedPost
+        return iter([PlannedPost(user_id, post_id, post_type, stage)])
+
+    @patch('cqc_lem.app.run_content_plan.chord')
+    @patch('cqc_lem.app.run_content_plan.iter_planned_posts', return_value=iter([]))
+    def test_does_not_crash_when_no_posts_are_planned(self, mock_planned, mock_chord):
         from cqc_lem.app.run_content_plan import auto_create_weekly_content
-        # Should not raise TypeError: 'NoneType' is not iterable
         auto_create_weekly_content(user_id=1)
+        mock_planned.assert_called_once_with(next_week=False, user_id=1)
+        mock_chord.assert_not_called()
+
+    @patch('cqc_lem.app.run_content_plan.iter_planned_posts', return_value=iter([]))
+    def test_streams_next_week_on_weekends(self, mock_planned, monkeypatch):
+        class _Saturday(_real_datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return _real_datetime(2024, 1, 13, 12, 0)
 
-    @patch('cqc_lem.app.run_content_plan.get_planned_posts_for_current_week', return_value=[])
-    def test_does_not_crash_when_planned_posts_is_empty(self, mock_current):
+        monkeypatch.setattr('cqc_lem.app.run_content_plan.datetime', _Saturday)
         from cqc_lem.app.run_content_plan import auto_create_weekly_content
-        auto_create_weekly_content(user_id=1)
+        auto_create_weekly_content()
+        mock_planned.assert_called_once_with(next_week=True, user_id=None)
+
+    @patch('cqc_lem.app.run_content_plan.create_content')
+    @patch('cqc_lem.app.run_content_plan.chord')
+    @patch('cqc_lem.app.run_content_plan.iter_planned_posts')
+    def test_one_task_per_post_in_a_chord(self, mock_planned, mock_chord, mock_create):
+        from cqc_lem.app.run_content_plan import auto_create_weekly_content
+        from cqc_lem.utilities.db import PlannedPost
+        mock_planned.return_value = iter([PlannedPost(1, 42, 'text', 'awareness'),
+                                          PlannedPost(2, 43, 'video', 'decision')])
+        auto_create_weekly_content()
+
+        header = mock_chord.call_args.args[0]
+        assert [sig.task for sig in header] == ['cqc_lem.app.run_content_plan.create_weekly_post'] * 2
+        assert header[1].args == (43, 2, 'video', 'decision')
+        callback = mock_chord.return_value.call_args.args[0]
+        assert callback.task == 'cqc_lem.app.run_content_plan.report_weekly_content'
+        mock_create.assert_not_called()  # content is created by the fanned-out tasks
+
+
+class TestCreateWeeklyPost:
+    """Tests for create_weekly_post — one planned post's content, status and outcome."""
+
+    @pytest.fixture(autouse=True)
+    def free_providers(self):
+        with patch('cqc_lem.app.run_content_plan.acquire_provider_slots', return_value=None), \
+             patch('cqc_lem.app.run_content_plan.release_provider_slots') as mock_release:
+            yield mock_release
 
     @patch('cqc_lem.app.run_content_plan.update_db_post_status')
     @patch('cqc_lem.app.run_content_plan.update_db_post_content')
     @patch('cqc_lem.app.run_content_plan.create_content', return_value=(None, None))
-    @patch('cqc_lem.app.run_content_plan.get_planned_posts_for_current_week')
-    def test_skips_post_when_content_is_none(
-        self, mock_current, mock_create, mock_update_content, mock_update_status
-    ):
-        from cqc_lem.app.run_content_plan import auto_create_weekly_content
-        mock_current.return_value = [
-            {'user_id': 1, 'id': 42, 'post_type': 'text', 'buyer_stage': 'awareness'}
-        ]
-        auto_create_weekly_content(user_id=1)
+    def test_skips_post_when_content_is_none(self, mock_create, mock_update_content, mock_update_status):
+        from cqc_lem.app.run_content_plan import create_weekly_post
+        assert create_weekly_post(42, 1, 'text', 'awareness')['status'] == 'skipped'
         mock_update_content.assert_not_called()
         mock_update_status.assert_not_called()
 
-    @patch('cqc_lem.app.run_content_plan.get_user_preferences', return_value={'auto_schedule_posts': 0})
-    @patch('cqc_lem.app.run_content_plan.update_db_post_status')
-    @patch('cqc_lem.app.run_content_plan.update_db_post_content')
-    @patch('cqc_lem.app.run_content_plan.create_content', return_value=('Great post content', None))
-    @patch('cqc_lem.app.run_content_plan.get_planned_posts_for_current_week')
-    def test_updates_db_when_content_is_valid(
-        self, mock_current, mock_create, mock_update_content, mock_update_status, mock_prefs
-    ):
-        from cqc_lem.app.run_content_plan import auto_create_weekly_content
-        mock_current.return_value = [
-            {'user_id': 1, 'id': 42, 'post_type': 'text', 'buyer_stage': 'awareness'}
-        ]
-        auto_create_weekly_content(user_id=1)
-        mock_update_content.assert_called_once_with(42, 'Great post content')
-        mock_update_status.assert_called_once()
+    @patch('cqc_lem.app.run_content_plan.create_content', side_effect=RuntimeError("LLM down"))
+    def test_failure_is_reported_not_raised(self, mock_create, free_providers):
+        from cqc_lem.app.run_content_plan import create_weekly_post
+        result = create_weekly_post(42, 1, 'video', 'awareness')
+        assert result['status'] == 'failed' and result['post_id'] == 42
+        assert free_providers.call_args.args[0] == ('llm', 'flux', 'runway')
 
     @patch('cqc_lem.app.run_content_plan.get_user_preferences', return_value={'auto_schedule_posts': 0})
     @patch('cqc_lem.app.run_content_plan.update_db_post_status')
     @patch('cqc_lem.app.run_content_plan.update_db_post_content')
     @patch('cqc_lem.app.run_content_plan.create_content', return_value=('Auto-off content', None))
-    @patch('cqc_lem.app.run_content_plan.get_planned_posts_for_current_week')
     def test_status_is_pending_when_auto_schedule_off(
-        self, mock_current, mock_create, mock_update_content, mock_update_status, mock_prefs
+        self, mock_create, mock_update_content, mock_update_status, mock_prefs
     ):
-        from cqc_lem.app.run_content_plan import auto_create_weekly_content
+        from cqc_lem.app.run_content_plan import create_weekly_post
         from cqc_lem.utilities.db import PostStatus
-        mock_current.return_value = [
-            {'user_id': 1, 'id': 55, 'post_type': 'text', 'buyer_stage': 'awareness'}
-        ]
-        auto_create_weekly_content(user_id=1)
+        assert create_weekly_post(55, 1, 'text', 'awareness')['status'] == 'pending'
+        mock_update_content.assert_called_once_with(55, 'Auto-off content')
         mock_update_status.assert_called_once_with(55, PostStatus.PENDING)
 
     @patch('cqc_lem.app.run_content_plan.get_user_preferences', return_value={'auto_schedule_posts': 1})
     @patch('cqc_lem.app.run_content_plan.update_db_post_status')
     @patch('cqc_lem.app.run_content_plan.update_db_post_content')
     @patch('cqc_lem.app.run_content_plan.create_content', return_value=('Auto-on content', None))
-    @patch('cqc_lem.app.run_content_plan.get_planned_posts_for_current_week')
     def test_status_is_approved_when_auto_schedule_on(
-        self, mock_current, mock_create, mock_update_content, mock_update_status, mock_prefs
+        self, mock_create, mock_update_content, mock_update_status, mock_prefs
     ):
-        from cqc_lem.app.run_content_plan import auto_create_weekly_content
+        from cqc_lem.app.run_content_plan import create_weekly_post
         from cqc_lem.utilities.db import PostStatus
-        mock_current.return_value = [
-            {'user_id': 2, 'id': 77, 'post_type': 'text', 'buyer_stage': 'decision'}
-        ]
-        auto_create_weekly_content(user_id=2)
+        assert create_weekly_post(77, 2, 'text', 'decision')['status'] == 'approved'
         mock_update_status.assert_called_once_with(77, PostStatus.APPROVED)
 
+    @patch('cqc_lem.app.run_content_plan.create_content')
+    def test_retries_while_provider_is_full(self, mock_create):
+        from celery.exceptions import Retry
+
+        from cqc_lem.app.run_content_plan import create_weekly_post
+        with patch('cqc_lem.app.run_content_plan.acquire_provider_slots', return_value='runway'), \
+             patch.object(create_weekly_post, 'retry', side_effect=Retry()) as mock_retry, \
+             pytest.raises(Retry):
+            create_weekly_post(42, 1, 'video', 'awareness')
+        mock_create.assert_not_called()
+        mock_retry.assert_called_once_with(countdown=60.0, max_retries=None)
+
+
+class TestReportWeeklyContent:
+    @patch('cqc_lem.app.run_content_plan.track_task')
+    def test_summarises_outcomes_and_wall_time(self, mock_track):
+        import time
+
+        from cqc_lem.app.run_content_plan import report_weekly_content
+        results = [{'post_id': 1, 'user_id': 1, 'status': 'approved', 'seconds': 3.0},
+                   {'post_id': 2, 'user_id': 1, 'status': 'failed', 'seconds': 90.0},
+                   {'post_id': 3, 'user_id': 2, 'status': 'pending', 'seconds': 5.0}]
+        summary = report_weekly_content(results, started_at=time.time() - 120)
+
+        assert (summary['posts'], summary['approved'], summary['pending'], summary['failed']) == (3, 1, 1, 1)
+        assert summary['wall_seconds'] >= 120
+        assert summary['slowest_post_seconds'] == 90.0
+        assert mock_track.call_args.kwargs['success'] is False
+        assert mock_track.call_args.kwargs['duration_ms'] >= 120000
+
 
 # ---------------------------------------------------------------------------
 # Helper function tests
@@ -241,8 +288,8 @@ class TestProcessSelectedPost:
 # ---------------------------------------------------------------------------
 
 class TestSaveContentPlan:
-    @patch("cqc_lem.app.run_content_plan.insert_planned_post", return_value=True)
-    def test_inserts_each_plan_entry(self, mock_insert):
+    @patch("cqc_lem.app.run_content_plan.insert_planned_posts", return_value=3)
+    def test_inserts_whole_plan_in_one_call(self, mock_insert):
         from cqc_lem.app.run_content_plan import save_content_plan
         from datetime import datetime
         daily_plan = [
@@ -251,15 +298,16 @@ class TestSaveContentPlan:
             {"scheduled_datetime": datetime(2024, 6, 3, 9, 0), "post_type": "video", "stage": "decision"},
         ]
         save_content_plan(user_id=1, daily_plan=daily_plan)
-        assert mock_insert.call_count == 3
+        mock_insert.assert_called_once()
+        assert len(mock_insert.call_args.args[1]) == 3
 
-    @patch("cqc_lem.app.run_content_plan.insert_planned_post", return_value=True)
+    @patch("cqc_lem.app.run_content_plan.insert_planned_posts", return_value=0)
     def test_empty_plan_inserts_nothing(self, mock_insert):
         from cqc_lem.app.run_content_plan import save_content_plan
         save_content_plan(user_id=1, daily_plan=[])
         mock_insert.assert_not_called()
 
-    @patch("cqc_lem.app.run_content_plan.insert_planned_post", return_value=True)
+    @patch("cqc_lem.app.run_content_plan.insert_planned_posts", return_value=1)
     def test_correct_post_type_conversion(self, mock_insert):
         from cqc_lem.app.run_content_plan import save_content_plan
         from cqc_lem.utilities.db import PostType
@@ -270,7 +318,7 @@ class TestSaveContentPlan:
         save_content_plan(user_id=5, daily_plan=daily_plan)
         call_args = mock_insert.call_args
         assert call_args.args[0] == 5
-        assert call_args.args[2] == PostType.CAROUSEL
+        assert call_args.args[1] == [(datetime(2024, 6, 1, 9, 0), PostType.CAROUSEL, "awareness")]
 
 
 # ---------------------------------------------------------------------------
@@ -316,24 +364,137 @@ class TestCreateContent:
         assert video_url is None
 
 
+class TestProfileForPost:
+    @patch("cqc_lem.app.run_automation.update_stale_profile")
+    @patch("cqc_lem.app.run_content_plan.load_profile_for_user")
+    def test_uses_the_cached_profile(self, mock_load, mock_refresh):
+        from cqc_lem.app.run_content_plan import _profile_for_post
+        assert _profile_for_post(1) is mock_load.return_value
+        mock_refresh.apply_async.assert_not_called()
+
+    @patch("cqc_lem.app.run_automation.update_stale_profile")
+    @patch("cqc_lem.app.run_content_plan.load_profile_for_user", return_value=None)
+    def test_uncached_profile_queues_a_refresh_instead_of_opening_a_browser(self, mock_load, mock_refresh):
+        from cqc_lem.app.run_content_plan import _profile_for_post
+        with patch("cqc_lem.utilities.selenium_util.get_driver_wait_pair") as mock_driver:
+            profile = _profile_for_post(1)
+        assert profile.full_name == "John Doe"
+        mock_refresh.apply_async.assert_called_once_with(kwargs={'user_id': 1})
+        mock_driver.assert_not_called()
+
+    @patch("cqc_lem.app.run_automation.update_stale_profile")
+    @patch("cqc_lem.app.run_content_plan.load_profile_for_user", return_value=None)
+    def test_placeholder_profile_when_the_refresh_cannot_be_queued(self, mock_load, mock_refresh):
+        from cqc_lem.app.run_content_plan import _profile_for_post
+        mock_refresh.apply_async.side_effect = ConnectionError("broker down")
+        assert _profile_for_post(1).full_name == "John Doe"
+
+
 # ---------------------------------------------------------------------------
 # auto_generate_content tests
 # ---------------------------------------------------------------------------
 
 class TestAutoGenerateContent:
-    @patch("cqc_lem.app.run_content_plan.plan_content_for_user")
-    @patch("cqc_lem.app.run_content_plan.get_active_user_ids", return_value=[1, 2, 3])
-    def test_queues_task_for_each_active_user(self, mock_ids, mock_plan):
+    _PLAN = [{"scheduled_datetime": __import__("datetime").datetime(2024, 6, 1, 9, 0),
+              "post_type": "text", "stage": "awareness"}]
+
+    @patch("cqc_lem.app.run_content_plan.insert_planned_posts_batch", return_value=3)
+    @patch("cqc_lem.app.run_content_plan.build_content_plans")
+    @patch("cqc_lem.app.run_content_plan.iter_active_users", return_value=[{"id": 1}, {"id": 2}, {"id": 3}])
+    def test_persists_every_user_plan_in_one_batch(self, mock_ids, mock_build, mock_batch):
+        from cqc_lem.app.run_content_plan import auto_generate_content
+        mock_build.return_value = {1: self._PLAN, 2: self._PLAN, 3: self._PLAN}
+        auto_generate_content()
+        mock_build.assert_called_once_with([1, 2, 3])
+        mock_batch.assert_called_once()
+        assert set(mock_batch.call_args.args[0]) == {1, 2, 3}
+
+    @patch("cqc_lem.app.run_content_plan.insert_planned_posts_batch", return_value=1)
+    @patch("cqc_lem.app.run_content_plan.build_content_plans")
+    @patch("cqc_lem.app.run_content_plan.iter_active_users", return_value=[{"id": 1}, {"id": 2}, {"id": 3}])
+    def test_skips_users_with_no_plan(self, mock_ids, mock_build, mock_batch):
         from cqc_lem.app.run_content_plan import auto_generate_content
+        mock_build.return_value = {1: [], 3: self._PLAN}  # user 2 failed to plan
         auto_generate_content()
-        assert mock_plan.apply_async.call_count == 3
+        assert list(mock_batch.call_args.args[0]) == [3]
 
-    @patch("cqc_lem.app.run_content_plan.plan_content_for_user")
-    @patch("cqc_lem.app.run_content_plan.get_active_user_ids", return_value=[])
-    def test_no_active_users_does_not_queue(self, mock_ids, mock_plan):
+    @patch("cqc_lem.app.run_content_plan._PLAN_FLUSH_USERS", 2)
+    @patch("cqc_lem.app.run_content_plan.insert_planned_posts_batch", return_value=1)
+    @patch("cqc_lem.app.run_content_plan.build_content_plans")
+    @patch("cqc_lem.app.run_content_plan.iter_active_users", return_value=[{"id": 1}, {"id": 2}, {"id": 3}])
+    def test_flushes_in_user_batches(self, mock_ids, mock_build, mock_batch):
         from cqc_lem.app.run_content_plan import auto_generate_content
+        mock_build.side_effect = lambda ids: {user_id: self._PLAN for user_id in ids}
         auto_generate_content()
-        mock_plan.apply_async.assert_not_called()
+        assert [c.args[0] for c in mock_build.call_args_list] == [[1, 2], [3]]
+        assert [set(c.args[0]) for c in mock_batch.call_args_list] == [{1, 2}, {3}]
+
+    @patch("cqc_lem.app.run_content_plan.insert_planned_posts_batch")
+    @patch("cqc_lem.app.run_content_plan.build_content_plans")
+    @patch("cqc_lem.app.run_content_plan.iter_active_users", return_value=[])
+    def test_no_active_users_writes_nothing(self, mock_ids, mock_build, mock_batch):
+        from cqc_lem.app.run_content_plan import auto_generate_content
+        auto_generate_content()
+        mock_build.assert_not_called()
+        mock_batch.assert_not_called()
+
+
+class TestBatchPlanner:
+    _NOW = __import__("datetime").datetime(2024, 6, 10, 12, 0)  # June: 30 days
+
+    @pytest.mark.parametrize("counts,target,expected", [
+        ({}, 21, {"carousel": 7, "text": 7, "video": 7}),
+        ({"carousel": 5, "text": 1, "video": 3}, 20, {"carousel": 6, "text": 7, "video": 7}),
+        ({"carousel": 0, "text": 0, "video": 0}, 22, {"carousel": 8, "text": 7, "video": 7}),
+        ({"text": 9}, 2, {"carousel": 1, "text": 0, "video": 1}),
+    ])
+    def test_apportionment(self, counts, target, expected):
+        from cqc_lem.app.run_content_plan import apportion_post_types
+        assert apportion_post_types(counts, target) == expected
+
+    def test_plan_runs_to_the_end_of_the_month_in_local_time(self):
+        import pytz
+
+        from cqc_lem.app.run_content_plan import plan_posts
+        plan = plan_posts({"text": 3}, None, pytz.timezone("America/New_York"), now=self._NOW)
+
+        assert len(plan) == 20  # June 11 .. June 30
+        assert plan[0]["scheduled_datetime"] == __import__("datetime").datetime(2024, 6, 11, 13, 0)  # Tue 9am EDT
+        assert sorted(p["post_type"] for p in plan).count("text") == 6
+        assert {p["stage"] for p in plan} == {"awareness", "consideration", "decision"}
+
+    def test_skips_users_planned_more_than_30_days_out(self):
+        from datetime import timedelta
+
+        from cqc_lem.app.run_content_plan import plan_posts
+        assert plan_posts({}, self._NOW + timedelta(days=40), now=self._NOW) == []
+
+    @patch("cqc_lem.app.run_content_plan.get_user_timezone", return_value="UTC")
+    @patch("cqc_lem.app.run_content_plan.get_last_planned_post_dates")
+    @patch("cqc_lem.app.run_content_plan.get_post_type_counts_for_users")
+    def test_grouped_queries_once_per_batch(self, mock_counts, mock_last, mock_tz):
+        from datetime import timedelta
+
+        from cqc_lem.app.run_content_plan import build_content_plans
+        mock_counts.return_value = {1: {"video": 4}}
+        mock_last.return_value = {2: self._NOW + timedelta(days=45)}
+        plans = build_content_plans([1, 2, 3], now=self._NOW)
+
+        mock_counts.assert_called_once_with([1, 2, 3])
+        mock_last.assert_called_once_with([1, 2, 3])
+        assert len(plans[1]) == len(plans[3]) == 20
+        assert plans[2] == []
+        assert [p["post_type"] for p in plans[1]].count("video") == 6
+
+    @patch("cqc_lem.app.run_content_plan.insert_planned_posts_batch")
+    @patch("cqc_lem.app.run_content_plan.get_last_planned_post_dates", return_value=None)
+    @patch("cqc_lem.app.run_content_plan.get_post_type_counts_for_users", return_value={})
+    def test_batch_skipped_when_planned_posts_cannot_be_read(self, mock_counts, mock_last, mock_insert):
+        from cqc_lem.app.run_content_plan import _plan_and_save, build_content_plans
+
+        assert build_content_plans([1, 2], now=self._NOW) is None
+        assert _plan_and_save([1, 2]) == (0, 0)
+        mock_insert.assert_not_called()
 
 
 # ---------------------------------------------------------------------------
@@ -12,7 +12,7 @@ pytestmark = pytest.mark.unit
 
 _MOD = "cqc_lem.app.run_scheduler"
 
-_PATCH_GET_USERS_STRIPE = f"{_MOD}.get_users_with_stripe_subscriptions"
+_PATCH_ITER_USERS_STRIPE = f"{_MOD}.iter_users_with_stripe_subscriptions"
 _PATCH_UPDATE_SUB = f"{_MOD}.update_subscription_from_stripe"
 # sync_stripe_subscriptions imports these lazily inside the function body, so
 # we must patch at the source module, not at run_scheduler.
@@ -20,9 +20,9 @@ _PATCH_FETCH_SUB = "cqc_lem.utilities.stripe_util.fetch_subscription"
 _PATCH_GET_TIER = "cqc_lem.utilities.stripe_util.get_subscription_tier_from_price"
 _PATCH_STATUS_TO_DB = "cqc_lem.utilities.stripe_util.stripe_status_to_db"
 _PATCH_GET_ACTIVE = f"{_MOD}.get_active_user_ids"
-_PATCH_GET_POSTS = f"{_MOD}.get_ready_to_post_posts"
+_PATCH_ITER_ACTIVE = f"{_MOD}.iter_active_user_ids"
+_PATCH_GET_POSTS = f"{_MOD}.claim_ready_to_post_posts"
 _PATCH_GET_ORPHANED = f"{_MOD}.get_orphaned_scheduled_posts"
-_PATCH_UPDATE_POST_STATUS = f"{_MOD}.update_db_post_status"
 _PATCH_POST_TO_LINKEDIN = f"{_MOD}.post_to_linkedin"
 _PATCH_APPRECIATE = f"{_MOD}.automate_appreciation_dms_for_user"
 _PATCH_CLEAN_INVITES = f"{_MOD}.clean_stale_invites"
@@ -35,6 +35,12 @@ _PATCH_AUTOMATE_PROFILE_VIEWER = f"{_MOD}.automate_profile_viewer_engagement"
 # Helpers
 # ---------------------------------------------------------------------------
 
+def _subscribers(rows: list[dict]):
+    """Stream rows the way iter_users_with_stripe_subscriptions yields them."""
+    from cqc_lem.utilities.db import StripeSubscriber
+    return iter([StripeSubscriber(**row) for row in rows])
+
+
 def _async_task_mock() -> MagicMock:
     """Return a MagicMock with an apply_async attribute."""
     m = MagicMock()
@@ -50,7 +56,7 @@ class TestSyncStripeSubscriptions:
     """Tests for the sync_stripe_subscriptions Celery task."""
 
     def test_no_subscribers_returns_early_without_fetching(self):
-        with patch(_PATCH_GET_USERS_STRIPE, return_value=[]) as mock_get, \
+        with patch(_PATCH_ITER_USERS_STRIPE, return_value=iter([])) as mock_get, \
              patch(_PATCH_FETCH_SUB) as mock_fetch:
             from cqc_lem.app.run_scheduler import sync_stripe_subscriptions
             sync_stripe_subscriptions.run()
@@ -75,7 +81,7 @@ class TestSyncStripeSubscriptions:
 
         # fetch_subscription / stripe_status_to_db / get_subscription_tier_from_price are
         # imported inside sync_stripe_subscriptions's function body — patch at source module.
-        with patch(_PATCH_GET_USERS_STRIPE, return_value=[row]), \
+        with patch(_PATCH_ITER_USERS_STRIPE, return_value=_subscribers([row])), \
              patch(_PATCH_FETCH_SUB, return_value=sub), \
              patch(_PATCH_STATUS_TO_DB, return_value="active"), \
              patch(_PATCH_GET_TIER, return_value="starter"), \
@@ -100,7 +106,7 @@ class TestSyncStripeSubscriptions:
             "current_period_end": 1700000000,
         }
 
-        with patch(_PATCH_GET_USERS_STRIPE, return_value=[row]), \
+        with patch(_PATCH_ITER_USERS_STRIPE, return_value=_subscribers([row])), \
              patch(_PATCH_FETCH_SUB, return_value=sub), \
              patch(_PATCH_STATUS_TO_DB, return_value="past_due"), \
              patch(_PATCH_GET_TIER, return_value="starter"), \
@@ -128,7 +134,7 @@ class TestSyncStripeSubscriptions:
             "current_period_end": 1700000000,
         }
 
-        with patch(_PATCH_GET_USERS_STRIPE, return_value=[row]), \
+        with patch(_PATCH_ITER_USERS_STRIPE, return_value=_subscribers([row])), \
              patch(_PATCH_FETCH_SUB, return_value=sub), \
              patch(_PATCH_STATUS_TO_DB, return_value="active"), \
              patch(_PATCH_GET_TIER, return_value="professional"), \
@@ -148,7 +154,7 @@ class TestSyncStripeSubscriptions:
             "subscription_tier": "starter",
         }
 
-        with patch(_PATCH_GET_USERS_STRIPE, return_value=[row]), \
+        with patch(_PATCH_ITER_USERS_STRIPE, return_value=_subscribers([row])), \
              patch(_PATCH_FETCH_SUB, return_value=None), \
              patch(_PATCH_UPDATE_SUB) as mock_update:
             from cqc_lem.app.run_scheduler import sync_stripe_subscriptions
@@ -166,7 +172,7 @@ class TestSyncStripeSubscriptions:
             "subscription_tier": None,
         }
 
-        with patch(_PATCH_GET_USERS_STRIPE, return_value=[row]), \
+        with patch(_PATCH_ITER_USERS_STRIPE, return_value=_subscribers([row])), \
              patch(_PATCH_FETCH_SUB) as mock_fetch, \
              patch(_PATCH_UPDATE_SUB) as mock_update:
             from cqc_lem.app.run_scheduler import sync_stripe_subscriptions
@@ -199,7 +205,7 @@ class TestSyncStripeSubscriptions:
             "current_period_end": 1700000000,
         }
 
-        with patch(_PATCH_GET_USERS_STRIPE, return_value=rows), \
+        with patch(_PATCH_ITER_USERS_STRIPE, return_value=_subscribers(rows)), \
              patch(_PATCH_FETCH_SUB, return_value=sub), \
              patch(_PATCH_STATUS_TO_DB, return_value="past_due"), \
              patch(_PATCH_GET_TIER, return_value="starter"), \
@@ -232,21 +238,17 @@ class TestAutoCheckScheduledPosts:
         mock_commenting_task = _async_task_mock()
         mock_profile_task = _async_task_mock()
 
-        with patch(_PATCH_GET_POSTS, return_value=posts), \
+        with patch(_PATCH_GET_POSTS, return_value=posts) as mock_claim, \
              patch(_PATCH_GET_ACTIVE, return_value=[7]), \
              patch(_PATCH_GET_ORPHANED, return_value=[]), \
-             patch(_PATCH_UPDATE_POST_STATUS) as mock_upd, \
              patch(_PATCH_POST_TO_LINKEDIN, mock_post_task), \
              patch(_PATCH_AUTOMATE_COMMENTING, mock_commenting_task), \
              patch(_PATCH_AUTOMATE_PROFILE_VIEWER, mock_profile_task):
             from cqc_lem.app.run_scheduler import auto_check_scheduled_posts
             result = auto_check_scheduled_posts.run()
 
-        # post status updated to SCHEDULED
-        mock_upd.assert_called_once()
-        status_arg = mock_upd.call_args[0][1]
-        from cqc_lem.utilities.db import PostStatus
-        assert status_arg == PostStatus.SCHEDULED
+        # a short batch means nothing else is due: one claim transaction per sweep
+        mock_claim.assert_called_once()
 
         # post_to_linkedin.apply_async called with correct kwargs
         mock_post_task.apply_async.assert_called_once()
@@ -275,7 +277,6 @@ class TestAutoCheckScheduledPosts:
         with patch(_PATCH_GET_POSTS, return_value=posts), \
              patch(_PATCH_GET_ACTIVE, return_value=[7, 8, 9]), \
              patch(_PATCH_GET_ORPHANED, return_value=[]), \
-             patch(_PATCH_UPDATE_POST_STATUS), \
              patch(_PATCH_POST_TO_LINKEDIN, mock_post_task), \
              patch(_PATCH_AUTOMATE_COMMENTING, mock_commenting_task), \
              patch(_PATCH_AUTOMATE_PROFILE_VIEWER, mock_profile_task):
@@ -285,6 +286,27 @@ class TestAutoCheckScheduledPosts:
         assert "3 post" in result
         assert mock_post_task.apply_async.call_count == 3
 
+    def test_full_batches_are_claimed_until_a_short_one(self):
+        scheduled_dt = datetime(2025, 6, 20, 14, 0, 0, tzinfo=timezone.utc)
+        batches = [[(1, scheduled_dt, 7), (2, scheduled_dt, 7)], [(3, scheduled_dt, 7)]]
+
+        mock_post_task = _async_task_mock()
+
+        with patch(f"{_MOD}.CQC_LEM_POST_CLAIM_BATCH", 2), \
+             patch(_PATCH_GET_POSTS, side_effect=batches) as mock_claim, \
+             patch(_PATCH_GET_ACTIVE, return_value=[]), \
+             patch(_PATCH_GET_ORPHANED, return_value=[]), \
+             patch(_PATCH_POST_TO_LINKEDIN, mock_post_task), \
+             patch(_PATCH_AUTOMATE_COMMENTING, _async_task_mock()), \
+             patch(_PATCH_AUTOMATE_PROFILE_VIEWER, _async_task_mock()):
+            from cqc_lem.app.run_scheduler import auto_check_scheduled_posts
+            result = auto_check_scheduled_posts.run()
+
+        assert mock_claim.call_count == 2
+        assert mock_claim.call_args.kwargs["limit"] == 2
+        assert mock_post_task.apply_async.call_count == 3
+        assert "3 post" in result
+
     def test_naive_scheduled_time_gets_utc_tzinfo(self):
         """A naive datetime returned from MySQL is treated as UTC before becoming the eta."""
         naive_dt = datetime(2025, 6, 20, 14, 0, 0)  # no tzinfo — simulates MySQL read
@@ -298,7 +320,6 @@ class TestAutoCheckScheduledPosts:
         with patch(_PATCH_GET_POSTS, return_value=posts), \
              patch(_PATCH_GET_ACTIVE, return_value=[10]), \
              patch(_PATCH_GET_ORPHANED, return_value=[]), \
-             patch(_PATCH_UPDATE_POST_STATUS), \
              patch(_PATCH_POST_TO_LINKEDIN, mock_post_task), \
              patch(_PATCH_AUTOMATE_COMMENTING, mock_commenting_task), \
              patch(_PATCH_AUTOMATE_PROFILE_VIEWER, mock_profile_task):
@@ -309,8 +330,8 @@ class TestAutoCheckScheduledPosts:
         assert eta.tzinfo is not None, "eta must be timezone-aware"
         assert eta == expected_eta
 
-    def test_update_db_post_status_called_before_apply_async(self):
-        """Status must be set to SCHEDULED before dispatching the Celery task."""
+    def test_posts_claimed_before_apply_async(self):
+        """Posts must be claimed (status SCHEDULED) before dispatching the Celery task."""
         call_order = []
         scheduled_dt = datetime(2025, 6, 20, 14, 0, 0, tzinfo=timezone.utc)
         posts = [(99, scheduled_dt, 5)]
@@ -319,25 +340,25 @@ class TestAutoCheckScheduledPosts:
         mock_commenting_task = _async_task_mock()
         mock_profile_task = _async_task_mock()
 
-        def record_update(*args, **kwargs):
-            call_order.append("update_status")
+        def record_claim(*args, **kwargs):
+            call_order.append("claim")
+            return posts
 
         def record_apply(*args, **kwargs):
             call_order.append("apply_async")
 
         mock_post_task.apply_async.side_effect = record_apply
 
-        with patch(_PATCH_GET_POSTS, return_value=posts), \
+        with patch(_PATCH_GET_POSTS, side_effect=record_claim), \
              patch(_PATCH_GET_ACTIVE, return_value=[5]), \
              patch(_PATCH_GET_ORPHANED, return_value=[]), \
-             patch(_PATCH_UPDATE_POST_STATUS, side_effect=record_update), \
              patch(_PATCH_POST_TO_LINKEDIN, mock_post_task), \
              patch(_PATCH_AUTOMATE_COMMENTING, mock_commenting_task), \
              patch(_PATCH_AUTOMATE_PROFILE_VIEWER, mock_profile_task):
             from cqc_lem.app.run_scheduler import auto_check_scheduled_posts
             auto_check_scheduled_posts.run()
 
-        assert call_order[0] == "update_status"
+        assert call_order[0] == "claim"
         assert "apply_async" in call_order
 
     def test_inactive_user_pre_post_tasks_skipped(self):
@@ -352,7 +373,6 @@ class TestAutoCheckScheduledPosts:
         with patch(_PATCH_GET_POSTS, return_value=posts), \
              patch(_PATCH_GET_ACTIVE, return_value=[60]), \
              patch(_PATCH_GET_ORPHANED, return_value=[]), \
-             patch(_PATCH_UPDATE_POST_STATUS), \
              patch(_PATCH_POST_TO_LINKEDIN, mock_post_task), \
              patch(_PATCH_AUTOMATE_COMMENTING, mock_commenting_task), \
              patch(_PATCH_AUTOMATE_PROFILE_VIEWER, mock_profile_task):
@@ -373,7 +393,6 @@ class TestAutoCheckScheduledPosts:
         with patch(_PATCH_GET_POSTS, return_value=posts), \
              patch(_PATCH_GET_ACTIVE, return_value=[]), \
              patch(_PATCH_GET_ORPHANED, return_value=[]), \
-             patch(_PATCH_UPDATE_POST_STATUS), \
              patch(_PATCH_POST_TO_LINKEDIN, mock_post_task), \
              patch(_PATCH_AUTOMATE_COMMENTING, _async_task_mock()), \
              patch(_PATCH_AUTOMATE_PROFILE_VIEWER, _async_task_mock()):
@@ -399,7 +418,6 @@ class TestAutoCheckScheduledPosts:
         with patch(_PATCH_GET_POSTS, return_value=posts), \
              patch(_PATCH_GET_ACTIVE, return_value=[60]), \
              patch(_PATCH_GET_ORPHANED, return_value=[]), \
-             patch(_PATCH_UPDATE_POST_STATUS), \
              patch(_PATCH_POST_TO_LINKEDIN, mock_post_task), \
              patch(_PATCH_AUTOMATE_COMMENTING, mock_commenting_task), \
              patch(_PATCH_AUTOMATE_PROFILE_VIEWER, mock_profile_task):
@@ -466,7 +484,6 @@ class TestAutoCheckScheduledPosts:
         with patch(_PATCH_GET_POSTS, return_value=new_posts), \
              patch(_PATCH_GET_ACTIVE, return_value=[7]), \
              patch(_PATCH_GET_ORPHANED, return_value=orphaned), \
-             patch(_PATCH_UPDATE_POST_STATUS), \
              patch(_PATCH_POST_TO_LINKEDIN, mock_post_task), \
              patch(_PATCH_AUTOMATE_COMMENTING, mock_commenting_task), \
              patch(_PATCH_AUTOMATE_PROFILE_VIEWER, mock_profile_task):
@@ -478,13 +495,88 @@ class TestAutoCheckScheduledPosts:
         assert "1 orphaned" in result
 
 
+class TestDelayedDispatch:
+    """Post and pre-post tasks parked in the Redis sorted set instead of Celery ETAs."""
+
+    def test_tasks_parked_under_the_post_instead_of_eta(self):
+        scheduled_dt = datetime(2025, 6, 20, 14, 0, 0, tzinfo=timezone.utc)
+        mock_post_task = _async_task_mock()
+        mock_post_task.name = "cqc_lem.app.run_automation.post_to_linkedin"
+        mock_commenting_task = _async_task_mock()
+        mock_commenting_task.name = "cqc_lem.app.run_automation.automate_commenting"
+        mock_profile_task = _async_task_mock()
+
+        with patch(_PATCH_GET_POSTS, return_value=[(42, scheduled_dt, 7)]), \
+             patch(_PATCH_GET_ACTIVE, return_value=[7]), \
+             patch(_PATCH_GET_ORPHANED, return_value=[]), \
+             patch(f"{_MOD}.delayed_dispatch.schedule", return_value=True) as mock_schedule, \
+             patch(_PATCH_POST_TO_LINKEDIN, mock_post_task), \
+             patch(_PATCH_AUTOMATE_COMMENTING, mock_commenting_task), \
+             patch(_PATCH_AUTOMATE_PROFILE_VIEWER, mock_profile_task):
+            from cqc_lem.app.run_scheduler import auto_check_scheduled_posts
+            auto_check_scheduled_posts.run()
+
+        mock_post_task.apply_async.assert_not_called()
+        mock_commenting_task.apply_async.assert_not_called()
+        assert mock_schedule.call_count == 3
+        post_call, comment_call, _ = mock_schedule.call_args_list
+        assert post_call.args == ("cqc_lem.app.run_automation.post_to_linkedin",
+                                  {"user_id": 7, "post_id": 42}, scheduled_dt)
+        assert post_call.kwargs == {"key": "post:42", "anchor": scheduled_dt}
+        assert comment_call.args[2] == datetime(2025, 6, 20, 13, 45, 0, tzinfo=timezone.utc)
+
+    def test_orphan_with_parked_tasks_is_not_requeued(self):
+        from cqc_lem.utilities.delayed_dispatch import DelayedJob
+
+        orphaned = [(1485, datetime(2026, 6, 19, 19, 45, 0), 60), (1486, datetime(2026, 6, 19, 19, 45, 0), 61)]
+        parked = {"post:1485": [DelayedJob("post:1485:post", "post", {}, 0.0, "post:1485", 0.0)]}
+        mock_post_task = _async_task_mock()
+
+        with patch(_PATCH_GET_POSTS, return_value=[]), \
+             patch(_PATCH_GET_ORPHANED, return_value=orphaned), \
+             patch(f"{_MOD}.delayed_dispatch.pending", side_effect=lambda key: parked.get(key, [])), \
+             patch(_PATCH_POST_TO_LINKEDIN, mock_post_task):
+            from cqc_lem.app.run_scheduler import auto_check_scheduled_posts
+            auto_check_scheduled_posts.run()
+
+        mock_post_task.apply_async.assert_called_once_with(kwargs={"user_id": 61, "post_id": 1486})
+
+    def test_dispatcher_sends_through_registered_task(self):
+        from cqc_lem.app.run_scheduler import _send_delayed_task, dispatch_delayed_tasks
+
+        registered = _async_task_mock()
+        with patch.dict(f"{_MOD}.shared_task.tasks", {"cqc_lem.x": registered}), \
+             patch(f"{_MOD}.shared_task.send_task") as mock_send_task:
+            _send_delayed_task("cqc_lem.x", {"post_id": 1})
+            _send_delayed_task("cqc_lem.unknown", {"post_id": 2})
+
+        registered.apply_async.assert_called_once_with(kwargs={"post_id": 1})
+        mock_send_task.assert_called_once_with("cqc_lem.unknown", kwargs={"post_id": 2})
+
+        with patch(f"{_MOD}.delayed_dispatch.dispatch_due",
+                   return_value={"dispatched": 2, "failed": 0, "max_lateness": 3.0}) as mock_dispatch:
+            assert dispatch_delayed_tasks.run()["dispatched"] == 2
+        mock_dispatch.assert_called_once_with(_send_delayed_task)
+
+    def test_lock_reaper_checks_task_states_through_the_result_backend(self):
+        from cqc_lem.app.run_scheduler import reap_once_locks
+
+        with patch(f"{_MOD}.once_locks.reap_stale", return_value={"reaped": 1, "expired": 0}) as mock_reap, \
+             patch(f"{_MOD}.shared_task.AsyncResult") as mock_result, \
+             patch(f"{_MOD}.log_warning"):
+            assert reap_once_locks.run() == {"reaped": 1, "expired": 0}
+            mock_result.return_value.state = "SUCCESS"
+            assert mock_reap.call_args.args[0]("task-1") == "SUCCESS"
+        mock_result.assert_called_once_with("task-1")
+
+
 # ---------------------------------------------------------------------------
 # auto_appreciate_dms
 # ---------------------------------------------------------------------------
 
 class TestAutoAppreciateDms:
     def test_no_users_returns_no_active_users(self):
-        with patch(_PATCH_GET_ACTIVE, return_value=[]):
+        with patch(_PATCH_ITER_ACTIVE, return_value=[]):
             from cqc_lem.app.run_scheduler import auto_appreciate_dms
             result = auto_appreciate_dms.run()
 
@@ -493,7 +585,7 @@ class TestAutoAppreciateDms:
     def test_one_user_calls_apply_async_with_correct_kwargs(self):
         mock_task = _async_task_mock()
 
-        with patch(_PATCH_GET_ACTIVE, return_value=[42]), \
+        with patch(_PATCH_ITER_ACTIVE, return_value=[42]), \
              patch(_PATCH_APPRECIATE, mock_task):
             from cqc_lem.app.run_scheduler import auto_appreciate_dms
             result = auto_appreciate_dms.run()
@@ -508,7 +600,7 @@ class TestAutoAppreciateDms:
         mock_task = _async_task_mock()
         users = [1, 2, 3]
 
-        with patch(_PATCH_GET_ACTIVE, return_value=users), \
+        with patch(_PATCH_ITER_ACTIVE, return_value=users), \
              patch(_PATCH_APPRECIATE, mock_task):
             from cqc_lem.app.run_scheduler import auto_appreciate_dms
             result = auto_appreciate_dms.run()
@@ -519,7 +611,7 @@ class TestAutoAppreciateDms:
     def test_apply_async_includes_retry_policy(self):
         mock_task = _async_task_mock()
 
-        with patch(_PATCH_GET_ACTIVE, return_value=[10]), \
+        with patch(_PATCH_ITER_ACTIVE, return_value=[10]), \
              patch(_PATCH_APPRECIATE, mock_task):
             from cqc_lem.app.run_scheduler import auto_appreciate_dms
             auto_appreciate_dms.run()
@@ -536,7 +628,7 @@ class TestAutoAppreciateDms:
 
 class TestAutoCleanStaleInvites:
     def test_no_users_returns_no_active_users(self):
-        with patch(_PATCH_GET_ACTIVE, return_value=[]):
+        with patch(_PATCH_ITER_ACTIVE, return_value=[]):
             from cqc_lem.app.run_scheduler import auto_clean_stale_invites
             result = auto_clean_stale_invites.run()
 
@@ -545,7 +637,7 @@ class TestAutoCleanStaleInvites:
     def test_one_user_calls_clean_stale_invites_apply_async(self):
         mock_task = _async_task_mock()
 
-        with patch(_PATCH_GET_ACTIVE, return_value=[7]), \
+        with patch(_PATCH_ITER_ACTIVE, return_value=[7]), \
              patch(_PATCH_CLEAN_INVITES, mock_task):
             from cqc_lem.app.run_scheduler import auto_clean_stale_invites
             result = auto_clean_stale_invites.run()
@@ -559,7 +651,7 @@ class TestAutoCleanStaleInvites:
         mock_task = _async_task_mock()
         users = [1, 2, 3, 4]
 
-        with patch(_PATCH_GET_ACTIVE, return_value=users), \
+        with patch(_PATCH_ITER_ACTIVE, return_value=users), \
              patch(_PATCH_CLEAN_INVITES, mock_task):
             from cqc_lem.app.run_scheduler import auto_clean_stale_invites
             result = auto_clean_stale_invites.run()
@@ -570,7 +662,7 @@ class TestAutoCleanStaleInvites:
     def test_apply_async_includes_retry_policy(self):
         mock_task = _async_task_mock()
 
-        with patch(_PATCH_GET_ACTIVE, return_value=[5]), \
+        with patch(_PATCH_ITER_ACTIVE, return_value=[5]), \
              patch(_PATCH_CLEAN_INVITES, mock_task):
             from cqc_lem.app.run_scheduler import auto_clean_stale_invites
             auto_clean_stale_invites.run()
@@ -586,7 +678,7 @@ class TestAutoCleanStaleInvites:
 
 class TestAutoCleanStaleProfiles:
     def test_no_users_returns_no_active_users(self):
-        with patch(_PATCH_GET_ACTIVE, return_value=[]):
+        with patch(_PATCH_ITER_ACTIVE, return_value=[]):
             from cqc_lem.app.run_scheduler import auto_clean_stale_profiles
             result = auto_clean_stale_profiles.run()
 
@@ -595,7 +687,7 @@ class TestAutoCleanStaleProfiles:
     def test_one_user_calls_update_stale_profile_apply_async(self):
         mock_task = _async_task_mock()
 
-        with patch(_PATCH_GET_ACTIVE, return_value=[15]), \
+        with patch(_PATCH_ITER_ACTIVE, return_value=[15]), \
              patch(_PATCH_UPDATE_STALE, mock_task):
             from cqc_lem.app.run_scheduler import auto_clean_stale_profiles
             result = auto_clean_stale_profiles.run()
@@ -609,7 +701,7 @@ class TestAutoCleanStaleProfiles:
         mock_task = _async_task_mock()
         users = [10, 20, 30]
 
-        with patch(_PATCH_GET_ACTIVE, return_value=users), \
+        with patch(_PATCH_ITER_ACTIVE, return_value=users), \
              patch(_PATCH_UPDATE_STALE, mock_task):
             from cqc_lem.app.run_scheduler import auto_clean_stale_profiles
             result = auto_clean_stale_profiles.run()
@@ -620,7 +712,7 @@ class TestAutoCleanStaleProfiles:
     def test_apply_async_includes_retry_policy(self):
         mock_task = _async_task_mock()
 
-        with patch(_PATCH_GET_ACTIVE, return_value=[99]), \
+        with patch(_PATCH_ITER_ACTIVE, return_value=[99]), \
              patch(_PATCH_UPDATE_STALE, mock_task):
             from cqc_lem.app.run_scheduler import auto_clean_stale_profiles
             auto_clean_stale_profiles.run()
@@ -640,14 +732,14 @@ _PATCH_AUTOMATE_INVITES = f"{_MOD}.automate_invites_to_company_page_for_user"
 
 class TestAutoInviteToCompanyPages:
     def test_no_active_users_returns_no_active_users(self):
-        with patch(_PATCH_GET_ACTIVE, return_value=[]):
+        with patch(_PATCH_ITER_ACTIVE, return_value=[]):
             from cqc_lem.app.run_scheduler import auto_invite_to_company_pages
             result = auto_invite_to_company_pages.run()
         assert result == "No Active Users"
 
     def test_single_user_calls_apply_async_with_user_id(self):
         mock_task = _async_task_mock()
-        with patch(_PATCH_GET_ACTIVE, return_value=[7]), \
+        with patch(_PATCH_ITER_ACTIVE, return_value=[7]), \
              patch(_PATCH_AUTOMATE_INVITES, mock_task):
             from cqc_lem.app.run_scheduler import auto_invite_to_company_pages
             result = auto_invite_to_company_pages.run()
@@ -659,7 +751,7 @@ class TestAutoInviteToCompanyPages:
 
     def test_multiple_users_calls_apply_async_for_each(self):
         mock_task = _async_task_mock()
-        with patch(_PATCH_GET_ACTIVE, return_value=[1, 2, 3]), \
+        with patch(_PATCH_ITER_ACTIVE, return_value=[1, 2, 3]), \
              patch(_PATCH_AUTOMATE_INVITES, mock_task):
             from cqc_lem.app.run_scheduler import auto_invite_to_company_pages
             result = auto_invite_to_company_pages.run()
@@ -669,7 +761,7 @@ class TestAutoInviteToCompanyPages:
 
     def test_apply_async_includes_retry_policy_with_max_retries_3(self):
         mock_task = _async_task_mock()
-        with patch(_PATCH_GET_ACTIVE, return_value=[99]), \
+        with patch(_PATCH_ITER_ACTIVE, return_value=[99]), \
              patch(_PATCH_AUTOMATE_INVITES, mock_task):
             from cqc_lem.app.run_scheduler import auto_invite_to_company_pages
             auto_invite_to_company_pages.run()
@@ -786,11 +878,10 @@ class TestAutoInviteToCompanyPages:
     """auto_invite_to_company_pages must only invite users who have a company page set."""
 
     def test_only_users_with_company_page_are_invited(self):
-        with patch(f"{_MOD}.get_active_user_ids", return_value=[1, 2, 3]), \
-             patch(f"{_MOD}.get_company_linked_in_url_for_user",
-                   side_effect=lambda uid: {1: "https://www.linkedin.com/company/a/",
-                                            2: None,
-                                            3: "https://www.linkedin.com/company/c/"}.get(uid)), \
+        users = [{"id": 1, "company_linked_in_url": "https://www.linkedin.com/company/a/"},
+                 {"id": 2, "company_linked_in_url": None},
+                 {"id": 3, "company_linked_in_url": "https://www.linkedin.com/company/c/"}]
+        with patch(f"{_MOD}.iter_active_users", return_value=iter(users)) as mock_iter, \
              patch(f"{_MOD}.automate_invites_to_company_page_for_user") as mock_task:
             from cqc_lem.app.run_scheduler import auto_invite_to_company_pages
             result = auto_invite_to_company_pages()
@@ -800,12 +891,26 @@ class TestAutoInviteToCompanyPages:
         invited = {c.kwargs["kwargs"]["user_id"] for c in mock_task.apply_async.call_args_list}
         assert invited == {1, 3}
         assert "2 user(s)" in result
+        # One streamed read instead of a company-page lookup per user
+        mock_iter.assert_called_once_with(columns=("company_linked_in_url",))
 
     def test_no_company_pages_returns_early(self):
-        with patch(f"{_MOD}.get_active_user_ids", return_value=[1, 2]), \
-             patch(f"{_MOD}.get_company_linked_in_url_for_user", return_value=None), \
+        users = [{"id": 1, "company_linked_in_url": None}, {"id": 2, "company_linked_in_url": ""}]
+        with patch(f"{_MOD}.iter_active_users", return_value=iter(users)), \
              patch(f"{_MOD}.automate_invites_to_company_page_for_user") as mock_task:
             from cqc_lem.app.run_scheduler import auto_invite_to_company_pages
             result = auto_invite_to_company_pages()
         mock_task.apply_async.assert_not_called()
         assert "No active users with a company page" in result
+
+
+@pytest.mark.unit
+class TestAutoReconcileCreditBalances:
+    def test_reconciles_both_ledgers_and_reports_drift(self):
+        with patch(f"{_MOD}.reconcile_credit_balances",
+                   side_effect=lambda kind: {7: (1, 2)} if kind == "video" else {}) as mock_reconcile:
+            from cqc_lem.app.run_scheduler import auto_reconcile_credit_balances
+            result = auto_reconcile_credit_balances()
+
+        assert [c.args[0] for c in mock_reconcile.call_args_list] == ["avatar", "video"]
+        assert result == "Reconciled 1 credit balance(s)"
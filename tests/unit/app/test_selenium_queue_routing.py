@@ -11,6 +11,7 @@ import pytest
 pytestmark = pytest.mark.unit
 
 SELENIUM_TASKS = [
+    "comment_on_post",
     "automate_commenting",
     "automate_reply_commenting",
     "automate_appreciation_dms_for_user",
@@ -69,3 +70,41 @@ def test_celeryconfig_task_routes_cover_all_selenium_tasks():
         assert routes[full_name].get("queue") == "selenium", (
             f"{full_name} task_routes entry must map to queue='selenium'"
         )
+
+
+def test_routing_table_targets_declared_queues():
+    """Every route points at a queue in QUEUE_TOPOLOGY, and no task is routed twice."""
+    from cqc_lem.app import celeryconfig
+    routed = [name for names in celeryconfig.TASK_QUEUE_ROUTES.values() for name in names]
+    assert set(celeryconfig.TASK_QUEUE_ROUTES) <= set(celeryconfig.QUEUE_TOPOLOGY)
+    assert len(routed) == len(set(routed))
+    assert celeryconfig.task_routes["cqc_lem.app.run_automation.post_to_linkedin"] == {"queue": "publish"}
+    assert list(celeryconfig.QUEUE_TOPOLOGY)[0] == "publish"
+    assert celeryconfig.broker_transport_options["queue_order_strategy"] == "priority"
+
+
+def test_routes_agree_with_task_decorators():
+    """A task that declares queue= on its decorator is routed to the same queue."""
+    from cqc_lem.app import celeryconfig
+    from cqc_lem.app.my_celery import app
+    for task_name, route in celeryconfig.task_routes.items():
+        task = app.tasks.get(task_name)
+        assert task is not None, f"{task_name} is routed but not registered"
+        if getattr(task, "queue", None):
+            assert task.queue == route["queue"], task_name
+
+
+@pytest.mark.parametrize("queues,expected", [
+    ("publish", ["--pool=threads", "--concurrency=4", "--queues=publish"]),
+    ("media", ["--pool=prefork", "--concurrency=2", "--queues=media"]),
+    ("publish, llm", ["--pool=threads", "--concurrency=8", "--queues=publish,llm"]),
+    ("celery,maintenance", ["--pool=prefork", "--concurrency=2", "--queues=celery,maintenance"]),
+    # llm's thread count is not a process count once a prefork queue joins it
+    ("celery,llm,media,maintenance",
+     ["--pool=prefork", "--concurrency=2", "--queues=celery,llm,media,maintenance"]),
+])
+def test_worker_options_follow_the_topology(queues, expected, monkeypatch):
+    from cqc_lem.app.celeryconfig import worker_options
+    monkeypatch.delenv("CELERY_WORKER_POOL", raising=False)
+    monkeypatch.delenv("CELERY_WORKER_CONCURRENCY", raising=False)
+    assert worker_options(queues) == expected
@@ -20,8 +20,8 @@ class TestPremiumTier:
 class TestGenerateVideoSrc:
     def test_premium_no_credits_falls_back_to_standard(self):
         with patch("cqc_lem.utilities.db.get_post_video_quality", return_value="premium"), \
-             patch("cqc_lem.utilities.db.get_video_credit_balance", return_value=0), \
-             patch("cqc_lem.utilities.db.deduct_video_credits") as ded, \
+             patch("cqc_lem.utilities.db.get_video_credit_balance") as bal, \
+             patch("cqc_lem.utilities.db.deduct_video_credits", return_value=False) as ded, \
              patch("cqc_lem.utilities.db.get_active_avatar", return_value=None), \
              patch("cqc_lem.app.run_content_plan.get_flux_image_prompt_from_ai", return_value="scene"), \
              patch("cqc_lem.app.run_content_plan.generate_flux1_image_from_prompt", return_value="/tmp/i.png"), \
@@ -29,7 +29,9 @@ class TestGenerateVideoSrc:
              patch("cqc_lem.app.run_content_plan.create_runway_video", return_value="https://x.mp4") as crv:
             from cqc_lem.app.run_content_plan import _generate_video_src
             src = _generate_video_src(1, "text", None, post_id=9)
-        ded.assert_not_called()
+        # the conditional deduct is the balance check
+        bal.assert_not_called()
+        ded.assert_called_once()
         assert src == "https://x.mp4"
         assert crv.call_args[1]["model"] == "gen4_turbo"  # standard fallback
 
@@ -0,0 +1,146 @@
+"""Unit tests for LinkedIn token-bucket pacing (pacing.py)."""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+from celery.exceptions import Retry
+
+pytestmark = pytest.mark.unit
+
+_MOD = "cqc_lem.utilities.linkedin.pacing"
+
+
+@pytest.fixture
+def client(monkeypatch, fake_redis):
+    monkeypatch.setenv("LINKEDIN_PACING_ENABLED", "true")
+    with patch(f"{_MOD}.redis_client", return_value=fake_redis):
+        yield fake_redis
+
+
+def _tokens(client, key):
+    return float(client.hget(f"linkedin:pacing:{key}", "tokens"))
+
+
+class TestBudgets:
+    def test_parses_count_per_period(self, monkeypatch):
+        from cqc_lem.utilities.linkedin.pacing import user_budgets
+
+        monkeypatch.setenv("LINKEDIN_USER_BUDGETS", "comment:12/h, dm:2/m,invite:x/h,feed:5/w,view:0/h")
+        assert user_budgets() == {"comment": (12.0, 12 / 3600), "dm": (2.0, 2 / 60)}
+
+
+class TestTake:
+    def test_spends_from_egress_and_user_buckets(self, client):
+        from cqc_lem.utilities.linkedin.pacing import take
+
+        assert take({"feed": 1, "comment": 0}, 7, egress="a1b2c3", now=1000.0) == 0.0
+
+        assert _tokens(client, "egress:a1b2c3:feed") == 119.0
+        assert _tokens(client, "user:7:feed") == 29.0
+        assert _tokens(client, "user:7:comment") == 12.0  # checked, not spent
+        assert client.hget("linkedin:pacing:stats", "feed:granted") == b"1"
+
+    def test_empty_bucket_waits_for_its_refill(self, client, monkeypatch):
+        from cqc_lem.utilities.linkedin.pacing import take
+
+        monkeypatch.setenv("LINKEDIN_EGRESS_BUDGETS", "")
+        monkeypatch.setenv("LINKEDIN_USER_BUDGETS", "dm:2/m")
+        assert take({"dm": 1}, 7, egress="direct", now=1000.0) == 0.0
+        assert take({"dm": 1}, 7, egress="direct", now=1000.0) == 0.0
+        assert take({"dm": 1}, 7, egress="direct", now=1000.0) == pytest.approx(30.0)
+        assert take({"dm": 1}, 7, egress="direct", now=1015.0) == pytest.approx(15.0)
+        assert take({"dm": 1}, 7, egress="direct", now=1030.0) == 0.0
+        assert client.hget("linkedin:pacing:stats", "dm:deferred") == b"2"
+
+    def test_refill_stops_at_capacity(self, client, monkeypatch):
+        from cqc_lem.utilities.linkedin.pacing import take
+
+        monkeypatch.setenv("LINKEDIN_EGRESS_BUDGETS", "")
+        monkeypatch.setenv("LINKEDIN_USER_BUDGETS", "dm:2/m")
+        take({"dm": 2}, 7, egress="direct", now=1000.0)
+        assert take({"dm": 2}, 7, egress="direct", now=1000.0 + 3600) == 0.0
+        assert take({"dm": 1}, 7, egress="direct", now=1000.0 + 3600) == pytest.approx(30.0)
+
+    def test_nothing_spent_when_one_bucket_is_short(self, client, monkeypatch):
+        from cqc_lem.utilities.linkedin.pacing import take
+
+        monkeypatch.setenv("LINKEDIN_USER_BUDGETS", "invite:1/h")
+        take({"invite": 1}, 7, egress="a1b2c3", now=1000.0)
+        assert take({"feed": 1, "invite": 1}, 7, egress="a1b2c3", now=1000.0) == pytest.approx(3600.0)
+        assert not client.exists("linkedin:pacing:egress:a1b2c3:feed")
+        assert _tokens(client, "egress:a1b2c3:invite") == 19.0
+
+    def test_egress_cooldown_defers_every_action(self, client):
+        from cqc_lem.utilities.linkedin.pacing import take
+        from cqc_lem.utilities.linkedin.rate_limit import cooldown_key
+
+        client.set(cooldown_key("a1b2c3"), 1, ex=120)
+        assert take({"feed": 1}, 7, egress="a1b2c3", now=1000.0) == 120.0
+        assert not client.exists("linkedin:pacing:user:7:feed")
+
+    def test_resolves_the_users_egress(self, client):
+        from cqc_lem.utilities.linkedin.pacing import take
+        from cqc_lem.utilities.proxy import egress_id
+
+        with patch("cqc_lem.utilities.db.get_user_proxy", return_value="http://u:p@gw:823"), \
+             patch("cqc_lem.utilities.db.get_user_geo", return_value={"country": "US"}):
+            take({"invite": 1}, 7)
+
+        assert client.exists(f"linkedin:pacing:egress:{egress_id('http://u:p@gw:823')}:invite")
+
+    def test_redis_failure_proceeds(self, client):
+        from cqc_lem.utilities.linkedin.pacing import acquire_token
+
+        redis = MagicMock()
+        redis.register_script.return_value.side_effect = ConnectionError("refused")
+        with patch(f"{_MOD}.redis_client", return_value=redis), patch(f"{_MOD}.log_warning"):
+            assert acquire_token("comment", 7, egress="direct") == 0.0
+
+    def test_disabled_skips_redis(self, monkeypatch):
+        from cqc_lem.utilities.linkedin.pacing import acquire_token
+
+        monkeypatch.setenv("LINKEDIN_PACING_ENABLED", "false")
+        with patch(f"{_MOD}.redis_client") as mock_client:
+            assert acquire_token("comment", 7) == 0.0
+        mock_client.assert_not_called()
+
+
+class TestPacedDecorator:
+    def _task(self):
+        task = MagicMock()
+        task.name = "cqc_lem.app.run_automation.send_private_dm"
+        task.retry.side_effect = lambda **kw: Retry()
+        return task
+
+    def test_runs_when_tokens_are_taken(self):
+        from cqc_lem.utilities.linkedin.pacing import paced
+
+        body = MagicMock(return_value="sent")
+        with patch(f"{_MOD}.take", return_value=0.0) as mock_take:
+            assert paced("dm")(body)(self._task(), user_id=7, profile_url="u", message="m") == "sent"
+        mock_take.assert_called_once_with({"feed": 1, "dm": 1}, 7)
+
+    def test_defers_without_running_when_paced_out(self):
+        from cqc_lem.utilities.linkedin.pacing import paced
+
+        body = MagicMock()
+        task = self._task()
+        with patch(f"{_MOD}.take", return_value=42.4) as mock_take, patch(f"{_MOD}.log_info"), \
+             pytest.raises(Retry):
+            paced("comment", spend=False)(body)(task, 7)
+
+        mock_take.assert_called_once_with({"feed": 1, "comment": 0}, 7)
+        task.retry.assert_called_once_with(countdown=42, max_retries=None)
+        body.assert_not_called()
+
+
+class TestStats:
+    def test_prometheus_gauges_per_action(self, client):
+        from cqc_lem.utilities.linkedin.pacing import prometheus_gauges
+
+        client.hset("linkedin:pacing:stats", mapping={"comment:granted": 9, "comment:deferred": 2})
+        gauges = prometheus_gauges()
+
+        assert gauges['cqc_lem_linkedin_pacing_granted_total{action="comment"}'] == 9
+        assert gauges['cqc_lem_linkedin_pacing_deferred_total{action="comment"}'] == 2
+        assert gauges['cqc_lem_linkedin_pacing_granted_total{action="dm"}'] == 0
@@ -37,7 +37,12 @@ class TestMarkRateLimited:
         monkeypatch.setenv("LINKEDIN_RATE_LIMIT_COOLDOWN_SECONDS", "120")
         from cqc_lem.utilities.linkedin.rate_limit import mark_rate_limited
         mark_rate_limited("boom")
-        fake_redis.set.assert_called_once_with("linkedin:429_cooldown", "boom", ex=120)
+        fake_redis.set.assert_called_once_with("linkedin:429_cooldown:direct", "boom", ex=120)
+
+    def test_keyed_per_egress(self, fake_redis):
+        from cqc_lem.utilities.linkedin.rate_limit import mark_rate_limited
+        mark_rate_limited("boom", egress="a1b2c3")
+        assert fake_redis.set.call_args.args[0] == "linkedin:429_cooldown:a1b2c3"
 
     def test_defaults_reason(self, fake_redis):
         from cqc_lem.utilities.linkedin.rate_limit import mark_rate_limited
@@ -61,7 +66,8 @@ class TestCooldownRemaining:
     def test_returns_positive_ttl(self, fake_redis):
         fake_redis.ttl.return_value = 42
         from cqc_lem.utilities.linkedin.rate_limit import rate_limit_cooldown_remaining
-        assert rate_limit_cooldown_remaining() == 42
+        assert rate_limit_cooldown_remaining("a1b2c3") == 42
+        fake_redis.ttl.assert_called_once_with("linkedin:429_cooldown:a1b2c3")
 
     def test_zero_when_key_absent(self, fake_redis):
         fake_redis.ttl.return_value = -2  # redis: key does not exist
@@ -83,7 +89,7 @@ class TestClearRateLimit:
     def test_deletes_key(self, fake_redis):
         from cqc_lem.utilities.linkedin.rate_limit import clear_rate_limit
         clear_rate_limit()
-        fake_redis.delete.assert_called_once_with("linkedin:429_cooldown")
+        fake_redis.delete.assert_called_once_with("linkedin:429_cooldown:direct")
 
     def test_no_redis_is_noop(self):
         with patch(f"{_MOD}._redis_client", return_value=None):
@@ -96,6 +102,19 @@ class TestClearRateLimit:
         clear_rate_limit()  # must not raise
 
 
+class TestDriverEgress:
+    def test_reads_tag_set_by_driver_factory(self):
+        from cqc_lem.utilities.linkedin.rate_limit import driver_egress
+        driver = MagicMock()
+        driver.linkedin_egress = "a1b2c3"
+        assert driver_egress(driver) == "a1b2c3"
+
+    def test_untagged_driver_is_direct(self):
+        from cqc_lem.utilities.linkedin.rate_limit import driver_egress
+        assert driver_egress(MagicMock()) == "direct"
+        assert driver_egress(object()) == "direct"
+
+
 class TestRedisClientSelection:
     def test_prefers_redis_broker_url(self, monkeypatch):
         monkeypatch.setenv("CELERY_BROKER_URL", "redis://broker:6379/0")
@@ -57,9 +57,10 @@ class TestAddAvatarCredits:
             result = add_avatar_credits(1, 3, "purchase_value", "sess_abc")
 
         assert result is True
-        cur.execute.assert_called_once()
-        sql = cur.execute.call_args[0][0]
-        assert "INSERT INTO avatar_credit_ledger" in sql
+        (balance_sql, _), (ledger_sql, _) = [c[0] for c in cur.execute.call_args_list]
+        assert "INSERT INTO avatar_credit_balances" in balance_sql
+        assert "INSERT INTO avatar_credit_ledger" in ledger_sql
+        conn.commit.assert_called_once()
 
     def test_returns_false_on_db_error(self):
         conn, cur = _make_db_mocks()
@@ -94,6 +95,21 @@ class TestDeductAvatarCredit:
             assert deduct_avatar_credit(1, "train-xyz") is False
 
 
+@pytest.mark.unit
+class TestLinkAvatarCreditToTraining:
+    def test_sets_training_id_on_latest_unlinked_spend(self):
+        conn, cur = _make_db_mocks(rowcount=1)
+        with patch("cqc_lem.utilities.db.get_db_connection", return_value=conn):
+            from cqc_lem.utilities.db import link_avatar_credit_to_training
+
+            assert link_avatar_credit_to_training(1, "train-xyz") is True
+
+        sql, params = cur.execute.call_args[0]
+        assert "training_id IS NULL" in sql and "LIMIT 1" in sql
+        assert params == ("train-xyz", 1)
+        conn.commit.assert_called_once()
+
+
 @pytest.mark.unit
 class TestInsertAvatarTraining:
     def test_returns_lastrowid(self):
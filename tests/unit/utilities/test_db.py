@@ -123,10 +123,10 @@ class TestGetPosts:
 
         with patch("cqc_lem.utilities.db.get_db_connection") as mock_conn:
             mock_conn.return_value = mock_database_connection["connection"]
-            mock_database_connection["cursor"].fetchone.return_value = {"total": 1}
-            mock_database_connection["cursor"].fetchall.return_value = [
-                {"id": 1, "content": "Test", "status": "pending", "post_type": "text",
-                 "scheduled_time": "2024-01-01 12:00:00", "video_url": None, "carousel_slides": None}
+            mock_database_connection["cursor"].fetchall.side_effect = [
+                [{"id": 1, "content": "Test", "status": "pending", "post_type": "text",
+                  "scheduled_time": "2024-01-01 12:00:00", "video_url": None, "carousel_slides": None}],
+                [{"post_type": "text", "status": "pending", "total": 1, "this_week": 0}],
             ]
 
             posts, total = get_posts(60)
@@ -139,14 +139,13 @@ class TestGetPosts:
 
         with patch("cqc_lem.utilities.db.get_db_connection") as mock_conn:
             mock_conn.return_value = mock_database_connection["connection"]
-            mock_database_connection["cursor"].fetchone.return_value = {"total": 0}
             mock_database_connection["cursor"].fetchall.return_value = []
 
             get_posts(42, limit=25, offset=50, sort_order='desc', status_filter='pending')
 
             calls = mock_database_connection["cursor"].execute.call_args_list
-            # Second call is the data query; it should contain LIMIT/OFFSET params
-            data_call_args = calls[1][0][1]
+            # First call is the data query; it should contain LIMIT/OFFSET params
+            data_call_args = calls[0][0][1]
             assert 25 in data_call_args  # limit
             assert 50 in data_call_args  # offset
 
@@ -155,14 +154,41 @@ class TestGetPosts:
 
         with patch("cqc_lem.utilities.db.get_db_connection") as mock_conn:
             mock_conn.return_value = mock_database_connection["connection"]
-            mock_database_connection["cursor"].fetchone.return_value = {"total": 0}
-            mock_database_connection["cursor"].fetchall.return_value = []
+            mock_database_connection["cursor"].fetchall.side_effect = [
+                [], [{"post_type": "text", "status": "approved", "total": 3, "this_week": 0},
+                     {"post_type": "text", "status": "pending", "total": 5, "this_week": 0}],
+            ]
 
-            get_posts(42, status_filter='approved')
+            _, total = get_posts(42, status_filter='approved')
 
             calls = mock_database_connection["cursor"].execute.call_args_list
-            count_call_params = calls[0][0][1]
-            assert 'approved' in count_call_params
+            data_call_params = calls[0][0][1]
+            assert 'approved' in data_call_params
+            assert total == 3
+
+    def test_cursor_uses_keyset_instead_of_offset(self, mock_database_connection):
+        from cqc_lem.utilities.db import encode_post_cursor, get_posts
+
+        after = datetime(2025, 3, 1, 9, 30)
+        cursor = encode_post_cursor({"id": 77, "scheduled_time": after})
+        with patch("cqc_lem.utilities.db.get_db_connection") as mock_conn:
+            mock_conn.return_value = mock_database_connection["connection"]
+            mock_database_connection["cursor"].fetchall.return_value = []
+
+            _, total = get_posts(42, limit=20, offset=500, cursor=cursor, include_total=False)
+
+            sql, params = mock_database_connection["cursor"].execute.call_args[0]
+            assert "OFFSET" not in sql
+            assert "id > %s" in sql
+            assert params == [42, after, after, 77, 20]
+            assert total is None
+            mock_database_connection["cursor"].execute.assert_called_once()
+
+    def test_malformed_cursor_raises_value_error(self):
+        from cqc_lem.utilities.db import get_posts
+
+        with pytest.raises(ValueError):
+            get_posts(42, cursor="not-a-cursor")
 
 
 @pytest.mark.unit
@@ -466,13 +492,13 @@ class TestUpdateSubscriptionFromStripe:
 
 @pytest.mark.unit
 class TestGetUserPreferences:
-    def test_returns_preferences(self, mock_database_connection):
+    def test_returns_preferences(self, mock_database_connection, user_settings_row):
         from cqc_lem.utilities.db import get_user_preferences
 
         expected = {"last_login_inactivate_delay": 90, "auto_schedule_posts": 0}
         with patch("cqc_lem.utilities.db.get_db_connection") as mock_conn:
             mock_conn.return_value = mock_database_connection["connection"]
-            mock_database_connection["cursor"].fetchone.return_value = expected
+            mock_database_connection["cursor"].fetchone.return_value = user_settings_row(**expected)
 
             result = get_user_preferences(5)
 
@@ -0,0 +1,141 @@
+"""Unit tests for the async (aiomysql) read helpers used by the FastAPI hot endpoints."""
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+_MOD = "cqc_lem.utilities.db_async"
+
+
+@pytest.fixture
+def fake_pool():
+    """aiomysql stand-in: a pool whose connections all share one dict cursor."""
+    cursor = MagicMock()
+    cursor.execute = AsyncMock()
+    cursor.fetchone = AsyncMock(return_value=None)
+    cursor.fetchall = AsyncMock(return_value=[])
+    cursor.__aenter__ = AsyncMock(return_value=cursor)
+    cursor.__aexit__ = AsyncMock(return_value=False)
+    connection = MagicMock()
+    connection.cursor.return_value = cursor
+    pool = MagicMock()
+    pool.acquire = AsyncMock(return_value=connection)
+    pool.release = AsyncMock()
+    with patch(f"{_MOD}.aiomysql", MagicMock()), \
+         patch(f"{_MOD}._get_pool", AsyncMock(return_value=pool)):
+        yield {"pool": pool, "connection": connection, "cursor": cursor}
+
+
+def _expires_in(seconds: float) -> datetime:
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds)).replace(tzinfo=None)
+
+
+class TestSessions:
+    async def test_lookup_is_cached_and_shared_with_sync_db(self, fake_pool):
+        from cqc_lem.utilities import db, db_async
+
+        fake_pool["cursor"].fetchone.return_value = {"user_id": 7, "expires_at": _expires_in(3600)}
+        assert await db_async.get_session_user_id("tok") == 7
+        assert await db_async.get_session_user_id("tok") == 7
+
+        fake_pool["cursor"].execute.assert_awaited_once()
+        fake_pool["pool"].release.assert_awaited_once_with(fake_pool["connection"])
+        assert db.get_session_user_id("tok") == 7  # served from the same cache, no connection
+
+    async def test_delete_session_evicts(self, fake_pool):
+        from cqc_lem.utilities import db_async
+
+        fake_pool["cursor"].fetchone.return_value = {"user_id": 7, "expires_at": _expires_in(3600)}
+        await db_async.get_session_user_id("tok")
+        assert await db_async.delete_session("tok") is True
+
+        fake_pool["cursor"].fetchone.return_value = None
+        assert await db_async.get_session_user_id("tok") is None
+
+    async def test_db_error_returns_none_and_releases(self, fake_pool):
+        from cqc_lem.utilities import db_async
+
+        fake_pool["cursor"].execute.side_effect = OSError("connection reset")
+        with patch(f"{_MOD}.myprint") as mock_print:
+            assert await db_async.get_session_user_id("tok") is None
+
+        mock_print.assert_called_once()
+        fake_pool["pool"].release.assert_awaited_once()
+
+
+class TestPosts:
+    async def test_keyset_page_matches_sync_sql_and_uses_cached_total(self, fake_pool):
+        from cqc_lem.utilities import db, db_async
+
+        post = {"id": 3, "scheduled_time": datetime(2025, 1, 1, 9, 0)}
+        cursor_token = db.encode_post_cursor(post)
+        fake_pool["cursor"].fetchall.side_effect = [
+            [{"id": 4}],
+            [{"post_type": "text", "status": "pending", "total": 5, "this_week": 2}],
+        ]
+
+        posts, total = await db_async.get_posts(1, limit=25, cursor=cursor_token, status_filter="PENDING")
+
+        assert posts == [{"id": 4}]
+        assert total == 5
+        sql, params = fake_pool["cursor"].execute.await_args_list[0].args
+        assert (sql, params) == db._posts_page_query(1, 25, 0, 'asc', "PENDING", cursor_token)
+        assert db.get_post_status_counts(1) == {"pending": 5}  # sync readers see the cached stats
+
+    async def test_bad_cursor_raises_value_error(self, fake_pool):
+        from cqc_lem.utilities import db_async
+
+        with pytest.raises(ValueError):
+            await db_async.get_posts(1, cursor="%%%")
+
+    async def test_unknown_email_returns_empty_page(self, fake_pool):
+        from cqc_lem.utilities import db_async
+
+        assert await db_async.get_post_by_email("ghost@example.com") == ([], 0)
+        fake_pool["cursor"].execute.assert_awaited_once()
+
+
+class TestSettingsAndCredits:
+    async def test_user_settings_primes_the_shared_cache(self, fake_pool, user_settings_row):
+        from cqc_lem.utilities import db, db_async
+
+        fake_pool["cursor"].fetchone.return_value = user_settings_row(timezone="Asia/Tokyo")
+        settings = await db_async.get_user_settings(5)
+
+        assert settings.timezone == "Asia/Tokyo"
+        assert db.get_user_timezone(5) == "Asia/Tokyo"
+
+    async def test_credit_balance_reads_balance_table(self, fake_pool):
+        from cqc_lem.utilities import db_async
+
+        fake_pool["cursor"].fetchone.return_value = {"balance": 4}
+        assert await db_async.get_video_credit_balance(9) == 4
+        sql, params = fake_pool["cursor"].execute.await_args.args
+        assert "FROM video_credit_balances" in sql
+        assert params == (9,)
+
+    async def test_avatar_trainings_use_sync_row_shape(self, fake_pool):
+        from cqc_lem.utilities import db_async
+
+        fake_pool["cursor"].fetchall.return_value = [{
+            "id": 1, "training_id": "t1", "model_ref": None, "trigger_word": "me", "status": "succeeded",
+            "is_active": 1, "created_at": None, "updated_at": None,
+        }]
+        trainings = await db_async.get_avatar_trainings(9)
+        assert trainings[0]["is_active"] is True
+
+
+class TestSyncFallback:
+    async def test_runs_sync_helper_without_aiomysql(self):
+        from cqc_lem.utilities import db_async
+
+        with patch(f"{_MOD}.aiomysql", None), \
+             patch("cqc_lem.utilities.db.get_video_credit_balance", return_value=11) as mock_sync, \
+             patch(f"{_MOD}._get_pool") as mock_pool:
+            assert await db_async.get_video_credit_balance(3) == 11
+
+        mock_sync.assert_called_once_with(3)
+        mock_pool.assert_not_called()
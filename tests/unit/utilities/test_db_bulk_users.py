@@ -0,0 +1,125 @@
+"""Unit tests for the set-oriented user readers (get_users_by_ids, iter_active_users)."""
+
+from unittest.mock import patch
+
+import mysql.connector
+import pytest
+
+pytestmark = pytest.mark.unit
+
+_GET_CONN = "cqc_lem.utilities.db.get_db_connection"
+
+
+class TestGetUsersByIds:
+    def test_one_query_for_many_ids(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        cursor = mock_database_connection["cursor"]
+        cursor.fetchall.return_value = [{"id": 1, "email": "a@x"}, {"id": 3, "email": "c@x"}]
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]) as mock_conn:
+            users = db.get_users_by_ids([1, 2, 3, 1], columns=("email",))
+
+        assert users == {1: {"id": 1, "email": "a@x"}, 3: {"id": 3, "email": "c@x"}}
+        mock_conn.assert_called_once()
+        sql, params = cursor.execute.call_args[0]
+        assert sql.startswith("SELECT id, email FROM users WHERE id IN (%s, %s, %s)")
+        assert params == [1, 2, 3]
+
+    def test_chunks_large_id_lists(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        mock_database_connection["cursor"].fetchall.return_value = []
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]), \
+             patch("cqc_lem.utilities.db._USER_BULK_BATCH", 2):
+            db.get_users_by_ids([1, 2, 3, 4, 5], columns=("email",))
+
+        assert mock_database_connection["cursor"].execute.call_count == 3
+
+    def test_rejects_unknown_column(self):
+        from cqc_lem.utilities import db
+
+        with pytest.raises(ValueError):
+            db.get_users_by_ids([1], columns=("email; DROP TABLE users",))
+
+    def test_db_error_returns_empty(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        mock_database_connection["cursor"].execute.side_effect = mysql.connector.Error("down")
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            assert db.get_users_by_ids([1]) == {}
+
+
+class TestIterActiveUsers:
+    def test_keyset_batches_until_short_page(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        cursor = mock_database_connection["cursor"]
+        cursor.fetchall.side_effect = [[{"id": 4}, {"id": 9}], [{"id": 12}]]
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            ids = [row["id"] for row in db.iter_active_users(columns=(), batch_size=2)]
+
+        assert ids == [4, 9, 12]
+        assert [c[0][1] for c in cursor.execute.call_args_list] == [(0, 2), (9, 2)]
+        assert "linkedin_connection_status = 'connected'" in cursor.execute.call_args[0][0]
+
+    def test_default_columns_prime_user_settings(self, mock_database_connection, user_settings_row):
+        from cqc_lem.utilities import db
+
+        row = dict(user_settings_row(timezone="Asia/Tokyo"), id=5, email="e@x", password="pw")
+        mock_database_connection["cursor"].fetchall.return_value = [row]
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]) as mock_conn:
+            list(db.iter_active_users())
+            assert db.get_user_timezone(5) == "Asia/Tokyo"
+
+        mock_conn.assert_called_once()
+
+    def test_active_user_password_pairs_skip_missing_credentials(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        mock_database_connection["cursor"].fetchall.return_value = [
+            {"id": 1, "email": "a@x", "password": "pw"},
+            {"id": 2, "email": "b@x", "password": None},
+        ]
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]) as mock_conn:
+            assert db.get_active_user_password_pairs() == [["a@x", "pw"]]
+
+        mock_conn.assert_called_once()
+        mock_database_connection["connection"].close.assert_called_once()
+
+
+class TestPlannerGroupedReads:
+    def test_post_type_counts_grouped_by_user(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        cursor = mock_database_connection["cursor"]
+        cursor.fetchall.return_value = [{"user_id": 1, "post_type": "text", "count": 4},
+                                        {"user_id": 1, "post_type": "video", "count": 2},
+                                        {"user_id": 3, "post_type": "carousel", "count": 1}]
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            counts = db.get_post_type_counts_for_users([1, 2, 3])
+
+        assert counts == {1: {"text": 4, "video": 2}, 3: {"carousel": 1}}
+        sql, params = cursor.execute.call_args[0]
+        assert "GROUP BY user_id, post_type" in sql and params == [1, 2, 3]
+
+    def test_last_planned_dates_chunked(self, mock_database_connection):
+        from datetime import datetime
+
+        from cqc_lem.utilities import db
+
+        cursor = mock_database_connection["cursor"]
+        cursor.fetchall.side_effect = [[(1, datetime(2024, 6, 30))], [(3, None)]]
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]), \
+             patch("cqc_lem.utilities.db._USER_BULK_BATCH", 2):
+            dates = db.get_last_planned_post_dates([1, 2, 3])
+
+        assert dates == {1: datetime(2024, 6, 30)}
+        assert cursor.execute.call_count == 2
+
+    def test_db_error_returns_none(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        mock_database_connection["cursor"].execute.side_effect = mysql.connector.Error("down")
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            assert db.get_post_type_counts_for_users([1]) is None
+            assert db.get_last_planned_post_dates([1]) is None
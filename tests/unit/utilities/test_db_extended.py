@@ -365,6 +365,69 @@ class TestInsertPlannedPost:
             assert result is False
 
 
+# ---------------------------------------------------------------------------
+# insert_planned_posts / insert_planned_posts_batch
+# ---------------------------------------------------------------------------
+
+class TestInsertPlannedPosts:
+    def test_single_multi_row_insert_and_commit(self, mock_database_connection):
+        from cqc_lem.utilities.db import PostType, insert_planned_posts
+
+        with patch("cqc_lem.utilities.db.get_db_connection") as mock_conn:
+            mock_conn.return_value = mock_database_connection["connection"]
+            mock_database_connection["cursor"].rowcount = 2
+
+            result = insert_planned_posts(42, [
+                (datetime(2025, 6, 15, 10, 0, 0, tzinfo=timezone.utc), PostType.TEXT, "awareness"),
+                (datetime(2025, 6, 16, 10, 0, 0), PostType.VIDEO, "decision"),
+            ])
+
+            assert result == 2
+            mock_database_connection["cursor"].execute.assert_called_once()
+            sql, params = mock_database_connection["cursor"].execute.call_args[0]
+            assert "INSERT INTO posts" in sql
+            assert sql.count("(%s, %s, %s, %s, %s, %s)") == 2
+            assert len(params) == 12
+            assert params[2] == 42 and params[8] == 42
+            mock_database_connection["connection"].commit.assert_called_once()
+
+    def test_empty_rows_skip_database(self, mock_database_connection):
+        from cqc_lem.utilities.db import insert_planned_posts
+
+        with patch("cqc_lem.utilities.db.get_db_connection") as mock_conn:
+            assert insert_planned_posts(42, []) == 0
+            mock_conn.assert_not_called()
+
+    def test_batch_spans_users_and_chunks(self, mock_database_connection):
+        from cqc_lem.utilities.db import PostType, insert_planned_posts_batch
+
+        row = (datetime(2025, 6, 15, 10, 0, 0), PostType.CAROUSEL, "consideration")
+        with patch("cqc_lem.utilities.db.get_db_connection") as mock_conn, \
+                patch("cqc_lem.utilities.db._PLANNED_POST_INSERT_CHUNK", 3):
+            mock_conn.return_value = mock_database_connection["connection"]
+            mock_database_connection["cursor"].rowcount = 2
+
+            result = insert_planned_posts_batch({1: [row, row], 2: [row, row]})
+
+            # 4 rows / chunk of 3 -> 2 statements, one commit
+            assert mock_database_connection["cursor"].execute.call_count == 2
+            assert result == 4
+            mock_database_connection["connection"].commit.assert_called_once()
+
+    def test_rolls_back_whole_batch_on_db_error(self, mock_database_connection):
+        from cqc_lem.utilities.db import PostType, insert_planned_posts_batch
+
+        with patch("cqc_lem.utilities.db.get_db_connection") as mock_conn:
+            mock_conn.return_value = mock_database_connection["connection"]
+            mock_database_connection["cursor"].execute.side_effect = mysql.connector.Error("err")
+
+            result = insert_planned_posts_batch({1: [(datetime(2025, 6, 15), PostType.TEXT, "awareness")]})
+
+            assert result == 0
+            mock_database_connection["connection"].rollback.assert_called_once()
+            mock_database_connection["connection"].commit.assert_not_called()
+
+
 # ---------------------------------------------------------------------------
 # update_db_post
 # ---------------------------------------------------------------------------
@@ -486,7 +549,8 @@ class TestGetPostByEmail:
             assert posts == ["post1"]
             assert total == 1
             mock_get_posts.assert_called_once_with(
-                42, limit=5, offset=10, sort_order="desc", status_filter="pending"
+                42, limit=5, offset=10, sort_order="desc", status_filter="pending",
+                cursor=None, include_total=True
             )
 
 
@@ -627,6 +691,51 @@ class TestGetReadyToPostPosts:
             assert result is None
 
 
+class TestClaimReadyToPostPosts:
+    def test_locks_due_rows_and_flips_them_in_one_transaction(self, mock_database_connection):
+        from cqc_lem.utilities.db import claim_ready_to_post_posts
+
+        due = datetime(2025, 6, 1, 12, 0, 0)
+        cursor = mock_database_connection["cursor"]
+        cursor.fetchall.return_value = [(10, due, 42), (11, due, 43)]
+        with patch("cqc_lem.utilities.db.get_db_connection") as mock_conn:
+            mock_conn.return_value = mock_database_connection["connection"]
+
+            result = claim_ready_to_post_posts(limit=50)
+
+        assert result == [(10, due, 42), (11, due, 43)]
+        (select_sql, select_params), (update_sql, update_params) = [c.args for c in cursor.execute.call_args_list]
+        assert "FOR UPDATE SKIP LOCKED" in select_sql
+        assert select_params[-1] == 50
+        assert "status = 'approved' AND id IN (%s, %s)" in update_sql
+        assert update_params == ("scheduled", 10, 11)
+        mock_database_connection["connection"].commit.assert_called_once()
+
+    def test_nothing_due_skips_update(self, mock_database_connection):
+        from cqc_lem.utilities.db import claim_ready_to_post_posts
+
+        mock_database_connection["cursor"].fetchall.return_value = []
+        with patch("cqc_lem.utilities.db.get_db_connection") as mock_conn:
+            mock_conn.return_value = mock_database_connection["connection"]
+
+            assert claim_ready_to_post_posts() == []
+
+        assert mock_database_connection["cursor"].execute.call_count == 1
+
+    def test_db_error_rolls_back_and_claims_nothing(self, mock_database_connection):
+        from cqc_lem.utilities.db import claim_ready_to_post_posts
+
+        cursor = mock_database_connection["cursor"]
+        cursor.fetchall.return_value = [(10, datetime(2025, 6, 1), 42)]
+        cursor.execute.side_effect = [None, mysql.connector.Error("lock wait timeout")]
+        with patch("cqc_lem.utilities.db.get_db_connection") as mock_conn:
+            mock_conn.return_value = mock_database_connection["connection"]
+
+            assert claim_ready_to_post_posts() == []
+
+        mock_database_connection["connection"].rollback.assert_called_once()
+
+
 # ---------------------------------------------------------------------------
 # get_user_password_pair_by_id
 # ---------------------------------------------------------------------------
@@ -10,10 +10,11 @@ _GET_CONN = "cqc_lem.utilities.db.get_db_connection"
 
 
 class TestGetUserGeo:
-    def test_returns_full_geo_dict(self, mock_database_connection):
+    def test_returns_full_geo_dict(self, mock_database_connection, user_settings_row):
         with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
-            mock_database_connection["cursor"].fetchone.return_value = (
-                30.3321, -81.6556, "America/New_York", "en-US", "Jacksonville", "US",
+            mock_database_connection["cursor"].fetchone.return_value = user_settings_row(
+                latitude=30.3321, longitude=-81.6556, timezone="America/New_York", locale="en-US",
+                city="Jacksonville", country="US",
             )
             from cqc_lem.utilities.db import get_user_geo
             result = get_user_geo(1)
@@ -30,11 +31,9 @@ class TestGetUserGeo:
             from cqc_lem.utilities.db import get_user_geo
             assert get_user_geo(99) is None
 
-    def test_handles_null_latlng(self, mock_database_connection):
+    def test_handles_null_latlng(self, mock_database_connection, user_settings_row):
         with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
-            mock_database_connection["cursor"].fetchone.return_value = (
-                None, None, "UTC", None, None, None,
-            )
+            mock_database_connection["cursor"].fetchone.return_value = user_settings_row(timezone="UTC")
             from cqc_lem.utilities.db import get_user_geo
             result = get_user_geo(2)
         assert result["latitude"] is None
@@ -0,0 +1,221 @@
+"""Unit tests for the buffered activity-log writer (db_log_buffer.py + insert_new_log)."""
+
+import os
+from unittest.mock import MagicMock, patch
+
+import mysql.connector
+import pytest
+
+pytestmark = pytest.mark.unit
+
+_MOD = "cqc_lem.utilities.db"
+
+
+def _buffer(writer, **kwargs):
+    from cqc_lem.utilities.db_log_buffer import LogBuffer
+    kwargs.setdefault("flush_interval", 0)  # no background thread unless a test asks for one
+    return LogBuffer(writer, **kwargs)
+
+
+class TestLogBuffer:
+    def test_flushes_when_max_rows_reached(self):
+        writer = MagicMock(return_value=True)
+        buf = _buffer(writer, max_rows=3)
+        buf.add((1,))
+        buf.add((2,))
+        writer.assert_not_called()
+        buf.add((3,))
+        writer.assert_called_once_with([(1,), (2,), (3,)])
+        assert buf.pending() == 0
+
+    def test_explicit_flush_writes_pending_rows(self):
+        writer = MagicMock(return_value=True)
+        buf = _buffer(writer, max_rows=50)
+        buf.add((1,))
+        assert buf.flush() is True
+        writer.assert_called_once_with([(1,)])
+
+    def test_flush_with_nothing_pending_skips_writer(self):
+        writer = MagicMock(return_value=True)
+        assert _buffer(writer).flush() is True
+        writer.assert_not_called()
+
+    def test_failed_write_keeps_rows_in_order_for_retry(self):
+        writer = MagicMock(side_effect=[False, True])
+        buf = _buffer(writer, max_rows=50)
+        buf.add((1,))
+        assert buf.flush() is False
+        buf.add((2,))
+        assert buf.flush() is True
+        assert writer.call_args.args[0] == [(1,), (2,)]
+
+    def test_writer_exception_is_treated_as_failure(self):
+        writer = MagicMock(side_effect=mysql.connector.Error("down"))
+        buf = _buffer(writer, max_rows=50)
+        buf.add((1,))
+        assert buf.flush() is False
+        assert buf.pending() == 1
+
+    def test_retained_rows_are_capped(self):
+        writer = MagicMock(return_value=False)
+        with patch("cqc_lem.utilities.db_log_buffer._MAX_RETAINED_ROWS", 2):
+            buf = _buffer(writer, max_rows=50)
+            for i in range(3):
+                buf.add((i,))
+            buf.flush()
+        assert buf.pending() == 2
+
+    def test_max_rows_one_is_write_through(self):
+        writer = MagicMock(return_value=True)
+        buf = _buffer(writer, max_rows=1, flush_interval=5)
+        buf.add((1,))
+        writer.assert_called_once_with([(1,)])
+        assert buf._thread is None
+
+    def test_background_thread_flushes_on_interval(self):
+        import threading
+        flushed = threading.Event()
+
+        def writer(rows):
+            flushed.set()
+            return True
+
+        buf = _buffer(writer, max_rows=50, flush_interval=0.01)
+        buf.add((1,))
+        assert flushed.wait(2)
+        buf.reset()
+
+    def test_child_process_drops_parent_rows(self):
+        writer = MagicMock(return_value=True)
+        buf = _buffer(writer, max_rows=50)
+        buf.add((1,))
+        with patch("cqc_lem.utilities.db_log_buffer.os.getpid", return_value=os.getpid() + 1):
+            assert buf.flush() is True
+        writer.assert_not_called()
+        assert buf.pending() == 0
+
+
+class TestInsertNewLog:
+    def test_buffers_row_without_touching_database(self):
+        from cqc_lem.utilities.db import (
+            LogActionType,
+            LogResultType,
+            _log_buffer,
+            insert_new_log,
+        )
+
+        with patch(f"{_MOD}.get_db_connection") as mock_conn:
+            assert insert_new_log(7, LogActionType.COMMENT, LogResultType.SUCCESS, post_url="https://x") is True
+            mock_conn.assert_not_called()
+        assert _log_buffer.pending() == 1
+
+    def test_flush_true_writes_multi_row_insert(self, mock_database_connection):
+        from cqc_lem.utilities.db import LogActionType, LogResultType, insert_new_log
+
+        with patch(f"{_MOD}.get_db_connection", return_value=mock_database_connection["connection"]):
+            insert_new_log(7, LogActionType.COMMENT, LogResultType.SUCCESS, post_url="https://a")
+            assert insert_new_log(7, LogActionType.REPLY, LogResultType.FAILURE, post_id=3, flush=True) is True
+
+        sql, params = mock_database_connection["cursor"].execute.call_args[0]
+        assert "INSERT INTO logs" in sql
+        assert sql.count("(%s, %s, %s, %s, %s, %s)") == 2
+        assert params[:6] == [7, LogActionType.COMMENT.value, None, "https://a", None, LogResultType.SUCCESS.value]
+        mock_database_connection["connection"].commit.assert_called_once()
+
+    def test_connection_error_keeps_rows_for_retry(self, mock_database_connection):
+        from cqc_lem.utilities.db import (
+            LogActionType,
+            LogResultType,
+            _log_buffer,
+            insert_new_log,
+        )
+
+        mock_database_connection["cursor"].execute.side_effect = mysql.connector.OperationalError("gone")
+        with patch(f"{_MOD}.get_db_connection", return_value=mock_database_connection["connection"]):
+            assert insert_new_log(7, LogActionType.DM, LogResultType.SUCCESS, flush=True) is False
+        assert _log_buffer.pending() == 1
+
+    def test_rejected_rows_are_dropped(self, mock_database_connection):
+        from cqc_lem.utilities.db import (
+            LogActionType,
+            LogResultType,
+            _log_buffer,
+            insert_new_log,
+        )
+
+        mock_database_connection["cursor"].execute.side_effect = mysql.connector.DataError("too long")
+        with patch(f"{_MOD}.get_db_connection", return_value=mock_database_connection["connection"]):
+            insert_new_log(7, LogActionType.DM, LogResultType.SUCCESS, flush=True)
+        assert _log_buffer.pending() == 0
+
+    def test_rejected_batch_keeps_the_rows_the_server_accepts(self, mock_database_connection):
+        from cqc_lem.utilities.db import (
+            LogActionType,
+            LogResultType,
+            _log_buffer,
+            insert_new_log,
+        )
+
+        cursor = mock_database_connection["cursor"]
+        cursor.execute.side_effect = [mysql.connector.IntegrityError("post deleted"), None,
+                                      mysql.connector.IntegrityError("post deleted"), None]
+        with patch(f"{_MOD}.get_db_connection", return_value=mock_database_connection["connection"]):
+            insert_new_log(7, LogActionType.COMMENT, LogResultType.SUCCESS, post_url="https://a")
+            insert_new_log(7, LogActionType.REPLY, LogResultType.SUCCESS, post_id=99)
+            assert insert_new_log(7, LogActionType.DM, LogResultType.SUCCESS, flush=True) is True
+
+        statements = cursor.execute.call_args_list
+        assert statements[0].args[0].count("(%s, %s, %s, %s, %s, %s)") == 3
+        assert [c.args[1][:3] for c in statements[1:]] == [
+            [7, LogActionType.COMMENT.value, None], [7, LogActionType.REPLY.value, 99], [7, LogActionType.DM.value, None]]
+        mock_database_connection["connection"].commit.assert_called_once()
+        assert _log_buffer.pending() == 0
+
+    def test_connection_lost_while_retrying_rows_keeps_the_batch(self, mock_database_connection):
+        from cqc_lem.utilities.db import (
+            LogActionType,
+            LogResultType,
+            _log_buffer,
+            insert_new_log,
+        )
+
+        mock_database_connection["cursor"].execute.side_effect = [mysql.connector.IntegrityError("fk"), None,
+                                                                  mysql.connector.OperationalError("gone")]
+        with patch(f"{_MOD}.get_db_connection", return_value=mock_database_connection["connection"]):
+            insert_new_log(7, LogActionType.COMMENT, LogResultType.SUCCESS)
+            assert insert_new_log(7, LogActionType.DM, LogResultType.SUCCESS, flush=True) is False
+
+        mock_database_connection["connection"].commit.assert_not_called()
+        assert _log_buffer.pending() == 2
+
+    def test_dedupe_reader_flushes_pending_logs_first(self, mock_database_connection):
+        from cqc_lem.utilities.db import (
+            LogActionType,
+            LogResultType,
+            has_user_commented_on_post_url,
+            insert_new_log,
+        )
+
+        mock_database_connection["cursor"].fetchone.return_value = (1,)
+        with patch(f"{_MOD}.get_db_connection", return_value=mock_database_connection["connection"]):
+            insert_new_log(7, LogActionType.COMMENT, LogResultType.SUCCESS, post_url="https://a")
+            assert has_user_commented_on_post_url(7, "https://a") is True
+
+        statements = [c.args[0] for c in mock_database_connection["cursor"].execute.call_args_list]
+        assert "INSERT INTO logs" in statements[0]
+        assert statements[1].startswith("SELECT COUNT(*) FROM logs")
+
+
+class TestCeleryFlushHooks:
+    def test_task_postrun_flushes_logs(self):
+        with patch("cqc_lem.app.my_celery.flush_logs") as mock_flush, \
+                patch("cqc_lem.app.my_celery.track_task"):
+            from cqc_lem.app.my_celery import on_task_postrun
+            on_task_postrun(task_id="t1", task=MagicMock(name="task"), state="SUCCESS")
+        mock_flush.assert_called_once()
+
+    def test_worker_process_shutdown_flushes_logs(self):
+        with patch("cqc_lem.app.my_celery.flush_logs") as mock_flush:
+            from cqc_lem.app.my_celery import flush_logs_on_shutdown
+            flush_logs_on_shutdown()
+        mock_flush.assert_called_once()
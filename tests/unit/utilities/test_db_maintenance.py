@@ -0,0 +1,196 @@
+"""Unit tests for logs partition retention and the expired-session purge (db_maintenance.py)."""
+
+import gzip
+import json
+from datetime import date, datetime, timezone
+from unittest.mock import patch
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+_MOD = "cqc_lem.utilities.db_maintenance"
+_GET_CONN = "cqc_lem.utilities.db.get_db_connection"
+
+_OCT_2026 = 1790812800  # 2026-10-01 00:00:00 UTC
+_NOV_2026 = 1793491200
+_DEC_2026 = 1796083200
+_JAN_2027 = 1798761600
+
+
+def _partitions(*bounds):
+    from cqc_lem.utilities.db_maintenance import LogPartition
+    names = ["p_history", "p202611", "p202612"]
+    return [LogPartition(names[i], bound, 10, 4096) for i, bound in enumerate(bounds)] + \
+        [LogPartition("p_future", None, 0, 16384)]
+
+
+class TestPlanning:
+    def test_months_ahead_are_split_off_p_future(self):
+        from cqc_lem.utilities.db_maintenance import partitions_to_add
+
+        assert partitions_to_add(_partitions(_NOV_2026), date(2026, 10, 17), ahead=2) == [
+            ("p202611", _DEC_2026), ("p202612", _JAN_2027),
+        ]
+        assert partitions_to_add(_partitions(_NOV_2026, _DEC_2026, _JAN_2027), date(2026, 10, 17), ahead=2) == []
+
+    def test_first_run_splits_p_history_at_this_month(self):
+        from cqc_lem.utilities.db_maintenance import LogPartition, partitions_to_add
+
+        assert partitions_to_add([LogPartition("p_future", None, 10, 4096)], date(2026, 10, 17), ahead=2) == [
+            ("p_history", _OCT_2026), ("p202610", _NOV_2026), ("p202611", _DEC_2026), ("p202612", _JAN_2027),
+        ]
+
+    def test_not_partitioned_plans_nothing(self):
+        from cqc_lem.utilities.db_maintenance import (
+            partitions_to_add,
+            partitions_to_archive,
+        )
+
+        assert partitions_to_add([], date(2026, 10, 17), ahead=2) == []
+        assert partitions_to_archive([], date(2026, 10, 17), retention_months=12) == []
+
+    def test_only_months_wholly_past_retention_are_archived(self):
+        from cqc_lem.utilities.db_maintenance import partitions_to_archive
+
+        partitions = _partitions(_NOV_2026, _DEC_2026, _JAN_2027)
+        names = lambda today: [p.name for p in partitions_to_archive(partitions, today, 12)]  # noqa: E731
+        assert names(date(2027, 11, 30)) == ["p_history"]
+        assert names(date(2027, 12, 1)) == ["p_history", "p202611"]
+
+    def test_archive_file_names(self):
+        from cqc_lem.utilities.db_maintenance import LogPartition, archive_file_name
+
+        assert archive_file_name(LogPartition("p_history", _NOV_2026, 0, 0)) == "logs_before_2026_11.jsonl.gz"
+        assert archive_file_name(LogPartition("p202611", _DEC_2026, 0, 0)) == "logs_2026_11.jsonl.gz"
+
+
+class TestArchive:
+    def _rows(self):
+        from cqc_lem.utilities.db_maintenance import _LogRow
+        return [_LogRow(i, 7, "comment", None, f"https://x/{i}", "hi", "success", datetime(2026, 11, 2))
+                for i in (1, 2)]
+
+    def test_archives_then_drops(self, tmp_path, mock_database_connection):
+        from cqc_lem.utilities.db_maintenance import LogPartition, archive_log_partition
+
+        with patch("cqc_lem.utilities.db._stream_rows", return_value=iter(self._rows())) as mock_stream, \
+             patch(f"{_MOD}._partition_row_count", return_value=2), \
+             patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            result = archive_log_partition(LogPartition("p202611", _DEC_2026, 2, 0), str(tmp_path))
+
+        assert mock_stream.call_args.kwargs["primary"] is True
+        assert result["rows"] == 2
+        with gzip.open(tmp_path / "logs_2026_11.jsonl.gz", "rt") as archive:
+            lines = [json.loads(line) for line in archive]
+        assert [line["id"] for line in lines] == [1, 2]
+        assert lines[0]["created_at"] == "2026-11-02 00:00:00"
+        mock_database_connection["cursor"].execute.assert_called_once_with(
+            "ALTER TABLE logs DROP PARTITION p202611")
+
+    def test_incomplete_archive_keeps_partition(self, tmp_path, mock_database_connection):
+        from cqc_lem.utilities.db_maintenance import LogPartition, archive_log_partition
+
+        with patch("cqc_lem.utilities.db._stream_rows", return_value=iter(self._rows())), \
+             patch(f"{_MOD}._partition_row_count", return_value=3), \
+             patch(f"{_MOD}.log_warning"), \
+             patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            assert archive_log_partition(LogPartition("p202611", _DEC_2026, 3, 0), str(tmp_path)) is None
+
+        assert list(tmp_path.iterdir()) == []
+        mock_database_connection["cursor"].execute.assert_not_called()
+
+    def test_failed_stream_keeps_partition(self, tmp_path, mock_database_connection):
+        import mysql.connector
+
+        from cqc_lem.utilities.db_maintenance import LogPartition, archive_log_partition
+
+        with patch("cqc_lem.utilities.db._stream_rows", side_effect=mysql.connector.Error("gone away")), \
+             patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            assert archive_log_partition(LogPartition("p202611", _DEC_2026, 3, 0), str(tmp_path)) is None
+
+        assert list(tmp_path.iterdir()) == []
+        mock_database_connection["cursor"].execute.assert_not_called()
+
+
+class TestPurges:
+    def test_expired_sessions_deleted_in_batches(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        cursor = mock_database_connection["cursor"]
+        counts = iter([2, 2, 1])
+        cursor.execute.side_effect = lambda *a: setattr(cursor, "rowcount", next(counts))
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            assert db.purge_expired_sessions(batch_size=2) == 5
+        assert cursor.execute.call_count == 3
+        query, (now, batch_size) = cursor.execute.call_args.args
+        assert query == "DELETE FROM sessions WHERE expires_at < %s LIMIT %s"
+        assert now.tzinfo is timezone.utc and batch_size == 2
+        assert mock_database_connection["connection"].commit.call_count == 3
+
+    def test_orphaned_logs_of_deleted_users(self, mock_database_connection):
+        from cqc_lem.utilities.db_maintenance import purge_orphaned_logs
+
+        cursor = mock_database_connection["cursor"]
+        cursor.fetchall.side_effect = [[(1,), (2,), (3,)], [(1,), (3,)], []]
+        cursor.rowcount = 4
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            assert purge_orphaned_logs(batch_size=10) == 4
+        assert cursor.execute.call_args.args == ("DELETE FROM logs WHERE user_id = %s LIMIT %s", (2, 10))
+
+    def test_orphaned_logs_of_deleted_posts(self, mock_database_connection):
+        from cqc_lem.utilities.db_maintenance import purge_orphaned_logs
+
+        cursor = mock_database_connection["cursor"]
+        cursor.fetchall.side_effect = [[(1,)], [(1,)], [(40,), (31,)]]
+        cursor.rowcount = 2
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            assert purge_orphaned_logs(batch_size=10) == 4
+        deletes = [c.args for c in cursor.execute.call_args_list if c.args[0].startswith("DELETE")]
+        assert deletes == [("DELETE FROM logs WHERE post_id = %s LIMIT %s", (31, 10)),
+                           ("DELETE FROM logs WHERE post_id = %s LIMIT %s", (40, 10))]
+
+
+class TestRun:
+    def test_dry_run_changes_nothing(self):
+        from cqc_lem.utilities.db_maintenance import run_maintenance
+
+        with patch(f"{_MOD}.get_log_partitions", return_value=_partitions(_NOV_2026)), \
+             patch(f"{_MOD}._orphaned_log_user_ids", return_value={9}), \
+             patch(f"{_MOD}._orphaned_log_post_ids", return_value={40, 41}), \
+             patch(f"{_MOD}._expired_sessions_estimate", return_value=(30, 3000)), \
+             patch(f"{_MOD}.add_log_partitions") as mock_add, \
+             patch(f"{_MOD}.archive_log_partition") as mock_archive, \
+             patch("cqc_lem.utilities.db.purge_expired_sessions") as mock_purge:
+            report = run_maintenance(dry_run=True, today=date(2027, 12, 1))
+
+        assert report["partitions_to_archive"][0]["partition"] == "p_history"
+        assert report["orphaned_log_users"] == 1
+        assert report["orphaned_log_posts"] == 2
+        assert report["expired_sessions"] == 30
+        assert report["reclaimable_bytes"] == 4096 + 3000
+        mock_add.assert_not_called()
+        mock_archive.assert_not_called()
+        mock_purge.assert_not_called()
+
+    def test_run(self):
+        from cqc_lem.utilities.db_maintenance import run_maintenance
+
+        archived = {"partition": "p_history", "rows": 10, "file": "f"}
+        with patch(f"{_MOD}.get_log_partitions", return_value=_partitions(_NOV_2026)), \
+             patch(f"{_MOD}.add_log_partitions", return_value=["p202712"]), \
+             patch(f"{_MOD}.archive_log_partition", return_value=archived), \
+             patch(f"{_MOD}.purge_orphaned_logs", return_value=0), \
+             patch("cqc_lem.utilities.db.purge_expired_sessions", return_value=12):
+            summary = run_maintenance(today=date(2027, 12, 1))
+
+        assert summary == {"partitions_added": ["p202712"], "partitions_archived": [archived],
+                           "orphaned_logs_deleted": 0, "expired_sessions_deleted": 12}
+
+    def test_beat_task(self):
+        from cqc_lem.app.run_scheduler import auto_db_maintenance
+
+        with patch("cqc_lem.app.run_scheduler.run_maintenance", return_value={"x": 1}) as mock_run, \
+             patch("cqc_lem.app.run_scheduler.log_info"):
+            assert auto_db_maintenance.run(dry_run=True) == {"x": 1}
+        mock_run.assert_called_once_with(dry_run=True)
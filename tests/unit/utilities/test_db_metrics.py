@@ -0,0 +1,259 @@
+"""Unit tests for per-function db latency metrics (db_metrics.py)."""
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+_MOD = "cqc_lem.utilities.db_metrics"
+_CONNECT = "cqc_lem.utilities.db_pool.mysql.connector.connect"
+
+
+def _stats(name):
+    from cqc_lem.utilities.db_metrics import registry
+    return registry.snapshot()[name]
+
+
+class TestShapes:
+    def test_params_shape_never_includes_values(self):
+        from cqc_lem.utilities.db_metrics import params_shape
+
+        assert params_shape((7, "secret@example.com", None)) == "(int, str, NoneType)"
+        assert params_shape((1, 2, 3, 4, 5, "x")) == "(int x 5, str)"
+        assert params_shape({"email": "secret@example.com"}) == "{email: str}"
+        assert params_shape([(1, "a"), (2, "b")], many=True) == "2 x (int, str)"
+        assert params_shape(None) is None
+
+    def test_normalize_sql_collapses_whitespace_and_placeholder_lists(self):
+        from cqc_lem.utilities.db_metrics import normalize_sql
+
+        sql = "SELECT *\n  FROM posts\n WHERE id IN (%s, %s, %s, %s, %s, %s)"
+        assert normalize_sql(sql) == "SELECT * FROM posts WHERE id IN (%s, ...)"
+        rows = "INSERT INTO logs VALUES (%s, %s, %s, %s), (%s, %s, %s, %s), (%s, %s, %s, %s)"
+        assert normalize_sql(rows) == "INSERT INTO logs VALUES (%s, ...), ..."
+
+
+class TestInstrument:
+    def test_records_calls_rows_and_statement_time(self):
+        from cqc_lem.utilities.db_metrics import InstrumentedCursor, instrument
+
+        raw = MagicMock()
+        raw.fetchall.return_value = [{"id": 1}, {"id": 2}]
+
+        def get_things():
+            cursor = InstrumentedCursor(raw)
+            cursor.execute("SELECT id FROM things WHERE user_id = %s", (1,))
+            return cursor.fetchall()
+
+        wrapped = instrument(get_things, name="db.get_things")
+        assert wrapped() == [{"id": 1}, {"id": 2}]
+        wrapped()
+        stats = _stats("db.get_things")
+        assert stats["calls"] == 2
+        assert stats["rows"] == 4
+        assert stats["errors"] == 0
+        assert stats["buckets"][-1] == 2
+
+    def test_swallowed_statement_failure_counts_as_error(self):
+        from cqc_lem.utilities.db_metrics import InstrumentedCursor, instrument
+
+        raw = MagicMock()
+        raw.execute.side_effect = RuntimeError("lost connection")
+
+        def helper():
+            try:
+                InstrumentedCursor(raw).execute("SELECT 1")
+            except RuntimeError:
+                return None
+
+        instrument(helper, name="db.helper")()
+        assert _stats("db.helper")["errors"] == 1
+
+    def test_nested_calls_charge_queries_to_the_inner_function(self):
+        from cqc_lem.utilities.db_metrics import InstrumentedCursor, instrument
+
+        raw = MagicMock()
+        raw.fetchone.return_value = {"id": 1}
+
+        inner = instrument(lambda: InstrumentedCursor(raw).fetchone(), name="db.inner")
+        outer = instrument(lambda: inner(), name="db.outer")
+        outer()
+        assert _stats("db.inner")["rows"] == 1
+        assert _stats("db.outer")["rows"] == 0
+        assert _stats("db.outer")["calls"] == 1
+
+    def test_generator_counts_one_call_per_iteration(self):
+        from cqc_lem.utilities.db_metrics import InstrumentedCursor, instrument
+
+        raw = MagicMock()
+        raw.fetchmany.side_effect = [[1, 2], [3], []]
+
+        def batches():
+            cursor = InstrumentedCursor(raw)
+            while rows := cursor.fetchmany(2):
+                yield rows
+
+        assert list(instrument(batches, name="db.batches")()) == [[1, 2], [3]]
+        stats = _stats("db.batches")
+        assert stats["calls"] == 1
+        assert stats["rows"] == 3
+
+    async def test_coroutine_function(self):
+        from cqc_lem.utilities.db_metrics import instrument, record_statement
+
+        async def lookup():
+            record_statement("SELECT 1", None, 0.002, rows=1)
+            return 1
+
+        assert await instrument(lookup, name="db_async.lookup")() == 1
+        assert _stats("db_async.lookup")["rows"] == 1
+        assert _stats("db_async.lookup")["execute_ms"] == 2.0
+
+    def test_slow_statement_sampled_without_values(self, monkeypatch):
+        from cqc_lem.utilities.db_metrics import (
+            InstrumentedCursor,
+            instrument,
+            registry,
+        )
+
+        monkeypatch.setenv("DB_SLOW_QUERY_MS", "0")
+        cursor = InstrumentedCursor(MagicMock())
+        instrument(lambda: cursor.execute("SELECT id FROM users\n WHERE email = %s", ("a@b.com",)),
+                   name="db.find")()
+        [sample] = registry.slow_queries()
+        assert sample["function"] == "db.find"
+        assert sample["sql"] == "SELECT id FROM users WHERE email = %s"
+        assert sample["params"] == "(str)"
+        assert "a@b.com" not in str(sample)
+
+    def test_disabled(self, monkeypatch):
+        from cqc_lem.utilities.db_metrics import instrument
+
+        monkeypatch.setenv("DB_METRICS_ENABLED", "false")
+        func = lambda: None  # noqa: E731
+        assert instrument(func) is func
+
+
+class TestDbModule:
+    def test_public_helpers_are_instrumented(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        mock_database_connection["cursor"].fetchone.return_value = {"id": 5}
+        with patch("cqc_lem.utilities.db.get_db_connection",
+                   return_value=mock_database_connection["connection"]):
+            assert db.get_user_id("a@b.com") == 5
+        assert _stats("db.get_user_id")["calls"] == 1
+        assert not hasattr(db.get_db_connection, "__wrapped__")
+
+    def test_pooled_connection_times_acquire_and_cursor(self):
+        from cqc_lem.utilities.db_metrics import InstrumentedCursor, instrument
+        from cqc_lem.utilities.db_pool import ConnectionPool
+
+        raw = MagicMock()
+        raw.in_transaction = False
+        raw.cursor.return_value.fetchall.return_value = [(1,)]
+        pool = ConnectionPool(lambda: {"host": "db"})
+
+        def query():
+            connection = pool.acquire()
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            rows = cursor.fetchall()
+            connection.close()
+            return cursor, rows
+
+        with patch(_CONNECT, return_value=raw):
+            cursor, rows = instrument(query, name="db.query")()
+        assert isinstance(cursor, InstrumentedCursor)
+        assert rows == [(1,)]
+        assert _stats("db.query")["rows"] == 1
+        assert _stats("db.query")["acquire_ms"] > 0
+
+
+class TestExport:
+    def _record(self):
+        from cqc_lem.utilities.db_metrics import instrument, record_statement
+        instrument(lambda: record_statement("SELECT 1", None, 0.003, rows=2), name="db.get_posts")()
+
+    def test_prometheus_exposition(self):
+        from cqc_lem.utilities.db_metrics import render_prometheus
+
+        self._record()
+        text = render_prometheus({"cqc_lem_db_pool_idle": 3})
+        assert 'cqc_lem_db_call_seconds_bucket{function="db.get_posts",le="+Inf"} 1' in text
+        assert 'cqc_lem_db_call_seconds_count{function="db.get_posts"} 1' in text
+        assert 'cqc_lem_db_rows_total{function="db.get_posts"} 2' in text
+        assert "cqc_lem_db_pool_idle 3" in text
+
+    def test_report_table(self):
+        from cqc_lem.utilities.db_metrics import report
+
+        assert report() == "No db calls recorded."
+        self._record()
+        assert "db.get_posts" in report()
+
+    def test_publish_waits_for_interval(self):
+        from cqc_lem.utilities.db_metrics import maybe_publish
+
+        self._record()
+        with patch(f"{_MOD}._publish") as mock_publish:
+            assert maybe_publish(background=False) is False
+        mock_publish.assert_not_called()
+
+    def test_publish_sends_pending_batch_once(self):
+        from cqc_lem.utilities.db_metrics import maybe_publish, registry
+
+        self._record()
+        cloudwatch = MagicMock()
+        with patch("cqc_lem.utilities.env_constants.AWS_REGION", "us-east-1"), \
+             patch("cqc_lem.utilities.utils.get_cloudwatch_client", return_value=cloudwatch), \
+             patch("cqc_lem.utilities.observability.track_db_calls") as mock_track, \
+             patch("cqc_lem.utilities.redis_client.redis_client", return_value=None):
+            assert maybe_publish(force=True, background=False) is True
+            maybe_publish(force=True, background=False)
+
+        mock_track.assert_called_once()
+        assert mock_track.call_args.args == ("db.get_posts",)
+        data = cloudwatch.put_metric_data.call_args.kwargs["MetricData"]
+        latency = next(d for d in data if d["MetricName"] == "CallLatency")
+        assert latency["StatisticValues"]["SampleCount"] == 1
+        assert cloudwatch.put_metric_data.call_count == 1
+        assert registry.take_pending() == {}
+
+    def test_published_snapshots_are_merged(self):
+        import json
+
+        from cqc_lem.utilities.db_metrics import load_published_snapshots, registry
+
+        self._record()
+        payload = json.dumps({"totals": registry.snapshot(), "slow": []})
+        client = MagicMock()
+        client.scan_iter.return_value = ["db_metrics:a:1", "db_metrics:b:2"]
+        client.get.return_value = payload
+        with patch("cqc_lem.utilities.redis_client.redis_client", return_value=client):
+            totals, slow = load_published_snapshots()
+        assert totals["db.get_posts"]["calls"] == 2
+        assert slow == []
+
+
+class TestDbAsync:
+    async def test_statements_and_acquire_recorded(self):
+        from cqc_lem.utilities import db_async
+
+        cursor = MagicMock()
+        cursor.execute = AsyncMock()
+        cursor.fetchone = AsyncMock(return_value={"id": 9})
+        cursor.__aenter__ = AsyncMock(return_value=cursor)
+        cursor.__aexit__ = AsyncMock(return_value=False)
+        connection = MagicMock()
+        connection.cursor.return_value = cursor
+        pool = MagicMock()
+        pool.acquire = AsyncMock(return_value=connection)
+        pool.release = AsyncMock()
+        with patch("cqc_lem.utilities.db_async.aiomysql", MagicMock()), \
+             patch("cqc_lem.utilities.db_async._get_pool", AsyncMock(return_value=pool)):
+            assert await db_async.get_user_id("a@b.com") == 9
+        stats = _stats("db_async.get_user_id")
+        assert stats["calls"] == 1
+        assert stats["rows"] == 1
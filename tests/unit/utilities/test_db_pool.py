@@ -0,0 +1,209 @@
+"""Unit tests for the process-wide MySQL connection pool (db_pool.py)."""
+
+import os
+import threading
+from unittest.mock import MagicMock, patch
+
+import mysql.connector
+import pytest
+from mysql.connector import errorcode
+
+pytestmark = pytest.mark.unit
+
+_CONNECT = "cqc_lem.utilities.db_pool.mysql.connector.connect"
+_SETTINGS = {"host": "db", "user": "u", "password": "p", "database": "d", "port": 3306, "time_zone": "+00:00"}
+
+
+def _make_pool(**kwargs):
+    from cqc_lem.utilities.db_pool import ConnectionPool
+    return ConnectionPool(lambda: _SETTINGS, **kwargs)
+
+
+def _fresh_conn():
+    conn = MagicMock()
+    conn.in_transaction = False
+    return conn
+
+
+class TestAcquireRelease:
+    def test_close_returns_connection_for_reuse(self):
+        with patch(_CONNECT, side_effect=lambda **kw: _fresh_conn()) as mock_connect:
+            pool = _make_pool(size=2)
+            first = pool.acquire()
+            raw = first._conn
+            first.close()
+            second = pool.acquire()
+
+        assert second._conn is raw
+        mock_connect.assert_called_once_with(**_SETTINGS)
+        assert pool.stats()["created"] == 1
+
+    def test_close_is_idempotent(self):
+        with patch(_CONNECT, side_effect=lambda **kw: _fresh_conn()):
+            pool = _make_pool(size=2)
+            conn = pool.acquire()
+            conn.close()
+            conn.close()
+
+        assert pool.stats()["idle"] == 1
+        assert pool.stats()["checked_out"] == 0
+
+    def test_open_transaction_is_rolled_back_on_release(self):
+        raw = _fresh_conn()
+        raw.in_transaction = True
+        with patch(_CONNECT, return_value=raw):
+            pool = _make_pool()
+            pool.acquire().close()
+
+        raw.rollback.assert_called_once()
+        assert pool.stats()["idle"] == 1
+
+    def test_failed_rollback_discards_connection(self):
+        raw = _fresh_conn()
+        raw.in_transaction = True
+        raw.rollback.side_effect = mysql.connector.Error("Unread result found")
+        with patch(_CONNECT, return_value=raw):
+            pool = _make_pool()
+            pool.acquire().close()
+
+        raw.close.assert_called_once()
+        assert pool.stats()["idle"] == 0
+        assert pool.stats()["discarded"] == 1
+
+    def test_proxy_forwards_attributes(self):
+        raw = _fresh_conn()
+        with patch(_CONNECT, return_value=raw):
+            conn = _make_pool().acquire()
+            conn.cursor(dictionary=True)
+
+        raw.cursor.assert_called_once_with(dictionary=True)
+
+    def test_connect_error_frees_slot(self):
+        with patch(_CONNECT, side_effect=mysql.connector.Error("down")):
+            pool = _make_pool(size=1)
+            with pytest.raises(mysql.connector.Error):
+                pool.acquire()
+
+        assert pool.stats()["checked_out"] == 0
+
+
+class TestExhaustion:
+    def test_raises_pool_exhausted_after_timeout(self):
+        from cqc_lem.utilities.db_pool import PoolExhausted
+        with patch(_CONNECT, side_effect=lambda **kw: _fresh_conn()):
+            pool = _make_pool(size=1, timeout=0.01)
+            pool.acquire()
+            with pytest.raises(PoolExhausted):
+                pool.acquire()
+
+        stats = pool.stats()
+        assert stats["waits"] == 1
+        assert stats["timeouts"] == 1
+
+    def test_pool_exhausted_is_a_mysql_error(self):
+        from cqc_lem.utilities.db_pool import PoolExhausted
+        assert issubclass(PoolExhausted, mysql.connector.Error)
+
+    def test_waiter_gets_connection_released_by_other_thread(self):
+        with patch(_CONNECT, side_effect=lambda **kw: _fresh_conn()):
+            pool = _make_pool(size=1, timeout=5)
+            held = pool.acquire()
+            raw = held._conn
+            timer = threading.Timer(0.05, held.close)
+            timer.start()
+            got = pool.acquire()
+            timer.join()
+
+        assert got._conn is raw
+        assert pool.stats()["waits"] == 1
+        assert pool.stats()["wait_time_ms"] >= 0
+
+
+class TestHealthCheck:
+    def test_idle_connection_pinged_and_replaced_when_dead(self):
+        dead, fresh = _fresh_conn(), _fresh_conn()
+        dead.ping.side_effect = mysql.connector.Error("gone away")
+        with patch(_CONNECT, side_effect=[dead, fresh]):
+            pool = _make_pool(ping_after=0)
+            pool.acquire().close()
+            conn = pool.acquire()
+
+        assert conn._conn is fresh
+        dead.ping.assert_called_once_with(reconnect=False)
+        assert pool.stats()["discarded"] == 1
+
+    def test_recently_used_connection_not_pinged(self):
+        raw = _fresh_conn()
+        with patch(_CONNECT, return_value=raw):
+            pool = _make_pool(ping_after=60)
+            pool.acquire().close()
+            pool.acquire()
+
+        raw.ping.assert_not_called()
+
+
+class TestAuthFailure:
+    def test_refreshes_credentials_and_retries_once(self):
+        denied = mysql.connector.Error("denied", errno=errorcode.ER_ACCESS_DENIED_ERROR)
+        raw = _fresh_conn()
+        refresh = MagicMock()
+        with patch(_CONNECT, side_effect=[denied, raw]) as mock_connect:
+            from cqc_lem.utilities.db_pool import ConnectionPool
+            pool = ConnectionPool(lambda: _SETTINGS, on_auth_failure=refresh)
+            conn = pool.acquire()
+
+        refresh.assert_called_once()
+        assert mock_connect.call_count == 2
+        assert conn._conn is raw
+
+    def test_other_errors_are_not_retried(self):
+        refresh = MagicMock()
+        with patch(_CONNECT, side_effect=mysql.connector.Error("timeout", errno=2003)):
+            from cqc_lem.utilities.db_pool import ConnectionPool
+            pool = ConnectionPool(lambda: _SETTINGS, on_auth_failure=refresh)
+            with pytest.raises(mysql.connector.Error):
+                pool.acquire()
+
+        refresh.assert_not_called()
+
+
+class TestForkSafety:
+    def test_inherited_connections_are_dropped_without_closing(self):
+        raw = _fresh_conn()
+        with patch(_CONNECT, side_effect=[raw, _fresh_conn()]):
+            pool = _make_pool()
+            pool.acquire().close()
+            with patch("cqc_lem.utilities.db_pool.os.getpid", return_value=os.getpid() + 1):
+                conn = pool.acquire()
+
+        assert conn._conn is not raw
+        raw.close.assert_not_called()
+
+
+class TestSecretCache:
+    def test_loads_once_within_ttl(self):
+        from cqc_lem.utilities.db_pool import SecretCache
+        loader = MagicMock(return_value={"host": "h"})
+        cache = SecretCache(loader, ttl_seconds=300)
+        cache.get()
+        cache.get()
+        loader.assert_called_once()
+
+    def test_invalidate_forces_reload(self):
+        from cqc_lem.utilities.db_pool import SecretCache
+        loader = MagicMock(side_effect=[{"password": "old"}, {"password": "new"}])
+        cache = SecretCache(loader, ttl_seconds=300)
+        cache.get()
+        cache.invalidate()
+        assert cache.get() == {"password": "new"}
+
+
+class TestDbConnectionContextManager:
+    def test_yields_connection_and_closes_it(self, mock_database_connection):
+        with patch("cqc_lem.utilities.db.get_db_connection",
+                   return_value=mock_database_connection["connection"]):
+            from cqc_lem.utilities.db import db_connection
+            with db_connection() as conn:
+                assert conn is mock_database_connection["connection"]
+
+        mock_database_connection["connection"].close.assert_called_once()
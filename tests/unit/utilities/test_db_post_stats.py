@@ -0,0 +1,80 @@
+"""Unit tests for the cached per-user post aggregates behind the dashboard and /posts/ total."""
+
+from datetime import datetime
+from unittest.mock import patch
+
+import mysql.connector
+import pytest
+
+pytestmark = pytest.mark.unit
+
+_GET_CONN = "cqc_lem.utilities.db.get_db_connection"
+
+_ROWS = [
+    {"post_type": "text", "status": "pending", "total": 3, "this_week": 2},
+    {"post_type": "video", "status": "pending", "total": 1, "this_week": 1},
+    {"post_type": "text", "status": "posted", "total": 5, "this_week": 0},
+    {"post_type": "carousel", "status": "approved", "total": 2, "this_week": None},
+]
+
+
+class TestGetPostDashboardStats:
+    def test_aggregates_grouped_rows(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        mock_database_connection["cursor"].fetchall.return_value = _ROWS
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            stats = db.get_post_dashboard_stats(42)
+
+        assert stats["scheduled_this_week"] == 3
+        assert stats["pending_review"] == 4
+        assert stats["posted_total"] == 5
+        assert stats["total"] == 11
+        assert stats["by_status"] == {"pending": 4, "posted": 5, "approved": 2}
+        assert stats["by_type"] == {"text": 8, "video": 1, "carousel": 2}
+        mock_database_connection["cursor"].execute.assert_called_once()
+
+    def test_week_window_starts_monday_at_start_of_month(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        class _FixedDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime(2026, 7, 1, 15, 30, tzinfo=tz)  # Wednesday the 1st
+
+        mock_database_connection["cursor"].fetchall.return_value = []
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]), \
+             patch("cqc_lem.utilities.db.datetime", _FixedDatetime):
+            db.get_post_dashboard_stats(42)
+
+        params = mock_database_connection["cursor"].execute.call_args[0][1]
+        assert datetime(2026, 6, 29) in params
+        assert datetime(2026, 7, 6) in params
+
+    def test_cached_until_post_status_changes(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        mock_database_connection["cursor"].fetchall.return_value = _ROWS
+        mock_database_connection["cursor"].rowcount = 1
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]) as mock_conn:
+            db.get_post_dashboard_stats(42)
+            assert db.get_post_status_counts(42)["posted"] == 5
+            assert mock_conn.call_count == 1
+
+            db.update_db_post_status(1, db.PostStatus.POSTED)
+            db.get_post_dashboard_stats(42)
+            db.bulk_update_posts([1, 2], status=db.PostStatus.APPROVED)
+            db.get_post_dashboard_stats(42)
+
+        # load, status update, reload, bulk update, reload
+        assert mock_conn.call_count == 5
+
+    def test_db_error_returns_none_and_is_not_cached(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        cursor = mock_database_connection["cursor"]
+        cursor.execute.side_effect = [mysql.connector.Error("down"), None]
+        cursor.fetchall.return_value = _ROWS
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            assert db.get_post_dashboard_stats(42) is None
+            assert db.get_post_status_counts(42)["pending"] == 4
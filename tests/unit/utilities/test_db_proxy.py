@@ -18,16 +18,16 @@ def _mock_conn(fetch_row=None, rowcount=1):
 
 
 class TestGetUserProxy:
-    def test_returns_url_when_set(self):
-        conn, cursor = _mock_conn(fetch_row=("http://10.0.0.5:8080",))
+    def test_returns_url_when_set(self, user_settings_row):
+        conn, cursor = _mock_conn(fetch_row=user_settings_row(proxy_url="http://10.0.0.5:8080"))
         with patch(f"{_DB}.get_db_connection", return_value=conn):
             from cqc_lem.utilities.db import get_user_proxy
             assert get_user_proxy(7) == "http://10.0.0.5:8080"
         args = cursor.execute.call_args[0]
         assert "proxy_url" in args[0] and args[1] == (7,)
 
-    def test_returns_none_when_null(self):
-        conn, _ = _mock_conn(fetch_row=(None,))
+    def test_returns_none_when_null(self, user_settings_row):
+        conn, _ = _mock_conn(fetch_row=user_settings_row(proxy_url=None))
         with patch(f"{_DB}.get_db_connection", return_value=conn):
             from cqc_lem.utilities.db import get_user_proxy
             assert get_user_proxy(7) is None
@@ -0,0 +1,130 @@
+"""Unit tests for read-replica routing (ReplicaRouter, db.get_read_connection)."""
+
+import contextvars
+from unittest.mock import MagicMock, patch
+
+import mysql.connector
+import pytest
+from mysql.connector import errorcode
+
+pytestmark = pytest.mark.unit
+
+_MOD = "cqc_lem.utilities.db_replica"
+
+
+def _replica_pool(status_row=None):
+    """Fake replica ConnectionPool whose SHOW REPLICA STATUS returns ``status_row``."""
+    cursor = MagicMock()
+    cursor.fetchone.return_value = status_row
+    connection = MagicMock()
+    connection.cursor.return_value = cursor
+    pool = MagicMock()
+    pool.acquire.return_value = connection
+    return pool
+
+
+def _router(status_row=None, **kwargs):
+    from cqc_lem.utilities.db_replica import ReplicaRouter
+    return ReplicaRouter(_replica_pool(status_row), max_lag=5, check_interval=60, **kwargs)
+
+
+def _fresh(func, *args):
+    """Run in a new context, i.e. a different request/task than the one that wrote."""
+    return contextvars.Context().run(func, *args)
+
+
+class TestReplicaRouter:
+    def test_disabled_without_pool(self):
+        from cqc_lem.utilities.db_replica import ReplicaRouter
+        router = ReplicaRouter(None)
+        assert router.acquire(1) is None
+        assert router.stats()["enabled"] is False
+
+    def test_current_replica_serves_reads(self):
+        router = _router({"Seconds_Behind_Source": 1})
+        assert _fresh(router.acquire, 1) is not None
+        assert router.stats()["replica_reads"] == 1
+
+    def test_lagging_or_stopped_replica_falls_back(self):
+        for row in ({"Seconds_Behind_Source": 30}, {"Seconds_Behind_Source": None}):
+            router = _router(row)
+            assert _fresh(router.acquire, 1) is None
+
+    def test_no_replication_status_is_trusted(self):
+        router = _router(None)
+        assert _fresh(router.acquire) is not None
+
+    def test_old_server_syntax_fallback(self):
+        router = _router()
+        cursor = router._pool.acquire.return_value.cursor.return_value
+        cursor.execute.side_effect = [mysql.connector.Error(errno=errorcode.ER_PARSE_ERROR), None]
+        cursor.fetchone.return_value = {"Seconds_Behind_Master": 0}
+        router.refresh_lag_if_due()
+        assert cursor.execute.call_args[0][0] == "SHOW SLAVE STATUS"
+        assert router.stats()["lag_seconds"] == 0.0
+
+    def test_lag_measured_once_per_interval(self):
+        router = _router({"Seconds_Behind_Source": 0})
+        for _ in range(3):
+            _fresh(router.acquire)
+        cursor = router._pool.acquire.return_value.cursor.return_value
+        assert cursor.execute.call_count == 1
+
+    def test_write_keeps_user_and_context_on_primary(self):
+        router = _router({"Seconds_Behind_Source": 0})
+        router.refresh_lag_if_due()
+
+        def write_then_read():
+            router.mark_write(7)
+            return router.use_replica(8)
+
+        assert _fresh(write_then_read) is False  # same context reads its own writes
+        assert _fresh(router.use_replica, 7) is False  # other contexts, same user
+        assert _fresh(router.use_replica, 8) is True
+
+    def test_force_primary(self):
+        from cqc_lem.utilities.db_replica import force_primary
+        router = _router({"Seconds_Behind_Source": 0})
+        router.refresh_lag_if_due()
+        with force_primary():
+            assert router.use_replica() is False
+        assert router.use_replica() is True
+
+    def test_unreachable_replica_is_skipped_until_next_check(self):
+        router = _router({"Seconds_Behind_Source": 0})
+        router.refresh_lag_if_due()
+        router._pool.acquire.side_effect = mysql.connector.Error("refused")
+        with patch(f"{_MOD}.log_warning"):
+            assert _fresh(router.acquire) is None
+        router._pool.acquire.side_effect = None
+        assert _fresh(router.acquire) is None
+        assert router.stats()["failures"] == 1
+
+
+class TestGetReadConnection:
+    def test_replica_connection_when_routed(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        router = _router({"Seconds_Behind_Source": 0})
+        with patch("cqc_lem.utilities.db._replica_router", router), \
+             patch("cqc_lem.utilities.db.get_db_connection") as mock_primary:
+            connection = _fresh(db.get_read_connection, 3)
+        assert connection is router._pool.acquire.return_value
+        mock_primary.assert_not_called()
+
+    def test_post_write_reads_go_to_primary(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        router = _router({"Seconds_Behind_Source": 0})
+        mock_database_connection["cursor"].fetchall.return_value = []
+
+        def write_then_read():
+            db.invalidate_post_stats(3)
+            return db.get_posts(3, include_total=False)
+
+        with patch("cqc_lem.utilities.db._replica_router", router), \
+             patch("cqc_lem.utilities.db.get_db_connection",
+                   return_value=mock_database_connection["connection"]) as mock_primary:
+            assert _fresh(write_then_read) == ([], None)
+        mock_primary.assert_called_once()
+        assert router.stats()["replica_reads"] == 0
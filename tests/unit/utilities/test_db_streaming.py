@@ -0,0 +1,124 @@
+"""Unit tests for the streaming batch scans (server-side cursor and keyset chunk readers)."""
+
+from datetime import datetime
+from unittest.mock import patch
+
+import mysql.connector
+import pytest
+
+pytestmark = pytest.mark.unit
+
+_GET_CONN = "cqc_lem.utilities.db.get_db_connection"
+
+
+class TestServerSideStream:
+    def test_rows_fetched_in_chunks_as_named_tuples(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        due = datetime(2026, 1, 5, 9, 0)
+        cursor = mock_database_connection["cursor"]
+        cursor.fetchmany.side_effect = [
+            [(6, 1, "video", "awareness", due), (5, 1, "carousel", "decision", due)],
+            [(4, 2, "video", "awareness", due)],
+            [],
+        ]
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            posts = list(db.iter_unposted_posts_missing_assets(chunk_size=2))
+
+        assert [p.id for p in posts] == [6, 5, 4]
+        assert posts[0] == (6, 1, "video", "awareness", due)
+        assert posts[1].post_type == "carousel"
+        mock_database_connection["connection"].cursor.assert_called_once_with(buffered=False)
+        cursor.fetchmany.assert_called_with(2)
+        cursor.fetchall.assert_not_called()
+
+    def test_stopping_early_drains_and_releases_connection(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        due = datetime(2026, 1, 5, 9, 0)
+        connection = mock_database_connection["connection"]
+        mock_database_connection["cursor"].fetchmany.side_effect = [
+            [(1, 1, "video", "awareness", due), (2, 1, "video", "awareness", due)], [],
+        ]
+        with patch(_GET_CONN, return_value=connection):
+            posts = db.iter_unposted_posts_missing_assets(chunk_size=2)
+            assert next(posts).id == 1
+            posts.close()
+
+        connection.consume_results.assert_called_once()
+        mock_database_connection["cursor"].close.assert_called_once()
+        connection.close.assert_called_once()
+
+    def test_database_error_mid_scan_is_raised(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        due = datetime(2026, 1, 5, 9, 0)
+        mock_database_connection["cursor"].fetchmany.side_effect = [
+            [(1, 1, "video", "awareness", due)], mysql.connector.Error("gone away"),
+        ]
+        seen = []
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            with pytest.raises(mysql.connector.Error):
+                for post in db.iter_unposted_posts_missing_assets(chunk_size=1):
+                    seen.append(post.id)
+        assert seen == [1]
+        mock_database_connection["connection"].close.assert_called_once()
+
+
+class TestKeysetStream:
+    def test_chunks_follow_last_id(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        cursor = mock_database_connection["cursor"]
+        cursor.fetchall.side_effect = [
+            [(10, "cus_a", "sub_a", "active", "starter"), (12, "cus_b", "sub_b", "past_due", "pro")],
+            [(15, "cus_c", "sub_c", "active", "starter")],
+        ]
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            rows = list(db.iter_users_with_stripe_subscriptions(chunk_size=2))
+
+        assert [r.id for r in rows] == [10, 12, 15]
+        assert rows[1].subscription_tier == "pro"
+        first, second = cursor.execute.call_args_list
+        assert first.args[0].endswith("AND id > %s ORDER BY id LIMIT %s")
+        assert first.args[1] == (0, 2)
+        assert second.args[1] == (12, 2)
+        # one short query per chunk: the connection is returned between them
+        assert mock_database_connection["connection"].close.call_count == 2
+
+    def test_active_user_ids_in_keyset_chunks(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        cursor = mock_database_connection["cursor"]
+        cursor.fetchall.side_effect = [[(3,), (8,)], [(11,)]]
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            assert list(db.iter_active_user_ids(chunk_size=2)) == [3, 8, 11]
+
+        assert cursor.execute.call_args.args[1] == (8, 2)
+        mock_database_connection["connection"].cursor.assert_called_with()
+        assert mock_database_connection["connection"].close.call_count == 2
+
+    def test_database_error_mid_scan_is_raised(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        cursor = mock_database_connection["cursor"]
+        cursor.fetchall.side_effect = [[(3,), (8,)], mysql.connector.Error("gone away")]
+        seen = []
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            with pytest.raises(mysql.connector.Error):
+                for user_id in db.iter_active_user_ids(chunk_size=2):
+                    seen.append(user_id)
+        assert seen == [3, 8]
+
+    def test_planned_posts_for_one_user_next_week(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        cursor = mock_database_connection["cursor"]
+        cursor.fetchall.return_value = [(3, 41, "text", "awareness")]
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            [post] = db.iter_planned_posts(next_week=True, user_id=3)
+
+        assert (post.user_id, post.id, post.post_type) == (3, 41, "text")
+        sql, params = cursor.execute.call_args.args
+        assert "WEEKDAY" in sql and "user_id = %s" in sql
+        assert params == (3, 0, db._STREAM_CHUNK)
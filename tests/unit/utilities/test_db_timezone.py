@@ -35,9 +35,9 @@ class TestGetDbConnectionTimezone:
 # ---------------------------------------------------------------------------
 
 class TestGetUserTimezone:
-    def test_returns_stored_timezone(self, mock_database_connection):
+    def test_returns_stored_timezone(self, mock_database_connection, user_settings_row):
         with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
-            mock_database_connection["cursor"].fetchone.return_value = ("America/New_York",)
+            mock_database_connection["cursor"].fetchone.return_value = user_settings_row(timezone="America/New_York")
             from cqc_lem.utilities.db import get_user_timezone
             result = get_user_timezone(1)
         assert result == "America/New_York"
@@ -49,9 +49,9 @@ class TestGetUserTimezone:
             result = get_user_timezone(99)
         assert result == "UTC"
 
-    def test_returns_utc_when_field_is_empty(self, mock_database_connection):
+    def test_returns_utc_when_field_is_empty(self, mock_database_connection, user_settings_row):
         with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
-            mock_database_connection["cursor"].fetchone.return_value = ("",)
+            mock_database_connection["cursor"].fetchone.return_value = user_settings_row(timezone="")
             from cqc_lem.utilities.db import get_user_timezone
             result = get_user_timezone(5)
         assert result == "UTC"
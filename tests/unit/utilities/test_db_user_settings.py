@@ -0,0 +1,75 @@
+"""Unit tests for the cached UserSettings read path and its invalidation."""
+
+from unittest.mock import patch
+
+import mysql.connector
+import pytest
+
+pytestmark = pytest.mark.unit
+
+_GET_CONN = "cqc_lem.utilities.db.get_db_connection"
+
+
+class TestGetUserSettings:
+    def test_one_query_serves_every_settings_getter(self, mock_database_connection, user_settings_row):
+        from cqc_lem.utilities import db
+
+        mock_database_connection["cursor"].fetchone.return_value = user_settings_row(
+            timezone="America/Chicago", blog_url="https://blog", sitemap_url="https://blog/sitemap.xml",
+            company_linked_in_url="https://linkedin.com/company/x", proxy_url="http://proxy:8080",
+            latitude=41.88, longitude=-87.63, last_login_inactivate_delay=30,
+        )
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]) as mock_conn:
+            assert db.get_user_timezone(1) == "America/Chicago"
+            assert db.get_user_blog_url(1) == "https://blog"
+            assert db.get_user_sitemap_url(1) == "https://blog/sitemap.xml"
+            assert db.get_company_linked_in_url_for_user(1) == "https://linkedin.com/company/x"
+            assert db.get_user_proxy(1) == "http://proxy:8080"
+            assert db.get_user_geo(1)["latitude"] == pytest.approx(41.88)
+            assert db.get_user_preferences(1)["last_login_inactivate_delay"] == 30
+
+        mock_conn.assert_called_once()
+        assert db.get_user_settings_cache_stats()["hits"] == 6
+
+    def test_missing_user_is_not_cached(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        mock_database_connection["cursor"].fetchone.return_value = None
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]) as mock_conn:
+            assert db.get_user_settings(99) is None
+            assert db.get_user_settings(99) is None
+        assert mock_conn.call_count == 2
+
+    def test_db_error_is_not_cached(self, mock_database_connection, user_settings_row):
+        from cqc_lem.utilities import db
+
+        cursor = mock_database_connection["cursor"]
+        cursor.execute.side_effect = [mysql.connector.Error("down"), None]
+        cursor.fetchone.return_value = user_settings_row(timezone="Europe/Paris")
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            assert db.get_user_timezone(3) == "UTC"
+            assert db.get_user_timezone(3) == "Europe/Paris"
+
+
+class TestInvalidation:
+    @pytest.mark.parametrize("update", [
+        lambda db: db.update_user_timezone(1, "Asia/Tokyo"),
+        lambda db: db.update_user_proxy(1, "socks5://p:1080"),
+        lambda db: db.update_user_location(1, 1.0, 2.0),
+        lambda db: db.update_user_preferences(1, None, True),
+        lambda db: db.update_user_settings(1, "https://b", "https://s"),
+        lambda db: db.update_user(1, blog_url="https://b"),
+        lambda db: db.update_company_linked_in_url_for_user(1, "https://c"),
+    ])
+    def test_update_invalidates_cached_settings(self, update, mock_database_connection, user_settings_row):
+        from cqc_lem.utilities import db
+
+        mock_database_connection["cursor"].fetchone.return_value = user_settings_row(timezone="UTC")
+        mock_database_connection["cursor"].rowcount = 1
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]) as mock_conn:
+            db.get_user_settings(1)
+            update(db)
+            db.get_user_settings(1)
+
+        # load, update, reload
+        assert mock_conn.call_count == 3
@@ -0,0 +1,250 @@
+"""Unit tests for the Redis sorted-set delayed dispatcher (delayed_dispatch.py)."""
+
+import json
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+_MOD = "cqc_lem.utilities.delayed_dispatch"
+
+_ANCHOR = datetime(2026, 10, 20, 14, 0, tzinfo=timezone.utc)
+_T = _ANCHOR.timestamp()
+
+
+@pytest.fixture
+def client(monkeypatch, fake_redis):
+    monkeypatch.setenv("DELAYED_DISPATCH_ENABLED", "true")
+    with patch(f"{_MOD}.redis_client", return_value=fake_redis):
+        yield fake_redis
+
+
+@pytest.fixture
+def broken(monkeypatch):
+    monkeypatch.setenv("DELAYED_DISPATCH_ENABLED", "true")
+    redis = MagicMock()
+    redis.pipeline.return_value.execute.side_effect = ConnectionError("refused")
+    redis.register_script.return_value.side_effect = ConnectionError("refused")
+    with patch(f"{_MOD}.redis_client", return_value=redis), patch(f"{_MOD}.log_warning"):
+        yield redis
+
+
+def _at(seconds: float) -> datetime:
+    return datetime.fromtimestamp(_T + seconds, timezone.utc)
+
+
+class TestSchedule:
+    def test_job_parked_under_its_post(self, client):
+        from cqc_lem.utilities.delayed_dispatch import schedule
+
+        assert schedule("run_automation.automate_commenting", {"user_id": 7}, _at(-900),
+                        key="post:42", anchor=_ANCHOR) is True
+
+        job_id = "post:42:run_automation.automate_commenting"
+        assert json.loads(client.hget("delayed:jobs", job_id))["offset"] == -900.0
+        assert client.zscore("delayed:due", job_id) == _T - 900
+        assert client.smembers("delayed:key:post:42") == {job_id.encode()}
+
+    def test_same_task_and_key_replaces_the_job(self, client):
+        from cqc_lem.utilities.delayed_dispatch import schedule
+
+        schedule("t", {"n": 1}, _at(0), key="post:1")
+        schedule("t", {"n": 2}, _at(60), key="post:1")
+        assert client.zrange("delayed:due", 0, -1, withscores=True) == [(b"post:1:t", _T + 60)]
+
+    def test_naive_due_time_is_utc(self, client):
+        from cqc_lem.utilities.delayed_dispatch import schedule
+
+        schedule("t", {}, datetime(2026, 10, 20, 14, 0), key="post:1")
+        assert client.zscore("delayed:due", "post:1:t") == _T
+
+    def test_redis_unavailable_falls_back(self, monkeypatch):
+        from cqc_lem.utilities.delayed_dispatch import schedule
+
+        monkeypatch.setenv("DELAYED_DISPATCH_ENABLED", "true")
+        with patch(f"{_MOD}.redis_client", return_value=None):
+            assert schedule("t", {}, _ANCHOR) is False
+
+    def test_redis_error_falls_back(self, broken):
+        from cqc_lem.utilities.delayed_dispatch import schedule
+
+        assert schedule("t", {}, _ANCHOR) is False
+
+    def test_disabled(self, monkeypatch):
+        from cqc_lem.utilities.delayed_dispatch import schedule
+
+        monkeypatch.setenv("DELAYED_DISPATCH_ENABLED", "false")
+        with patch(f"{_MOD}.redis_client") as mock_client:
+            assert schedule("t", {}, _ANCHOR) is False
+        mock_client.assert_not_called()
+
+
+class TestCancelAndReschedule:
+    def test_cancel_removes_every_job_of_the_post(self, client):
+        from cqc_lem.utilities.delayed_dispatch import cancel, pending, schedule
+
+        schedule("a", {}, _at(0), key="post:42")
+        schedule("b", {}, _at(60), key="post:42")
+        schedule("a", {}, _at(0), key="post:43")
+
+        assert cancel("post:42") == 2
+        assert pending("post:42") == []
+        assert [job.id for job in pending("post:43")] == ["post:43:a"]
+
+    def test_cancel_drops_a_leased_job(self, client):
+        from cqc_lem.utilities.delayed_dispatch import ack, cancel, pop_due, schedule
+
+        schedule("a", {}, _at(0), key="post:42")
+        [job] = pop_due(now=_T)
+        cancel("post:42")
+
+        assert ack(job) is False
+        assert pop_due(now=_T + 1000) == []
+
+    def test_cancel_unknown_post(self, client):
+        from cqc_lem.utilities.delayed_dispatch import cancel
+
+        assert cancel("post:42") == 0
+
+    def test_reschedule_keeps_each_offset(self, client):
+        from cqc_lem.utilities.delayed_dispatch import pending, reschedule, schedule
+
+        schedule("post", {}, _ANCHOR, key="post:42", anchor=_ANCHOR)
+        schedule("comment", {}, _at(-900), key="post:42", anchor=_ANCHOR)
+        new_anchor = datetime(2026, 10, 21, 9, 0, tzinfo=timezone.utc)
+
+        assert reschedule("post:42", new_anchor) == 2
+        assert [(job.task, job.due) for job in pending("post:42")] == [
+            ("comment", new_anchor.timestamp() - 900), ("post", new_anchor.timestamp())]
+
+
+class TestPop:
+    def test_due_jobs_are_leased_once(self, client):
+        from cqc_lem.utilities.delayed_dispatch import pop_due, schedule
+
+        schedule("post", {"post_id": 42}, _at(0), key="post:42")
+        schedule("later", {}, _at(600), key="post:42")
+
+        [job] = pop_due(now=_T + 60, limit=10)
+        assert (job.id, job.task, job.kwargs, job.due) == ("post:42:post", "post", {"post_id": 42}, _T)
+        # A second poller gets nothing: the job is leased, not pending
+        assert pop_due(now=_T + 60, limit=10) == []
+        assert client.zscore("delayed:processing", "post:42:post") == _T + 60 + 120
+
+    def test_limit_bounds_the_batch(self, client):
+        from cqc_lem.utilities.delayed_dispatch import pop_due, schedule
+
+        for n in range(5):
+            schedule("t", {"n": n}, _at(n))
+        assert [job.kwargs["n"] for job in pop_due(now=_T + 10, limit=3)] == [0, 1, 2]
+        assert [job.kwargs["n"] for job in pop_due(now=_T + 10, limit=3)] == [3, 4]
+
+    def test_ack_deletes_the_sent_job(self, client):
+        from cqc_lem.utilities.delayed_dispatch import ack, pop_due, schedule
+
+        schedule("post", {}, _at(0), key="post:42")
+        [job] = pop_due(now=_T)
+
+        assert ack(job) is True
+        assert not client.exists("delayed:jobs", "delayed:processing", "delayed:lease_due",
+                                 "delayed:key:post:42")
+
+    def test_job_scheduled_again_while_leased_survives_the_ack(self, client):
+        from cqc_lem.utilities.delayed_dispatch import ack, pending, pop_due, schedule
+
+        schedule("post", {"v": 1}, _at(0), key="post:42")
+        [job] = pop_due(now=_T)
+        schedule("post", {"v": 2}, _at(3600), key="post:42")
+
+        assert ack(job) is False
+        assert [(j.kwargs, j.due) for j in pending("post:42")] == [({"v": 2}, _T + 3600)]
+
+    def test_expired_lease_is_put_back_with_its_due_time(self, client):
+        from cqc_lem.utilities.delayed_dispatch import pop_due, schedule
+
+        schedule("post", {}, _at(0), key="post:42")
+        pop_due(now=_T)  # this poller dies before sending
+
+        assert pop_due(now=_T + 119) == []
+        [job] = pop_due(now=_T + 121)
+        assert (job.id, job.due) == ("post:42:post", _T)
+
+    def test_restore_ends_the_lease_at_once(self, client):
+        from cqc_lem.utilities.delayed_dispatch import pop_due, restore, schedule
+
+        schedule("post", {}, _at(0), key="post:42")
+        [job] = pop_due(now=_T)
+
+        assert restore(job) is True
+        assert [j.id for j in pop_due(now=_T + 1)] == ["post:42:post"]
+
+    def test_redis_error_pops_nothing(self, broken):
+        from cqc_lem.utilities.delayed_dispatch import pop_due
+
+        assert pop_due(now=_T) == []
+
+
+class TestDispatch:
+    def test_due_jobs_sent_and_lateness_recorded(self, client):
+        from cqc_lem.utilities.delayed_dispatch import (
+            dispatch_due,
+            get_delayed_dispatch_stats,
+            schedule,
+        )
+
+        schedule("post", {"post_id": 1}, _at(0), key="post:1")
+        schedule("post", {"post_id": 2}, _at(30), key="post:2")
+        send = MagicMock()
+
+        result = dispatch_due(send, limit=10, now=_T + 40)
+
+        assert result == {"dispatched": 2, "failed": 0, "max_lateness": 40.0}
+        assert [c.args for c in send.call_args_list] == [("post", {"post_id": 1}), ("post", {"post_id": 2})]
+        stats = get_delayed_dispatch_stats()
+        assert (stats["pending"], stats["leased"], stats["dispatched"]) == (0, 0, 2)
+        assert stats["lateness_seconds"] == 50.0
+
+    def test_full_batch_polls_again(self, client):
+        from cqc_lem.utilities.delayed_dispatch import dispatch_due, schedule
+
+        schedule("a", {}, _at(0))
+        schedule("b", {}, _at(0))
+        send = MagicMock()
+        assert dispatch_due(send, limit=1, now=_T)["dispatched"] == 2
+        assert send.call_count == 2
+
+    def test_failed_send_is_retried_on_the_next_poll(self, client):
+        from cqc_lem.utilities.delayed_dispatch import dispatch_due, schedule
+
+        schedule("post", {"post_id": 1}, _at(0), key="post:1")
+        send = MagicMock(side_effect=[ConnectionError("broker down"), None])
+        with patch(f"{_MOD}.log_warning"):
+            result = dispatch_due(send, limit=1, now=_T)
+        assert result["failed"] == 1 and result["dispatched"] == 0
+
+        assert dispatch_due(send, limit=1, now=_T + 15)["dispatched"] == 1
+        assert send.call_count == 2
+
+    def test_job_kept_when_its_ack_fails(self, broken):
+        from cqc_lem.utilities.delayed_dispatch import DelayedJob, ack
+
+        assert ack(DelayedJob("post:1:post", "post", {}, 1000.0, "post:1", 0.0)) is False
+
+    def test_stats(self, client):
+        from cqc_lem.utilities.delayed_dispatch import (
+            get_delayed_dispatch_stats,
+            pop_due,
+            schedule,
+        )
+
+        long_ago = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        schedule("a", {}, long_ago)
+        schedule("b", {}, long_ago)
+        schedule("c", {}, _at(60))
+        pop_due(now=long_ago.timestamp(), limit=1)
+
+        stats = get_delayed_dispatch_stats()
+        assert (stats["pending"], stats["leased"]) == (2, 1)
+        assert stats["overdue_seconds"] > 86400
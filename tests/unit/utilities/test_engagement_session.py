@@ -0,0 +1,249 @@
+"""Unit tests for durable engagement-session loops (engagement_session.py)."""
+
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+_MOD = "cqc_lem.utilities.engagement_session"
+
+
+class _Clock:
+    """Wall and monotonic time that only move when the loop sleeps or a pass runs."""
+
+    def __init__(self, now=1000.0, pass_seconds=5.0):
+        self.now = now
+        self.pass_seconds = pass_seconds
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    clock = _Clock()
+    with patch(f"{_MOD}.time", clock):
+        yield clock
+
+
+@pytest.fixture
+def client():
+    redis = MagicMock()
+    redis.hgetall.return_value = {}
+    with patch(f"{_MOD}.redis_client", return_value=redis):
+        yield redis
+
+
+@pytest.fixture
+def no_redis():
+    with patch(f"{_MOD}.redis_client", return_value=None):
+        yield
+
+
+def _task(task_id="task-1"):
+    task = MagicMock()
+    task.name = "cqc_lem.app.run_automation.automate_commenting"
+    task.request.id = task_id
+    return task
+
+
+def _pass(clock):
+    calls = []
+
+    def iteration():
+        calls.append(clock.now)
+        clock.now += clock.pass_seconds
+        return f"pass {len(calls)}"
+
+    return iteration, calls
+
+
+class TestRun:
+    def test_single_pass_without_budget(self, clock, client):
+        from cqc_lem.utilities.engagement_session import EngagementSession
+
+        task = _task()
+        session = EngagementSession.open(task, "commenting", {"user_id": 7, "loop_for_duration": None})
+        iteration, calls = _pass(clock)
+
+        assert session.run(iteration) == "pass 1"
+        assert len(calls) == 1
+        task.apply_async.assert_not_called()
+        client.hgetall.assert_not_called()
+
+    def test_short_waits_reuse_the_browser_until_the_budget_is_spent(self, clock, no_redis):
+        from cqc_lem.utilities.engagement_session import EngagementSession
+
+        task = _task()
+        session = EngagementSession.open(task, "commenting",
+                                         {"user_id": 7, "loop_for_duration": 200, "future_forward": 60})
+        iteration, calls = _pass(clock)
+
+        assert session.run(iteration) == "pass 4"
+        assert calls == [1000.0, 1065.0, 1130.0, 1195.0]  # 1200 + 60 would pass the 1200 deadline
+        task.apply_async.assert_not_called()
+
+    def test_long_wait_checkpoints_and_reschedules(self, clock, client):
+        from cqc_lem.utilities.engagement_session import EngagementSession
+
+        task = _task()
+        session = EngagementSession.open(task, "commenting",
+                                         {"user_id": 7, "loop_for_duration": 3600, "future_forward": 600})
+        iteration, _ = _pass(clock)
+        session.run(iteration)
+
+        call = task.apply_async.call_args.kwargs
+        assert call["countdown"] == 600
+        assert call["kwargs"] == {"user_id": 7, "loop_for_duration": 2995, "future_forward": 600,
+                                  "session": "task-1"}
+        checkpoint = client.pipeline.return_value.hset.call_args.kwargs["mapping"]
+        assert checkpoint["task_id"] == call["task_id"]
+        assert checkpoint["deadline"] == 4600.0
+        assert checkpoint["iteration"] == 1
+        client.pipeline.return_value.zadd.assert_called_with("engagement:due", {"commenting:7": 1605.0 + 3600})
+
+    def test_yields_the_browser_after_max_hold(self, clock, no_redis, monkeypatch):
+        from cqc_lem.utilities.engagement_session import EngagementSession
+
+        monkeypatch.setenv("ENGAGEMENT_SESSION_MAX_HOLD_SECONDS", "100")
+        task = _task()
+        session = EngagementSession.open(task, "commenting",
+                                         {"user_id": 7, "loop_for_duration": 3600, "future_forward": 60})
+        iteration, calls = _pass(clock)
+        session.run(iteration)
+
+        assert len(calls) == 2
+        assert task.apply_async.call_args.kwargs["countdown"] == 60
+
+    def test_next_wait_carries_state_into_the_continuation(self, clock, no_redis):
+        from cqc_lem.utilities.engagement_session import EngagementSession
+
+        def backoff(s):
+            s.kwargs["future_forward"] += 1
+            return 300
+
+        task = _task()
+        session = EngagementSession.open(task, "reply_commenting",
+                                         {"user_id": 7, "post_id": 3, "loop_for_duration": 3600,
+                                          "future_forward": 0}, scope=3)
+        iteration, _ = _pass(clock)
+        session.run(iteration, next_wait=backoff)
+
+        assert session.key == "engagement:session:reply_commenting:3:7"
+        assert task.apply_async.call_args.kwargs["kwargs"]["future_forward"] == 1
+
+    def test_failed_pass_clears_the_checkpoint(self, clock, client):
+        from cqc_lem.utilities.engagement_session import EngagementSession
+
+        session = EngagementSession.open(_task(), "commenting", {"user_id": 7, "loop_for_duration": 600})
+        client.hget.return_value = session.session_id.encode()
+
+        with pytest.raises(RuntimeError):
+            session.run(MagicMock(side_effect=RuntimeError("stale element")))
+        client.pipeline.return_value.delete.assert_called_once_with("engagement:session:commenting:7")
+
+
+class TestOpen:
+    def _state(self, overrides=None):
+        state = {b"session_id": b"sess-1", b"task": b"cqc_lem.app.run_automation.automate_commenting",
+                 b"task_id": b"task-2", b"deadline": b"2000.0", b"iteration": b"4",
+                 b"kwargs": json.dumps({"user_id": 7, "loop_for_duration": 900, "future_forward": 60,
+                                        "session": "sess-1"}).encode()}
+        state.update(overrides or {})
+        return state
+
+    def test_superseded_continuation_is_skipped(self, clock, client):
+        from cqc_lem.utilities.engagement_session import EngagementSession
+
+        client.hgetall.return_value = self._state({b"session_id": b"sess-9"})
+        with patch(f"{_MOD}.log_info"):
+            assert EngagementSession.open(_task("task-2"), "commenting",
+                                          {"user_id": 7, "loop_for_duration": 900, "session": "sess-1"}) is None
+
+    def test_continuation_resumed_elsewhere_is_skipped(self, clock, client):
+        from cqc_lem.utilities.engagement_session import EngagementSession
+
+        client.hgetall.return_value = self._state()
+        with patch(f"{_MOD}.log_info"):
+            assert EngagementSession.open(_task("task-old"), "commenting",
+                                          {"user_id": 7, "loop_for_duration": 900, "session": "sess-1"}) is None
+
+    def test_redelivered_message_resumes_from_the_checkpoint(self, clock, client):
+        from cqc_lem.utilities.engagement_session import EngagementSession
+
+        client.hgetall.return_value = self._state()
+        session = EngagementSession.open(_task("task-2"), "commenting",
+                                         {"user_id": 7, "loop_for_duration": 3600, "future_forward": 60})
+
+        assert (session.session_id, session.deadline, session.iteration) == ("sess-1", 2000.0, 4)
+        client.pipeline.return_value.hincrby.assert_any_call("engagement:stats", "commenting:resumed", 1)
+
+    def test_new_run_takes_over_the_checkpoint(self, clock, client):
+        from cqc_lem.utilities.engagement_session import EngagementSession
+
+        client.hgetall.return_value = self._state()
+        session = EngagementSession.open(_task("task-new"), "commenting",
+                                         {"user_id": 7, "loop_for_duration": 600, "future_forward": 60})
+
+        assert (session.session_id, session.deadline) == ("task-new", 1600.0)
+        mapping = client.pipeline.return_value.hset.call_args.kwargs["mapping"]
+        assert mapping["session_id"] == "task-new"
+        assert mapping["task_id"] == "task-new"
+
+    def test_redis_failure_starts_from_kwargs(self, clock, client):
+        from cqc_lem.utilities.engagement_session import EngagementSession
+
+        client.hgetall.side_effect = ConnectionError("refused")
+        with patch(f"{_MOD}.log_warning"):
+            session = EngagementSession.open(_task(), "commenting", {"user_id": 7, "loop_for_duration": 600})
+        assert session.deadline == 1600.0
+
+
+class TestResumeLost:
+    def test_resends_live_sessions_and_drops_expired(self, client):
+        from cqc_lem.utilities.engagement_session import resume_lost
+
+        client.zrangebyscore.return_value = [b"commenting:7", b"profile_viewers:8"]
+        live = {b"session_id": b"sess-1", b"task": b"run_automation.automate_commenting",
+                b"task_id": b"dead", b"deadline": b"2000.0", b"iteration": b"2",
+                b"kwargs": json.dumps({"user_id": 7, "future_forward": 60}).encode()}
+        expired = {**live, b"deadline": b"900.0"}
+        client.hgetall.side_effect = [live, expired]
+        send = MagicMock()
+
+        assert resume_lost(send, now=1000.0) == {"resumed": 1, "expired": 1}
+        task_name, kwargs, task_id = send.call_args.args
+        assert task_name == "run_automation.automate_commenting"
+        assert kwargs == {"user_id": 7, "future_forward": 60, "loop_for_duration": 1000, "session": "sess-1"}
+        assert client.pipeline.return_value.hset.call_args.kwargs["mapping"]["task_id"] == task_id
+        client.delete.assert_called_once_with("engagement:session:profile_viewers:8")
+
+    def test_without_redis(self, no_redis):
+        from cqc_lem.utilities.engagement_session import resume_lost
+
+        send = MagicMock()
+        assert resume_lost(send) == {"resumed": 0, "expired": 0}
+        send.assert_not_called()
+
+
+class TestStats:
+    def test_prometheus_gauges_per_activity(self, client):
+        from cqc_lem.utilities.engagement_session import prometheus_gauges
+
+        client.zrange.return_value = [b"commenting:7", b"reply_commenting:3:7", b"commenting:8"]
+        client.hgetall.return_value = {b"commenting:iterations": b"12", b"commenting:iteration_seconds": b"90.5",
+                                       b"reply_commenting:reused": b"3"}
+        gauges = prometheus_gauges()
+
+        assert gauges['cqc_lem_engagement_sessions_active{activity="commenting"}'] == 2
+        assert gauges['cqc_lem_engagement_iterations_total{activity="commenting"}'] == 12
+        assert gauges['cqc_lem_engagement_iteration_seconds_total{activity="commenting"}'] == 90.5
+        assert gauges['cqc_lem_engagement_browser_reused_total{activity="reply_commenting"}'] == 3
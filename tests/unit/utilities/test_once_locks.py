@@ -0,0 +1,158 @@
+"""Unit tests for non-blocking celery-once locks (once_locks.py)."""
+
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+_MOD = "cqc_lem.utilities.once_locks"
+
+
+_KEY = "qo_cqc_lem.tests.once_example_user_id-7"
+
+
+@pytest.fixture
+def client(fake_redis):
+    with patch(f"{_MOD}.redis_client", return_value=fake_redis):
+        yield fake_redis
+
+
+@pytest.fixture
+def no_redis():
+    with patch(f"{_MOD}.redis_client", return_value=None):
+        yield
+
+
+@pytest.fixture
+def task():
+    from cqc_lem.app.my_celery import app
+    from cqc_lem.utilities.once_locks import QueueOnce
+
+    @app.task(bind=True, base=QueueOnce, once={'graceful': True, 'keys': ['user_id']},
+              name="cqc_lem.tests.once_example")
+    def once_example(self, user_id, note=None):
+        return user_id
+
+    with patch("celery.app.task.Task.apply_async") as mock_send:
+        mock_send.side_effect = lambda self, args=None, kwargs=None, **options: MagicMock(id=options.get("task_id"))
+        once_example.mock_send = mock_send
+        yield once_example
+
+
+def _stat(client, field):
+    value = client.hget("once:stats", field)
+    return float(value) if value is not None else 0
+
+
+class TestApplyAsync:
+    def test_first_request_takes_the_lock_with_its_task_id(self, client, task):
+        result = task.apply_async(kwargs={"user_id": 7})
+
+        assert client.get(_KEY) == result.id.encode()
+        assert 3590 < client.ttl(_KEY) <= 3600
+        assert client.zscore("once:locks", f"cqc_lem.tests.once_example|{_KEY}") is not None
+        task.mock_send.assert_called_once()
+        assert _stat(client, "once_example:acquired") == 1
+
+    def test_duplicate_coalesces_into_the_queued_task(self, client, task):
+        first = task.apply_async(kwargs={"user_id": 7})
+        result = task.apply_async(kwargs={"user_id": 7, "note": "again"})
+
+        assert result.id == first.id
+        task.mock_send.assert_called_once()
+        assert _stat(client, "once_example:hits") == 1
+
+    def test_other_keys_are_not_duplicates(self, client, task):
+        task.apply_async(kwargs={"user_id": 7})
+        task.apply_async(kwargs={"user_id": 8})
+
+        assert task.mock_send.call_count == 2
+
+    def test_non_graceful_duplicate_fails_fast_with_the_holder(self, client, task):
+        from cqc_lem.utilities.once_locks import AlreadyQueued
+
+        first = task.apply_async(kwargs={"user_id": 7})
+        with pytest.raises(AlreadyQueued) as exc:
+            task.apply_async(kwargs={"user_id": 7}, once={'graceful': False})
+        assert exc.value.task_id == first.id
+        assert 3590 < exc.value.countdown <= 3600
+
+    def test_retry_skips_the_lock(self, client, task):
+        task.apply_async(kwargs={"user_id": 7}, retries=1)
+
+        assert not client.exists(_KEY)
+        task.mock_send.assert_called_once()
+
+    def test_failed_publish_releases_the_lock(self, client, task):
+        task.mock_send.side_effect = ConnectionError("broker down")
+
+        with pytest.raises(ConnectionError):
+            task.apply_async(kwargs={"user_id": 7}, task_id="task-9")
+        assert not client.exists(_KEY)
+        assert client.zcard("once:locks") == 0
+
+    def test_without_redis_enqueues_without_a_lock(self, no_redis, task):
+        task.apply_async(kwargs={"user_id": 7})
+
+        task.mock_send.assert_called_once()
+
+    def test_after_return_releases_only_its_own_lock(self, client, task):
+        task.apply_async(kwargs={"user_id": 7}, task_id="task-2")
+
+        task.after_return("SUCCESS", 7, "task-1", (), {"user_id": 7}, None)
+        assert client.get(_KEY) == b"task-2"
+
+        task.after_return("SUCCESS", 7, "task-2", (), {"user_id": 7}, None)
+        assert not client.exists(_KEY)
+        assert client.zcard("once:locks") == 0
+
+
+class TestReapStale:
+    def test_reaps_locks_of_finished_tasks(self, client):
+        from cqc_lem.utilities.once_locks import RedisOnceBackend, reap_stale
+
+        backend = RedisOnceBackend()
+        for n, task_id in ((1, "task-done"), (2, "task-queued"), (3, "task-gone")):
+            backend.lock(f"qo_post_{n}", task_id, 3600, "cqc_lem.x.post")
+        client.delete("qo_post_3")  # expired
+        states = {"task-done": "FAILURE", "task-queued": "PENDING"}
+
+        assert reap_stale(states.get, now=time.time() + 121) == {"reaped": 1, "expired": 1}
+        assert not client.exists("qo_post_1")
+        assert client.get("qo_post_2") == b"task-queued"
+        assert client.zrange("once:locks", 0, -1) == [b"cqc_lem.x.post|qo_post_2"]
+        assert _stat(client, "post:stale") == 1
+
+    def test_young_locks_are_not_checked(self, client):
+        from cqc_lem.utilities.once_locks import RedisOnceBackend, reap_stale
+
+        RedisOnceBackend().lock("qo_post_1", "task-done", 3600, "cqc_lem.x.post")
+        state_of = MagicMock(return_value="FAILURE")
+
+        assert reap_stale(state_of) == {"reaped": 0, "expired": 0}
+        state_of.assert_not_called()
+
+    def test_without_redis(self, no_redis):
+        from cqc_lem.utilities.once_locks import reap_stale
+
+        state_of = MagicMock()
+        assert reap_stale(state_of) == {"reaped": 0, "expired": 0}
+        state_of.assert_not_called()
+
+
+class TestStats:
+    def test_prometheus_gauges_per_task(self, client):
+        from cqc_lem.utilities.once_locks import prometheus_gauges
+
+        client.zadd("once:locks", {"a|k1": 1.0, "a|k2": 1.0, "a|k3": 1.0, "a|k4": 1.0})
+        client.hset("once:stats", mapping={"post_to_linkedin:acquired": 12, "post_to_linkedin:hits": 3,
+                                           "post_to_linkedin:wait_seconds": 0.25, "send_private_dm:stale": 1})
+        gauges = prometheus_gauges()
+
+        assert gauges["cqc_lem_once_locks_held"] == 4
+        assert gauges['cqc_lem_once_lock_acquired_total{task="post_to_linkedin"}'] == 12
+        assert gauges['cqc_lem_once_lock_hits_total{task="post_to_linkedin"}'] == 3
+        assert gauges['cqc_lem_once_lock_wait_seconds_total{task="post_to_linkedin"}'] == 0.25
+        assert gauges['cqc_lem_once_lock_stale_total{task="send_private_dm"}'] == 1
@@ -0,0 +1,93 @@
+"""Unit tests for per-provider concurrency limits (provider_slots.py)."""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+_MOD = "cqc_lem.utilities.provider_slots"
+
+
+@pytest.fixture
+def client(fake_redis):
+    with patch(f"{_MOD}.redis_client", return_value=fake_redis):
+        yield fake_redis
+
+
+class TestLimits:
+    def test_parsed_from_env(self, monkeypatch):
+        from cqc_lem.utilities.provider_slots import (
+            provider_limits,
+            providers_for_post_type,
+        )
+
+        monkeypatch.setenv("CONTENT_PROVIDER_CONCURRENCY", "runway:1, flux:x, LLM:0")
+        assert provider_limits() == {"runway": 1, "llm": 0}
+        assert providers_for_post_type("carousel") == ("llm", "flux")
+        assert providers_for_post_type(None) == ("llm",)
+
+
+class TestAcquire:
+    def test_leases_every_provider_up_to_its_limit(self, client, monkeypatch):
+        from cqc_lem.utilities.provider_slots import acquire
+
+        monkeypatch.setenv("CONTENT_PROVIDER_CONCURRENCY", "llm:8,runway:1")
+        assert acquire(("llm", "runway"), "task-1", now=1000.0) is None
+        assert client.zscore("provider:slots:runway", "task-1") == 1000.0 + 1800
+        assert acquire(("llm", "runway"), "task-2", now=1001.0) == "runway"
+
+    def test_full_provider_takes_none_of_the_leases(self, client, monkeypatch):
+        from cqc_lem.utilities.provider_slots import acquire
+
+        monkeypatch.setenv("CONTENT_PROVIDER_CONCURRENCY", "llm:8,runway:1")
+        acquire(("runway",), "task-1", now=1000.0)
+        acquire(("llm", "runway"), "task-2", now=1001.0)
+        assert client.zscore("provider:slots:llm", "task-2") is None
+
+    def test_holder_retrying_keeps_its_lease(self, client, monkeypatch):
+        from cqc_lem.utilities.provider_slots import acquire
+
+        monkeypatch.setenv("CONTENT_PROVIDER_CONCURRENCY", "runway:1")
+        acquire(("runway",), "task-1", now=1000.0)
+        assert acquire(("runway",), "task-1", now=1500.0) is None
+        assert client.zscore("provider:slots:runway", "task-1") == 1500.0 + 1800
+
+    def test_expired_lease_frees_the_slot(self, client, monkeypatch):
+        from cqc_lem.utilities.provider_slots import acquire
+
+        monkeypatch.setenv("CONTENT_PROVIDER_CONCURRENCY", "runway:1")
+        acquire(("runway",), "task-1", now=1000.0)
+        assert acquire(("runway",), "task-2", now=1000.0 + 1801) is None
+        assert client.zrange("provider:slots:runway", 0, -1) == [b"task-2"]
+
+    def test_zero_limit_is_unlimited(self, client, monkeypatch):
+        from cqc_lem.utilities.provider_slots import acquire
+
+        monkeypatch.setenv("CONTENT_PROVIDER_CONCURRENCY", "llm:0")
+        assert all(acquire(("llm",), f"task-{i}", now=1000.0) is None for i in range(20))
+
+    def test_redis_failure_runs_the_task(self):
+        from cqc_lem.utilities.provider_slots import acquire
+
+        redis = MagicMock()
+        redis.register_script.return_value.side_effect = ConnectionError("refused")
+        with patch(f"{_MOD}.redis_client", return_value=redis), patch(f"{_MOD}.log_warning"):
+            assert acquire(("runway",), "task-1") is None
+
+    def test_release_and_stats(self, client, monkeypatch):
+        from cqc_lem.utilities.provider_slots import (
+            acquire,
+            get_provider_slot_stats,
+            release,
+        )
+
+        monkeypatch.setenv("CONTENT_PROVIDER_CONCURRENCY", "llm:8,flux:4,runway:2")
+        acquire(("llm", "flux", "runway"), "task-1", now=1000.0)
+        acquire(("llm", "runway"), "task-2", now=1000.0)
+        release(("llm", "flux"), "task-1")
+
+        stats = get_provider_slot_stats(now=1000.0)
+        assert stats == {"llm": {"in_use": 1, "limit": 8}, "flux": {"in_use": 0, "limit": 4},
+                         "runway": {"in_use": 2, "limit": 2}}
+        assert get_provider_slot_stats(now=1000.0 + 1801)["runway"]["in_use"] == 0
@@ -0,0 +1,83 @@
+"""Unit tests for the interval queue-depth sampler (queue_metrics.py)."""
+
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+_MOD = "cqc_lem.utilities.queue_metrics"
+
+_SAMPLE = {"celery": {"QueueLength": 4, "ActiveTasks": 1}, "selenium": {"QueueLength": 2}}
+
+
+class TestQueueSampler:
+    def test_one_put_metric_data_per_tick(self):
+        from cqc_lem.utilities.queue_metrics import NAMESPACE, QueueSampler
+
+        mock_cw_client = MagicMock()
+        sampler = QueueSampler(lambda: _SAMPLE, interval=60, aws_region="us-east-1")
+        with patch(f"{_MOD}.get_cloudwatch_client", return_value=mock_cw_client):
+            assert sampler.tick() == _SAMPLE
+
+        mock_cw_client.put_metric_data.assert_called_once()
+        kwargs = mock_cw_client.put_metric_data.call_args.kwargs
+        assert kwargs["Namespace"] == NAMESPACE == "cqc-lem/celery_queue"
+        assert [(d["MetricName"], d["Dimensions"][0]["Value"], d["Value"]) for d in kwargs["MetricData"]] == [
+            ("ActiveTasks", "celery", 1), ("QueueLength", "celery", 4), ("QueueLength", "selenium", 2)]
+
+    def test_no_cloudwatch_without_aws_region(self):
+        from cqc_lem.utilities.queue_metrics import QueueSampler
+
+        sampler = QueueSampler(lambda: _SAMPLE, interval=60, aws_region=None)
+        with patch(f"{_MOD}.get_cloudwatch_client") as mock_cw:
+            sampler.tick()
+        mock_cw.assert_not_called()
+        assert sampler.latest == _SAMPLE
+
+    def test_sample_or_publish_failure_never_raises(self):
+        from cqc_lem.utilities.queue_metrics import QueueSampler
+
+        failing = QueueSampler(MagicMock(side_effect=ConnectionError("broker down")), interval=60)
+        assert failing.tick() == {}
+
+        sampler = QueueSampler(lambda: _SAMPLE, interval=60, aws_region="us-east-1")
+        with patch(f"{_MOD}.get_cloudwatch_client", side_effect=Exception("timeout")):
+            assert sampler.tick() == _SAMPLE
+
+    def test_disabled_interval_starts_nothing(self, monkeypatch):
+        from cqc_lem.utilities.queue_metrics import QueueSampler
+
+        monkeypatch.setenv("QUEUE_METRICS_INTERVAL_SECONDS", "0")
+        sample = MagicMock()
+        sampler = QueueSampler(sample)
+        sampler.start()
+        sample.assert_not_called()
+        assert sampler._thread is None
+
+
+class TestFormats:
+    def test_metric_data_timestamped_once(self):
+        from cqc_lem.utilities.queue_metrics import metric_data
+
+        ts = datetime(2026, 10, 18, tzinfo=timezone.utc)
+        data = metric_data(_SAMPLE, timestamp=ts)
+        assert len(data) == 3
+        assert all(d["Timestamp"] == ts and d["Unit"] == "Count" for d in data)
+
+    def test_fixed_dimensions_added_to_every_datum(self):
+        from cqc_lem.utilities.queue_metrics import metric_data, render_prometheus
+
+        data = metric_data(_SAMPLE, dimensions={"Worker": "llm-worker@host"})
+        assert all(d["Dimensions"][1] == {"Name": "Worker", "Value": "llm-worker@host"} for d in data)
+        assert 'cqc_lem_celery_active_tasks{queue="celery",worker="llm-worker@host"} 1' in \
+            render_prometheus(_SAMPLE, {"Worker": "llm-worker@host"})
+
+    def test_prometheus_text(self):
+        from cqc_lem.utilities.queue_metrics import render_prometheus
+
+        text = render_prometheus(_SAMPLE)
+        assert text.count("# TYPE cqc_lem_celery_queue_length gauge") == 1
+        assert 'cqc_lem_celery_queue_length{queue="selenium"} 2' in text
+        assert 'cqc_lem_celery_active_tasks{queue="celery"} 1' in text
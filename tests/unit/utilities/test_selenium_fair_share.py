@@ -0,0 +1,242 @@
+"""Unit tests for per-user fair-share admission of Selenium tasks (selenium_fair_share.py)."""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+from celery.exceptions import Retry
+
+pytestmark = pytest.mark.unit
+
+_MOD = "cqc_lem.utilities.selenium_fair_share"
+
+
+@pytest.fixture
+def client(monkeypatch, fake_redis):
+    monkeypatch.setenv("SELENIUM_FAIR_SHARE_ENABLED", "true")
+    with patch(f"{_MOD}.redis_client", return_value=fake_redis):
+        yield fake_redis
+
+
+@pytest.fixture
+def broken(monkeypatch):
+    monkeypatch.setenv("SELENIUM_FAIR_SHARE_ENABLED", "true")
+    redis = MagicMock()
+    redis.register_script.return_value.side_effect = ConnectionError("refused")
+    with patch(f"{_MOD}.redis_client", return_value=redis):
+        yield redis
+
+
+class TestTiers:
+    def test_weights_and_caps_by_tier(self, monkeypatch):
+        from cqc_lem.utilities.selenium_fair_share import tier_cap, tier_weight
+
+        assert tier_weight("enterprise") == 3.0
+        assert tier_weight(None) == 1.0
+        monkeypatch.setenv("SELENIUM_TIER_CAPS", "enterprise:2, starter:x")
+        assert tier_cap("enterprise") == 2
+        assert tier_cap("starter") == 1
+
+
+class TestAcquire:
+    def test_user_cap_holds_until_the_lease_is_released(self, client):
+        from cqc_lem.utilities.selenium_fair_share import acquire_slot, release_slot
+
+        slot, reason = acquire_slot(7, "task-1", tier="starter", now=1000.0)
+        assert slot is not None and reason is None
+        assert acquire_slot(7, "task-2", tier="starter", now=1001.0) == (None, "cap")
+
+        release_slot(slot)
+        assert acquire_slot(7, "task-2", tier="starter", now=1002.0)[0] is not None
+
+    def test_tier_cap_allows_parallel_runs(self, client, monkeypatch):
+        from cqc_lem.utilities.selenium_fair_share import acquire_slot
+
+        monkeypatch.setenv("SELENIUM_TIER_CAPS", "enterprise:2")
+        assert acquire_slot(7, "task-1", tier="enterprise", now=1000.0)[1] is None
+        assert acquire_slot(7, "task-2", tier="enterprise", now=1000.0)[1] is None
+        assert acquire_slot(7, "task-3", tier="enterprise", now=1000.0) == (None, "cap")
+
+    def test_retried_task_renews_its_own_lease(self, client):
+        from cqc_lem.utilities.selenium_fair_share import acquire_slot
+
+        acquire_slot(7, "task-1", tier="starter", now=1000.0)
+        assert acquire_slot(7, "task-1", tier="starter", now=1500.0)[1] is None
+        assert client.zscore("selenium:leases", "7|task-1") == 1500.0 + 3600
+
+    def test_expired_lease_frees_the_slot(self, client):
+        from cqc_lem.utilities.selenium_fair_share import acquire_slot
+
+        acquire_slot(7, "task-1", tier="starter", now=1000.0)
+        assert acquire_slot(7, "task-2", tier="starter", now=1000.0 + 3601)[1] is None
+        assert client.zrange("selenium:leases", 0, -1) == [b"7|task-2"]
+
+    def test_global_slots_defer_other_users(self, client, monkeypatch):
+        from cqc_lem.utilities.selenium_fair_share import acquire_slot
+
+        monkeypatch.setenv("SELENIUM_FAIR_SHARE_SLOTS", "1")
+        acquire_slot(7, "task-1", tier="starter", now=1000.0)
+        assert acquire_slot(8, "task-2", tier="starter", now=1000.0) == (None, "busy")
+
+    def test_waiting_user_gets_the_next_turn(self, client, monkeypatch):
+        from cqc_lem.utilities.selenium_fair_share import acquire_slot, release_slot
+
+        monkeypatch.setenv("SELENIUM_FAIR_SHARE_SLOTS", "1")
+        slot, _ = acquire_slot(7, "task-1", tier="starter", now=1000.0)
+        assert acquire_slot(8, "task-2", tier="starter", now=1010.0) == (None, "busy")
+        release_slot(slot)
+
+        # The slot is free, but user 8 has been waiting and is behind in virtual time
+        assert acquire_slot(7, "task-3", tier="starter", now=1020.0) == (None, "turn")
+        slot, _ = acquire_slot(8, "task-2", tier="starter", now=1030.0)
+        assert slot.waited == 20.0
+        assert float(client.hget("selenium:wait_stats", "8:wait_seconds")) == 20.0
+        assert client.zcard("selenium:contenders") == 1  # user 7, now waiting its turn
+
+    @staticmethod
+    def _contend(tiers: dict, rounds: int = 8) -> list:
+        """Both users keep browser work queued and ask for a slot every round."""
+        from cqc_lem.utilities.selenium_fair_share import (
+            acquire_slot,
+            note_queued,
+            release_slot,
+        )
+
+        for user in tiers:
+            note_queued(user)
+        admitted = []
+        for i in range(rounds):
+            for user, tier in tiers.items():
+                slot, _ = acquire_slot(user, f"task-{user}-{i}", tier=tier)
+                if slot is not None:
+                    admitted.append(user)
+                    release_slot(slot)
+        return admitted
+
+    def test_equal_weights_take_turns(self, client):
+        admitted = self._contend({7: "starter", 8: "starter"})
+        assert (admitted.count(7), admitted.count(8)) == (8, 8)
+
+    def test_turns_are_weighted_by_tier(self, client):
+        # Enterprise (weight 3) runs every round; starter gets about one turn in three
+        admitted = self._contend({7: "enterprise", 8: "starter"})
+        assert (admitted.count(7), admitted.count(8)) == (8, 3)
+
+    def test_stale_queued_count_stops_holding_others_back(self, client):
+        from cqc_lem.utilities.selenium_fair_share import acquire_slot
+
+        client.hset("selenium:queued", "8", 1)
+        client.zadd("selenium:queued_seen", {"8": 1000.0})
+        client.hset("selenium:vtime", "7", 5)
+
+        assert acquire_slot(7, "task-1", tier="starter", now=1010.0) == (None, "turn")
+        assert acquire_slot(7, "task-1", tier="starter", now=1000.0 + 301)[1] is None
+
+    def test_tier_read_from_db_when_not_given(self, client):
+        from cqc_lem.utilities.selenium_fair_share import acquire_slot
+
+        with patch("cqc_lem.utilities.db.get_user_subscription_info",
+                   return_value={"subscription_tier": "enterprise"}) as mock_info:
+            acquire_slot(7, "task-1", now=1000.0)
+        mock_info.assert_called_once_with(7)
+        assert float(client.hget("selenium:vtime", "7")) == pytest.approx(1 / 3)
+
+    def test_redis_failure_admits(self, broken):
+        from cqc_lem.utilities.selenium_fair_share import acquire_slot
+
+        with patch(f"{_MOD}.log_warning"):
+            slot, reason = acquire_slot(7, "task-1", tier="starter")
+        assert slot is not None and reason is None
+
+    def test_disabled_admits_without_redis(self):
+        from cqc_lem.utilities.selenium_fair_share import acquire_slot
+
+        with patch(f"{_MOD}.redis_client") as mock_client:
+            slot, _ = acquire_slot(7, "task-1")
+        assert slot.user_id == 7
+        mock_client.assert_not_called()
+
+
+class TestDecorator:
+    def _task(self):
+        task = MagicMock()
+        task.name = "cqc_lem.app.run_automation.automate_commenting"
+        task.request.id = "task-1"
+        task.retry.side_effect = Retry()
+        return task
+
+    def test_admitted_run_releases_its_lease(self, client):
+        from cqc_lem.utilities.selenium_fair_share import fair_share_slot
+
+        body = MagicMock(side_effect=lambda *a, **k: client.zcard("selenium:leases:7"))
+        with patch(f"{_MOD}._user_tier", return_value="starter"):
+            assert fair_share_slot(body)(self._task(), user_id=7, loop_for_duration=60) == 1
+
+        assert client.zcard("selenium:leases") == 0
+        assert client.zcard("selenium:leases:7") == 0
+
+    def test_deferred_run_retries_without_opening_a_browser(self, client):
+        from cqc_lem.utilities.selenium_fair_share import acquire_slot, fair_share_slot
+
+        acquire_slot(7, "task-0", tier="starter")
+        body = MagicMock()
+        task = self._task()
+        with patch(f"{_MOD}._user_tier", return_value="starter"), \
+             patch(f"{_MOD}.log_info"), \
+             pytest.raises(Retry):
+            fair_share_slot(body)(task, 7)
+
+        body.assert_not_called()
+        task.retry.assert_called_once_with(countdown=30.0, max_retries=None)
+
+    def test_selenium_tasks_keep_their_signature(self):
+        import inspect
+
+        from cqc_lem.app.run_automation import automate_commenting
+
+        assert list(inspect.signature(automate_commenting.run).parameters)[:2] == ["user_id", "loop_for_duration"]
+        assert automate_commenting.name == "cqc_lem.app.run_automation.automate_commenting"
+
+
+class TestQueuedAndStats:
+    def test_queued_count_and_cleanup(self, client):
+        from cqc_lem.utilities.selenium_fair_share import note_queued
+
+        note_queued(7)
+        note_queued(7)
+        assert client.hget("selenium:queued", "7") == b"2"
+        note_queued(7, -1)
+        note_queued(7, -1)
+        assert not client.hexists("selenium:queued", "7")
+        assert client.zscore("selenium:queued_seen", "7") is None
+
+    def test_publish_hook_counts_selenium_tasks_only(self):
+        from cqc_lem.app.my_celery import count_queued_selenium_task
+
+        with patch("cqc_lem.app.my_celery.note_queued") as mock_note:
+            count_queued_selenium_task(body=((), {"user_id": 7}, {}), routing_key="selenium")
+            count_queued_selenium_task(body=((), {"user_id": 8}, {}), routing_key="celery")
+        mock_note.assert_called_once_with(7)
+
+    def test_prometheus_gauges_per_user(self, client, monkeypatch):
+        from cqc_lem.utilities.db_metrics import render_prometheus
+        from cqc_lem.utilities.selenium_fair_share import (
+            acquire_slot,
+            note_queued,
+            prometheus_gauges,
+        )
+
+        monkeypatch.setenv("SELENIUM_USER_CAP", "2")
+        acquire_slot(7, "task-1", tier="starter")
+        acquire_slot(7, "task-2", tier="starter")
+        client.zadd("selenium:leases", {"8|task-3": 0.0})  # expired
+        for _ in range(3):
+            note_queued(8)
+        client.hset("selenium:wait_stats", "7:wait_seconds", 12.5)
+        gauges = prometheus_gauges()
+
+        assert gauges['cqc_lem_selenium_inflight{user_id="7"}'] == 2
+        assert 'cqc_lem_selenium_inflight{user_id="8"}' not in gauges
+        assert gauges['cqc_lem_selenium_queued{user_id="8"}'] == 3
+        assert gauges['cqc_lem_selenium_wait_seconds_total{user_id="7"}'] == 12.5
+        text = render_prometheus(gauges)
+        assert text.count("# TYPE cqc_lem_selenium_inflight gauge") == 1
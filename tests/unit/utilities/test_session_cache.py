@@ -0,0 +1,179 @@
+"""Unit tests for the session-token cache and its use by get_session_user_id/delete_session."""
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+_MOD = "cqc_lem.utilities.session_cache"
+_GET_CONN = "cqc_lem.utilities.db.get_db_connection"
+
+
+@pytest.fixture
+def redis_server():
+    """A sync and an async fakeredis client on one in-memory server, as an API replica
+    would reach the same Redis from threads and from the event loop."""
+    import fakeredis
+
+    server = fakeredis.FakeServer()
+    return fakeredis.FakeStrictRedis(server=server), fakeredis.FakeAsyncRedis(server=server)
+
+
+def _expires_in(seconds: float) -> datetime:
+    # naive UTC, as the DATETIME column returns it
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds)).replace(tzinfo=None)
+
+
+class TestSessionCache:
+    def test_hit_after_set_and_stats(self):
+        from cqc_lem.utilities.session_cache import SessionCache
+        cache = SessionCache(ttl=60)
+        assert cache.get("tok") is None
+        cache.set("tok", 7, _expires_in(3600))
+        assert cache.get("tok") == 7
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+    def test_already_expired_session_is_not_cached(self):
+        from cqc_lem.utilities.session_cache import SessionCache
+        cache = SessionCache(ttl=60)
+        cache.set("tok", 7, _expires_in(-1))
+        assert cache.get("tok") is None
+
+    def test_zero_ttl_disables_cache(self):
+        from cqc_lem.utilities.session_cache import SessionCache
+        cache = SessionCache(ttl=0)
+        cache.set("tok", 7, _expires_in(3600))
+        assert cache.get("tok") is None
+
+    def test_raw_token_is_never_stored(self, redis_server):
+        from cqc_lem.utilities.session_cache import SessionCache
+        redis, _ = redis_server
+        with patch(f"{_MOD}.redis_client", return_value=redis):
+            cache = SessionCache(ttl=60, use_redis=True)
+            cache.set("secret-token", 7, _expires_in(3600))
+        assert redis.keys()
+        assert all(b"secret-token" not in key for key in redis.keys())
+
+    def test_redis_shares_entries_and_evictions_across_replicas(self, redis_server):
+        from cqc_lem.utilities.session_cache import SessionCache
+        redis, _ = redis_server
+        with patch(f"{_MOD}.redis_client", return_value=redis):
+            replica_a = SessionCache(ttl=60, use_redis=True)
+            replica_b = SessionCache(ttl=60, use_redis=True)
+            replica_a.set("tok", 7, _expires_in(3600))
+            assert replica_b.get("tok") == 7
+            assert replica_b.stats()["redis_hits"] == 1
+
+            replica_a.evict("tok")
+            replica_b.clear()  # stands in for its short local TTL lapsing
+            assert replica_b.get("tok") is None
+
+    def test_evict_user_drops_every_token_of_the_user(self, redis_server):
+        from cqc_lem.utilities.session_cache import SessionCache
+        redis, _ = redis_server
+        with patch(f"{_MOD}.redis_client", return_value=redis):
+            replica_a = SessionCache(ttl=60, use_redis=True)
+            replica_b = SessionCache(ttl=60, use_redis=True)
+            replica_a.set("tok-1", 7, _expires_in(3600))
+            replica_a.set("tok-2", 7, _expires_in(3600))
+            replica_a.set("tok-3", 8, _expires_in(3600))
+
+            replica_a.evict_user(7)
+            assert replica_a.get("tok-1") is None and replica_a.get("tok-2") is None
+            assert replica_b.get("tok-1") is None and replica_b.get("tok-2") is None
+            assert replica_b.get("tok-3") == 8
+
+    def test_evict_user_without_redis(self):
+        from cqc_lem.utilities.session_cache import SessionCache
+        cache = SessionCache(ttl=60)
+        cache.set("tok-1", 7, _expires_in(3600))
+        cache.set("tok-2", 8, _expires_in(3600))
+        cache.evict_user(7)
+        assert (cache.get("tok-1"), cache.get("tok-2")) == (None, 8)
+
+    async def test_async_tier_shares_redis_with_the_sync_one(self, redis_server):
+        from cqc_lem.utilities.session_cache import SessionCache
+        redis, aredis = redis_server
+        with patch(f"{_MOD}.redis_client", return_value=redis), \
+             patch(f"{_MOD}.async_redis_client", return_value=aredis) as mock_async:
+            worker = SessionCache(ttl=60, use_redis=True)
+            api = SessionCache(ttl=60, use_redis=True)
+            worker.set("tok", 7, _expires_in(3600))
+            assert await api.aget("tok") == 7
+
+            await api.aset("tok-2", 8, _expires_in(3600))
+            assert worker.get("tok-2") == 8
+
+            await api.aevict("tok-2")
+            worker.clear()
+            assert worker.get("tok-2") is None
+        mock_async.assert_called_once()  # one client per event loop
+
+    def test_redis_failure_falls_back_to_miss(self):
+        from cqc_lem.utilities.session_cache import SessionCache
+        redis = MagicMock()
+        redis.get.side_effect = ConnectionError("down")
+        redis.pipeline.return_value.execute.side_effect = ConnectionError("down")
+        with patch(f"{_MOD}.redis_client", return_value=redis):
+            cache = SessionCache(ttl=60, use_redis=True)
+            cache.set("tok", 7, _expires_in(3600))
+            cache.clear()
+            assert cache.get("tok") is None
+
+    def test_ttl_defaults_to_seconds_without_redis(self, monkeypatch):
+        from cqc_lem.utilities.session_cache import session_cache_ttl
+        monkeypatch.delenv("SESSION_CACHE_TTL_SECONDS", raising=False)
+        monkeypatch.setenv("SESSION_CACHE_REDIS", "false")
+        assert session_cache_ttl() == 5.0
+        monkeypatch.setenv("SESSION_CACHE_REDIS", "true")
+        assert session_cache_ttl() == 300.0
+        monkeypatch.setenv("SESSION_CACHE_TTL_SECONDS", "30")
+        assert session_cache_ttl() == 30.0
+
+
+class TestDbSessionLookup:
+    def test_second_lookup_skips_the_database(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        mock_database_connection["cursor"].fetchone.return_value = {"user_id": 7, "expires_at": _expires_in(3600)}
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]) as mock_conn:
+            assert db.get_session_user_id("tok") == 7
+            assert db.get_session_user_id("tok") == 7
+        mock_conn.assert_called_once()
+        assert db.get_session_cache_stats()["hit_rate"] == 0.5
+
+    def test_invalid_token_is_not_cached(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        mock_database_connection["cursor"].fetchone.return_value = None
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]) as mock_conn:
+            assert db.get_session_user_id("bad") is None
+            assert db.get_session_user_id("bad") is None
+        assert mock_conn.call_count == 2
+
+    def test_delete_session_evicts(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        cursor = mock_database_connection["cursor"]
+        cursor.fetchone.return_value = {"user_id": 7, "expires_at": _expires_in(3600)}
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            db.get_session_user_id("tok")
+            assert db.delete_session("tok") is True
+            cursor.fetchone.return_value = None
+            assert db.get_session_user_id("tok") is None
+
+    def test_delete_user_evicts_their_sessions(self, mock_database_connection):
+        from cqc_lem.utilities import db
+
+        cursor = mock_database_connection["cursor"]
+        cursor.fetchone.return_value = {"user_id": 7, "expires_at": _expires_in(3600)}
+        cursor.rowcount = 1
+        with patch(_GET_CONN, return_value=mock_database_connection["connection"]):
+            db.get_session_user_id("tok")
+            assert db.delete_user(7) is True
+            cursor.fetchone.return_value = None  # the sessions row cascaded away
+            assert db.get_session_user_id("tok") is None
+        cursor.execute.assert_any_call("DELETE FROM users WHERE id = %s", (7,))
@@ -0,0 +1,72 @@
+"""Unit tests for the in-process TTL/LRU cache."""
+
+import os
+from unittest.mock import patch
+
+import pytest
+
+pytestmark = pytest.mark.unit
+
+_MOD = "cqc_lem.utilities.ttl_cache"
+
+
+class TestTTLCache:
+    def test_hit_and_miss_counters(self):
+        from cqc_lem.utilities.ttl_cache import TTLCache
+        cache = TTLCache(maxsize=10, ttl=60)
+        assert cache.get("a") is None
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        assert cache.stats() == {"size": 1, "maxsize": 10, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+    def test_entries_expire_after_ttl(self):
+        from cqc_lem.utilities.ttl_cache import TTLCache
+        with patch(f"{_MOD}.time.monotonic", side_effect=[100.0, 100.5, 200.0]):
+            cache = TTLCache(maxsize=10, ttl=1)
+            cache.set("a", 1)
+            assert cache.get("a") == 1
+            assert cache.get("a", "gone") == "gone"
+
+    def test_per_entry_ttl_override(self):
+        from cqc_lem.utilities.ttl_cache import TTLCache
+        with patch(f"{_MOD}.time.monotonic", side_effect=[100.0, 105.0]):
+            cache = TTLCache(maxsize=10, ttl=1)
+            cache.set("a", 1, ttl=10)
+            assert cache.get("a") == 1
+
+    def test_evicts_least_recently_used(self):
+        from cqc_lem.utilities.ttl_cache import TTLCache
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1 and cache.get("c") == 3
+
+    def test_pop_and_clear(self):
+        from cqc_lem.utilities.ttl_cache import TTLCache
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.pop("a")
+        cache.pop("missing")
+        assert cache.get("a") is None
+        cache.clear()
+        assert cache.stats()["size"] == 0
+
+    def test_pop_where(self):
+        from cqc_lem.utilities.ttl_cache import TTLCache
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", (7, None))
+        cache.set("b", (8, None))
+        cache.set("c", (7, None))
+        assert cache.pop_where(lambda entry: entry[0] == 7) == 2
+        assert cache.get("b") == (8, None) and cache.stats()["size"] == 1
+
+    def test_child_process_starts_empty(self):
+        from cqc_lem.utilities.ttl_cache import TTLCache
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1)
+        with patch(f"{_MOD}.os.getpid", return_value=os.getpid() + 1):
+            assert cache.get("a") is None
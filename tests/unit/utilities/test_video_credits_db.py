@@ -47,6 +47,34 @@ class TestVideoCreditMutations:
         params = cur.execute.call_args[0][1]
         assert params[1] == -3 and params[3] == 9
 
+    def test_deduct_is_conditional_decrement(self):
+        conn, cur = _db()
+        with patch("cqc_lem.utilities.db.get_db_connection", return_value=conn):
+            from cqc_lem.utilities.db import deduct_video_credits
+            deduct_video_credits(1, 3, post_id=9)
+        sql, params = cur.execute.call_args_list[0][0]
+        assert "UPDATE video_credit_balances" in sql and "balance >= %s" in sql
+        assert params == (3, 1, 3)
+        conn.commit.assert_called_once()
+
+    def test_deduct_insufficient_writes_nothing(self):
+        conn, cur = _db(rowcount=0)
+        with patch("cqc_lem.utilities.db.get_db_connection", return_value=conn):
+            from cqc_lem.utilities.db import deduct_video_credits
+            assert deduct_video_credits(1, 3, post_id=9) is False
+        cur.execute.assert_called_once()  # no ledger row
+        conn.rollback.assert_called_once()
+        conn.commit.assert_not_called()
+
+    def test_ledger_error_rolls_back_balance(self):
+        conn, cur = _db()
+        cur.execute.side_effect = [None, __import__("mysql.connector", fromlist=["c"]).Error("x")]
+        with patch("cqc_lem.utilities.db.get_db_connection", return_value=conn):
+            from cqc_lem.utilities.db import add_video_credits
+            assert add_video_credits(1, 15, "purchase_medium") is False
+        conn.rollback.assert_called_once()
+        conn.commit.assert_not_called()
+
     def test_refund_inserts_positive(self):
         conn, cur = _db()
         with patch("cqc_lem.utilities.db.get_db_connection", return_value=conn):
@@ -61,6 +89,28 @@ class TestVideoCreditMutations:
             assert get_video_credit_ledger_entry_by_session("sess_1")["delta"] == 15
 
 
+class TestReconcileCreditBalances:
+    def test_fixes_only_drifted_users(self):
+        conn, cur = _db()
+        cur.fetchall.return_value = [{"user_id": 4}, {"user_id": 8}]
+        # user 4 drifted 2 -> 5; user 8 was fixed by a concurrent write before we locked it
+        cur.fetchone.side_effect = [{"balance": 2}, {"total": 5}, {"balance": 3}, {"total": 3}]
+        with patch("cqc_lem.utilities.db.get_db_connection", return_value=conn):
+            from cqc_lem.utilities.db import reconcile_credit_balances
+            assert reconcile_credit_balances("video") == {4: (2, 5)}
+        updates = [c[0] for c in cur.execute.call_args_list if c[0][0].startswith("UPDATE video_credit_balances")]
+        assert updates == [("UPDATE video_credit_balances SET balance = %s WHERE user_id = %s", (5, 4))]
+        assert any("FOR UPDATE" in c[0][0] for c in cur.execute.call_args_list)
+
+    def test_error_returns_what_was_fixed(self):
+        conn, cur = _db()
+        cur.execute.side_effect = __import__("mysql.connector", fromlist=["c"]).Error("x")
+        with patch("cqc_lem.utilities.db.get_db_connection", return_value=conn):
+            from cqc_lem.utilities.db import reconcile_credit_balances
+            assert reconcile_credit_balances("avatar") == {}
+        conn.rollback.assert_called_once()
+
+
 class TestPostVideoQuality:
     def test_get_defaults_standard(self):
         conn, _ = _db(fetchone=None)